@@ -3,6 +3,10 @@ import pickle
 import tensorflow as tf
 import numpy as np
 from cnns.deeprl import tf_util
+from cnns.deeprl.vec_env import VecEnv
+from cnns.deeprl.vec_env import get_max_steps
+from cnns.deeprl.vec_env import get_vec_env
+from cnns.deeprl.vec_rollouts import collect_rollouts
 from cnns.nnlib.utils.general_utils import PolicyType
 
 
@@ -68,45 +72,29 @@ def create_model(mean, std, input_size=1, output_size=1, hidden_units=100):
 def run_model(args, policy_fn, expert_policy_fn=None, env=None):
     print('number of rollouts: ', args.rollouts)
 
-    returns = []
-    observations = []
-    actions = []
-    expert_actions = []
-
     with tf.Session():
         tf_util.initialize()
 
+        # Close only the environment created here (e.g. its worker
+        # processes), the environment of the caller is left open.
+        is_own_env = env is None
         if env is None:
-            import gym
-            env = gym.make(args.env_name)
-        max_steps = args.max_timesteps or env.spec.timestep_limit
-        print("max steps: ", max_steps)
-
-        for i in range(args.rollouts):
-            if args.verbose:
-                print('iter', i)
-            obs = env.reset()
-            done = False
-            totalr = 0.  # total rewards
-            steps = 0
-            while not done:
-                action = policy_fn(obs[None, :])
-                if expert_policy_fn is not None:
-                    expert_action = expert_policy_fn(obs[None, :])
-                    expert_actions.append(expert_action)
-                observations.append(obs)
-                actions.append(action)
-                obs, r, done, _ = env.step(action)
-                totalr += r
-                steps += 1
-                if args.render:
-                    env.render()
-                # if steps % 100 == 0: print("%i/%i" % (steps, max_steps))
-                if steps >= max_steps:
-                    break
-
-            # print('Episode {} finished after {} timesteps'.format(i, steps + 1))
-            returns.append(totalr)
+            env = get_vec_env(args)
+        elif not isinstance(env, VecEnv):
+            env = VecEnv([env])
+        try:
+            max_steps = get_max_steps(env, args.max_timesteps)
+            print("max steps: ", max_steps)
+
+            # Step the copies of the environment in lock-step, the policies
+            # are queried once for the observations of all the copies.
+            returns, observations, actions, expert_actions = collect_rollouts(
+                vec_env=env, policy_fn=policy_fn, rollouts=args.rollouts,
+                max_steps=max_steps, expert_policy_fn=expert_policy_fn,
+                render=args.render, verbose=args.verbose)
+        finally:
+            if is_own_env:
+                env.close()
 
         # print('returns; ', returns)
         mean_return = np.mean(returns)
@@ -114,8 +102,8 @@ def run_model(args, policy_fn, expert_policy_fn=None, env=None):
         print('mean return; ', mean_return)
         print('std of return; ', std_return)
 
-        expert_data = {'observations': np.array(observations),
-                       'actions': np.array(actions)}
+        expert_data = {'observations': observations,
+                       'actions': actions}
 
         if args.policy_type == PolicyType.EXPERT:
             output_chunks = [args.env_name,
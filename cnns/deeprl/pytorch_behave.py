@@ -6,6 +6,7 @@ from cnns.nnlib.utils.exec_args import get_args
 from cnns.nnlib.datasets.deeprl.rollouts import get_rollouts_dataset
 from cnns.deeprl.pytorch_model import load_model
 from cnns.deeprl.models import run_model
+from cnns.deeprl.vec_env import get_vec_env
 from cnns.deeprl.pytorch_model import pytorch_policy_fn
 import time
 import numpy as np
@@ -48,8 +49,8 @@ def run(args):
         print(header_str)
         file.flush()
 
-    import gym
-    env = gym.make(args.env_name)
+    # The copies of the environment are kept for all the iterations.
+    env = get_vec_env(args)
 
     for behave_iter in range(args.behave_iterations):
 
@@ -0,0 +1,167 @@
+"""
+Copies of an environment stepped in lock-step, either in this process
+(VecEnv) or each copy in its own worker process (SubprocVecEnv).
+
+Both use the old gym API: reset() returns the observation and step(action)
+returns (observation, reward, done, info). Only the selected copies
+(indexes) are reset or stepped, so the copies that finished their last
+episode can stay idle.
+"""
+import functools
+import multiprocessing
+import numpy as np
+
+
+def make_env(env_name):
+    import gym
+    return gym.make(env_name)
+
+
+def get_max_steps(env, max_timesteps=None):
+    """
+    :param env: the environment (its spec gives the default limit).
+    :param max_timesteps: the max number of steps of an episode (None - the
+    limit of the environment).
+    :return: the max number of steps of an episode.
+    """
+    if max_timesteps:
+        return max_timesteps
+    return env.spec.timestep_limit
+
+
+class VecEnv(object):
+    """
+    The copies of the environment in this process.
+    """
+
+    def __init__(self, envs):
+        """
+        :param envs: the list of the environments.
+        """
+        self.envs = envs
+        self.num_envs = len(envs)
+        self.spec = envs[0].spec
+
+    def reset(self, indexes=None):
+        """
+        :param indexes: the indexes of the copies to reset (None - all).
+        :return: the observations of the reset copies (len(indexes), obs_dim).
+        """
+        if indexes is None:
+            indexes = range(self.num_envs)
+        return np.stack([self.envs[index].reset() for index in indexes])
+
+    def step(self, actions, indexes=None):
+        """
+        :param actions: the actions (len(indexes), action_dim).
+        :param indexes: the indexes of the copies to step (None - all).
+        :return: the observations, the rewards and the done flags of the
+        stepped copies.
+        """
+        if indexes is None:
+            indexes = range(self.num_envs)
+        results = [self.envs[index].step(action) for index, action in
+                   zip(indexes, actions)]
+        return self.stack_results(results)
+
+    @staticmethod
+    def stack_results(results):
+        observations, rewards, dones, _ = zip(*results)
+        return (np.stack(observations), np.array(rewards, dtype=np.float64),
+                np.array(dones, dtype=bool))
+
+    def render(self):
+        self.envs[0].render()
+
+    def close(self):
+        pass
+
+
+def worker(remote, env_fn):
+    env = env_fn()
+    while True:
+        command, data = remote.recv()
+        if command == 'step':
+            remote.send(env.step(data))
+        elif command == 'reset':
+            remote.send(env.reset())
+        elif command == 'render':
+            env.render()
+        elif command == 'spec':
+            remote.send(env.spec)
+        elif command == 'close':
+            remote.close()
+            break
+        else:
+            raise Exception(f'Unknown command: {command}')
+
+
+class SubprocVecEnv(VecEnv):
+    """
+    The copies of the environment, each in its own worker process. The
+    commands are sent to all the selected workers before any result is
+    received, so the copies step in parallel.
+    """
+
+    def __init__(self, env_fns):
+        """
+        :param env_fns: the list of the picklable functions that create the
+        environments (e.g. functools.partial(make_env, env_name)).
+        """
+        self.num_envs = len(env_fns)
+        self.remotes, worker_remotes = zip(
+            *[multiprocessing.Pipe() for _ in range(self.num_envs)])
+        self.processes = [
+            multiprocessing.Process(target=worker, args=(worker_remote, env_fn),
+                                    daemon=True)
+            for worker_remote, env_fn in zip(worker_remotes, env_fns)]
+        for process, worker_remote in zip(self.processes, worker_remotes):
+            process.start()
+            worker_remote.close()
+        self.remotes[0].send(('spec', None))
+        self.spec = self.remotes[0].recv()
+        self.closed = False
+
+    def reset(self, indexes=None):
+        if indexes is None:
+            indexes = range(self.num_envs)
+        for index in indexes:
+            self.remotes[index].send(('reset', None))
+        return np.stack([self.remotes[index].recv() for index in indexes])
+
+    def step(self, actions, indexes=None):
+        if indexes is None:
+            indexes = range(self.num_envs)
+        for index, action in zip(indexes, actions):
+            self.remotes[index].send(('step', action))
+        return self.stack_results(
+            [self.remotes[index].recv() for index in indexes])
+
+    def render(self):
+        self.remotes[0].send(('render', None))
+
+    def close(self):
+        if self.closed:
+            return
+        for remote in self.remotes:
+            remote.send(('close', None))
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+
+def get_vec_env(args, env_fn=None):
+    """
+    :param args: the global arguments, args.rollout_envs copies of the
+    environment are created, each in its own worker process if
+    args.rollout_subprocess or all in this process.
+    :param env_fn: the function that creates an environment (by default the
+    gym environment args.env_name).
+    :return: the vectorized environment.
+    """
+    if env_fn is None:
+        env_fn = functools.partial(make_env, args.env_name)
+    num_envs = max(1, args.rollout_envs)
+    if args.rollout_subprocess:
+        return SubprocVecEnv([env_fn for _ in range(num_envs)])
+    return VecEnv([env_fn() for _ in range(num_envs)])
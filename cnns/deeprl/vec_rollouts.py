@@ -0,0 +1,91 @@
+"""
+Collect the rollouts (episodes) of a policy with the copies of an
+environment stepped in lock-step (see vec_env).
+
+The learner (and the expert) are queried once per step for the batch of the
+observations of all the running copies and the observations and the actions
+are written to the NumPy buffers preallocated for all the episodes. A copy
+that finishes its episode starts the next episode that has not been started
+yet, so the episodes are the same as if they were run one after another and
+the data is returned in the order of the episodes.
+"""
+import numpy as np
+
+
+def collect_rollouts(vec_env, policy_fn, rollouts, max_steps,
+                     expert_policy_fn=None, render=False, verbose=False):
+    """
+    :param vec_env: the copies of the environment (VecEnv or SubprocVecEnv).
+    :param policy_fn: the policy that maps the batch of the observations
+    (n, obs_dim) to the actions (n, action_dim).
+    :param rollouts: the number of the episodes.
+    :param max_steps: the max number of the steps of an episode.
+    :param expert_policy_fn: the expert policy queried for the observations
+    (but the actions of the policy_fn are taken) or None.
+    :param render: render the first copy of the environment.
+    :param verbose: print the indexes of the started episodes.
+    :return: the returns of the episodes (rollouts,), the observations
+    (steps, obs_dim), the actions (steps, action_dim) and the expert actions
+    (steps, action_dim) or None, for the steps of all the episodes.
+    """
+    num_envs = min(vec_env.num_envs, rollouts)
+    returns = np.zeros(rollouts)
+    lengths = np.zeros(rollouts, dtype=np.int64)
+    # The episode run by each copy of the environment (-1 - idle).
+    episodes = np.arange(num_envs)
+    next_episode = num_envs
+    if verbose:
+        for episode in episodes:
+            print('iter', episode)
+
+    obs = vec_env.reset(range(num_envs))
+    # The buffers for all the steps of all the episodes.
+    observations = np.zeros((rollouts, max_steps) + obs.shape[1:],
+                            dtype=obs.dtype)
+    actions = None
+    expert_actions = None
+
+    while (episodes >= 0).any():
+        running = np.flatnonzero(episodes >= 0)
+        episode_ids = episodes[running]
+        steps = lengths[episode_ids]
+        batch_obs = obs[running]
+        action = np.asarray(policy_fn(batch_obs))
+        if actions is None:
+            actions = np.zeros((rollouts, max_steps) + action.shape[1:],
+                               dtype=action.dtype)
+        observations[episode_ids, steps] = batch_obs
+        actions[episode_ids, steps] = action
+        if expert_policy_fn is not None:
+            expert_action = np.asarray(expert_policy_fn(batch_obs))
+            if expert_actions is None:
+                expert_actions = np.zeros(
+                    (rollouts, max_steps) + expert_action.shape[1:],
+                    dtype=expert_action.dtype)
+            expert_actions[episode_ids, steps] = expert_action
+
+        new_obs, rewards, dones = vec_env.step(action, running)
+        obs[running] = new_obs
+        returns[episode_ids] += rewards
+        lengths[episode_ids] += 1
+        if render:
+            vec_env.render()
+
+        finished = running[dones | (lengths[episode_ids] >= max_steps)]
+        for index in finished:
+            if next_episode < rollouts:
+                if verbose:
+                    print('iter', next_episode)
+                episodes[index] = next_episode
+                next_episode += 1
+                obs[index] = vec_env.reset([index])[0]
+            else:
+                episodes[index] = -1
+
+    # The steps of the episodes one after another.
+    mask = np.arange(max_steps) < lengths[:, None]
+    observations = observations[mask]
+    actions = actions[mask]
+    if expert_actions is not None:
+        expert_actions = expert_actions[mask]
+    return returns, observations, actions, expert_actions
@@ -0,0 +1,40 @@
+import functools
+import time
+import unittest
+from cnns.deeprl.vec_env import SubprocVecEnv
+from cnns.deeprl.vec_env import VecEnv
+from cnns.deeprl.vec_rollouts import collect_rollouts
+from cnns.deeprl.vec_rollouts_test import StubEnv
+from cnns.deeprl.vec_rollouts_test import policy_fn
+
+
+class TestVecRolloutsBenchmark(unittest.TestCase):
+
+    def test_benchmark(self):
+        # The environments with the slow steps (e.g. the physics simulation)
+        # and a policy with a fixed cost per query. A single copy steps the
+        # episodes one after another as before.
+        def slow_policy_fn(obs):
+            time.sleep(0.002)
+            return policy_fn(obs)
+
+        for num_envs in [1, 8]:
+            for name, vec_env in [
+                ("in-process", VecEnv(
+                    [StubEnv(step_time=0.001) for _ in range(num_envs)])),
+                ("subprocess", SubprocVecEnv(
+                    [functools.partial(StubEnv, step_time=0.001) for _ in
+                     range(num_envs)]))]:
+                start = time.time()
+                try:
+                    returns, _, _, _ = collect_rollouts(
+                        vec_env, slow_policy_fn, rollouts=16, max_steps=50)
+                finally:
+                    vec_env.close()
+                print(f"{name} envs: {num_envs}, time (sec): ",
+                      time.time() - start)
+                self.assertEqual(16, len(returns))
+
+
+if __name__ == '__main__':
+    unittest.main()
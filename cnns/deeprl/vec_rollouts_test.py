@@ -0,0 +1,149 @@
+import functools
+import time
+import unittest
+import numpy as np
+from cnns.deeprl.vec_env import SubprocVecEnv
+from cnns.deeprl.vec_env import VecEnv
+from cnns.deeprl.vec_env import get_max_steps
+from cnns.deeprl.vec_rollouts import collect_rollouts
+from cnns.nnlib.utils.object import Object
+
+
+class StubEnv(object):
+    """
+    A deterministic environment with the old gym API: the episodes are
+    started from the consecutive initial states and the length of an
+    episode depends on its initial state.
+    """
+
+    def __init__(self, obs_dim=3, start=0, step_time=0.0):
+        self.obs_dim = obs_dim
+        self.episode = start
+        self.step_time = step_time
+        self.spec = Object(timestep_limit=50)
+
+    def reset(self):
+        self.episode += 1
+        self.steps = 0
+        self.length = 5 + self.episode % 7
+        self.state = np.full(self.obs_dim, self.episode, dtype=np.float64)
+        return self.state.copy()
+
+    def step(self, action):
+        if self.step_time > 0:
+            time.sleep(self.step_time)
+        self.steps += 1
+        self.state = self.state + np.sum(action)
+        reward = float(np.sum(action) + self.steps)
+        done = self.steps >= self.length
+        return self.state.copy(), reward, done, {}
+
+
+def policy_fn(obs):
+    return np.stack([obs[:, 0] * 0.01, -obs[:, 1] * 0.02], axis=1)
+
+
+def expert_policy_fn(obs):
+    return np.stack([-obs[:, 2] * 0.03, np.ones(len(obs))], axis=1)
+
+
+class CountingEnv(StubEnv):
+    """
+    Every copy starts the episodes from the same shared counter, so a copy
+    runs the same episode as the single environment would.
+    """
+    counter = 0
+
+    def reset(self):
+        self.episode = CountingEnv.counter
+        CountingEnv.counter += 1
+        return super(CountingEnv, self).reset()
+
+
+def run_sequential(env, rollouts, max_steps):
+    # The reference: one step of one episode at a time.
+    returns, observations, actions, expert_actions = [], [], [], []
+    for _ in range(rollouts):
+        obs = env.reset()
+        done = False
+        total = 0.
+        steps = 0
+        while not done:
+            action = policy_fn(obs[None, :])
+            expert_actions.append(expert_policy_fn(obs[None, :])[0])
+            observations.append(obs)
+            actions.append(action[0])
+            obs, r, done, _ = env.step(action[0])
+            total += r
+            steps += 1
+            if steps >= max_steps:
+                break
+        returns.append(total)
+    return (np.array(returns), np.array(observations), np.array(actions),
+            np.array(expert_actions))
+
+
+class TestVecRollouts(unittest.TestCase):
+
+    def check_rollouts(self, vec_env, rollouts, max_steps):
+        CountingEnv.counter = 0
+        expect = run_sequential(CountingEnv(), rollouts=rollouts,
+                                max_steps=max_steps)
+        CountingEnv.counter = 0
+        result = collect_rollouts(vec_env, policy_fn, rollouts=rollouts,
+                                  max_steps=max_steps,
+                                  expert_policy_fn=expert_policy_fn)
+        for expect_array, array in zip(expect, result):
+            self.assertEqual(expect_array.shape, array.shape)
+            self.assertTrue(np.allclose(expect_array, array))
+
+    def test_collect_rollouts(self):
+        for num_envs in [1, 3, 12]:
+            vec_env = VecEnv([CountingEnv() for _ in range(num_envs)])
+            self.check_rollouts(vec_env, rollouts=10, max_steps=50)
+            # The episodes cut by the max number of steps.
+            self.check_rollouts(vec_env, rollouts=10, max_steps=8)
+
+    def test_subproc_vec_env(self):
+        # The workers have their own episode counters.
+        vec_env = SubprocVecEnv(
+            [functools.partial(StubEnv, start=index * 3) for index in
+             range(2)])
+        self.assertEqual(50, get_max_steps(vec_env))
+        expect_env = VecEnv([StubEnv(start=index * 3) for index in range(2)])
+        try:
+            expect = collect_rollouts(expect_env, policy_fn, rollouts=6,
+                                      max_steps=20)
+            result = collect_rollouts(vec_env, policy_fn, rollouts=6,
+                                      max_steps=20)
+        finally:
+            vec_env.close()
+        self.assertIsNone(result[3])
+        for expect_array, array in zip(expect[:3], result[:3]):
+            self.assertTrue(np.allclose(expect_array, array))
+
+    def test_in_process_subprocess(self):
+        # The in-process and the subprocess copies of the environment give
+        # the same rollouts (the timing is in vec_rollouts_benchmark.py).
+        for num_envs in [1, 4]:
+            expect_env = VecEnv(
+                [StubEnv(start=index * 3) for index in range(num_envs)])
+            vec_env = SubprocVecEnv(
+                [functools.partial(StubEnv, start=index * 3) for index in
+                 range(num_envs)])
+            try:
+                expect = collect_rollouts(expect_env, policy_fn, rollouts=8,
+                                          max_steps=20,
+                                          expert_policy_fn=expert_policy_fn)
+                result = collect_rollouts(vec_env, policy_fn, rollouts=8,
+                                          max_steps=20,
+                                          expert_policy_fn=expert_policy_fn)
+            finally:
+                vec_env.close()
+            for expect_array, array in zip(expect, result):
+                self.assertEqual(expect_array.shape, array.shape)
+                self.assertTrue(np.array_equal(expect_array, array))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -72,12 +72,15 @@ def get_transform_train(args, dtype=torch.float32, signal_dimension=2):
         transformations.append(transforms.Normalize(cifar_mean, cifar_std))
     if signal_dimension == 1:
         transformations.append(FlatTransformation())
-    if args and args.svd_transform > 0.0:
+    # With the batch_transform the compression is applied once per collated
+    # batch (see: get_batch_transform) instead of per image.
+    is_image_transform = args and not args.batch_transform
+    if is_image_transform and args.svd_transform > 0.0:
         transformations.append(
             SVDCompressionTransformation(args=args,
                                          compress_rate=args.svd_transform)
         )
-    if args and args.fft_transform > 0.0:
+    if is_image_transform and args.fft_transform > 0.0:
         transformations.append(
             FFTCompressionTransformation(compress_rate=args.fft_transform)
         )
@@ -100,12 +103,13 @@ def get_transform_test(args, dtype=torch.float32, signal_dimension=2,
     if noise_sigma > 0:
         transformations.append(
             AddGaussianNoiseTransformation(sigma=noise_sigma))
-    if args and args.svd_transform > 0.0:
+    is_image_transform = args and not args.batch_transform
+    if is_image_transform and args.svd_transform > 0.0:
         transformations.append(
             SVDCompressionTransformation(args=args,
                                          compress_rate=args.svd_transform)
         )
-    if args and args.fft_transform > 0.0:
+    if is_image_transform and args.fft_transform > 0.0:
         transformations.append(
             FFTCompressionTransformation(compress_rate=args.fft_transform)
         )
@@ -23,7 +23,10 @@ def get_transform(args):
     transformations = []
     transformations.append(transforms.ToTensor())
     transformations.append(transforms.Normalize(mnist_mean, mnist_std))
-    if args and args.svd_transform > 0.0:
+    # With the batch_transform the compression is applied once per collated
+    # batch (see: get_batch_transform) instead of per image.
+    is_image_transform = args and not args.batch_transform
+    if is_image_transform and args.svd_transform > 0.0:
         transformations.append(
             SVDCompressionTransformation(args=args,
                                          compress_rate=args.svd_transform)
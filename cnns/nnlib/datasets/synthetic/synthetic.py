@@ -13,7 +13,10 @@ from cnns.nnlib.datasets.transformations.svd_compression import \
 
 def get_transform_train(args):
     transformations = []
-    if args and args.svd_transform > 0.0:
+    # With the batch_transform the compression is applied once per collated
+    # batch (see: get_batch_transform) instead of per image.
+    is_image_transform = args and not args.batch_transform
+    if is_image_transform and args.svd_transform > 0.0:
         transformations.append(
             SVDCompressionTransformation(args=args,
                                          compress_rate=args.svd_transform)
@@ -24,7 +27,10 @@ def get_transform_train(args):
 
 def get_transform_test(args):
     transformations = []
-    if args and args.svd_transform > 0.0:
+    # With the batch_transform the compression is applied once per collated
+    # batch (see: get_batch_transform) instead of per image.
+    is_image_transform = args and not args.batch_transform
+    if is_image_transform and args.svd_transform > 0.0:
         transformations.append(
             SVDCompressionTransformation(args=args,
                                          compress_rate=args.svd_transform)
@@ -0,0 +1,64 @@
+import torch
+import numpy as np
+
+
+class TensorBatchLoader(object):
+    """
+    Iterate over batches of a dataset that is fully resident in memory.
+
+    This is a drop-in replacement for the torch.utils.data.DataLoader for
+    small datasets (e.g. from the UCR archive). The DataLoader calls
+    __getitem__ for each sample and collates the samples back into a batch.
+    Here, we shuffle the whole tensor with a single permutation per epoch and
+    yield the batches as slices (views) of the resident tensor.
+    """
+
+    def __init__(self, dataset, batch_size, shuffle=True, device=None,
+                 drop_last=False):
+        """
+        :param dataset: the dataset with the data and labels attributes (e.g.
+        UCRDataset), the data is a tensor with samples in the first dimension.
+        :param batch_size: the number of samples in a batch.
+        :param shuffle: shuffle the samples at the beginning of each epoch.
+        :param device: place the data and labels once on this device (e.g. the
+        training device), by default the data stays where it is.
+        :param drop_last: drop the last incomplete batch.
+        """
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        data = dataset.data
+        labels = dataset.labels
+        if isinstance(labels, np.ndarray):
+            labels = torch.from_numpy(labels)
+        if device is not None:
+            data = data.to(device)
+            labels = labels.to(device)
+        if len(data) != len(labels):
+            raise Exception(
+                f"The number of samples: {len(data)} and labels: "
+                f"{len(labels)} differ.")
+        self.data = data
+        self.labels = labels
+
+    def __len__(self):
+        """
+        :return: the number of batches in an epoch.
+        """
+        size = len(self.data)
+        if self.drop_last:
+            return size // self.batch_size
+        return (size + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        data = self.data
+        labels = self.labels
+        if self.shuffle:
+            permutation = torch.randperm(len(data)).to(data.device)
+            data = data[permutation]
+            labels = labels[permutation]
+        for batch in range(len(self)):
+            start = batch * self.batch_size
+            stop = start + self.batch_size
+            yield data[start:stop], labels[start:stop]
@@ -0,0 +1,49 @@
+import unittest
+import torch
+import numpy as np
+from cnns.nnlib.datasets.tensor_loader import TensorBatchLoader
+
+
+class InMemoryDataset(object):
+
+    def __init__(self, size, width):
+        self.data = torch.arange(size * width, dtype=torch.float).reshape(
+            size, 1, width)
+        self.labels = np.arange(size, dtype=np.int64)
+
+
+class TestTensorBatchLoader(unittest.TestCase):
+
+    def test_batches(self):
+        dataset = InMemoryDataset(size=10, width=3)
+        loader = TensorBatchLoader(dataset=dataset, batch_size=4,
+                                   shuffle=False)
+        self.assertEqual(3, len(loader))
+        batches = list(loader)
+        self.assertEqual([4, 4, 2], [len(target) for _, target in batches])
+        data, target = batches[1]
+        self.assertTrue(torch.equal(dataset.data[4:8], data))
+        self.assertEqual(torch.int64, target.dtype)
+
+    def test_shuffle_keeps_pairs(self):
+        torch.manual_seed(31)
+        dataset = InMemoryDataset(size=11, width=3)
+        loader = TensorBatchLoader(dataset=dataset, batch_size=4,
+                                   shuffle=True, drop_last=False)
+        seen = []
+        for data, target in loader:
+            # Each sample still has its own label.
+            self.assertTrue(torch.equal(dataset.data[target], data))
+            seen.extend(target.tolist())
+        self.assertEqual(list(range(11)), sorted(seen))
+
+    def test_drop_last(self):
+        dataset = InMemoryDataset(size=10, width=3)
+        loader = TensorBatchLoader(dataset=dataset, batch_size=4,
+                                   drop_last=True)
+        self.assertEqual(2, len(loader))
+        self.assertEqual(2, len(list(loader)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import torch
+from cnns.nnlib.robustness.channels.channels_definition import fft_channel
+from cnns.nnlib.robustness.channels.channels_definition import \
+    compress_svd_batch
+from cnns.nnlib.datasets.transformations.svd_compression import \
+    SVDCompressionTransformation
+from cnns.nnlib.utils.general_utils import SVDTransformType
+
+
+class BatchCompressionTransformation(object):
+    """Compress a collated batch of images with SVD and/or FFT.
+
+    Given tensor (N,C,H,W).
+
+    This is the batch counterpart of the SVDCompressionTransformation and
+    FFTCompressionTransformation. It runs once per batch (after the data
+    loader collated the images and the batch was moved to the training
+    device), so the rfft/irfft and svd are executed on the whole batch instead
+    of one image at a time in the data loader workers.
+    """
+
+    def __init__(self, args=None, svd_compress_rate=0.0, fft_compress_rate=0.0):
+        self.args = args
+        self.svd_compress_rate = svd_compress_rate
+        self.fft_compress_rate = fft_compress_rate
+        self.compress_svd = None
+        if svd_compress_rate > 0.0:
+            svd_type = args.svd_transform_type
+            if svd_type == SVDTransformType.STANDARD_TORCH:
+                self.compress_svd = compress_svd_batch
+            elif svd_type in (SVDTransformType.STANDARD_NUMPY,
+                              SVDTransformType.COMPRESS_RESIZE):
+                # The numpy versions work on a single image, so we still
+                # loop over the batch, but outside of the data loader.
+                image_transform = SVDCompressionTransformation(
+                    args=args, compress_rate=svd_compress_rate)
+                self.compress_svd = lambda x, compress_rate: torch.stack(
+                    [image_transform(image).to(x.device) for image in x])
+            elif svd_type == SVDTransformType.NONE:
+                self.compress_svd = None
+            else:
+                # The SVD domain transformations change the number of channels
+                # and have to be applied per image.
+                raise Exception(
+                    f'Unsupported svd_type for the batch transformation: '
+                    f'{svd_type.name}')
+
+    def __call__(self, data):
+        """
+        Arguments:
+            data (Tensor): Tensor batch of images of size (N, C, H, W) to be
+            compressed.
+
+        Returns:
+            Tensor: compressed batch of images.
+        """
+        if self.compress_svd is not None:
+            data = self.compress_svd(data, compress_rate=self.svd_compress_rate)
+        if self.fft_compress_rate > 0.0:
+            data = fft_channel(data, compress_rate=self.fft_compress_rate)
+        return data
+
+
+# The datasets with the loaders that apply the svd_transform and the
+# fft_transform per image (without the batch_transform).
+SVD_TRANSFORM_DATASETS = ("cifar10", "cifar100", "mnist", "mnist_svd",
+                          "synthetic")
+FFT_TRANSFORM_DATASETS = ("cifar10", "cifar100")
+
+
+def get_batch_transform(args):
+    """
+    Get the batch compression transformation for the collated batches.
+
+    :param args: the general arguments for a program.
+    :return: the batch transformation or None if the input compression is
+    applied per image in the data loader (or there is no compression at all
+    for the dataset).
+    """
+    if not args.batch_transform:
+        return None
+    svd_compress_rate = 0.0
+    if args.dataset in SVD_TRANSFORM_DATASETS:
+        svd_compress_rate = args.svd_transform
+    fft_compress_rate = 0.0
+    if args.dataset in FFT_TRANSFORM_DATASETS:
+        fft_compress_rate = args.fft_transform
+    if svd_compress_rate <= 0.0 and fft_compress_rate <= 0.0:
+        return None
+    return BatchCompressionTransformation(
+        args=args,
+        svd_compress_rate=svd_compress_rate,
+        fft_compress_rate=fft_compress_rate)
@@ -0,0 +1,81 @@
+import unittest
+import torch
+import numpy as np
+from cnns.nnlib.utils.arguments import Arguments
+from cnns.nnlib.utils.general_utils import SVDTransformType
+from cnns.nnlib.datasets.mnist import mnist
+from cnns.nnlib.datasets.synthetic import synthetic
+from cnns.nnlib.datasets.transformations.svd_compression import \
+    SVDCompressionTransformation
+from .batch_compression import BatchCompressionTransformation
+from .batch_compression import get_batch_transform
+
+
+class TestBatchCompression(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+        self.args = Arguments()
+        self.args.svd_transform_type = SVDTransformType.STANDARD_TORCH
+        self.data = torch.rand(4, 3, 8, 8)
+
+    def test_svd_batch_as_per_image(self):
+        compress_rate = 50.0
+        image_transform = SVDCompressionTransformation(
+            args=self.args, compress_rate=compress_rate)
+        expect = torch.stack([image_transform(image) for image in self.data])
+        batch_transform = BatchCompressionTransformation(
+            args=self.args, svd_compress_rate=compress_rate)
+        result = batch_transform(self.data)
+        np.testing.assert_allclose(actual=result.numpy(),
+                                   desired=expect.numpy(), rtol=1e-5,
+                                   atol=1e-5)
+
+    def test_get_batch_transform(self):
+        self.args.svd_transform = 50.0
+        self.args.batch_transform = False
+        self.assertIsNone(get_batch_transform(self.args))
+        self.args.batch_transform = True
+        self.assertIsInstance(get_batch_transform(self.args),
+                              BatchCompressionTransformation)
+        self.args.svd_transform = 0.0
+        self.args.fft_transform = 0.0
+        self.assertIsNone(get_batch_transform(self.args))
+
+    def test_get_batch_transform_datasets(self):
+        # Only the compression that the loader of the dataset would apply
+        # per image.
+        self.args.batch_transform = True
+        self.args.svd_transform = 50.0
+        self.args.fft_transform = 50.0
+        self.args.dataset = "mnist"
+        batch_transform = get_batch_transform(self.args)
+        self.assertEqual(50.0, batch_transform.svd_compress_rate)
+        self.assertEqual(0.0, batch_transform.fft_compress_rate)
+        self.args.dataset = "imagenet"
+        self.assertIsNone(get_batch_transform(self.args))
+
+    def test_no_image_transform(self):
+        # The loaders do not compress per image with the batch_transform.
+        self.args.svd_transform = 50.0
+        self.args.batch_transform = True
+        for transform in [mnist.get_transform(self.args),
+                          synthetic.get_transform_train(self.args),
+                          synthetic.get_transform_test(self.args)]:
+            self.assertFalse(any(
+                isinstance(x, SVDCompressionTransformation) for x in
+                transform.transforms))
+        self.args.batch_transform = False
+        self.assertTrue(any(
+            isinstance(x, SVDCompressionTransformation) for x in
+            mnist.get_transform(self.args).transforms))
+
+    def test_svd_domain_not_supported(self):
+        self.args.svd_transform_type = SVDTransformType.TO_SVD_DOMAIN
+        with self.assertRaises(Exception):
+            BatchCompressionTransformation(args=self.args,
+                                           svd_compress_rate=50.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
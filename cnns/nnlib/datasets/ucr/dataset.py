@@ -2,9 +2,20 @@ import torch
 from torch.utils.data import Dataset
 from torchvision import transforms
 import os
+import struct
 import pandas as pd
 import numpy as np
 
+# The binary cache of a csv file with a time-series dataset: the header
+# (magic, version, number of rows, width, size and modification time of the csv
+# file), then the float32 data (rows x width) and the int64 labels (rows).
+CACHE_SUFFIX = ".bin"
+CACHE_MAGIC = b"UCRCACHE"
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct("<8sIqqqq")
+# Keep the data aligned in the file.
+CACHE_HEADER_SIZE = 64
+
 
 class ToTensor(object):
     """Transform the numpy array to a tensor."""
@@ -37,6 +48,106 @@ class AddChannel(object):
         return torch.unsqueeze(input, dim=0)
 
 
+def get_csv_stamp(csv_path):
+    """
+    :param csv_path: the path to the csv file.
+    :return: the size and the modification time of the csv file (to detect
+    that the cache is stale).
+    """
+    stat = os.stat(csv_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def write_binary_cache(csv_path, cache_path):
+    """
+    Convert the csv file (the label in the first column and then the values of
+    the time-series) to the binary cache.
+
+    :param csv_path: the path to the csv file.
+    :param cache_path: the path to the binary cache.
+    :return: the data and labels.
+    """
+    data_all = pd.read_csv(csv_path, header=None)
+    labels = np.asarray(data_all.iloc[:, 0], dtype=np.int64)
+    data = np.asarray(data_all.iloc[:, 1:], dtype=np.float64).astype(
+        np.float32)
+    rows, width = data.shape
+    csv_size, csv_mtime = get_csv_stamp(csv_path)
+    header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, rows, width,
+                               csv_size, csv_mtime)
+    # Write to a temporary file first, so that a concurrent reader never sees
+    # a partially written cache.
+    tmp_path = cache_path + "." + str(os.getpid()) + ".tmp"
+    with open(tmp_path, "wb") as file:
+        file.write(header.ljust(CACHE_HEADER_SIZE, b"\0"))
+        file.write(np.ascontiguousarray(data).tobytes())
+        file.write(np.ascontiguousarray(labels).tobytes())
+    os.replace(tmp_path, cache_path)
+    return data, labels
+
+
+def read_binary_cache(cache_path, csv_path=None):
+    """
+    Map the binary cache to memory (no parsing and no copy of the data).
+
+    :param cache_path: the path to the binary cache.
+    :param csv_path: the source csv file, if given and the csv file changed
+    after the cache was written, the cache is stale and None is returned.
+    :return: the data (rows x width, float32) and labels (int64) or None if
+    there is no valid cache.
+    """
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, "rb") as file:
+        header = file.read(CACHE_HEADER.size)
+    if len(header) != CACHE_HEADER.size:
+        return None
+    magic, version, rows, width, csv_size, csv_mtime = CACHE_HEADER.unpack(
+        header)
+    if magic != CACHE_MAGIC or version != CACHE_VERSION:
+        return None
+    if csv_path is not None and get_csv_stamp(csv_path) != (
+            csv_size, csv_mtime):
+        return None
+    # Copy-on-write mode: the arrays are writable but the file is never
+    # modified.
+    data = np.memmap(cache_path, dtype=np.float32, mode="c",
+                     offset=CACHE_HEADER_SIZE, shape=(rows, width))
+    labels = np.memmap(cache_path, dtype=np.int64, mode="c",
+                       offset=CACHE_HEADER_SIZE + data.nbytes, shape=(rows,))
+    return data, labels
+
+
+def load_data_labels(csv_path, use_cache=True):
+    """
+    Load the data and labels from the csv file through the binary cache.
+
+    The csv file is parsed only once and converted to the binary cache (next
+    to the csv file), the next calls map the cache to memory.
+
+    :param csv_path: the path to the csv file.
+    :param use_cache: use (and create if needed) the binary cache.
+    :return: the data (rows x width, float32) and labels (int64).
+    """
+    if not use_cache:
+        data_all = pd.read_csv(csv_path, header=None)
+        labels = np.asarray(data_all.iloc[:, 0], dtype=np.int64)
+        data = np.asarray(data_all.iloc[:, 1:], dtype=np.float64).astype(
+            np.float32)
+        return data, labels
+    cache_path = csv_path + CACHE_SUFFIX
+    cached = read_binary_cache(cache_path=cache_path, csv_path=csv_path)
+    if cached is not None:
+        return cached
+    try:
+        write_binary_cache(csv_path=csv_path, cache_path=cache_path)
+    except OSError as ex:
+        # E.g. a read only directory with the datasets.
+        print("Cannot write the binary cache: ", cache_path, ex)
+        return load_data_labels(csv_path=csv_path, use_cache=False)
+    return read_binary_cache(cache_path=cache_path)
+
+
 class UCRDataset(Dataset):
     """One of the time-series datasets from the UCR archive."""
 
@@ -46,12 +157,15 @@ class UCRDataset(Dataset):
                  AddChannel()]),
             train=True,
             ucr_path=None,
-            mean=None, std=None):
+            mean=None, std=None,
+            use_cache=True):
         """
         :param dataset_name: the name of the dataset to fetch from file on disk.
         :param transformations: pytorch transforms for transforms and tensor
         conversion.
         :param ucr_path: the path to the ucr dataset.
+        :param use_cache: load the data through the memory mapped binary cache
+        of the csv file.
         """
         dir_path = os.path.dirname(os.path.realpath(__file__))
         if ucr_path is None:
@@ -69,12 +183,11 @@ class UCRDataset(Dataset):
         else:
             csv_path = os.path.join(ucr_path, dataset_name,
                                     dataset_name + suffix)
-        self.data_all = pd.read_csv(csv_path, header=None)
-        self.labels = np.asarray(self.data_all.iloc[:, 0], dtype=np.int)
+        self.data, self.labels = load_data_labels(csv_path=csv_path,
+                                                  use_cache=use_cache)
         self.num_classes = len(np.unique(self.labels))
         self.labels = self.__transform_labels(labels=self.labels,
                                               num_classes=self.num_classes)
-        self.data = np.asarray(self.data_all.iloc[:, 1:], dtype=np.float)
         self.width = len(self.data[0, :])
         # the data is already z-normalized in the UCR archive
         # # normalize the data
@@ -88,8 +201,8 @@ class UCRDataset(Dataset):
 
         # self.transformations = transformations
         self.dtype = torch.float
-        self.data = torch.tensor(self.data, device=torch.device("cpu"),
-                                 dtype=self.dtype)
+        # No copy of the (memory mapped) float32 data.
+        self.data = torch.from_numpy(self.data)
         # add the dimension for the channel
         self.data = torch.unsqueeze(self.data, dim=1)
 
@@ -1,10 +1,14 @@
 import unittest
 import logging
+import os
+import tempfile
+import numpy as np
 from cnns.nnlib.utils.log_utils import get_logger
 from cnns.nnlib.utils.log_utils import set_up_logging
 from cnns.nnlib.datasets.ucr.dataset import UCRDataset
 from cnns.nnlib.datasets.ucr.dataset import ToTensor
 from cnns.nnlib.datasets.ucr.dataset import AddChannel
+from cnns.nnlib.datasets.ucr.dataset import CACHE_SUFFIX
 from cnns.nnlib.datasets.ucr.ucr import get_dev_dataset
 import torch
 from torchvision import transforms
@@ -35,3 +39,29 @@ class TestUCRdataset(unittest.TestCase):
         dev_dataset = get_dev_dataset(args=args, train_dataset=train_dataset)
         self.assertEqual(len(dev_dataset), 135)
         self.assertEqual(len(train_dataset), 315)
+
+    def testBinaryCache(self):
+        with tempfile.TemporaryDirectory() as ucr_path:
+            dataset_name = "Case_cache"
+            csv_path = os.path.join(ucr_path, dataset_name + "_TRAIN")
+            labels = np.array([2, 1, 3, 2, 1])
+            data = np.random.randn(5, 7)
+            np.savetxt(csv_path, np.hstack((labels[:, None], data)),
+                       delimiter=",")
+
+            parsed = UCRDataset(dataset_name, train=True, ucr_path=ucr_path,
+                                use_cache=False)
+            self.assertFalse(os.path.exists(csv_path + CACHE_SUFFIX))
+            # The first load creates the cache, the second maps it to memory.
+            created = UCRDataset(dataset_name, train=True, ucr_path=ucr_path)
+            self.assertTrue(os.path.exists(csv_path + CACHE_SUFFIX))
+            mapped = UCRDataset(dataset_name, train=True, ucr_path=ucr_path)
+
+            for dataset in [created, mapped]:
+                self.assertEqual(parsed.width, dataset.width)
+                self.assertEqual(parsed.num_classes, dataset.num_classes)
+                self.assertEqual((5, 1, 7), tuple(dataset.data.size()))
+                self.assertTrue(torch.equal(parsed.data, dataset.data))
+                np.testing.assert_array_equal(parsed.labels, dataset.labels)
+            np.testing.assert_array_equal(np.array([1, 0, 2, 1, 0]),
+                                          mapped.labels)
@@ -4,6 +4,7 @@ import torch
 from cnns.nnlib.utils.general_utils import MemoryType
 from cnns.nnlib.datasets.ucr.dataset import ToTensor
 from cnns.nnlib.datasets.ucr.dataset import AddChannel
+from cnns.nnlib.datasets.tensor_loader import TensorBatchLoader
 
 
 def get_dev_dataset(args, train_dataset):
@@ -30,7 +31,8 @@ def get_dev_dataset(args, train_dataset):
     dev_dataset = UCRDataset(dataset_name, train=True,
                              transformations=transforms.Compose(
                                  [ToTensor(dtype=torch.float),
-                                  AddChannel()]))
+                                  AddChannel()]),
+                             ucr_path=args.ucr_path)
     dev_dataset.set_range(train_len, total_len)
     if len(dev_dataset) != dev_len:
         raise Exception("Error in extracting the dev set from the train set.")
@@ -77,15 +79,23 @@ def get_ucr(args):
     if train_size < batch_size:
         batch_size = train_size
 
-    train_loader = torch.utils.data.DataLoader(
-        dataset=train_dataset, batch_size=batch_size, shuffle=True,
-        **kwargs)
+    if args.in_memory_loader:
+        # The whole dataset is already a tensor in memory, so yield the
+        # batches by slicing it (placed once on the training device).
+        def get_loader(dataset):
+            return TensorBatchLoader(dataset=dataset, batch_size=batch_size,
+                                     shuffle=True, device=args.device)
+    else:
+        def get_loader(dataset):
+            return torch.utils.data.DataLoader(
+                dataset=dataset, batch_size=batch_size, shuffle=True,
+                **kwargs)
+
+    train_loader = get_loader(train_dataset)
 
     dev_loader = None
     if args.is_dev_dataset:
-        dev_loader = torch.utils.data.DataLoader(
-            dataset=dev_dataset, batch_size=batch_size, shuffle=True,
-            **kwargs)
+        dev_loader = get_loader(dev_dataset)
 
     test_dataset = UCRDataset(dataset_name, train=False,
                               transformations=transforms.Compose(
@@ -102,7 +112,6 @@ def get_ucr(args):
     # args.test_batch_size = int(min(args.input_size / 10, args.test_batch_size))
     args.flat_size = None
     args.out_channels = None
-    test_loader = torch.utils.data.DataLoader(
-        dataset=test_dataset, batch_size=batch_size, shuffle=True, **kwargs)
+    test_loader = get_loader(test_dataset)
 
     return train_loader, test_loader, dev_loader
@@ -4,7 +4,21 @@ import os
 database_path = '/TimeSeriesDatasets/'
 
 
-def load_data(dirname, normalization=False, slice_ratio=1, percent_valid=0.2):
+def load_data(dirname, normalization=False, slice_ratio=1, percent_valid=0.2,
+              lazy=False):
+    """
+    :param lazy: return the train, valid and test sets as SlicedDataset (the
+    windows are drawn on demand) instead of the materialized arrays.
+    """
+    if lazy and normalization:
+        raise Exception("The z-normalization of the windows requires the "
+                        "materialized arrays (lazy=False).")
+    if lazy:
+        def slice_fn(x, y, ratio):
+            dataset = SlicedDataset(x, y, ratio)
+            return dataset, dataset.get_window_labels()
+    else:
+        slice_fn = slice_data
     dir_path = os.path.dirname(os.path.realpath(__file__))
     # print("current path: ", dir_path)
 
@@ -35,20 +49,20 @@ def load_data(dirname, normalization=False, slice_ratio=1, percent_valid=0.2):
         valid_x = train_x[ind[:valid_last_index]]
         valid_y = train_y[ind[:valid_last_index]]
         ind = np.delete(ind, (range(0, int(valid_last_index))))
-        valid_x, valid_y = slice_data(valid_x, valid_y, slice_ratio)
+        valid_x, valid_y = slice_fn(valid_x, valid_y, slice_ratio)
     else:
         valid_x = np.array([])
         valid_y = np.array([])
 
     train_x = train_x[ind]
     train_y = train_y[ind]
-    train_x, train_y = slice_data(train_x, train_y, slice_ratio)
+    train_x, train_y = slice_fn(train_x, train_y, slice_ratio)
 
     # print("size of train set: ", len(train_y))
     # print("size of validation set: ", len(valid_y))
 
     # shuffle again
-    n = train_x.shape[0]
+    n = len(train_x)
     ind = np.arange(n)
     rng.shuffle(ind)  # shuffle the train set
 
@@ -57,7 +71,7 @@ def load_data(dirname, normalization=False, slice_ratio=1, percent_valid=0.2):
     test_x = data[:, 1:].astype(np.float32)
     test_y = np.int_(data[:, 0].astype(np.float32)) - 1
 
-    test_x, test_y = slice_data(test_x, test_y, slice_ratio)
+    test_x, test_y = slice_fn(test_x, test_y, slice_ratio)
     # print("size of the test set: ", len(test_x))
 
     # z-normalization (not done by default - the UCR dataset is normalized already)
@@ -71,23 +85,101 @@ def load_data(dirname, normalization=False, slice_ratio=1, percent_valid=0.2):
     return [(train_x, train_y), (valid_x, valid_y), (test_x, test_y), len_train_data, slice_ratio]
 
 
+def get_slice_sizes(length, slice_ratio):
+    """
+    :param length: the length of the time-series.
+    :param slice_ratio: the length of a window relative to the time-series.
+    :return: the length of a window and the number of windows per time-series.
+
+    >>> get_slice_sizes(length=10, slice_ratio=0.8)
+    (8, 3)
+    """
+    length_sliced = int(length * slice_ratio)
+    # if increase_num =5, it means one ori becomes 5 new instances.
+    increase_num = length - length_sliced + 1
+    return length_sliced, increase_num
+
+
+def slice_data_view(data_x, slice_ratio=1):
+    """
+    All the windows of the time-series as a read-only strided view of data_x
+    (no copy of the data).
+
+    :param data_x: the time-series (n, length).
+    :param slice_ratio: the length of a window relative to the time-series.
+    :return: the windows (n, increase_num, length_sliced), the window j of the
+    time-series i is data_x[i, j: j + length_sliced].
+
+    >>> x = np.arange(8).reshape(2, 4)
+    >>> slice_data_view(x, slice_ratio=0.5)[1]
+    array([[4, 5],
+           [5, 6],
+           [6, 7]])
+    """
+    data_x = np.asarray(data_x)
+    n, length = data_x.shape
+    length_sliced, increase_num = get_slice_sizes(length=length,
+                                                  slice_ratio=slice_ratio)
+    stride_n, stride_length = data_x.strides
+    return np.lib.stride_tricks.as_strided(
+        data_x, shape=(n, increase_num, length_sliced),
+        strides=(stride_n, stride_length, stride_length), writeable=False)
+
+
+class SlicedDataset(object):
+    """
+    The window slicing augmentation drawn on demand.
+
+    The windows are the strided view of the original time-series, so the
+    dataset takes no more memory than the original data. A window (or a batch
+    of windows) is copied only when it is requested. The dataset can be used
+    directly with the torch.utils.data.DataLoader.
+    """
+
+    def __init__(self, data_x, data_y, slice_ratio=1):
+        """
+        :param data_x: the time-series (n, length).
+        :param data_y: the labels (n).
+        :param slice_ratio: the length of a window relative to the time-series.
+        """
+        self.windows = slice_data_view(data_x, slice_ratio=slice_ratio)
+        self.labels = np.asarray(data_y)
+        n, self.increase_num, self.length_sliced = self.windows.shape
+        if n != len(self.labels):
+            raise Exception(
+                f"The number of time-series: {n} and labels: "
+                f"{len(self.labels)} differ.")
+
+    def __len__(self):
+        return self.windows.shape[0] * self.increase_num
+
+    def __getitem__(self, index):
+        """
+        :param index: the index of a window (or an array of indexes for a
+        batch), ordered as in slice_data.
+        :return: the window (a copy) and its label.
+        """
+        i, j = np.divmod(index, self.increase_num)
+        return np.array(self.windows[i, j]), self.labels[i]
+
+    def get_window_labels(self):
+        """
+        :return: the label of each window (ordered as in slice_data).
+        """
+        return np.repeat(self.labels, self.increase_num)
+
+
 def slice_data(data_x, data_y, slice_ratio=1):
     # return the sliced dataset
     if slice_ratio == 1:
         return data_x, data_y
     n = data_x.shape[0]
-    length = data_x.shape[1]
-    length_sliced = int(length * slice_ratio)
-
-    increase_num = length - length_sliced + 1  # if increase_num =5, it means one ori becomes 5 new instances.
+    windows = slice_data_view(data_x, slice_ratio=slice_ratio)
+    _, increase_num, length_sliced = windows.shape
     n_sliced = n * increase_num
-    # print "*increase num", increase_num
-    # print "*new length", n_sliced, "orginal len", n
-
-    new_x = np.zeros((n_sliced, length_sliced))
-    new_y = np.zeros((n_sliced))
-    for i in range(n):
-        for j in range(increase_num):
-            new_x[i * increase_num + j, :] = data_x[i, j: j + length_sliced]
-            new_y[i * increase_num + j] = np.int_(data_y[i].astype(np.float32))
+    # A single vectorized copy of all the windows.
+    new_x = np.array(windows, dtype=np.float64).reshape(n_sliced,
+                                                        length_sliced)
+    new_y = np.repeat(np.int_(np.asarray(data_y).astype(np.float32)),
+                      increase_num).astype(np.float64)
     return new_x, new_y
@@ -0,0 +1,51 @@
+import unittest
+import numpy as np
+from cnns.nnlib.load_time_series import slice_data
+from cnns.nnlib.load_time_series import slice_data_view
+from cnns.nnlib.load_time_series import SlicedDataset
+
+
+def slice_data_loops(data_x, data_y, slice_ratio):
+    n, length = data_x.shape
+    length_sliced = int(length * slice_ratio)
+    increase_num = length - length_sliced + 1
+    new_x = np.zeros((n * increase_num, length_sliced))
+    new_y = np.zeros((n * increase_num))
+    for i in range(n):
+        for j in range(increase_num):
+            new_x[i * increase_num + j, :] = data_x[i, j: j + length_sliced]
+            new_y[i * increase_num + j] = np.int_(data_y[i].astype(np.float32))
+    return new_x, new_y
+
+
+class TestSliceData(unittest.TestCase):
+
+    def setUp(self):
+        self.x = np.random.randn(7, 40).astype(np.float32)
+        self.y = np.random.randint(0, 3, 7).astype(np.float32)
+        self.slice_ratio = 0.9
+
+    def test_slice_data(self):
+        expect_x, expect_y = slice_data_loops(self.x, self.y, self.slice_ratio)
+        x, y = slice_data(self.x, self.y, self.slice_ratio)
+        np.testing.assert_array_equal(expect_x, x)
+        np.testing.assert_array_equal(expect_y, y)
+
+    def test_slice_data_view_no_copy(self):
+        windows = slice_data_view(self.x, self.slice_ratio)
+        self.assertTrue(np.shares_memory(windows, self.x))
+        self.assertFalse(windows.flags.writeable)
+
+    def test_sliced_dataset(self):
+        expect_x, expect_y = slice_data_loops(self.x, self.y, self.slice_ratio)
+        dataset = SlicedDataset(self.x, self.y, self.slice_ratio)
+        self.assertEqual(len(expect_x), len(dataset))
+        for index in [0, 3, 4, 17, len(dataset) - 1]:
+            window, label = dataset[index]
+            np.testing.assert_array_equal(expect_x[index], window)
+            self.assertEqual(expect_y[index], label)
+        np.testing.assert_array_equal(expect_y, dataset.get_window_labels())
+
+
+if __name__ == '__main__':
+    unittest.main()
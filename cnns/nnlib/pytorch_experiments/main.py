@@ -32,6 +32,8 @@ from cnns.nnlib.utils.general_utils import get_log_time
 from cnns.nnlib.datasets.mnist.mnist import get_mnist
 from cnns.nnlib.datasets.synthetic.synthetic import get_synthetic
 from cnns.nnlib.datasets.cifar import get_cifar
+from cnns.nnlib.datasets.transformations.batch_compression import \
+    get_batch_transform
 from cnns.nnlib.datasets.svhn import get_svhn
 from cnns.nnlib.datasets.ucr.ucr import get_ucr
 from cnns.nnlib.datasets.imagenet.imagenet_pytorch import load_imagenet
@@ -45,6 +47,16 @@ from cnns.nnlib.datasets.deeprl.rollouts import get_rollouts_dataset
 from cnns.nnlib.robustness.channels.channels_definition import \
     compress_svd_batch
 from cnns.nnlib.utils.general_utils import NetworkType
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import expand_grid
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import apply_job
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import get_job_key
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import get_args_job_key
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import read_done_jobs
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import append_line
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import get_sweep_workers
+from cnns.nnlib.pytorch_experiments.utils.sweep_utils import run_sweep
+from cnns.nnlib.pytorch_layers.conv_profiler import conv_profiler
+from cnns.nnlib.pytorch_layers.conv_profiler import set_conv_profiler
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -150,6 +162,7 @@ def train(model, train_loader, optimizer, loss_function, args, epoch=None):
     train_loss = 0
     correct = 0
     total = 0
+    batch_transform = get_batch_transform(args)
 
     for batch_idx, (data, target) in enumerate(train_loader):
         # fp16 (apex) - the data is cast explicitely to fp16 via data.to() method.
@@ -162,13 +175,12 @@ def train(model, train_loader, optimizer, loss_function, args, epoch=None):
             output = model(data)
         else:
             data = data.to(device=args.device, dtype=args.dtype)
+            if batch_transform is not None:
+                data = batch_transform(data)
             output = model(data)
 
         target = target.to(device=args.device)
 
-        # if args.svd_transform > 0.0:
-        #     compress_svd_batch(x=data, compress_rate=args.svd_transform)
-
         loss = loss_function(output, target)
 
         # The cross entropy loss combines `log_softmax` and `nll_loss` in
@@ -244,6 +256,7 @@ def test(model, test_loader, loss_function, args, epoch=None):
     test_loss = 0
     correct = 0
     total = 0
+    batch_transform = get_batch_transform(args)
     with torch.no_grad():
         for batch_idx, (data, target) in enumerate(test_loader):
             if isinstance(data, dict):
@@ -253,13 +266,12 @@ def test(model, test_loader, loss_function, args, epoch=None):
                 output = model(data)
             else:
                 data = data.to(device=args.device, dtype=args.dtype)
+                if batch_transform is not None:
+                    data = batch_transform(data)
                 output = model(data)
 
             target = target.to(args.device)
 
-            # if args.svd_transform > 0.0:
-            #     compress_svd_batch(x=data, compress_rate=args.svd_transform)
-
             # sum up batch loss
             test_loss += loss_function(output, target.squeeze()).item()
 
@@ -497,6 +509,9 @@ def main(args):
                     args.compress_rate) + "\n")
         return
 
+    set_conv_profiler(args)
+    conv_profiler.reset()
+
     dataset_start_time = time.time()
     dev_loss = min_dev_los = sys.float_info.max
     dev_accuracy = 0.0
@@ -598,12 +613,71 @@ def main(args):
         #         max_test_accuracy) + "-compress-rate-" + str(
         #         args.compress_rate) + "-" + "checkpoint.tar")
 
-    with open(global_log_file, "a") as file:
-        file.write(dataset_name + "," + str(min_train_loss) + "," + str(
-            max_train_accuracy) + "," + str(min_dev_loss) + "," + str(
-            max_dev_accuracy) + "," + str(min_test_loss) + "," + str(
-            max_test_accuracy) + "," + str(
-            time.time() - dataset_start_time) + "\n")
+    # A single (locked) write per job, the job key in the additional_info
+    # column is used to resume the sweep.
+    append_line(global_log_file,
+                dataset_name + "," + str(min_train_loss) + "," + str(
+                    max_train_accuracy) + "," + str(min_dev_loss) + "," + str(
+                    max_dev_accuracy) + "," + str(min_test_loss) + "," + str(
+                    max_test_accuracy) + "," + str(
+                    time.time() - dataset_start_time) + "," +
+                get_args_job_key(args) + "\n")
+
+    if args.profile_conv:
+        conv_profiler.export(os.path.join(
+            results_folder_name,
+            get_log_time() + "-dataset-" + str(dataset_name) + "-" +
+            args.profile_conv_file))
+
+
+def run_job(job):
+    """
+    Run a single job from the sweep over the grid of the hyper-parameters.
+
+    :param job: the values of the hyper-parameters (see: expand_grid).
+    """
+    apply_job(args, job)
+    dataset_name = job['dataset_name']
+    print("compress rate: ", args.compress_rate)
+    print("Dataset: ", dataset_name)
+    print("preserve energy: ", args.preserve_energy)
+    print("noise sigma: ", args.noise_sigma)
+    print('svd transform: ', args.svd_transform)
+    print('fft transform: ', args.fft_transform)
+    start_training = time.time()
+    try:
+        main(args=args)
+    except RuntimeError as err:
+        print(f"ERROR: {dataset_name}. "
+              "Details: " + str(err))
+        traceback.print_tb(err.__traceback__)
+    print("elapsed time (sec): ",
+          time.time() - start_training)
+
+
+def init_worker(log_file, header, slot):
+    """
+    Initialize a process from the pool that runs the jobs of the sweep.
+
+    :param log_file: the global log file of the sweep.
+    :param header: the header with the metadata of the sweep.
+    :param slot: the number of the worker, selects the cuda device.
+    """
+    global global_log_file, HEADER, amp_handle
+    global_log_file = log_file
+    HEADER = header
+    if args.use_cuda and torch.cuda.is_available():
+        device_id = slot % torch.cuda.device_count()
+        torch.cuda.set_device(device_id)
+        args.device = torch.device("cuda", device_id)
+    else:
+        # Do not oversubscribe the cores with the threads of each worker.
+        torch.set_num_threads(
+            max(1, os.cpu_count() // get_sweep_workers(args)))
+    if args.precision_type is PrecisionType.AMP:
+        from apex import amp
+
+        amp_handle = amp.init(enabled=True)
 
 
 if __name__ == '__main__':
@@ -616,8 +690,12 @@ if __name__ == '__main__':
     except KeyError:
         cuda_visible_devices = 0
 
-    global_log_file = os.path.join(results_folder_name,
-                                   get_log_time() + "-ucr-fcnn.log")
+    if args.sweep_log_file:
+        # Resume the sweep from the previous global log file.
+        global_log_file = args.sweep_log_file
+    else:
+        global_log_file = os.path.join(results_folder_name,
+                                       get_log_time() + "-ucr-fcnn.log")
     args_str = args.get_str()
     print('args: ', args_str)
     HEADER = "hostname," + str(
@@ -685,52 +763,18 @@ if __name__ == '__main__':
 
     print("flist: ", flist)
     print('ucr path: ', args.ucr_path)
-    compress_rate = 0
-    for compress_rate in args.compress_rates:
-        # for noise_epsilon in args.noise_epsilons:
-        # args.noise_epsilon = noise_epsilon
-        print("compress rate: ", compress_rate)
-
-        # This is to run many experiments and get a single file with answers.
-        # This assumes that we use only a single additional laver for the
-        # ResNet network.
-        args.compress_rate = compress_rate
-
-        # compression techniques
-        if args.attack_type == AttackType.GAUSS_ONLY:
-            args.compress_fft_layer = compress_rate
-        if args.attack_type == AttackType.ROUND_ONLY:
-            args.values_per_channel = compress_rate
-        if args.attack_type == AttackType.SVD_ONLY:
-            args.svd_compress = compress_rate
-
-        for dataset_name in flist:
-            args.dataset_name = dataset_name
-            print("Dataset: ", dataset_name)
-            for preserve_energy in args.preserve_energies:
-                print("preserve energy: ", preserve_energy)
-                args.preserve_energy = preserve_energy
-                for noise_sigma in args.noise_sigmas:
-                    print("noise sigma: ", noise_sigma)
-                    args.noise_sigma = noise_sigma
-                    for noise_epsilon in args.noise_epsilons:
-                        args.noise_epsilon = noise_epsilon
-                        for laplace_epsilon in args.laplace_epsilons:
-                            args.laplace_epsilon = laplace_epsilon
-                            for svd_transform in args.svd_compress_transform:
-                                args.svd_transform = svd_transform
-                                print('svd transform: ', svd_transform)
-                                for fft_transform in args.fft_compress_transform:
-                                    args.fft_transform = fft_transform
-                                    print('fft transform: ', fft_transform)
-                                    start_training = time.time()
-                                    try:
-                                        main(args=args)
-                                    except RuntimeError as err:
-                                        print(f"ERROR: {dataset_name}. "
-                                              "Details: " + str(err))
-                                        traceback.print_tb(err.__traceback__)
-                                    print("elapsed time (sec): ",
-                                          time.time() - start_training)
+    jobs = expand_grid(args=args, flist=flist)
+    done_jobs = read_done_jobs(global_log_file)
+    jobs = [job for job in jobs if get_job_key(job) not in done_jobs]
+    print("jobs to run: ", len(jobs), " already done: ", len(done_jobs))
+
+    if torch.cuda.is_available():
+        device_count = torch.cuda.device_count()
+    else:
+        device_count = 0
+    workers = get_sweep_workers(args=args, device_count=device_count)
+    print("sweep workers: ", workers)
+    run_sweep(jobs=jobs, run_job=run_job, workers=workers,
+              init_worker=init_worker, init_args=(global_log_file, HEADER))
 
     print("total elapsed time (sec); ", time.time() - start_time)
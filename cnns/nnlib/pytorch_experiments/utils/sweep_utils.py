@@ -0,0 +1,195 @@
+"""
+Run the grid of experiments from main.py (compress rates x datasets x preserve
+energies x noise sigmas x noise epsilons x laplace epsilons x svd/fft
+transforms) as separate jobs, serially or on a pool of processes.
+
+Each finished job appends a single line to the global log file. The line ends
+with the job key, so that an interrupted sweep can be resumed from the same
+log file and skip the grid points that were already done.
+"""
+import os
+import multiprocessing
+from cnns.nnlib.utils.general_utils import AttackType
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# The order of the parameters follows the order of the nested loops in the
+# original main.py, so the serial sweep runs the jobs in the same order.
+SWEEP_PARAMS = ['compress_rate',
+                'dataset_name',
+                'preserve_energy',
+                'noise_sigma',
+                'noise_epsilon',
+                'laplace_epsilon',
+                'svd_transform',
+                'fft_transform']
+
+JOB_KEY_PREFIX = "job:"
+
+
+def expand_grid(args, flist):
+    """
+    Expand the grid of the hyper-parameters into a list of jobs.
+
+    :param args: the general arguments for a program.
+    :param flist: the names of the datasets.
+    :return: a list of jobs, each job is a dict from the name of the
+    parameter (from SWEEP_PARAMS) to its value.
+    """
+    jobs = []
+    for compress_rate in args.compress_rates:
+        for dataset_name in flist:
+            for preserve_energy in args.preserve_energies:
+                for noise_sigma in args.noise_sigmas:
+                    for noise_epsilon in args.noise_epsilons:
+                        for laplace_epsilon in args.laplace_epsilons:
+                            for svd_transform in args.svd_compress_transform:
+                                for fft_transform in args.fft_compress_transform:
+                                    jobs.append({
+                                        'compress_rate': compress_rate,
+                                        'dataset_name': dataset_name,
+                                        'preserve_energy': preserve_energy,
+                                        'noise_sigma': noise_sigma,
+                                        'noise_epsilon': noise_epsilon,
+                                        'laplace_epsilon': laplace_epsilon,
+                                        'svd_transform': svd_transform,
+                                        'fft_transform': fft_transform})
+    return jobs
+
+
+def apply_job(args, job):
+    """
+    Set the values of the parameters from the job in args.
+
+    :param args: the general arguments for a program.
+    :param job: the job from the expanded grid.
+    """
+    for name in SWEEP_PARAMS:
+        setattr(args, name, job[name])
+
+    # This is to run many experiments and get a single file with answers.
+    # This assumes that we use only a single additional laver for the
+    # ResNet network.
+    compress_rate = job['compress_rate']
+    if args.attack_type == AttackType.GAUSS_ONLY:
+        args.compress_fft_layer = compress_rate
+    if args.attack_type == AttackType.ROUND_ONLY:
+        args.values_per_channel = compress_rate
+    if args.attack_type == AttackType.SVD_ONLY:
+        args.svd_compress = compress_rate
+
+
+def get_job_key(job):
+    """
+    :param job: the job from the expanded grid.
+    :return: the unique key of the job (without any commas, so that it can be
+    stored in a column of the global log file).
+
+    >>> get_job_key({'compress_rate': 0, 'dataset_name': 'Adiac',
+    ... 'preserve_energy': 100, 'noise_sigma': 0, 'noise_epsilon': 0.0,
+    ... 'laplace_epsilon': 0.0, 'svd_transform': 0.0, 'fft_transform': 0.0})
+    'job:compress_rate=0|dataset_name=Adiac|preserve_energy=100|noise_sigma=0|noise_epsilon=0.0|laplace_epsilon=0.0|svd_transform=0.0|fft_transform=0.0'
+    """
+    return JOB_KEY_PREFIX + "|".join(
+        [name + "=" + str(job[name]) for name in SWEEP_PARAMS])
+
+
+def get_args_job_key(args):
+    """
+    :param args: the general arguments for a program (with the values of the
+    current job).
+    :return: the key of the job that is executed with the args.
+    """
+    return get_job_key({name: getattr(args, name) for name in SWEEP_PARAMS})
+
+
+def read_done_jobs(log_file):
+    """
+    :param log_file: the global log file of the sweep.
+    :return: the set of keys for the jobs that are already in the log file.
+    """
+    done = set()
+    if not os.path.exists(log_file):
+        return done
+    with open(log_file, "r") as file:
+        for line in file:
+            for column in line.strip().split(","):
+                if column.startswith(JOB_KEY_PREFIX):
+                    done.add(column)
+    return done
+
+
+def append_line(log_file, line):
+    """
+    Append the line to the log file as a single write, so that the lines
+    from the concurrent jobs do not interleave.
+
+    :param log_file: the log file.
+    :param line: the line to be appended (with the new line character).
+    """
+    with open(log_file, "a") as file:
+        if fcntl is not None:
+            fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            file.write(line)
+            file.flush()
+            os.fsync(file.fileno())
+        finally:
+            if fcntl is not None:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def get_sweep_workers(args, device_count=0):
+    """
+    :param args: the general arguments for a program.
+    :param device_count: the number of available cuda devices.
+    :return: the number of processes for the sweep: 0 - run the jobs serially
+    in the current process, -1 - as many processes as cores (or as cuda
+    devices times the number of slots per device).
+    """
+    workers = args.sweep_workers
+    if workers == -1:
+        if args.use_cuda and device_count > 0:
+            workers = device_count * args.sweep_device_slots
+        else:
+            workers = os.cpu_count()
+    return workers
+
+
+def run_sweep(jobs, run_job, workers=0, init_worker=None, init_args=()):
+    """
+    Run the jobs serially or on a pool of processes.
+
+    :param jobs: the jobs from the expanded grid.
+    :param run_job: the function that executes a single job (it has to be a
+    module level function, so that it can be pickled).
+    :param workers: the number of processes (0 or 1 - run serially).
+    :param init_worker: the function to initialize each worker process, it
+    gets the init_args and the slot number of the worker (from 0 to
+    workers - 1), e.g. to select the cuda device.
+    :param init_args: the arguments for the init_worker.
+    """
+    if workers <= 1:
+        for job in jobs:
+            run_job(job)
+        return
+
+    # Spawn (instead of fork) the processes since cuda cannot be used in
+    # the forked processes.
+    context = multiprocessing.get_context('spawn')
+    slots = context.Queue()
+    for slot in range(workers):
+        slots.put(slot)
+    with context.Pool(processes=workers, initializer=_init_slot,
+                      initargs=(slots, init_worker, init_args)) as pool:
+        for _ in pool.imap_unordered(run_job, jobs):
+            pass
+
+
+def _init_slot(slots, init_worker, init_args):
+    slot = slots.get()
+    if init_worker is not None:
+        init_worker(*init_args, slot)
@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from cnns.nnlib.utils.arguments import Arguments
+from .sweep_utils import expand_grid
+from .sweep_utils import apply_job
+from .sweep_utils import get_job_key
+from .sweep_utils import get_args_job_key
+from .sweep_utils import read_done_jobs
+from .sweep_utils import append_line
+from .sweep_utils import run_sweep
+from .sweep_utils import get_sweep_workers
+
+# The jobs executed in the current process (for the serial sweep).
+executed = []
+
+
+def record_job(job):
+    executed.append(get_job_key(job))
+
+
+class TestSweepUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.args = Arguments()
+        self.args.compress_rates = [0, 50]
+        self.args.preserve_energies = [100]
+        self.args.noise_sigmas = [0.0]
+        self.args.noise_epsilons = [0.0, 0.1]
+        self.args.laplace_epsilons = [0.0]
+        self.args.svd_compress_transform = [0.0]
+        self.args.fft_compress_transform = [0.0, 10.0]
+        self.flist = ['Adiac', 'Beef', 'Car']
+
+    def test_expand_grid(self):
+        jobs = expand_grid(args=self.args, flist=self.flist)
+        self.assertEqual(2 * 3 * 2 * 2, len(jobs))
+        keys = set([get_job_key(job) for job in jobs])
+        self.assertEqual(len(jobs), len(keys))
+        # The order of the nested loops: compress rate is the outer one.
+        self.assertEqual(0, jobs[0]['compress_rate'])
+        self.assertEqual('Adiac', jobs[0]['dataset_name'])
+        self.assertEqual(10.0, jobs[1]['fft_transform'])
+
+    def test_apply_job(self):
+        job = expand_grid(args=self.args, flist=self.flist)[-1]
+        apply_job(self.args, job)
+        self.assertEqual(get_job_key(job), get_args_job_key(self.args))
+
+    def test_resume_from_log(self):
+        jobs = expand_grid(args=self.args, flist=self.flist)
+        with tempfile.TemporaryDirectory() as log_dir:
+            log_file = os.path.join(log_dir, 'global.log')
+            self.assertEqual(set(), read_done_jobs(log_file))
+            append_line(log_file, "dataset,min_train_loss,additional_info\n")
+            for job in jobs[:5]:
+                append_line(log_file, job['dataset_name'] + ",0.1,0.9," +
+                            get_job_key(job) + "\n")
+            done = read_done_jobs(log_file)
+        self.assertEqual(set([get_job_key(job) for job in jobs[:5]]), done)
+        todo = [job for job in jobs if get_job_key(job) not in done]
+        self.assertEqual(jobs[5:], todo)
+
+    def test_get_sweep_workers(self):
+        self.args.sweep_workers = 0
+        self.assertEqual(0, get_sweep_workers(self.args, device_count=4))
+        self.args.sweep_workers = -1
+        self.args.sweep_device_slots = 2
+        self.args.use_cuda = True
+        self.assertEqual(8, get_sweep_workers(self.args, device_count=4))
+        self.args.use_cuda = False
+        self.assertEqual(os.cpu_count(),
+                         get_sweep_workers(self.args, device_count=4))
+
+    def test_run_sweep_serial(self):
+        del executed[:]
+        jobs = expand_grid(args=self.args, flist=self.flist)
+        run_sweep(jobs=jobs, run_job=record_job, workers=0)
+        self.assertEqual([get_job_key(job) for job in jobs], executed)
+
+
+if __name__ == '__main__':
+    unittest.main()
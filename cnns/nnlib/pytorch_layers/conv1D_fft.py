@@ -20,6 +20,8 @@ import os
 # os.environ['CUDA_VISIBLE_DEVICES'] = '0'
 # os.environ['GPU_DEBUG'] = '0'
 
+from cnns.nnlib.pytorch_layers.fft_filter_cache import FilterSpectrumCache
+from cnns.nnlib.pytorch_layers.fft_tiling import conv_fft_tiled
 from cnns.nnlib.pytorch_layers.pytorch_utils import complex_pad_simple
 from cnns.nnlib.pytorch_layers.pytorch_utils import correlate_fft_signals
 from cnns.nnlib.pytorch_layers.pytorch_utils import fast_jmul
@@ -29,14 +31,15 @@ from cnns.nnlib.pytorch_layers.pytorch_utils import preserve_energy_index_back
 from cnns.nnlib.pytorch_layers.pytorch_utils import pytorch_conjugate
 from cnns.nnlib.pytorch_layers.pytorch_utils import pytorch_conjugate as conj
 from cnns.nnlib.pytorch_layers.pytorch_utils import to_tensor
-from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef_bulk
-from cnns.nnlib.pytorch_layers.pytorch_utils import retain_low_coef
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef_vectorized
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_low_coef_vectorized
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_elem_size
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_tensors
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_step_estimate
 from cnns.nnlib.pytorch_layers.pytorch_utils import cuda_mem_empty
 from cnns.nnlib.pytorch_layers.pytorch_utils import cuda_mem_show
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_spectrum
+from cnns.nnlib.pytorch_layers.pytorch_utils import MockContext
 # from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul_cpp
 from cnns.nnlib.utils.general_utils import additional_log_file, next_power2
 from cnns.nnlib.utils.general_utils import CompressType
@@ -77,7 +80,7 @@ class Conv1dfftFunction(torch.autograd.Function):
     # @profile
     def forward(ctx, input, filter, bias=None, padding=0, stride=1,
                 args=Arguments(), out_size=None, is_manual=tensor([0]),
-                conv_index=None):
+                conv_index=None, filter_cache=None, recompute=False):
         """
         Compute the forward pass for the 1D convolution.
 
@@ -106,6 +109,11 @@ class Conv1dfftFunction(torch.autograd.Function):
         :param is_manual: to check if the backward computation of convolution
         was computed manually.
         :param conv_index: the index of the convolution.
+        :param filter_cache: the FilterSpectrumCache of the layer to reuse the
+        padded, fft-ed and compressed filter (None - no caching).
+        :param recompute: save only the input and the filter (instead of their
+        spectra) for the backward pass and recompute the spectra there, to
+        trade the computation for the memory of the activations.
         :param is_debug: is the debug mode of execution.
         :param compress_type: NO_FILTER - should the filter be compressed or
         only the input signal? BIG_COEF: should we keep only the largest
@@ -118,6 +126,11 @@ class Conv1dfftFunction(torch.autograd.Function):
         """
         Conv1dfftFunction.mark_dirty(input)
 
+        if ctx and recompute:
+            # Keep only the input and filter, the spectra are recomputed in
+            # the backward pass.
+            saved_input, saved_filter = input, filter
+
         # if is_debug:
         #     gpu_profile(frame=sys._getframe(), event='line', arg=None)
 
@@ -364,68 +377,100 @@ class Conv1dfftFunction(torch.autograd.Function):
             # At least 1 coefficient in the filter.
             fft_size_filter = max(1, (half_fft_compressed_size - 1) * 2)
 
-        # fft_padding_filter = fft_size_filter - (WW + 2 * filter_pad)
-        fft_padding_filter = fft_size_filter - WW
-        # We have to pad the filter (at least the filter size - 1).
-        # fft_padding_filter can be a negative number
-        # right_filter_pad = max(filter_pad, filter_pad + fft_padding_filter)
-        right_filter_pad = fft_padding_filter
-        # filter = torch_pad(filter, (filter_pad, right_filter_pad),
-        #                    'constant', 0)
-        filter = torch_pad(filter, (0, right_filter_pad), 'constant', 0)
+        def get_filter_spectrum():
+            """
+            Pad, fft and compress the filter. The compression of the filter
+            depends only on the sizes and the filter itself, so the result
+            can be cached for the inference.
+            """
+            # fft_padding_filter = fft_size_filter - (WW + 2 * filter_pad)
+            fft_padding_filter = fft_size_filter - WW
+            # We have to pad the filter (at least the filter size - 1).
+            # fft_padding_filter can be a negative number
+            # right_filter_pad = max(filter_pad, filter_pad + fft_padding_filter)
+            right_filter_pad = fft_padding_filter
+            # filter = torch_pad(filter, (filter_pad, right_filter_pad),
+            #                    'constant', 0)
+            padded_filter = torch_pad(filter, (0, right_filter_pad),
+                                      'constant', 0)
 
-        if is_debug:
-            cuda_mem_show(info="filter pad")
+            if is_debug:
+                cuda_mem_show(info="filter pad")
 
-        yfft = torch.rfft(filter, signal_ndim=Conv1dfftFunction.signal_ndim,
-                          onesided=True)
-        del filter
-        if is_debug:
-            filter_bank = 0
-            filter_channel = 0
-            yfft_signal = yfft[filter_bank, filter_channel]
-            spectrum = get_spectrum(yfft_signal)
-            filter_spectrum_np = spectrum.cpu().numpy()
-            print("filter_spectrum_np: ", filter_spectrum_np)
-            plot_signal_freq(filter_spectrum_np,
-                             title=f"filter bank {filter_bank}, "
-                             f"filter channel {filter_channel},"
-                             f" conv {conv_index} spectral",
-                             xlabel="Frequency")
-            cuda_mem_show(info="filter fft")
+            yfft = torch.rfft(padded_filter,
+                              signal_ndim=Conv1dfftFunction.signal_ndim,
+                              onesided=True)
+            del padded_filter
+            if is_debug:
+                filter_bank = 0
+                filter_channel = 0
+                yfft_signal = yfft[filter_bank, filter_channel]
+                spectrum = get_spectrum(yfft_signal)
+                filter_spectrum_np = spectrum.cpu().numpy()
+                print("filter_spectrum_np: ", filter_spectrum_np)
+                plot_signal_freq(filter_spectrum_np,
+                                 title=f"filter bank {filter_bank}, "
+                                 f"filter channel {filter_channel},"
+                                 f" conv {conv_index} spectral",
+                                 xlabel="Frequency")
+                cuda_mem_show(info="filter fft")
+
+            if half_fft_compressed_size is not None:
+                # yfft = yfft[:, :, :half_fft_compressed_size, :]
+                if is_lead_reversed:
+                    yfft_compressed = yfft[..., -half_fft_compressed_size:, :]
+                else:
+                    yfft_compressed = yfft.narrow(
+                        dim=-2, start=0, length=half_fft_compressed_size)
+                del yfft
+                yfft = yfft_compressed
+
+            if is_debug:
+                cuda_mem_show(info="compress filter")
+
+            if compress_type is CompressType.BIG_COEFF:
+                if preserve_energy is not None and preserve_energy < 100:
+                    yfft = retain_big_coef_vectorized(
+                        yfft, preserve_energy=preserve_energy)
+                elif index_back_fft is not None and index_back_fft > 0:
+                    yfft = retain_big_coef_vectorized(yfft,
+                                                      index_back=index_back_fft)
+            elif compress_type is CompressType.LOW_COEFF:
+                if preserve_energy is not None and preserve_energy < 100:
+                    yfft = retain_low_coef_vectorized(
+                        yfft, preserve_energy=preserve_energy)
+                elif index_back_fft is not None and index_back_fft > 0:
+                    yfft = retain_low_coef_vectorized(yfft,
+                                                      index_back=index_back_fft)
+            return yfft
 
         if is_debug:
             print("conv_name," + "conv" + str(conv_index))
 
-        if half_fft_compressed_size is not None:
-            # yfft = yfft[:, :, :half_fft_compressed_size, :]
-            if is_lead_reversed:
-                yfft_compressed = yfft[..., -half_fft_compressed_size:, :]
-            else:
-                yfft_compressed = yfft.narrow(dim=-2, start=0,
-                                              length=half_fft_compressed_size)
-            del yfft
-            yfft = yfft_compressed
-
-        if is_debug:
-            cuda_mem_show(info="compress filter")
+        if filter_cache is None:
+            yfft = get_filter_spectrum()
+        else:
+            yfft = filter_cache.get(
+                filter=filter,
+                key=(fft_size, half_fft_compressed_size, is_lead_reversed,
+                     compress_type, preserve_energy, index_back_fft),
+                compute_spectrum=get_filter_spectrum)
+        del filter
 
         if compress_type is CompressType.BIG_COEFF:
             if preserve_energy is not None and preserve_energy < 100:
-                xfft = retain_big_coef_bulk(xfft,
-                                            preserve_energy=preserve_energy)
-                yfft = retain_big_coef_bulk(yfft,
-                                            preserve_energy=preserve_energy)
+                xfft = retain_big_coef_vectorized(
+                    xfft, preserve_energy=preserve_energy)
             elif index_back_fft is not None and index_back_fft > 0:
-                xfft = retain_big_coef_bulk(xfft, index_back=index_back_fft)
-                yfft = retain_big_coef_bulk(yfft, index_back=index_back_fft)
+                xfft = retain_big_coef_vectorized(xfft,
+                                                  index_back=index_back_fft)
         elif compress_type is CompressType.LOW_COEFF:
             if preserve_energy is not None and preserve_energy < 100:
-                xfft = retain_low_coef(xfft, preserve_energy=preserve_energy)
-                yfft = retain_low_coef(yfft, preserve_energy=preserve_energy)
+                xfft = retain_low_coef_vectorized(
+                    xfft, preserve_energy=preserve_energy)
             elif index_back_fft is not None and index_back_fft > 0:
-                xfft = retain_low_coef(xfft, index_back=index_back_fft)
-                yfft = retain_low_coef(yfft, index_back=index_back_fft)
+                xfft = retain_low_coef_vectorized(xfft,
+                                                  index_back=index_back_fft)
 
         if is_debug is True:
             if half_fft_compressed_size is None:
@@ -614,7 +659,15 @@ class Conv1dfftFunction(torch.autograd.Function):
             ctx.cuda_block_threads = cuda_block_threads
             ctx.half_fft_size = half_fft_size
             ctx.init_xfft_size = init_xfft_size
-            ctx.save_for_backward(xfft, yfft, to_tensor(W), to_tensor(WW),
+            ctx.recompute = recompute
+            if recompute:
+                # for the recomputation of the spectra
+                ctx.stride = stride
+                ctx.out_size = out_size
+                spectra = (saved_input, saved_filter)
+            else:
+                spectra = (xfft, yfft)
+            ctx.save_for_backward(*spectra, to_tensor(W), to_tensor(WW),
                                   to_tensor(fft_size), is_manual,
                                   to_tensor(conv_index),
                                   to_tensor(compress_type.value),
@@ -670,6 +723,16 @@ class Conv1dfftFunction(torch.autograd.Function):
         init_xfft_size = ctx.init_xfft_size
         conv_index = from_tensor(conv_index)  # for the debug/test purposes
 
+        if ctx.recompute:
+            # The input and filter were saved instead of the spectra, so run
+            # the forward pass again to get the spectra.
+            mock_ctx = MockContext()
+            Conv1dfftFunction.forward(
+                mock_ctx, xfft, yfft, None, padding, ctx.stride, args,
+                ctx.out_size, is_manual, conv_index, None)
+            xfft, yfft = mock_ctx.saved_tensors[:2]
+            del mock_ctx
+
         is_debug = from_tensor(is_debug)
         is_debug = True if is_debug == 1 else False
         if is_debug:
@@ -793,17 +856,18 @@ class Conv1dfftFunction(torch.autograd.Function):
 
         elif compress_type is CompressType.BIG_COEFF:
             if preserve_energy is not None and preserve_energy < 100:
-                doutfft = retain_big_coef_bulk(doutfft,
-                                               preserve_energy=preserve_energy)
+                doutfft = retain_big_coef_vectorized(
+                    doutfft, preserve_energy=preserve_energy)
             elif index_back_fft is not None and index_back_fft > 0:
-                doutfft = retain_big_coef_bulk(doutfft,
-                                               index_back=index_back_fft)
+                doutfft = retain_big_coef_vectorized(
+                    doutfft, index_back=index_back_fft)
         elif compress_type is CompressType.LOW_COEFF:
             if preserve_energy is not None and preserve_energy < 100:
-                doutfft = retain_low_coef(doutfft,
-                                          preserve_energy=preserve_energy)
+                doutfft = retain_low_coef_vectorized(
+                    doutfft, preserve_energy=preserve_energy)
             elif index_back_fft is not None and index_back_fft > 0:
-                doutfft = retain_low_coef(doutfft, index_back=index_back_fft)
+                doutfft = retain_low_coef_vectorized(
+                    doutfft, index_back=index_back_fft)
 
         if need_input_grad is True:
             # Initialize gradient output tensors.
@@ -1065,7 +1129,7 @@ class Conv1dfftFunction(torch.autograd.Function):
         if is_debug:
             cuda_mem_show(info="backward end", omit_objs=omit_objs)
 
-        return dx, dw, db, None, None, None, None, None, None
+        return dx, dw, db, None, None, None, None, None, None, None, None
 
 
 class Conv1dfft(Module):
@@ -1081,7 +1145,7 @@ class Conv1dfft(Module):
     def __init__(self, in_channels=None, out_channels=None, kernel_size=None,
                  stride=1, padding=0, dilation=None, groups=None, bias=True,
                  filter_value=None, bias_value=None, is_manual=tensor([0]),
-                 args=Arguments(), out_size=None):
+                 args=Arguments(), out_size=None, recompute_backward=None):
         """
         1D convolution using FFT implemented fully in PyTorch.
 
@@ -1125,6 +1189,10 @@ class Conv1dfft(Module):
         compress the filter. BIG_COEF: preserve only the largest coefficients
         in the frequency domain.
         :param dtype: the data type of PyTorch tensors.
+        :param recompute_backward: save only the input and filter for the
+        backward pass and recompute their spectra there (less memory for the
+        activations, more computation), None - use the
+        args.conv_recompute_backward.
 
         Regarding the stride parameter: the number of pixels between
         adjacent receptive fields in the horizontal and vertical
@@ -1197,6 +1265,15 @@ class Conv1dfft(Module):
         self.is_manual = is_manual
         self.conv_index = Conv1dfft.conv_index_counter
         Conv1dfft.conv_index_counter += 1
+        # The spectrum of the filter is reused in the inference mode.
+        if args is not None and args.fft_filter_cache:
+            self.filter_cache = FilterSpectrumCache()
+        else:
+            self.filter_cache = None
+        if recompute_backward is None:
+            recompute_backward = (args is not None and
+                                  args.conv_recompute_backward)
+        self.recompute_backward = recompute_backward
 
         self.reset_parameters()
 
@@ -1218,9 +1295,26 @@ class Conv1dfft(Module):
         :param input: the input map (e.g., an image)
         :return: the result of 1D convolution
         """
+        if self.args is not None and self.args.conv_tile_size > 0:
+            # Convolve the long time-series tile by tile (overlap-save).
+            return conv_fft_tiled(
+                conv=lambda tiles: self.conv_fft(tiles, padding=0, stride=1,
+                                                 out_size=None),
+                input=input, kernel_size=tuple(self.filter.shape[2:]),
+                padding=self.padding, stride=self.stride,
+                tile_size=self.args.conv_tile_size,
+                stride_type=self.args.stride_type, out_size=self.out_size)
+        return self.conv_fft(input, padding=self.padding, stride=self.stride,
+                             out_size=self.out_size)
+
+    def conv_fft(self, input, padding, stride, out_size):
+        # The weights do not change in the eval mode, so we can reuse the
+        # spectrum of the filter.
+        filter_cache = None if self.training else self.filter_cache
         return Conv1dfftFunction.apply(
-            input, self.filter, self.bias, self.padding, self.stride,
-            self.args, self.out_size, self.is_manual, self.conv_index)
+            input, self.filter, self.bias, padding, stride,
+            self.args, out_size, self.is_manual, self.conv_index,
+            filter_cache, self.recompute_backward)
 
 
 class Conv1dfftAutograd(Conv1dfft):
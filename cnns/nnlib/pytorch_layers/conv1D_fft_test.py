@@ -1718,6 +1718,33 @@ class TestPyTorchConv1d(unittest.TestCase):
             b_torch.grad.cpu().detach().numpy(),
             expected_db)
 
+    def test_recompute_backward(self):
+        x = torch.randn(2, 3, 20, dtype=self.dtype, requires_grad=True)
+        for conv_exec_type in [ConvExecType.BATCH, ConvExecType.SERIAL]:
+            for compress_rate, preserve_energy in [(0, 100), (30, 100),
+                                                   (0, 90)]:
+                args = Arguments(conv_exec_type=conv_exec_type,
+                                 compress_rate=compress_rate,
+                                 preserved_energy=preserve_energy,
+                                 next_power2=False)
+                conv = Conv1dfft(in_channels=3, out_channels=4, kernel_size=3,
+                                 padding=1, bias=True, args=args)
+                conv_recompute = Conv1dfft(filter_value=conv.filter,
+                                           bias_value=conv.bias, padding=1,
+                                           args=args, recompute_backward=True)
+                params = [x, conv.filter, conv.bias]
+                expect = conv(x)
+                expect_grads = torch.autograd.grad(expect.sum(), params)
+                result = conv_recompute(x)
+                result_grads = torch.autograd.grad(result.sum(), params)
+                np.testing.assert_allclose(desired=get_numpy(expect),
+                                           actual=get_numpy(result))
+                for expect_grad, result_grad in zip(expect_grads,
+                                                    result_grads):
+                    np.testing.assert_allclose(
+                        desired=get_numpy(expect_grad),
+                        actual=get_numpy(result_grad))
+
 
 if __name__ == '__main__':
     unittest.main()
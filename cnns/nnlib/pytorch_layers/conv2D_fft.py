@@ -10,7 +10,6 @@ import sys
 import math
 import numpy as np
 import torch
-import time
 from torch import tensor
 from torch.nn import Module
 from torch.nn.functional import pad as torch_pad
@@ -27,6 +26,7 @@ from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul2
 from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul3
 from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul4
 from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul5
+from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul_tiled
 from cnns.nnlib.pytorch_layers.pytorch_utils import to_tensor
 from cnns.nnlib.pytorch_layers.pytorch_utils import cuda_mem_show
 from cnns.nnlib.pytorch_layers.pytorch_utils import compress_2D_index_forward
@@ -37,6 +37,24 @@ from cnns.nnlib.pytorch_layers.pytorch_utils import get_elem_size
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_tensors_elem_size
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_step_estimate
 from cnns.nnlib.pytorch_layers.pytorch_utils import restore_size_2D
+from cnns.nnlib.pytorch_layers.fft_filter_cache import FilterSpectrumCache
+from cnns.nnlib.spectral_pool import spectral_pool_crop
+from cnns.nnlib.pytorch_layers.fft_tiling import conv_fft_tiled
+from cnns.nnlib.pytorch_layers.conv_profiler import conv_profiler
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_PAD
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_RFFT
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_COMPRESSION
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_COMPLEX_MULTIPLY
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_IRFFT
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_BACKWARD
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_BACKWARD_RFFT
+from cnns.nnlib.pytorch_layers.conv_profiler import \
+    STAGE_BACKWARD_INPUT_MULTIPLY
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_BACKWARD_INPUT_IRFFT
+from cnns.nnlib.pytorch_layers.conv_profiler import \
+    STAGE_BACKWARD_FILTER_MULTIPLY
+from cnns.nnlib.pytorch_layers.conv_profiler import \
+    STAGE_BACKWARD_FILTER_IRFFT
 from cnns.nnlib.utils.general_utils import CompressType, next_power2
 from cnns.nnlib.utils.general_utils import ConvExecType
 from cnns.nnlib.utils.general_utils import StrideType
@@ -63,38 +81,6 @@ logger.addHandler(consoleLog)
 
 current_file_name = __file__.split("/")[-1].split(".")[0]
 
-# forward pass
-global_preserve_energy_time = 0.0
-global_correlation_time = 0.0
-global_fft_time = 0.0
-global_irfft_time = 0.0
-global_complex_time = 0.0
-global_permute_time = 0.0
-global_complex_dxfft = 0.0
-global_pad_time = 0.0
-global_counter = 0
-global_conjugate_time = 0.0
-global_restore_time = 0.0
-global_init_time = 0.0
-
-# backward pass
-global_init_time_back = 0.0
-global_irfft_time_back = 0.0
-global_correlation_time_back_filter = 0.0
-global_correlation_time_back_input = 0.0
-global_pad_grad = 0.0
-global_fft_grad = 0.0
-global_correlate_input_grad = 0.0
-global_correlate_filter_grad = 0.0
-global_conjugate_filter = 0.0
-global_restore_input = 0.0
-global_irfft_input = 0.0
-global_restore_filter = 0.0
-global_irfft_filter = 0.0
-
-# global_threshold = 10000
-global_threshold = 5321
-
 
 def fast_multiply(xfft, yfft):
     """
@@ -123,6 +109,303 @@ def fast_multiply(xfft, yfft):
     return outfft
 
 
+def get_layer_compress_rate(args, conv_index):
+    """
+    :param args: the general arguments for a program.
+    :param conv_index: the index of the convolution.
+    :return: the compress rate for the convolutional layer.
+    """
+    compress_rate = args.compress_rate
+    if conv_index is not None and args.layers_compress_rates is not None:
+        if len(args.layers_compress_rates) < conv_index:
+            raise Exception("Not enough compress rates provided for "
+                            "the fft based convolution.")
+        compress_rate = args.layers_compress_rates[conv_index]
+    return compress_rate
+
+
+def get_conv2D_fft_sizes(H, W, HH, WW, padding, stride, out_size,
+                         compress_rate, preserve_energy, stride_type,
+                         use_next_power2):
+    """
+    Check the parameters of the fft based convolution and compute the sizes.
+
+    :param H: the height of the input map.
+    :param W: the width of the input map.
+    :param HH: the height of the filter.
+    :param WW: the width of the filter.
+    :return: pad_H, pad_W, stride_H, stride_W, out_H, out_W (the size of the
+    output), init_H_fft, init_W_fft (the size of the fft) and compress_rate_W.
+
+    >>> get_conv2D_fft_sizes(H=32, W=32, HH=3, WW=3, padding=1, stride=1,
+    ... out_size=None, compress_rate=None, preserve_energy=100,
+    ... stride_type=StrideType.STANDARD, use_next_power2=False)
+    (1, 1, 1, 1, 32, 32, 65, 65, None)
+    """
+    INPUT_ERROR = "Specify only one of: compress_rate, out_size, or " \
+                  "preserve_energy"
+    if (compress_rate is not None and compress_rate > 0) and (
+            out_size is not None):
+        raise TypeError(INPUT_ERROR)
+    if (compress_rate is not None and compress_rate > 0) and (
+            preserve_energy is not None and preserve_energy < 100):
+        raise TypeError(INPUT_ERROR)
+    if out_size is not None and (
+            preserve_energy is not None and preserve_energy < 100):
+        raise TypeError(INPUT_ERROR)
+
+    compress_rate_H, compress_rate_W = get_pair(value=compress_rate,
+                                                val_1_default=None,
+                                                val2_default=None)
+    if compress_rate_H != compress_rate_W:
+        raise Exception(
+            "We only support a symmetric compression in the frequency domain.")
+
+    pad_H, pad_W = get_pair(value=padding, val_1_default=0, val2_default=0,
+                            name="padding")
+
+    if pad_H != pad_W:
+        raise Exception(
+            "We only support a symmetric padding in the frequency domain.")
+
+    out_size_H, out_size_W = get_pair(value=out_size, val_1_default=None,
+                                      val2_default=None, name="out_size")
+
+    if out_size_H != out_size_W:
+        raise Exception(
+            "We only support a symmetric outputs in the frequency domain.")
+
+    stride_H, stride_W = get_pair(value=stride, val_1_default=None,
+                                  val2_default=None, name="stride")
+
+    if stride_H != stride_W:
+        raise Exception(
+            "We only support a symmetric striding in the frequency domain.")
+
+    if out_size_H:
+        out_H = out_size_H
+    elif out_size or stride_type is StrideType.SPECTRAL:
+        out_H = (H - HH + 2 * pad_H) // stride_H + 1
+    else:
+        out_H = H - HH + 1 + 2 * pad_H
+
+    if out_size_W:
+        out_W = out_size_W
+    elif out_size or stride_type is StrideType.SPECTRAL:
+        out_W = (W - WW + 2 * pad_W) // stride_W + 1
+    else:
+        out_W = W - WW + 1 + 2 * pad_W
+
+    if out_H != out_W:
+        raise Exception(
+            "We only support a symmetric compression in the frequency domain.")
+
+    # We have to pad input with (WW - 1) to execute fft correctly (no
+    # overlapping signals) and optimize it by extending the signal to the
+    # next power of 2. We want to reuse the fft-ed input x, so we use the
+    # larger size chosen from: the filter width WW or output width out_W.
+    # Larger padding does not hurt correctness of fft but makes it slightly
+    # slower, in terms of the computation time.
+
+    HHH = max(out_H, HH)
+    init_H_fft = H + 2 * pad_H + HHH - 1
+
+    WWW = max(out_W, WW)
+    init_W_fft = W + 2 * pad_W + WWW - 1
+
+    if use_next_power2 is True:
+        init_H_fft = next_power2(init_H_fft)
+        init_W_fft = next_power2(init_W_fft)
+
+    return (pad_H, pad_W, stride_H, stride_W, out_H, out_W, init_H_fft,
+            init_W_fft, compress_rate_W)
+
+
+def get_index_forward_W_fft(init_half_W_fft, compress_rate_W):
+    """
+    :param init_half_W_fft: the width of the one-sided spectrum.
+    :param compress_rate_W: the percentage of the coefficients to discard.
+    :return: the number of the coefficients to retain in the width (and
+    height) dimension of the spectrum.
+
+    >>> get_index_forward_W_fft(init_half_W_fft=33, compress_rate_W=75)
+    16
+    """
+    retain_rate_W = 100 - compress_rate_W
+    retain_ratio = math.sqrt(retain_rate_W / 100)
+    index_forward_W_fft = int(init_half_W_fft * retain_ratio)
+    # # At least one coefficient is removed.
+    # index_forward_W_fft = min(index_forward_W_fft,
+    #                           init_half_W_fft - 1)
+    return index_forward_W_fft
+
+
+def compress_2D_index_forward_complex(xfft, index_forward):
+    """
+    The compress_2D_index_forward for the native complex tensors.
+
+    :param xfft: the complex spectrum.
+    :param index_forward: how many coefficients are preserved.
+    :return: the compressed complex spectrum.
+    """
+    return torch.view_as_complex(
+        compress_2D_index_forward(torch.view_as_real(xfft), index_forward))
+
+
+def conv2D_fft_native(input, filter, bias=None, padding=(0, 0),
+                      stride=(1, 1), args=Arguments(), out_size=None,
+                      conv_index=None, filter_cache=None, pool_size=None):
+    """
+    Compute the 2D convolution via FFT with the spectra kept as native complex
+    tensors.
+
+    This is the alternative to the Conv2dfftFunction, which keeps the complex
+    numbers in the last dimension of size 2 and multiplies them with many
+    temporary tensors (complex_mul). Here, the spectra of the input and
+    filters are multiplied and summed over the channels in a single complex
+    einsum and the backward pass is computed by autograd.
+
+    :param input: the input map (activation) to the convolution (e.g. an
+    image).
+    :param filter: the filter (a.k.a. kernel of the convolution).
+    :param bias: the bias term for each filter.
+    :param padding: how much to pad each end of the height and width of the
+    input map.
+    :param stride: the stride for the height and width dimensions.
+    :param args: the general arguments for a program.
+    :param out_size: the expected output size (the spectral pooling).
+    :param conv_index: the index of the convolution.
+    :param filter_cache: the FilterSpectrumCache of the layer to reuse the
+    padded, fft-ed and compressed filter (None - no caching).
+    :param pool_size: the (height, width) of the output of the spectral
+    pooling applied to the output of the convolution (the same as the
+    SpectralPool of the out_H x out_W output). The output is a crop of the
+    fft grid of the convolution (the rest holds the wrapped values), so the
+    pooled spectrum of the crop is computed from the spectrum on the grid with
+    small matrices (spectral_pool_crop) instead of the inverse fft of the grid
+    and the fft of the crop.
+    :return: the result of convolution.
+    """
+    # Import it only here, since in PyTorch 1.7 the torch.fft module shadows
+    # the torch.fft function used by the complex_fft type.
+    import torch.fft
+
+    compress_rate = get_layer_compress_rate(args, conv_index)
+    preserve_energy = args.preserve_energy
+    stride_type = args.stride_type
+    if preserve_energy is not None and preserve_energy < 100:
+        raise Exception("The preserve energy compression is not supported "
+                        "for the native complex tensors.")
+    if args.fft_type != "real_fft":
+        raise Exception(f"Unsupported fft type for the native complex "
+                        f"tensors: {args.fft_type}.")
+    if pool_size is not None and (out_size is not None or max(
+            get_pair(stride, val_1_default=1, val2_default=1)) > 1):
+        raise Exception("The fused spectral pooling requires stride 1 and no "
+                        "out_size.")
+
+    N, C, H, W = input.size()
+    F, C, HH, WW = filter.size()
+
+    (pad_H, pad_W, stride_H, stride_W, out_H, out_W, init_H_fft,
+     init_W_fft, compress_rate_W) = get_conv2D_fft_sizes(
+        H=H, W=W, HH=HH, WW=WW, padding=padding, stride=stride,
+        out_size=out_size, compress_rate=compress_rate,
+        preserve_energy=preserve_energy, stride_type=stride_type,
+        use_next_power2=args.next_power2)
+    if pool_size is not None:
+        # The (circular) correlation is exact for the out_H x out_W outputs
+        # already on the (smallest) grid of the padded input.
+        init_H_fft = H + 2 * pad_H
+        init_W_fft = W + 2 * pad_W
+
+    input = torch_pad(
+        input, (pad_W, init_W_fft - W - pad_W, pad_H, init_H_fft - H - pad_H),
+        'constant', 0)
+    xfft = torch.fft.rfftn(input, dim=(-2, -1))
+    del input
+    init_half_W_fft = xfft.shape[-1]
+
+    is_spectral_pool = out_size or stride_type is StrideType.SPECTRAL
+    if compress_rate_W is not None and compress_rate_W > 0:
+        index_forward_W_fft = get_index_forward_W_fft(
+            init_half_W_fft=init_half_W_fft, compress_rate_W=compress_rate_W)
+    else:
+        index_forward_W_fft = None
+
+    def compress(xfft):
+        if is_spectral_pool:
+            xfft = compress_2D_index_forward_complex(xfft, out_W // 2 + 1)
+        if index_forward_W_fft is not None:
+            xfft = compress_2D_index_forward_complex(xfft, index_forward_W_fft)
+        return xfft
+
+    def get_filter_spectrum():
+        padded_filter = torch_pad(
+            filter, (0, init_W_fft - WW, 0, init_H_fft - HH), 'constant', 0)
+        # The correlation is the multiplication by the conjugate spectrum.
+        return compress(torch.fft.rfftn(padded_filter, dim=(-2, -1))).conj()
+
+    if filter_cache is None:
+        yfft = get_filter_spectrum()
+    else:
+        yfft = filter_cache.get(
+            filter=filter,
+            key=("native_complex", init_H_fft, init_W_fft,
+                 bool(is_spectral_pool), out_W, index_forward_W_fft),
+            compute_spectrum=get_filter_spectrum)
+
+    xfft = compress(xfft)
+    # Multiply and sum over the channels: (N, C) x (F, C) -> (N, F).
+    outfft = torch.einsum("nchw,fchw->nfhw", xfft, yfft)
+    del xfft
+    outfft = torch.view_as_complex(restore_size_2D(
+        torch.view_as_real(outfft), init_H_fft=init_H_fft,
+        init_half_W_fft=init_half_W_fft))
+    if pool_size is not None:
+        # Pool the spectrum of the out_H x out_W crop directly from the
+        # spectrum on the fft grid. The bias is constant, so it is added after
+        # the pooling, which preserves the mean.
+        out = spectral_pool_crop(
+            outfft, grid_size=(init_H_fft, init_W_fft),
+            crop_size=(out_H, out_W), out_size=get_pair(pool_size))
+    else:
+        out = torch.fft.irfftn(outfft, s=(init_H_fft, init_W_fft),
+                               dim=(-2, -1))
+        out = out[..., :out_H, :out_W]
+    del outfft
+    if bias is not None:
+        out = out + bias.unsqueeze(-1).unsqueeze(-1)
+    if (stride_H != 1 or stride_W != 1) and (
+            stride_type is StrideType.STANDARD):
+        out = out[:, :, ::stride_H, ::stride_W]
+    return out
+
+
+def to_exec_layout(xfft, yfft, conv_exec_type):
+    """
+    Permute the spectra of the input and the (conjugated) filter to the layout
+    of the complex multiplication for the conv_exec_type.
+
+    :param xfft: the spectrum of the input: N, C, H, W, I.
+    :param yfft: the spectrum of the filter: F, C, H, W, I.
+    :param conv_exec_type: the ConvExecType.
+    :return: xfft and yfft in the layout for the conv_exec_type.
+    """
+    if conv_exec_type is ConvExecType.SGEMM:
+        # xfft: H, W, C, N, I and yfft: H, W, F, C, I
+        return (xfft.permute(2, 3, 1, 0, 4).contiguous(),
+                yfft.permute(2, 3, 0, 1, 4).contiguous())
+    if conv_exec_type in (ConvExecType.CUDA_SHARED_LOG,
+                          ConvExecType.CUDA_DEEP):
+        # xfft: N, H, W, C, I and yfft: F, H, W, C, I
+        return (xfft.permute(0, 2, 3, 1, 4).contiguous(),
+                yfft.permute(0, 2, 3, 1, 4).contiguous())
+    if conv_exec_type is ConvExecType.CUDA:
+        return xfft.contiguous(), yfft.contiguous()
+    return xfft, yfft
+
+
 class Conv2dfftFunction(torch.autograd.Function):
     """
     Implement the 2D convolution via FFT with compression in the spectral domain
@@ -130,13 +413,169 @@ class Conv2dfftFunction(torch.autograd.Function):
     """
     signal_ndim = 2
 
+    @staticmethod
+    def get_spectra(input, filter, args, conv_index, filter_cache, H, W, HH,
+                    WW, pad_H, pad_W, out_W, init_H_fft, init_W_fft,
+                    compress_rate_W, out_size):
+        """
+        Pad, fft and compress the input and the filter.
+
+        It is called in the forward pass and, if the spectra are not stored
+        (the recompute mode), again in the backward pass.
+
+        :return: xfft, the conjugated yfft and the width of the one-sided
+        spectrum.
+        """
+        preserve_energy = args.preserve_energy
+        stride_type = args.stride_type
+        is_debug = args.is_debug
+
+        start_stage = conv_profiler.start()
+
+        # How many padded (zero) values there are because of going to the next
+        # power of 2?
+        fft_padding_input_H = init_H_fft - 2 * pad_H - H
+        fft_padding_input_W = init_W_fft - 2 * pad_W - W
+
+        # Pad only the dimensions for the height and width and neither the data
+        # points (the batch dimension) nor the channels.
+        input = torch_pad(
+            input, (pad_W, pad_W + fft_padding_input_W, pad_H,
+                    pad_H + fft_padding_input_H), 'constant', 0)
+
+        conv_profiler.stop(conv_index, STAGE_PAD, start_stage)
+
+        if args.mem_test:
+            torch.cuda.empty_cache()
+
+        start_stage = conv_profiler.start()
+
+        if args.fft_type == "real_fft":
+            # This is the main fft (real) type. However, PyTorch might run this
+            # slower than the fft complex type.
+            # fft of the input and filters
+            xfft = torch.rfft(input, signal_ndim=Conv2dfftFunction.signal_ndim,
+                              onesided=True)
+            del input
+        else:
+            # build complex tensors with 0 in the imaginary part
+            n, c, h, w = input.size()
+            zeros = torch.zeros(n, c, h, w, 1, dtype=input.dtype,
+                                device=input.device)
+            input.unsqueeze_(-1)
+            input = torch.cat((input, zeros), dim=-1)
+            xfft = torch.fft(input, signal_ndim=Conv2dfftFunction.signal_ndim)
+
+            del input
+
+        # The last dimension (-1) has size 2 as it represents the complex
+        # numbers with real and imaginary parts. The last but one dimension (-2)
+        # represents the length of the signal in the frequency domain.
+        init_half_W_fft = xfft.shape[-2]
+        init_H_fft = xfft.shape[-3]
+
+        is_spectral_pool = out_size or stride_type is StrideType.SPECTRAL
+        is_preserve_energy = preserve_energy is not None and (
+                preserve_energy < 100.0)
+        is_fine_grained_sparsification = False  # this is for tests
+        if compress_rate_W is not None and compress_rate_W > 0 and (
+                not is_fine_grained_sparsification):
+            index_forward_W_fft = get_index_forward_W_fft(
+                init_half_W_fft=init_half_W_fft,
+                compress_rate_W=compress_rate_W)
+        else:
+            index_forward_W_fft = None
+
+        def get_filter_spectrum():
+            """
+            Pad, fft and compress the filter. The compression of the filter
+            depends only on the sizes (besides the preserve energy, which is
+            applied jointly with the input later on), so the result can be
+            cached for the inference.
+            """
+            fft_padding_filter_H = init_H_fft - HH
+            fft_padding_filter_W = init_W_fft - WW
+
+            padded_filter = torch_pad(
+                filter, (0, fft_padding_filter_W, 0, fft_padding_filter_H),
+                'constant', 0)
+
+            if args.fft_type == "real_fft":
+                yfft = torch.rfft(padded_filter,
+                                  signal_ndim=Conv2dfftFunction.signal_ndim,
+                                  onesided=True)
+            else:
+                zeros = torch.zeros(padded_filter.size() + (1,),
+                                    dtype=padded_filter.dtype,
+                                    device=padded_filter.device)
+                padded_filter = torch.cat(
+                    (padded_filter.unsqueeze(-1), zeros), dim=-1)
+                yfft = torch.fft(padded_filter,
+                                 signal_ndim=Conv2dfftFunction.signal_ndim)
+            del padded_filter
+
+            if is_spectral_pool:
+                yfft = compress_2D_index_forward(yfft, out_W // 2 + 1)
+            if not is_preserve_energy and index_forward_W_fft is not None:
+                yfft = compress_2D_index_forward(yfft, index_forward_W_fft)
+            return yfft
+
+        if filter_cache is None:
+            yfft = get_filter_spectrum()
+        else:
+            yfft = filter_cache.get(
+                filter=filter,
+                key=(args.fft_type, init_H_fft, init_W_fft,
+                     bool(is_spectral_pool), out_W, is_preserve_energy,
+                     index_forward_W_fft),
+                compute_spectrum=get_filter_spectrum)
+        del filter
+
+        conv_profiler.stop(conv_index, STAGE_RFFT, start_stage)
+
+        if args.mem_test:
+            torch.cuda.empty_cache()
+
+        start_stage = conv_profiler.start()
+
+        # Pooling either via stride or explicitly via out_size_W.
+        if is_spectral_pool:
+            # We take one-sided fft so the output after the inverse fft should
+            # be out size, thus the representation in the spectral domain is
+            # twice smaller than the one in the spatial domain (the filter
+            # is already compressed).
+            half_fft_W = out_W // 2 + 1
+            xfft = compress_2D_index_forward(xfft, half_fft_W)
+
+        # Compression.
+        if is_preserve_energy:
+            xfft, yfft = preserve_energy2D_symmetry(
+                xfft, yfft, preserve_energy_rate=preserve_energy,
+                is_debug=is_debug)
+
+        elif compress_rate_W is not None and compress_rate_W > 0:
+            if is_fine_grained_sparsification:
+                xfft_spectrum = get_spectrum(xfft)
+                yfft_spectrum = get_spectrum(yfft)
+                for _ in range(compress_rate_W):
+                    xfft, xfft_spectrum = zero_out_min(xfft, xfft_spectrum)
+                    yfft, yfft_spectrum = zero_out_min(yfft, yfft_spectrum)
+            else:
+                # The filter is already compressed (get_filter_spectrum).
+                xfft = compress_2D_index_forward(xfft, index_forward_W_fft)
+
+        conv_profiler.stop(conv_index, STAGE_COMPRESSION, start_stage)
+
+        yfft = pytorch_conjugate(yfft)
+        return xfft, yfft, init_half_W_fft
+
     @staticmethod
     def forward(
             ctx, input, filter, bias=None,
             padding=(0, 0), stride=(1, 1),
             args=Arguments(), out_size=None,
             is_manual=tensor([0]),
-            conv_index=None):
+            conv_index=None, filter_cache=None, recompute=False):
         """
         Compute the forward pass for the 2D convolution.
 
@@ -170,6 +609,11 @@ class Conv2dfftFunction(torch.autograd.Function):
         :param is_manual: to check if the backward computation of convolution
         was computed manually.
         :param conv_index: the index of the convolution.
+        :param filter_cache: the FilterSpectrumCache of the layer to reuse the
+        padded, fft-ed and compressed filter (None - no caching).
+        :param recompute: save only the input and the filter (instead of their
+        spectra) for the backward pass and recompute the spectra there, to
+        trade the computation for the memory of the activations.
         :param is_debug: is the debug mode of execution.
         :param compress_type: NO_FILTER - should the filter be compressed or
         only the input signal? BIG_COEF: should we keep only the largest
@@ -187,12 +631,7 @@ class Conv2dfftFunction(torch.autograd.Function):
         if args.mem_test:
             torch.cuda.empty_cache()
 
-        compress_rate = args.compress_rate
-        if conv_index is not None and args.layers_compress_rates is not None:
-            if len(args.layers_compress_rates) < conv_index:
-                raise Exception("Not enough compress rates provided for "
-                                "the fft based convolution.")
-            compress_rate = args.layers_compress_rates[conv_index]
+        compress_rate = get_layer_compress_rate(args, conv_index)
         preserve_energy = args.preserve_energy
         use_next_power2 = args.next_power2
         is_debug = args.is_debug
@@ -201,29 +640,6 @@ class Conv2dfftFunction(torch.autograd.Function):
         dtype = input.dtype
         device = input.device
 
-        if is_debug:
-            # print("debug enabled")
-            global global_counter
-            global global_threshold
-            global_counter += 1
-            print("global_counter: ", global_counter)
-
-        if is_debug:
-            global global_init_time
-            start_init_time = time.time()
-
-        INPUT_ERROR = "Specify only one of: compress_rate, out_size, or " \
-                      "preserve_energy"
-        if (compress_rate is not None and compress_rate > 0) and (
-                out_size is not None):
-            raise TypeError(INPUT_ERROR)
-        if (compress_rate is not None and compress_rate > 0) and (
-                preserve_energy is not None and preserve_energy < 100):
-            raise TypeError(INPUT_ERROR)
-        if out_size is not None and (
-                preserve_energy is not None and preserve_energy < 100):
-            raise TypeError(INPUT_ERROR)
-
         # N - number of input maps (or images in the batch).
         # C - number of input channels.
         # H - height of the input map (e.g., height of an image).
@@ -236,190 +652,26 @@ class Conv2dfftFunction(torch.autograd.Function):
         # WW - the width of the filter (its length).
         F, C, HH, WW = filter.size()
 
-        compress_rate_H, compress_rate_W = get_pair(value=compress_rate,
-                                                    val_1_default=None,
-                                                    val2_default=None)
-        if compress_rate_H != compress_rate_W:
-            raise Exception(
-                "We only support a symmetric compression in the frequency domain.")
-
-        pad_H, pad_W = get_pair(value=padding, val_1_default=0, val2_default=0,
-                                name="padding")
-
-        if pad_H != pad_W:
-            raise Exception(
-                "We only support a symmetric padding in the frequency domain.")
-
-        out_size_H, out_size_W = get_pair(value=out_size, val_1_default=None,
-                                          val2_default=None, name="out_size")
-
-        if out_size_H != out_size_W:
-            raise Exception(
-                "We only support a symmetric outputs in the frequency domain.")
-
-        stride_H, stride_W = get_pair(value=stride, val_1_default=None,
-                                      val2_default=None, name="stride")
-
-        if stride_H != stride_W:
-            raise Exception(
-                "We only support a symmetric striding in the frequency domain.")
-
-        if out_size_H:
-            out_H = out_size_H
-        elif out_size or stride_type is StrideType.SPECTRAL:
-            out_H = (H - HH + 2 * pad_H) // stride_H + 1
-        else:
-            out_H = H - HH + 1 + 2 * pad_H
-
-        if out_size_W:
-            out_W = out_size_W
-        elif out_size or stride_type is StrideType.SPECTRAL:
-            out_W = (W - WW + 2 * pad_W) // stride_W + 1
-        else:
-            out_W = W - WW + 1 + 2 * pad_W
-
-        if out_H != out_W:
-            raise Exception(
-                "We only support a symmetric compression in the frequency domain.")
-
-        # We have to pad input with (WW - 1) to execute fft correctly (no
-        # overlapping signals) and optimize it by extending the signal to the
-        # next power of 2. We want to reuse the fft-ed input x, so we use the
-        # larger size chosen from: the filter width WW or output width out_W.
-        # Larger padding does not hurt correctness of fft but makes it slightly
-        # slower, in terms of the computation time.
-
-        HHH = max(out_H, HH)
-        init_H_fft = H + 2 * pad_H + HHH - 1
-
-        WWW = max(out_W, WW)
-        init_W_fft = W + 2 * pad_W + WWW - 1
-
-        if use_next_power2 is True:
-            init_H_fft = next_power2(init_H_fft)
-            init_W_fft = next_power2(init_W_fft)
-
-        if is_debug:
-            global_init_time += time.time() - start_init_time
-            if global_counter % global_threshold == 0:
-                print("global init time: ", global_init_time)
-
-        if is_debug:
-            start_pad_time = time.time()
-
-        # How many padded (zero) values there are because of going to the next
-        # power of 2?
-        fft_padding_input_H = init_H_fft - 2 * pad_H - H
-        fft_padding_input_W = init_W_fft - 2 * pad_W - W
-
-        # Pad only the dimensions for the height and width and neither the data
-        # points (the batch dimension) nor the channels.
-        input = torch_pad(
-            input, (pad_W, pad_W + fft_padding_input_W, pad_H,
-                    pad_H + fft_padding_input_H), 'constant', 0)
-
-        fft_padding_filter_H = init_H_fft - HH
-        fft_padding_filter_W = init_W_fft - WW
-
-        filter = torch_pad(
-            filter, (0, fft_padding_filter_W, 0, fft_padding_filter_H),
-            'constant', 0)
-
-        if is_debug:
-            global global_pad_time
-            global_pad_time += time.time() - start_pad_time
-            if global_counter % global_threshold == 0:
-                print("global pad time: ", global_pad_time)
-
-        if args.mem_test:
-            torch.cuda.empty_cache()
-
-        if is_debug:
-            global global_fft_time
-            start_fft_time = time.time()
-
-        if args.fft_type == "real_fft":
-            # This is the main fft (real) type. However, PyTorch might run this
-            # slower than the fft complex type.
-            # fft of the input and filters
-            xfft = torch.rfft(input, signal_ndim=Conv2dfftFunction.signal_ndim,
-                              onesided=True)
-            del input
-
-            yfft = torch.rfft(filter,
-                              signal_ndim=Conv2dfftFunction.signal_ndim,
-                              onesided=True)
-            del filter
-        else:
-            # build complex tensors with 0 in the imaginary part
-            n, c, h, w = input.size()
-            zeros = torch.zeros(n, c, h, w, 1, dtype=input.dtype,
-                                device=input.device)
-            input.unsqueeze_(-1)
-            filter.unsqueeze(-1)
-            input = torch.cat((input, zeros), dim=-1)
-            filter = torch.cat((filter, zeros), dim=-1)
-            xfft = torch.fft(input, signal_ndim=Conv2dfftFunction.signal_ndim)
-            yfft = torch.fft(filter, signal_ndim=Conv2dfftFunction.signal_ndim)
-
-            del input
-            del filter
-
-        if is_debug:
-            global_fft_time += time.time() - start_fft_time
-            if global_counter % global_threshold == 0:
-                print("(r)fft time: ", global_fft_time)
-
-        if args.mem_test:
-            torch.cuda.empty_cache()
-
-        # The last dimension (-1) has size 2 as it represents the complex
-        # numbers with real and imaginary parts. The last but one dimension (-2)
-        # represents the length of the signal in the frequency domain.
-        init_half_W_fft = xfft.shape[-2]
-        init_H_fft = xfft.shape[-3]
-
-        # Pooling either via stride or explicitly via out_size_W.
-        if out_size or stride_type is StrideType.SPECTRAL:
-            # We take one-sided fft so the output after the inverse fft should
-            # be out size, thus the representation in the spectral domain is
-            # twice smaller than the one in the spatial domain.
-            half_fft_W = out_W // 2 + 1
-            xfft = compress_2D_index_forward(xfft, half_fft_W)
-            yfft = compress_2D_index_forward(yfft, half_fft_W)
-
-        # Compression.
-        if preserve_energy is not None and preserve_energy < 100.0:
-            if is_debug:
-                start_energy = time.time()
-
-            xfft, yfft = preserve_energy2D_symmetry(
-                xfft, yfft, preserve_energy_rate=preserve_energy,
-                is_debug=is_debug)
-
-            if is_debug:
-                global global_preserve_energy_time
-                global_preserve_energy_time += time.time() - start_energy
-                if global_counter % global_threshold == 0:
-                    print("preserve energy time: ", global_preserve_energy_time)
-
-        elif compress_rate_W is not None and compress_rate_W > 0:
-            is_fine_grained_sparsification = False  # this is for tests
-            if is_fine_grained_sparsification:
-                xfft_spectrum = get_spectrum(xfft)
-                yfft_spectrum = get_spectrum(yfft)
-                for _ in range(compress_rate_W):
-                    xfft, xfft_spectrum = zero_out_min(xfft, xfft_spectrum)
-                    yfft, yfft_spectrum = zero_out_min(yfft, yfft_spectrum)
-            else:
-                retain_rate_W = 100 - compress_rate_W
-                retain_ratio = math.sqrt(retain_rate_W / 100)
-                index_forward_W_fft = int(init_half_W_fft * retain_ratio)
-                # # At least one coefficient is removed.
-                # index_forward_W_fft = min(index_forward_W_fft,
-                #                           init_half_W_fft - 1)
-                xfft = compress_2D_index_forward(xfft, index_forward_W_fft)
-                yfft = compress_2D_index_forward(yfft, index_forward_W_fft)
+        (pad_H, pad_W, stride_H, stride_W, out_H, out_W, init_H_fft,
+         init_W_fft, compress_rate_W) = get_conv2D_fft_sizes(
+            H=H, W=W, HH=HH, WW=WW, padding=padding, stride=stride,
+            out_size=out_size, compress_rate=compress_rate,
+            preserve_energy=preserve_energy, stride_type=stride_type,
+            use_next_power2=use_next_power2)
+
+        xfft, yfft, init_half_W_fft = Conv2dfftFunction.get_spectra(
+            input=input, filter=filter, args=args, conv_index=conv_index,
+            filter_cache=filter_cache, H=H, W=W, HH=HH, WW=WW, pad_H=pad_H,
+            pad_W=pad_W, out_W=out_W, init_H_fft=init_H_fft,
+            init_W_fft=init_W_fft, compress_rate_W=compress_rate_W,
+            out_size=out_size)
+
+        if ctx and recompute:
+            # Keep only the input and filter, the spectra are recomputed in
+            # the backward pass.
+            saved_input, saved_filter = input, filter
+        del input
+        del filter
 
         _, _, half_fft_compressed_H, half_fft_compressed_W, _ = xfft.size()
 
@@ -448,19 +700,7 @@ class Conv2dfftFunction(torch.autograd.Function):
         # C, H, W = xfft.size(1), xfft.size(2), xfft.size(3)
         # print(f"C,{C},H,{H},W,{W},C*H*W,{C*H*W}")
 
-        if is_debug:
-            global global_conjugate_time
-            start_conjugate = time.time()
-
-        yfft = pytorch_conjugate(yfft)
-
-        if is_debug:
-            global_conjugate_time += time.time() - start_conjugate
-            if global_counter % global_threshold == 0:
-                print("conjugate time: ", global_conjugate_time)
-
-        if is_debug:
-            start_correlation = time.time()
+        start_stage = conv_profiler.start()
 
         if args.conv_exec_type is ConvExecType.SERIAL:
             # Serially convolve each input map with all filters.
@@ -479,12 +719,11 @@ class Conv2dfftFunction(torch.autograd.Function):
                     # Add the bias term for each filter (it has to be unsqueezed to
                     # the dimension of the out to properly sum up the values).
                     out[nn] += unsqueezed_bias
+            conv_profiler.stop(conv_index, STAGE_COMPLEX_MULTIPLY, start_stage)
         else:
             if args.conv_exec_type is ConvExecType.SGEMM:
-                # We want for xfft: H, W, C, N, I
-                xfft = xfft.permute(2, 3, 1, 0, 4).contiguous()
-                # We want for yfft: H, W, F, C, I
-                yfft = yfft.permute(2, 3, 0, 1, 4).contiguous()
+                # We want for xfft: H, W, C, N, I and for yfft: H, W, F, C, I
+                xfft, yfft = to_exec_layout(xfft, yfft, args.conv_exec_type)
 
                 # result: H, W, F, N, I
                 outfft = fast_multiply(yfft, xfft)
@@ -499,16 +738,12 @@ class Conv2dfftFunction(torch.autograd.Function):
                                           half_fft_compressed_W, 2],
                                          dtype=dtype, device=device)
                     # Move the channels to the last but one dimension.
-                    # We want for xfft: N, H, W, C, I.
-                    xfft = xfft.permute(0, 2, 3, 1, 4).contiguous()
-                    # We want for yfft: F, H, W, C, I.
-                    yfft = yfft.permute(0, 2, 3, 1, 4).contiguous()
-                    # start_complex_time = time.time()
+                    # We want for xfft: N, H, W, C, I and for yfft: F, H, W, C,
+                    # I.
+                    xfft, yfft = to_exec_layout(xfft, yfft,
+                                                args.conv_exec_type)
                     complex_mul_shared_log_cuda(xfft, yfft, outfft)
                     torch.cuda.synchronize()
-                    # global global_complex_time
-                    # global_complex_time += time.time() - start_complex_time
-                    # print("complex multiply time: ", global_complex_time)
                 else:
                     raise Exception("Selected CUDA conv execution but no cuda "
                                     "device is available.")
@@ -519,16 +754,12 @@ class Conv2dfftFunction(torch.autograd.Function):
                                           half_fft_compressed_W, 2],
                                          dtype=dtype, device=device)
                     # Move the channels to the last but one dimension.
-                    # We want for xfft: N, H, W, C, I.
-                    xfft = xfft.permute(0, 2, 3, 1, 4).contiguous()
-                    # We want for yfft: F, H, W, C, I.
-                    yfft = yfft.permute(0, 2, 3, 1, 4).contiguous()
-                    # start_complex_time = time.time()
+                    # We want for xfft: N, H, W, C, I and for yfft: F, H, W, C,
+                    # I.
+                    xfft, yfft = to_exec_layout(xfft, yfft,
+                                                args.conv_exec_type)
                     complex_mul_deep_cuda(xfft, yfft, outfft)
                     torch.cuda.synchronize()
-                    # global global_complex_time
-                    # global_complex_time += time.time() - start_complex_time
-                    # print("complex multiply time: ", global_complex_time)
                 else:
                     raise Exception("Selected CUDA conv execution but no cuda "
                                     "device is available.")
@@ -536,20 +767,16 @@ class Conv2dfftFunction(torch.autograd.Function):
                 if torch.cuda.is_available():
                     # print("complex cuda multiplication")
                     # print("xfft size: ", xfft.size())
-                    # start_complex_time = time.time()
                     outfft = torch.zeros([N, F, half_fft_compressed_H,
                                           half_fft_compressed_W, 2],
                                          dtype=dtype, device=device)
                     # complex_mul_cuda(xfft, yfft, outfft)
-                    xfft = xfft.contiguous()
-                    yfft = yfft.contiguous()
+                    xfft, yfft = to_exec_layout(xfft, yfft,
+                                                args.conv_exec_type)
 
                     complex_mul_stride_no_permute_cuda(xfft, yfft, outfft,
                                                        cuda_block_threads)
                     torch.cuda.synchronize()
-                    # global global_complex_time
-                    # global_complex_time += time.time() - start_complex_time
-                    # print("complex multiply time: ", global_complex_time)
                 else:
                     raise Exception("Selected CUDA conv execution but no cuda "
                                     "device is available.")
@@ -568,6 +795,12 @@ class Conv2dfftFunction(torch.autograd.Function):
             #     # many filters.
             #     xfft_nn = xfft[start:stop]
             #     outfft[start:stop] = complex_mul_cpp(xfft_nn, yfft).sum(dim=2)
+            elif args.conv_exec_type is ConvExecType.BATCH and (
+                    args.conv_memory_budget > 0):
+                # Split the batch, filters and channels into tiles that fit
+                # in the memory budget.
+                outfft = complex_mul_tiled(xfft, yfft,
+                                           memory_budget=args.conv_memory_budget)
             elif args.conv_exec_type is ConvExecType.BATCH:
                 xfft = xfft.unsqueeze(dim=1)
                 # outfft = torch.empty([N, F, C, xfft.shape[2], xfft.shape[3], 2],
@@ -583,29 +816,13 @@ class Conv2dfftFunction(torch.autograd.Function):
                 raise Exception(f"Unknown conv exec "
                                 f"type: {args.conv_exec_type.name}.")
 
-            if is_debug:
-                global global_correlation_time
-                global_correlation_time += time.time() - start_correlation
-                if global_counter % global_threshold == 0:
-                    print("correlation time: ", global_correlation_time)
-
-            if is_debug:
-                start_restore = time.time()
+            conv_profiler.stop(conv_index, STAGE_COMPLEX_MULTIPLY, start_stage)
+            start_stage = conv_profiler.start()
 
             outfft = restore_size_2D(outfft,
                                      init_H_fft=init_H_fft,
                                      init_half_W_fft=init_half_W_fft)
 
-            if is_debug:
-                global global_restore_time
-                global_restore_time += time.time() - start_restore
-                if global_counter % global_threshold == 0:
-                    print("restore time (de-compress/concat output): ",
-                          global_restore_time)
-
-            if is_debug:
-                start_irfft_time = time.time()
-
             if args.fft_type == "real_fft":
                 out = torch.irfft(input=outfft,
                                   signal_ndim=Conv2dfftFunction.signal_ndim,
@@ -617,22 +834,14 @@ class Conv2dfftFunction(torch.autograd.Function):
                 # print("out: ", out)
                 out = out[..., 0]  # retain only the real numbers
 
-            if is_debug:
-                global global_irfft_time
-                global_irfft_time += time.time() - start_irfft_time
-                if global_counter % global_threshold == 0:
-                    print("i(r)fft time: ", global_irfft_time)
-
             del outfft
             out = out[..., :out_H, :out_W]
+            conv_profiler.stop(conv_index, STAGE_IRFFT, start_stage)
             if bias is not None:
                 # Add the bias term for each filter (it has to be unsqueezed to
                 # the dimension of the out to properly sum up the values).
                 out += unsqueezed_bias
 
-        # global global_correlation_time
-        # global_correlation_time += time.time() - start_correlation
-        # print("complex correlation time: ", global_correlation_time)
 
         if args.mem_test:
             torch.cuda.empty_cache()
@@ -668,7 +877,14 @@ class Conv2dfftFunction(torch.autograd.Function):
             ctx.half_fft_compressed_W = half_fft_compressed_W
             ctx.C = C
             ctx.args = args
-            ctx.save_for_backward(xfft, yfft)
+            ctx.recompute = recompute
+            if recompute:
+                # for the recomputation of the spectra
+                ctx.compress_rate_W = compress_rate_W
+                ctx.out_size = out_size
+                ctx.save_for_backward(saved_input, saved_filter)
+            else:
+                ctx.save_for_backward(xfft, yfft)
 
         return out.clone()
 
@@ -708,6 +924,7 @@ class Conv2dfftFunction(torch.autograd.Function):
         stride_W = ctx.stride_W
         ctx.is_manual[0] = 1  # Mark the manual execution of the backward pass.
         conv_index = ctx.conv_index
+        start_backward = conv_profiler.start()
         init_H_fft = ctx.init_H_fft
         init_W_fft = ctx.init_W_fft
         cuda_block_threads = ctx.cuda_block_threads
@@ -715,7 +932,19 @@ class Conv2dfftFunction(torch.autograd.Function):
         half_fft_compressed_W = ctx.half_fft_compressed_W
         C = ctx.C
         args = ctx.args
-        xfft, yfft = ctx.saved_tensors
+        if ctx.recompute:
+            input, filter = ctx.saved_tensors
+            xfft, yfft, _ = Conv2dfftFunction.get_spectra(
+                input=input, filter=filter, args=args, conv_index=conv_index,
+                filter_cache=None, H=H, W=W, HH=HH, WW=WW, pad_H=pad_H,
+                pad_W=pad_W, out_W=out_W, init_H_fft=init_H_fft,
+                init_W_fft=init_W_fft, compress_rate_W=ctx.compress_rate_W,
+                out_size=ctx.out_size)
+            del input
+            del filter
+            xfft, yfft = to_exec_layout(xfft, yfft, args.conv_exec_type)
+        else:
+            xfft, yfft = ctx.saved_tensors
 
         if args.mem_test:
             torch.cuda.empty_cache()
@@ -724,11 +953,6 @@ class Conv2dfftFunction(torch.autograd.Function):
         # if is_debug:
         #     print(f"execute backward pass for convolution index: {conv_index}")
 
-        if is_debug:
-            global global_counter
-            global_counter += 1
-            start_init = time.time()
-
         need_input_grad = ctx.needs_input_grad[0]
         need_filter_grad = ctx.needs_input_grad[1]
         need_bias_grad = ctx.needs_input_grad[2]
@@ -782,43 +1006,22 @@ class Conv2dfftFunction(torch.autograd.Function):
             for ff in range(F):
                 db[ff] += torch.sum(dout[:, ff, :])
 
-        if is_debug:
-            global global_init_time_back
-            global_init_time_back += time.time() - start_init
-            global global_threshold
-            if global_counter % global_threshold == 0:
-                print("global init time back: ", global_init_time_back)
-
-        if is_debug:
-            start_pad_grad = time.time()
+        start_stage = conv_profiler.start()
 
         padded_dout = torch_pad(
             dout, (0, fft_padding_dout_W, 0, fft_padding_dout_H),
             'constant', 0)
         del dout
 
-        if is_debug:
-            global global_pad_grad
-            global_pad_grad += time.time() - start_pad_grad
-            if global_counter % global_threshold == 0:
-                print("pad gradient: ", global_pad_grad)
-
         if args.mem_test:
             torch.cuda.empty_cache()
 
-        if is_debug:
-            start_fft_grad = time.time()
-
         doutfft = torch.rfft(padded_dout,
                              signal_ndim=Conv2dfftFunction.signal_ndim,
                              onesided=True)
         del padded_dout
 
-        if is_debug:
-            global global_fft_grad
-            global_fft_grad += time.time() - start_fft_grad
-            if global_counter % global_threshold == 0:
-                print("fft gradient: ", global_fft_grad)
+        conv_profiler.stop(conv_index, STAGE_BACKWARD_RFFT, start_stage)
 
         if args.mem_test:
             torch.cuda.empty_cache()
@@ -831,20 +1034,10 @@ class Conv2dfftFunction(torch.autograd.Function):
             doutfft = compress_2D_index_forward(doutfft, half_fft_compressed_W)
 
         if need_input_grad:
-            if is_debug:
-                start_conjugate_filter = time.time()
+            start_stage = conv_profiler.start()
 
             yfft = pytorch_conjugate(yfft)
 
-            if is_debug:
-                global global_conjugate_filter
-                global_conjugate_filter += time.time() - start_conjugate_filter
-                if global_counter % global_threshold == 0:
-                    print("conjugate filter: ", global_conjugate_filter)
-
-            if is_debug:
-                start_correlate_input_grad = time.time()
-
             # Initialize gradient output tensors.
             # the x used for convolution was with padding
             if args.conv_exec_type is ConvExecType.SERIAL:
@@ -865,6 +1058,8 @@ class Conv2dfftFunction(torch.autograd.Function):
                     out = torch.sum(out, dim=0)
                     out = torch.unsqueeze(input=out, dim=0)
                     dx[nn] = out
+                conv_profiler.stop(conv_index, STAGE_BACKWARD_INPUT_MULTIPLY,
+                                   start_stage)
             else:
                 if args.conv_exec_type is ConvExecType.SGEMM:
                     # We want for doutfft: H, W, N, F, I
@@ -882,22 +1077,14 @@ class Conv2dfftFunction(torch.autograd.Function):
                                              half_fft_compressed_W, 2],
                                             dtype=dtype, device=device)
 
-                        # global global_permute_time
-                        # start_permute = time.time()
                         # yfft is F, H, W, C -> C, H, W, F
                         yfft = yfft.permute(3, 1, 2, 0, 4).contiguous()
                         # Set the channels of doutfft permute as the last but
                         # one dimension.
                         # N,F,H,W,I -> N, H, W, F, I
                         doutfft = doutfft.permute(0, 2, 3, 1, 4).contiguous()
-                        # global_permute_time += time.time() - start_permute
-                        # print("permute time: ", global_permute_time)
-                        # global global_complex_dxfft
-                        # start_complex = time.time()
                         complex_mul_shared_log_cuda(doutfft, yfft, dxfft)
                         torch.cuda.synchronize()
-                        # global_complex_dxfft += time.time() - start_complex
-                        # print("complex dxfft: ", global_complex_dxfft)
                     else:
                         raise Exception(
                             "Selected CUDA conv execution but no cuda "
@@ -907,22 +1094,14 @@ class Conv2dfftFunction(torch.autograd.Function):
                         dxfft = torch.zeros([N, C, half_fft_compressed_H,
                                              half_fft_compressed_W, 2],
                                             dtype=dtype, device=device)
-                        # global global_permute_time
-                        # start_permute = time.time()
                         # yfft is F, H, W, C -> C, H, W, F
                         yfft = yfft.permute(3, 1, 2, 0, 4).contiguous()
                         # Set the channels of doutfft permute as the last but
                         # one dimension.
                         # N,F,H,W,I -> N, H, W, F, I
                         doutfft = doutfft.permute(0, 2, 3, 1, 4).contiguous()
-                        # global_permute_time += time.time() - start_permute
-                        # print("permute time: ", global_permute_time)
-                        # global global_complex_dxfft
-                        # start_complex = time.time()
                         complex_mul_deep_cuda(doutfft, yfft, dxfft)
                         torch.cuda.synchronize()
-                        # global_complex_dxfft += time.time() - start_complex
-                        # print("complex dxfft: ", global_complex_dxfft)
                     else:
                         raise Exception(
                             "Selected CUDA conv execution but no cuda "
@@ -932,26 +1111,24 @@ class Conv2dfftFunction(torch.autograd.Function):
                         dxfft = torch.zeros([N, C, half_fft_compressed_H,
                                              half_fft_compressed_W, 2],
                                             dtype=dtype, device=device)
-                        # global global_permute_time
-                        # start_permute = time.time()
                         doutfft = doutfft.contiguous()
                         dxfft = dxfft.contiguous()
                         yfft = yfft.permute(1, 0, 2, 3, 4).contiguous()
-                        # global_permute_time += time.time() - start_permute
-                        # print("permute time: ", global_permute_time)
-                        # global global_complex_dxfft
-                        # start_complex = time.time()
 
                         complex_mul_stride_no_permute_cuda(doutfft, yfft, dxfft,
                                                            cuda_block_threads)
                         torch.cuda.synchronize()
-                        # global_complex_dxfft += time.time() - start_complex
-                        # print("complex dxfft: ", global_complex_dxfft)
                     else:
                         raise Exception(
                             "Selected CUDA conv execution but no cuda "
                             "device is available.")
 
+                elif args.conv_exec_type is ConvExecType.BATCH and (
+                        args.conv_memory_budget > 0):
+                    # dxfft[n, c] = sum_f doutfft[n, f] * yfft[f, c]
+                    dxfft = complex_mul_tiled(
+                        doutfft, yfft.transpose(0, 1),
+                        memory_budget=args.conv_memory_budget)
                 elif args.conv_exec_type is ConvExecType.BATCH:
 
                     dxfft = torch.zeros([N, C, half_fft_compressed_H,
@@ -973,41 +1150,22 @@ class Conv2dfftFunction(torch.autograd.Function):
                     raise Exception(f"Unknown conv exec "
                                     f"type: {args.conv_exec_type.name}.")
 
-                if is_debug:
-                    global global_correlate_input_grad
-                    global_correlate_input_grad += time.time() - start_correlate_input_grad
-                    if global_counter % global_threshold == 0:
-                        print("correlate input grad: ",
-                              global_correlate_input_grad)
-
-                if is_debug:
-                    start_restore_input = time.time()
+                conv_profiler.stop(conv_index, STAGE_BACKWARD_INPUT_MULTIPLY,
+                                   start_stage)
+                start_stage = conv_profiler.start()
 
                 dxfft = restore_size_2D(dxfft, init_H_fft=init_H_fft,
                                         init_half_W_fft=init_half_W_fft)
 
-                if is_debug:
-                    global global_restore_input
-                    global_restore_input += time.time() - start_restore_input
-                    if global_counter % global_threshold == 0:
-                        print("restore input back: ", global_restore_input)
-
-                if is_debug:
-                    start_irfft_input = time.time()
-
                 dx = torch.irfft(input=dxfft,
                                  signal_ndim=Conv2dfftFunction.signal_ndim,
                                  signal_sizes=(init_H_fft, init_W_fft),
                                  onesided=True)
                 del dxfft
 
-                if is_debug:
-                    global global_irfft_input
-                    global_irfft_input += time.time() - start_irfft_input
-                    if global_counter % global_threshold == 0:
-                        print("irfft input back: ", global_irfft_input)
-
                 dx = dx[..., pad_H:H + pad_H, pad_W:W + pad_W]
+                conv_profiler.stop(conv_index, STAGE_BACKWARD_INPUT_IRFFT,
+                                   start_stage)
             del yfft
 
         if args.mem_test:
@@ -1042,8 +1200,7 @@ class Conv2dfftFunction(torch.autograd.Function):
             flowing back gradient dout and the input x:
             gradient L / gradient w = [x1, x2, x3, x4] * [dx1, dx2, dx3]
             """
-            if is_debug:
-                start_correlate_filter_grad = time.time()
+            start_stage = conv_profiler.start()
 
             doutfft = pytorch_conjugate(doutfft)
             if args.conv_exec_type is ConvExecType.SERIAL:
@@ -1068,6 +1225,8 @@ class Conv2dfftFunction(torch.autograd.Function):
                     #     "conv"+str(conv_index), out.size(), dw.size(), str(N),
                     #     str(C), str(F)))
                     dw[ff] = out
+                conv_profiler.stop(conv_index, STAGE_BACKWARD_FILTER_MULTIPLY,
+                                   start_stage)
             else:
 
                 if args.conv_exec_type is ConvExecType.SGEMM:
@@ -1162,6 +1321,12 @@ class Conv2dfftFunction(torch.autograd.Function):
                         raise Exception(
                             "Selected CUDA conv execution but no cuda "
                             "device is available.")
+                elif args.conv_exec_type is ConvExecType.BATCH and (
+                        args.conv_memory_budget > 0):
+                    # dwfft[f, c] = sum_n doutfft[n, f] * xfft[n, c]
+                    dwfft = complex_mul_tiled(
+                        doutfft.transpose(0, 1), xfft.transpose(0, 1),
+                        memory_budget=args.conv_memory_budget)
                 elif args.conv_exec_type is ConvExecType.BATCH:
 
                     # 2 is for the complex numbers
@@ -1187,41 +1352,22 @@ class Conv2dfftFunction(torch.autograd.Function):
                     raise Exception(f"Unknown conv exec "
                                     f"type: {args.conv_exec_type.name}.")
 
-                if is_debug:
-                    global global_correlate_filter_grad
-                    global_correlate_filter_grad += time.time() - start_correlate_filter_grad
-                    if global_counter % global_threshold == 0:
-                        print("correlate filter grad: ",
-                              global_correlate_filter_grad)
-
-                if is_debug:
-                    start_restore_filter = time.time()
+                conv_profiler.stop(conv_index, STAGE_BACKWARD_FILTER_MULTIPLY,
+                                   start_stage)
+                start_stage = conv_profiler.start()
 
                 dwfft = restore_size_2D(dwfft, init_H_fft=init_H_fft,
                                         init_half_W_fft=init_half_W_fft)
 
-                if is_debug:
-                    global global_restore_filter
-                    global_restore_filter += time.time() - start_restore_filter
-                    if global_counter % global_threshold == 0:
-                        print("filter restore back: ", global_restore_filter)
-
-                if is_debug:
-                    start_irfft_filter = time.time()
-
                 dw = torch.irfft(input=dwfft,
                                  signal_ndim=Conv2dfftFunction.signal_ndim,
                                  signal_sizes=(init_H_fft, init_W_fft),
                                  onesided=True)
                 del dwfft
 
-                if is_debug:
-                    global global_irfft_filter
-                    global_irfft_filter += time.time() - start_irfft_filter
-                    if global_counter % global_threshold == 0:
-                        print("irfft filter back: ", global_irfft_filter)
-
                 dw = dw[..., :HH, :WW]
+                conv_profiler.stop(conv_index, STAGE_BACKWARD_FILTER_IRFFT,
+                                   start_stage)
         del doutfft
         del xfft
 
@@ -1233,7 +1379,9 @@ class Conv2dfftFunction(torch.autograd.Function):
         # else:
         #     print("dw size: ", dw.size())
 
-        return dx, dw, db, None, None, None, None, None, None
+        conv_profiler.stop(conv_index, STAGE_BACKWARD, start_backward)
+
+        return dx, dw, db, None, None, None, None, None, None, None, None
 
 
 class Conv2dfft(Module):
@@ -1246,7 +1394,8 @@ class Conv2dfft(Module):
     def __init__(self, in_channels=None, out_channels=None, kernel_size=None,
                  stride=1, padding=0, dilation=None, groups=None, bias=False,
                  weight_value=None, bias_value=None, is_manual=tensor([0]),
-                 args=Arguments(), out_size=None):
+                 args=Arguments(), out_size=None, native_complex=None,
+                 recompute_backward=None, pool_size=None):
         """
 
         2D convolution using FFT implemented fully in PyTorch.
@@ -1284,6 +1433,15 @@ class Conv2dfft(Module):
         FFT convolution to the next power of 2.
         :param is_manual: to check if the backward computation of convolution
         was computed manually.
+        :param native_complex: compute the convolution with the native complex
+        tensors (conv2D_fft_native), None - use the args.native_complex.
+        :param recompute_backward: save only the input and filter for the
+        backward pass and recompute their spectra there (less memory for the
+        activations, more computation), None - use the
+        args.conv_recompute_backward.
+        :param pool_size: the (height, width) of the output of the spectral
+        pooling of the output of the convolution (as the SpectralPool),
+        requires the native complex tensors.
 
         Regarding the stride parameter: the number of pixels between
         adjacent receptive fields in the horizontal and vertical
@@ -1352,6 +1510,11 @@ class Conv2dfft(Module):
         self.conv_index = Conv2dfft.conv_index_counter
         Conv2dfft.conv_index_counter += 1
         self.out_size = out_size
+        # The spectrum of the filter is reused in the inference mode.
+        if args is not None and args.fft_filter_cache:
+            self.filter_cache = FilterSpectrumCache()
+        else:
+            self.filter_cache = None
 
         if args is None:
             self.compress_rate = None
@@ -1367,6 +1530,18 @@ class Conv2dfft(Module):
             self.is_debug = args.is_debug
             self.compress_type = args.compress_type
 
+        if native_complex is None:
+            native_complex = args is not None and args.native_complex
+        self.native_complex = native_complex
+        if recompute_backward is None:
+            recompute_backward = (args is not None and
+                                  args.conv_recompute_backward)
+        self.recompute_backward = recompute_backward
+        if pool_size is not None and not native_complex:
+            raise Exception("The fused spectral pooling requires the native "
+                            "complex tensors.")
+        self.pool_size = pool_size
+
         self.reset_parameters()
 
     def reset_parameters(self):
@@ -1403,9 +1578,35 @@ class Conv2dfft(Module):
         # ctx, input, filter, bias, padding = (0, 0), stride = (1, 1),
         # args = None, out_size = None, is_manual = tensor([0]),
         # conv_index = None
+        if self.args is not None and self.args.conv_tile_size > 0:
+            if self.pool_size is not None:
+                raise Exception("The fused spectral pooling is not supported "
+                                "for the tiled fft based convolution.")
+            # Convolve the large inputs tile by tile (overlap-save).
+            return conv_fft_tiled(
+                conv=lambda tiles: self.conv_fft(tiles, padding=0, stride=1,
+                                                 out_size=None),
+                input=input, kernel_size=tuple(self.weight.shape[2:]),
+                padding=self.padding, stride=self.stride,
+                tile_size=self.args.conv_tile_size,
+                stride_type=self.args.stride_type, out_size=self.out_size)
+        return self.conv_fft(input, padding=self.padding, stride=self.stride,
+                             out_size=self.out_size)
+
+    def conv_fft(self, input, padding, stride, out_size):
+        # The weights do not change in the eval mode, so we can reuse the
+        # spectrum of the filter.
+        filter_cache = None if self.training else self.filter_cache
+        if self.native_complex:
+            return conv2D_fft_native(
+                input, self.weight, self.bias, padding=padding,
+                stride=stride, args=self.args, out_size=out_size,
+                conv_index=self.conv_index, filter_cache=filter_cache,
+                pool_size=self.pool_size)
         return Conv2dfftFunction.apply(
-            input, self.weight, self.bias, self.padding, self.stride,
-            self.args, self.out_size, self.is_manual, self.conv_index)
+            input, self.weight, self.bias, padding, stride,
+            self.args, out_size, self.is_manual, self.conv_index,
+            filter_cache, self.recompute_backward)
 
 
 class Conv2dfftAutograd(Conv2dfft):
@@ -1641,10 +1842,13 @@ class Conv2dfftAutograd(Conv2dfft):
         >>> np.testing.assert_array_almost_equal(x=expect, y=result, decimal=5,
         ... err_msg="The expected array x and computed y are not almost equal.")
         """
+        # The cache is bypassed if the autograd has to track the filter.
+        filter_cache = None if self.training else self.filter_cache
         return Conv2dfftFunction.forward(
             ctx=None, input=input, filter=self.weight, bias=self.bias,
             padding=self.padding, stride=self.stride, is_manual=self.is_manual,
-            conv_index=self.conv_index, args=self.args, out_size=self.out_size)
+            conv_index=self.conv_index, args=self.args, out_size=self.out_size,
+            filter_cache=filter_cache)
 
 
 def test_run():
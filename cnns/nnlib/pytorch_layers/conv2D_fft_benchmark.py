@@ -9,6 +9,7 @@ from cnns.nnlib.layers import conv_forward_naive, conv_backward_naive
 from cnns.nnlib.pytorch_layers.conv2D_fft \
     import Conv2dfftAutograd, Conv2dfftFunction, Conv2dfft
 from cnns.nnlib.pytorch_layers.pytorch_utils import MockContext
+from cnns.nnlib.pytorch_layers.conv_profiler import conv_profiler
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_spectrum
 from cnns.nnlib.utils.log_utils import get_logger
 from cnns.nnlib.utils.log_utils import set_up_logging
@@ -518,8 +519,7 @@ class TestBenchmarkConv2d(unittest.TestCase):
         print("input size: ", x.size())
         print("filter size: ", y.size())
         print("padding: ", padding)
-        from .conv2D_fft import global_threshold
-        repetitions = global_threshold
+        repetitions = 5321
         print("repetitions: ", repetitions)
         preserve_energy = 80
         print("preserve energy: ", preserve_energy)
@@ -607,6 +607,15 @@ class TestBenchmarkConv2d(unittest.TestCase):
         speedup_full_pass = full_pass_fft / full_pass_pytorch
         print(f"Pytorch speedup for full pass: {speedup_full_pass}")
 
+        # Break down the fft convolution into its stages.
+        conv_profiler.reset()
+        conv_profiler.enable()
+        convFFT = conv.forward(input=x)
+        convFFT.backward(dout_clone)
+        conv_profiler.disable()
+        for record in conv_profiler.get_records():
+            print(record)
+
         if compress_rate == 0.0 and preserve_energy == 100:
             np.testing.assert_array_almost_equal(x.grad.cpu().detach().numpy(),
                                                  x_expect.grad.cpu().detach().numpy(),
@@ -951,6 +960,83 @@ class TestBenchmarkConv2d(unittest.TestCase):
             print(str(size) + "," + str(elapsed_time))
         print("total time: ", time.time() - start_total)
 
+    def test_native_complex_forward_backward(self):
+        """
+        Compare the fft based convolution with the native complex tensors and
+        with the complex numbers in the last dimension of size 2.
+        """
+        N, C, H, W = 32, 16, 32, 32
+        F, HH, WW = 16, 3, 3
+        repetitions = 10
+        x = torch.randn(N, C, H, W, dtype=self.dtype, device=self.device,
+                        requires_grad=True)
+        for conv_exec_type in [ConvExecType.BATCH, ConvExecType.SGEMM]:
+            args = Arguments(conv_exec_type=conv_exec_type, compress_rate=0,
+                             preserved_energy=100, next_power2=False,
+                             stride_type=StrideType.STANDARD)
+            conv = Conv2dfft(in_channels=C, out_channels=F, kernel_size=HH,
+                             padding=1, bias=True, args=args).to(self.device)
+            conv_native = Conv2dfft(weight_value=conv.weight,
+                                    bias_value=conv.bias, padding=1,
+                                    args=args, native_complex=True)
+            for name, layer in [(conv_exec_type.name, conv),
+                                ("native complex", conv_native)]:
+                # warm-up
+                layer(x).sum().backward()
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+                start = time.time()
+                for _ in range(repetitions):
+                    layer(x).sum().backward()
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+                print(f"{name} forward and backward time (sec): ",
+                      (time.time() - start) / repetitions)
+
+            expect = conv(x)
+            result = conv_native(x)
+            np.testing.assert_allclose(
+                desired=expect.detach().cpu().numpy(),
+                actual=result.detach().cpu().numpy(), rtol=1e-3, atol=1e-4)
+
+    def test_tiled_forward(self):
+        """
+        Compare the fft based convolution of the whole input and of the tiles
+        (overlap-save) for the ImageNet size of the input.
+        """
+        N, C, H, W = 8, 3, 224, 224
+        F, HH, WW = 16, 3, 3
+        repetitions = 3
+        x = torch.randn(N, C, H, W, dtype=self.dtype, device=self.device)
+        expect = None
+        for tile_size in [0, 32, 64, 128]:
+            args = Arguments(conv_exec_type=ConvExecType.BATCH,
+                             compress_rate=0, preserved_energy=100,
+                             next_power2=True, stride_type=StrideType.STANDARD)
+            args.conv_tile_size = tile_size
+            conv = Conv2dfft(in_channels=C, out_channels=F, kernel_size=HH,
+                             padding=1, bias=True, args=args).to(self.device)
+            if expect is not None:
+                conv.weight.data.copy_(expect_conv.weight.data)
+                conv.bias.data.copy_(expect_conv.bias.data)
+            with torch.no_grad():
+                result = conv(x)  # warm-up
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+                start = time.time()
+                for _ in range(repetitions):
+                    conv(x)
+                if self.device.type == "cuda":
+                    torch.cuda.synchronize()
+            print(f"tile size {tile_size} forward time (sec): ",
+                  (time.time() - start) / repetitions)
+            if expect is None:
+                expect, expect_conv = result, conv
+            else:
+                np.testing.assert_allclose(
+                    desired=expect.cpu().numpy(), actual=result.cpu().numpy(),
+                    rtol=1e-3, atol=1e-3)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1866,6 +1866,65 @@ class TestPyTorchConv2d(unittest.TestCase):
                 desired=dw_expect, actual=dw,
                 rtol=rtol, err_msg=self.ERR_MESSAGE_ALL_CLOSE)
 
+    def test_native_complex(self):
+        x = torch.randn(2, 3, 9, 9, dtype=self.dtype, requires_grad=True)
+        for compress_rate, stride, stride_type in [
+                (0, 1, StrideType.STANDARD), (0, 2, StrideType.SPECTRAL),
+                (30, 2, StrideType.STANDARD)]:
+            args = Arguments(conv_exec_type=ConvExecType.BATCH,
+                             compress_rate=compress_rate, preserved_energy=100,
+                             next_power2=False, stride_type=stride_type)
+            conv = Conv2dfft(in_channels=3, out_channels=4, kernel_size=3,
+                             padding=1, stride=stride, bias=True, args=args)
+            conv_native = Conv2dfft(weight_value=conv.weight,
+                                    bias_value=conv.bias, padding=1,
+                                    stride=stride, args=args,
+                                    native_complex=True)
+            params = [x, conv.weight, conv.bias]
+            expect = conv(x)
+            expect_grads = torch.autograd.grad(expect.sum(), params)
+            result = conv_native(x)
+            result_grads = torch.autograd.grad(result.sum(), params)
+            assert_allclose(desired=get_numpy(expect),
+                            actual=get_numpy(result), rtol=1e-4, atol=1e-5)
+            for expect_grad, result_grad in zip(expect_grads, result_grads):
+                assert_allclose(desired=get_numpy(expect_grad),
+                                actual=get_numpy(result_grad), rtol=1e-4,
+                                atol=1e-5)
+
+        args = Arguments(compress_rate=0, preserved_energy=90)
+        conv = Conv2dfft(in_channels=3, out_channels=4, kernel_size=3,
+                         args=args, native_complex=True)
+        with self.assertRaises(Exception):
+            conv(x)
+
+    def test_recompute_backward(self):
+        x = torch.randn(2, 3, 8, 8, dtype=self.dtype, requires_grad=True)
+        for conv_exec_type in [ConvExecType.BATCH, ConvExecType.SGEMM,
+                               ConvExecType.SERIAL]:
+            for compress_rate, preserve_energy in [(0, 100), (30, 100),
+                                                   (0, 90)]:
+                args = Arguments(conv_exec_type=conv_exec_type,
+                                 compress_rate=compress_rate,
+                                 preserved_energy=preserve_energy,
+                                 next_power2=False)
+                conv = Conv2dfft(in_channels=3, out_channels=4, kernel_size=3,
+                                 padding=1, bias=True, args=args)
+                conv_recompute = Conv2dfft(weight_value=conv.weight,
+                                           bias_value=conv.bias, padding=1,
+                                           args=args, recompute_backward=True)
+                params = [x, conv.weight, conv.bias]
+                expect = conv(x)
+                expect_grads = torch.autograd.grad(expect.sum(), params)
+                result = conv_recompute(x)
+                result_grads = torch.autograd.grad(result.sum(), params)
+                assert_allclose(desired=get_numpy(expect),
+                                actual=get_numpy(result))
+                for expect_grad, result_grad in zip(expect_grads,
+                                                    result_grads):
+                    assert_allclose(desired=get_numpy(expect_grad),
+                                    actual=get_numpy(result_grad))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,13 @@
+import math
 import sys
 import torch
 from torch import tensor
+from torch.nn import Module
+from torch.nn import init
+from torch.nn.functional import pad as torch_pad
+from torch.nn.parameter import Parameter
+from cnns.nnlib.pytorch_layers.pytorch_utils import get_pair
+from cnns.nnlib.utils.arguments import Arguments
 
 
 class Winograd(object):
@@ -33,61 +40,11 @@ class Winograd(object):
         """
         Compute Winograd convolution.
 
-        :param input:
-        :param filter:
-        :return: output
+        :param input: the input maps of shape (N, C, H, W).
+        :param filter: the filters of shape (F, C, 3, 3).
+        :return: output of shape (N, F, H - 2, W - 2).
         """
-        N, C, H, W = input.size()
-        K, Cprime, r, rprime = filter.size()
-        assert H == W
-        assert r == rprime
-        assert C == Cprime
-        m = 2
-        a = m + r - 1
-        # TODO pad with zeros the input for perfect tiling and slice the output.
-        if a % m != 0:
-            raise Exception("Only the tiling of 4x4 of the input is accepted.")
-        overlap = r - 1
-        input = torch.transpose(input, 0, 1)
-        assert input.size() == (C, N, H, W)
-        # ntile = int(math.ceil(H//a))
-        # P = N * ntile * ntile
-        T = (W - a) // overlap + 1  # tiles_per_channel
-        P = N * T * T
-        U = torch.zeros(K, C, a, a)
-        V = torch.zeros(C, P, a, a)
-        for k in range(K):
-            for c in range(C):
-                U[k, c] = torch.matmul(Winograd.G,
-                                       torch.matmul(filter[k, c], Winograd.G_T))
-        for n in range(N):
-            for tH in range(T):
-                for tW in range(T):
-                    for c in range(C):
-                        b = n * (T * T) + tH * T + tW
-                        vH = tH * (r - 1)
-                        vW = tW * (r - 1)
-                        V[c, b] = torch.matmul(Winograd.B_T, torch.matmul(
-                            input[c, n, vH:vH + a, vW:vW + a], Winograd.B))
-        M = torch.zeros(K, P, a, a)
-        for k in range(K):
-            for b in range(P):
-                for c in range(C):
-                    M[k, b] += U[k, c] * V[c, b]
-        out_size = H - r + 1
-        Y = torch.zeros(K, N, out_size, out_size)
-        for k in range(K):
-            for n in range(N):
-                for tH in range(T):
-                    for tW in range(T):
-                        b = n * (T * T) + tH * T + tW
-                        oH = tH * m
-                        oW = tW * m
-                        Y[k, n, oH:oH + m, oW:oW + m] = torch.matmul(
-                            Winograd.A_T, torch.matmul(M[k, b], Winograd.A))
-
-        Y = torch.transpose(Y, 0, 1)
-        return Y
+        return conv2D_winograd(input=input, filter=filter, m=2)
 
     @staticmethod
     def winograd_F_2_3(input, filter):
@@ -116,6 +73,208 @@ class Winograd(object):
         return input * filter
 
 
+# The transforms for F(m x m, 3 x 3): m -> (B_T, G, A_T), based on: Lavin and
+# Gray, "Fast Algorithms for Convolutional Neural Networks", 2015. They are
+# kept in double precision (e.g. 1/6) and cast to the dtype of the input.
+WINOGRAD_TRANSFORMS = {
+    2: (Winograd.B_T,
+        Winograd.G,
+        Winograd.A_T),
+    4: (tensor(
+        [[4.0, 0.0, -5.0, 0.0, 1.0, 0.0],
+         [0.0, -4.0, -4.0, 1.0, 1.0, 0.0],
+         [0.0, 4.0, -4.0, -1.0, 1.0, 0.0],
+         [0.0, -2.0, -1.0, 2.0, 1.0, 0.0],
+         [0.0, 2.0, -1.0, -2.0, 1.0, 0.0],
+         [0.0, 4.0, 0.0, -5.0, 0.0, 1.0]], dtype=torch.double),
+        tensor(
+            [[1 / 4, 0.0, 0.0],
+             [-1 / 6, -1 / 6, -1 / 6],
+             [-1 / 6, 1 / 6, -1 / 6],
+             [1 / 24, 1 / 12, 1 / 6],
+             [1 / 24, -1 / 12, 1 / 6],
+             [0.0, 0.0, 1.0]], dtype=torch.double),
+        tensor(
+            [[1.0, 1.0, 1.0, 1.0, 1.0, 0.0],
+             [0.0, 1.0, -1.0, 2.0, -2.0, 0.0],
+             [0.0, 1.0, 1.0, 4.0, 4.0, 0.0],
+             [0.0, 1.0, -1.0, 8.0, -8.0, 1.0]], dtype=torch.double)),
+}
+
+
+def get_winograd_transforms(m, dtype, device):
+    """
+    :param m: the size of the output tile (2 or 4).
+    :param dtype: the dtype of the transforms.
+    :param device: the device of the transforms.
+    :return: B_T, G, A_T for F(m x m, 3 x 3).
+    """
+    if m not in WINOGRAD_TRANSFORMS:
+        raise Exception(f"Unsupported size of the Winograd output tile: {m}, "
+                        f"use one of: {sorted(WINOGRAD_TRANSFORMS.keys())}.")
+    return [transform.to(dtype=dtype, device=device) for transform in
+            WINOGRAD_TRANSFORMS[m]]
+
+
+def winograd_filter_transform(filter, G):
+    """
+    :param filter: the filters of shape (F, C, 3, 3).
+    :param G: the filter transform.
+    :return: U = G g G^T of shape (F, C, a, a), where a = m + 2.
+    """
+    return torch.matmul(torch.matmul(G, filter), G.t())
+
+
+def conv2D_winograd(input, filter, bias=None, padding=0, stride=1, m=2,
+                    U=None):
+    """
+    Compute the 2D convolution (correlation, as in the conv2d in PyTorch) with
+    the Winograd minimal filtering algorithm F(m x m, 3 x 3).
+
+    All the stages are batched tensor operations: the input tiles of size
+    a x a (a = m + 2, overlapping by 2) are extracted with unfold, the input
+    and output transforms of all the tiles are single matrix multiplications
+    (with the Kronecker products of the transforms, e.g. B^T d B is
+    kron(B^T, B^T) vec(d)) and the reduction over the channels is a single
+    GEMM for each of the a x a positions in the transformed tile. The backward
+    pass is computed by autograd.
+
+    :param input: the input maps of shape (N, C, H, W).
+    :param filter: the filters of shape (F, C, 3, 3).
+    :param bias: the bias term for each filter.
+    :param padding: the padding of the input.
+    :param stride: the stride (the output is subsampled).
+    :param m: the size of the output tile (2 or 4).
+    :param U: the transformed filter (optional, to reuse it).
+    :return: the result of the convolution.
+
+    >>> x = torch.randn(2, 3, 9, 7)
+    >>> y = torch.randn(4, 3, 3, 3)
+    >>> expect = torch.nn.functional.conv2d(x, y, padding=1)
+    >>> result = conv2D_winograd(x, y, padding=1, m=4)
+    >>> assert torch.allclose(expect, result, atol=1e-4)
+    """
+    N, C, H, W = input.size()
+    F, _, HH, WW = filter.size()
+    if HH != 3 or WW != 3:
+        raise Exception(f"The Winograd convolution supports only the 3x3 "
+                        f"filters, but got: {HH}x{WW}.")
+    pad_H, pad_W = get_pair(value=padding, val_1_default=0, val2_default=0,
+                            name="padding")
+    stride_H, stride_W = get_pair(value=stride, val_1_default=1,
+                                  val2_default=1, name="stride")
+    B_T, G, A_T = get_winograd_transforms(m=m, dtype=input.dtype,
+                                          device=input.device)
+    a = m + HH - 1
+
+    out_H = H + 2 * pad_H - HH + 1
+    out_W = W + 2 * pad_W - WW + 1
+    tiles_H = math.ceil(out_H / m)
+    tiles_W = math.ceil(out_W / m)
+    # Pad the end of the input to a whole number of tiles.
+    input = torch_pad(input, (pad_W, tiles_W * m + WW - 1 - W - pad_W,
+                              pad_H, tiles_H * m + HH - 1 - H - pad_H))
+    # (N, C, tiles_H, tiles_W, a, a) -> (a * a, C * P)
+    P = N * tiles_H * tiles_W
+    input = input.unfold(2, a, m).unfold(3, a, m)
+    input = input.permute(4, 5, 1, 0, 2, 3).reshape(a * a, C * P)
+
+    # V = B^T d B for all the tiles.
+    V = torch.matmul(torch.kron(B_T, B_T), input).view(a * a, C, P)
+    del input
+    if U is None:
+        U = winograd_filter_transform(filter, G)
+
+    # The channel reduction: for each of the a x a positions:
+    # (F, C) x (C, N * tiles_H * tiles_W).
+    M = torch.bmm(U.permute(2, 3, 0, 1).reshape(a * a, F, C), V)
+    del V
+
+    # Y = A^T M A for all the tiles.
+    out = torch.matmul(torch.kron(A_T, A_T), M.view(a * a, F * P))
+    del M
+    # (m, m, F, N, tiles_H, tiles_W) -> (N, F, tiles_H, m, tiles_W, m)
+    out = out.view(m, m, F, N, tiles_H, tiles_W).permute(3, 2, 4, 0, 5, 1)
+    out = out.reshape(N, F, tiles_H * m, tiles_W * m)
+    out = out[:, :, :out_H, :out_W]
+    if bias is not None:
+        out = out + bias.view(1, F, 1, 1)
+    if stride_H != 1 or stride_W != 1:
+        out = out[:, :, ::stride_H, ::stride_W]
+    return out
+
+
+class Conv2dWinograd(Module):
+    """
+    2D convolution with 3x3 filters via the Winograd F(m x m, 3 x 3)
+    algorithm.
+    """
+
+    def __init__(self, in_channels=None, out_channels=None, kernel_size=3,
+                 stride=1, padding=0, bias=True, weight_value=None,
+                 bias_value=None, args=Arguments(), winograd_m=None):
+        """
+        :param in_channels: (int) – Number of channels in the input image.
+        :param out_channels: (int) – Number of channels produced by the
+        convolution (equal to the number of filters in the given conv layer).
+        :param kernel_size: (int) - Size of the convolving kernel (only 3).
+        :param stride: the stride of the convolution.
+        :param padding: the padding added to the (top and bottom) and to the
+        (left and right) of the input image.
+        :param bias: (bool) - add bias or not.
+        :param weight_value: you can provide the initial filter of shape
+        (F, C, 3, 3).
+        :param bias_value: you can provide the initial value of the bias,
+        of shape (F,).
+        :param args: the general arguments for a program.
+        :param winograd_m: the size of the output tile: 2 for F(2x2, 3x3) or 4
+        for F(4x4, 3x3), None - use the args.winograd_m.
+        """
+        super(Conv2dWinograd, self).__init__()
+        self.args = args
+        if winograd_m is None:
+            winograd_m = args.winograd_m
+        self.winograd_m = winograd_m
+        # Check the size of the output tile.
+        get_winograd_transforms(m=winograd_m, dtype=args.dtype, device="cpu")
+        if get_pair(kernel_size) != (3, 3):
+            raise Exception(f"The Winograd convolution supports only the 3x3 "
+                            f"filters, but got: {kernel_size}.")
+        self.stride = get_pair(stride)
+        self.padding = get_pair(padding)
+
+        if weight_value is None:
+            if out_channels is None or in_channels is None:
+                raise ValueError("Either specify weight_value or provide "
+                                 "the in_channels and out_channels to generate "
+                                 "the filter.")
+            self.weight = Parameter(
+                torch.empty(out_channels, in_channels, 3, 3, dtype=args.dtype))
+            init.kaiming_uniform_(self.weight, a=math.sqrt(5))
+        else:
+            self.weight = weight_value
+            out_channels, in_channels = weight_value.shape[:2]
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = (3, 3)
+
+        if bias_value is not None:
+            self.bias = bias_value
+        elif bias:
+            fan_in = in_channels * 3 * 3
+            bound = 1 / math.sqrt(fan_in)
+            self.bias = Parameter(
+                torch.empty(out_channels, dtype=args.dtype).uniform_(-bound,
+                                                                     bound))
+        else:
+            self.register_parameter('bias', None)
+
+    def forward(self, input):
+        return conv2D_winograd(input=input, filter=self.weight,
+                               bias=self.bias, padding=self.padding,
+                               stride=self.stride, m=self.winograd_m)
+
+
 if __name__ == "__main__":
     import doctest
 
@@ -6,6 +6,10 @@ import numpy as np
 import torch
 from torch import tensor
 from cnns.nnlib.pytorch_layers.conv2D_winograd import Winograd
+from cnns.nnlib.pytorch_layers.conv2D_winograd import Conv2dWinograd
+from cnns.nnlib.pytorch_layers.conv_picker import Conv
+from cnns.nnlib.utils.arguments import Arguments
+from cnns.nnlib.utils.general_utils import ConvType
 
 class TestPyTorchConv1d(unittest.TestCase):
 
@@ -41,6 +45,35 @@ class TestPyTorchConv1d(unittest.TestCase):
             x=expect, y=result,
             err_msg="The expected array x and computed y are not almost equal.")
 
+    def testConv2dWinograd(self):
+        x = torch.randn(2, 3, 11, 8, dtype=torch.double, requires_grad=True)
+        for winograd_m in [2, 4]:
+            for padding, stride in [(0, 1), (1, 1), (1, 2)]:
+                conv = Conv2dWinograd(in_channels=3, out_channels=4,
+                                      padding=padding, stride=stride,
+                                      winograd_m=winograd_m).double()
+                params = [x, conv.weight, conv.bias]
+                expect = torch.nn.functional.conv2d(
+                    x, conv.weight, conv.bias, padding=padding, stride=stride)
+                result = conv(x)
+                self.assertEqual(expect.shape, result.shape)
+                self.assertTrue(torch.allclose(expect, result))
+                expect_grads = torch.autograd.grad(expect.sum(), params)
+                result_grads = torch.autograd.grad(result.sum(), params)
+                for expect_grad, result_grad in zip(expect_grads,
+                                                    result_grads):
+                    self.assertTrue(torch.allclose(expect_grad, result_grad))
+
+    def testConvPicker(self):
+        args = Arguments()
+        args.conv_type = ConvType.WINOGRAD2D
+        args.winograd_m = 4
+        conv = Conv(kernel_sizes=[3], in_channels=3, out_channels=[4],
+                    strides=[1], padding=[1], args=args).get_conv()
+        self.assertIsInstance(conv, Conv2dWinograd)
+        self.assertEqual(4, conv.winograd_m)
+        with self.assertRaises(Exception):
+            Conv2dWinograd(in_channels=3, out_channels=4, kernel_size=5)
 
 
 if __name__ == '__main__':
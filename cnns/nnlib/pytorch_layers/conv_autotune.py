@@ -0,0 +1,363 @@
+"""
+Per-layer autotuning of the 2D convolution.
+
+The fastest implementation of the convolution (the standard nn.Conv2d, the
+fft based convolution with each of the ConvExecTypes, the DCT based
+convolution, the Winograd convolution for the 3x3 filters) depends on the
+sizes of the input and filters, so the best choice differs between the
+layers of a network. AutotuneConv2d benchmarks the candidates for each
+distinct input size on the first forward pass (the warm-up) and then
+dispatches to the winner. The winners are kept in a json file, so the
+benchmark is run only once per shape and device.
+
+A candidate is used only if it computes the same output as the reference:
+the nn.Conv2d for the exact convolution, or the fft based convolution with
+the args.conv_exec_type if the spectrum is compressed.
+"""
+import copy
+import json
+import math
+import os
+import time
+import torch
+import torch.nn.functional as F
+from torch import tensor
+from torch.nn import Module
+from torch.nn import init
+from torch.nn.parameter import Parameter
+from cnns.nnlib.pytorch_layers.conv2D_fft import Conv2dfft
+from cnns.nnlib.pytorch_layers.conv2D_fft import Conv2dfftFunction
+from cnns.nnlib.pytorch_layers.conv2D_winograd import conv2D_winograd
+from cnns.nnlib.pytorch_layers.conv_dct import ConvDCT
+from cnns.nnlib.pytorch_layers.fft_filter_cache import FilterSpectrumCache
+from cnns.nnlib.pytorch_layers.pytorch_utils import get_pair
+from cnns.nnlib.utils.arguments import Arguments
+from cnns.nnlib.utils.general_utils import ConvExecType
+from cnns.nnlib.utils.general_utils import ConvType
+from cnns.nnlib.utils.general_utils import StrideType
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+STANDARD_CANDIDATE = ConvType.STANDARD2D.name
+DCT_CANDIDATE = ConvType.DCT.name
+WINOGRAD_CANDIDATE = ConvType.WINOGRAD2D.name
+CUDA_EXEC_TYPES = (ConvExecType.CUDA, ConvExecType.CUDA_SHARED_LOG,
+                   ConvExecType.CUDA_DEEP)
+
+
+def get_fft_candidate(conv_exec_type):
+    """
+    :param conv_exec_type: the ConvExecType of the fft based convolution.
+    :return: the name of the candidate, e.g., FFT2D-SGEMM.
+    """
+    return ConvType.FFT2D.name + "-" + conv_exec_type.name
+
+
+def standard_conv(layer, input):
+    return F.conv2d(input, layer.weight, layer.bias, stride=layer.stride,
+                    padding=layer.padding)
+
+
+def get_fft_conv(conv_exec_type):
+    def fft_conv(layer, input):
+        args = layer.get_exec_args(conv_exec_type)
+        filter_cache = None if layer.training else layer.filter_cache
+        return Conv2dfftFunction.apply(
+            input, layer.weight, layer.bias, layer.padding, layer.stride,
+            args, None, layer.is_manual, layer.conv_index, filter_cache,
+            args.conv_recompute_backward)
+
+    return fft_conv
+
+
+def dct_conv(layer, input):
+    return layer.get_dct_conv()(input)
+
+
+def winograd_conv(layer, input):
+    # Raises an exception (the candidate is skipped) for other than 3x3
+    # filters.
+    return conv2D_winograd(input=input, filter=layer.weight, bias=layer.bias,
+                           padding=layer.padding, stride=layer.stride,
+                           m=layer.args.winograd_m)
+
+
+# The name of the candidate -> the function(layer, input) that runs the
+# convolution with the weights of the AutotuneConv2d layer.
+CANDIDATES = {STANDARD_CANDIDATE: standard_conv}
+for exec_type in ConvExecType:
+    CANDIDATES[get_fft_candidate(exec_type)] = get_fft_conv(exec_type)
+CANDIDATES[DCT_CANDIDATE] = dct_conv
+CANDIDATES[WINOGRAD_CANDIDATE] = winograd_conv
+
+
+class ConvAutotuner(object):
+    """
+    The benchmark of the candidates and the on-disk cache of the winners.
+    """
+
+    def __init__(self, cache_file=None, repetitions=3, rtol=1e-3):
+        """
+        :param cache_file: the json file with the winners (None - keep the
+        winners only in memory).
+        :param repetitions: how many times to run each candidate.
+        :param rtol: the max difference between the output of a candidate and
+        the reference (relative to the max absolute value of the reference).
+        """
+        self.cache_file = cache_file
+        self.repetitions = repetitions
+        self.rtol = rtol
+        self.winners = {}
+        if cache_file and os.path.exists(cache_file):
+            with open(cache_file, "r") as file:
+                self.winners = json.load(file)
+
+    def save(self):
+        if not self.cache_file:
+            return
+        # Many workers can share the cache file: under the lock, merge the
+        # winners saved by the other workers in the meantime, so that their
+        # entries are not lost.
+        with open(self.cache_file + ".lock", "w") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.path.exists(self.cache_file):
+                    with open(self.cache_file, "r") as file:
+                        for key, winner in json.load(file).items():
+                            self.winners.setdefault(key, winner)
+                # Write the whole cache to a temporary file and replace the
+                # old one, so that a reader never sees a partial file.
+                tmp_file = self.cache_file + ".tmp" + str(os.getpid())
+                with open(tmp_file, "w") as file:
+                    json.dump(self.winners, file, indent=2, sort_keys=True)
+                os.replace(tmp_file, self.cache_file)
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def time_candidate(self, run, layer, input):
+        """
+        :param run: the function(layer, input) of the candidate.
+        :param layer: the AutotuneConv2d layer.
+        :param input: the input to the layer.
+        :return: the output of the candidate and its average time.
+        """
+        is_backward = layer.training and torch.is_grad_enabled()
+
+        def step():
+            if not is_backward:
+                with torch.no_grad():
+                    return run(layer, input)
+            x = input.detach().clone().requires_grad_(True)
+            out = run(layer, x)
+            # Do not accumulate the gradients in the weights of the layer.
+            params = [x] + [param for param in (layer.weight, layer.bias) if
+                            param is not None and param.requires_grad]
+            torch.autograd.grad(out, params, grad_outputs=torch.ones_like(out))
+            return out.detach()
+
+        out = step()  # warm-up
+        if input.is_cuda:
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(self.repetitions):
+            step()
+        if input.is_cuda:
+            torch.cuda.synchronize()
+        return out, (time.perf_counter() - start) / self.repetitions
+
+    def pick(self, key, layer, input, candidates, reference):
+        """
+        Get the winner from the cache or benchmark the candidates.
+
+        :param key: the key of the shape of the convolution.
+        :param layer: the AutotuneConv2d layer.
+        :param input: the input to the layer.
+        :param candidates: the names of the candidates.
+        :param reference: the name of the candidate with the expected output.
+        :return: the name of the fastest candidate.
+        """
+        winner = self.winners.get(key)
+        if winner in candidates:
+            return winner
+        expect, best_time = self.time_candidate(
+            CANDIDATES[reference], layer, input)
+        winner = reference
+        tolerance = self.rtol * max(1.0, expect.abs().max().item())
+        for name in candidates:
+            if name == reference:
+                continue
+            try:
+                out, elapsed_time = self.time_candidate(
+                    CANDIDATES[name], layer, input)
+            except Exception:
+                # E.g. the cuda extension is not available.
+                continue
+            if out.shape != expect.shape or (
+                    out - expect).abs().max().item() > tolerance:
+                continue
+            if elapsed_time < best_time:
+                winner, best_time = name, elapsed_time
+        self.winners[key] = winner
+        self.save()
+        return winner
+
+
+# The autotuners shared by the layers, by the cache file.
+autotuners = {}
+
+
+def get_autotuner(args):
+    """
+    :param args: the general arguments for a program.
+    :return: the autotuner for the args.conv_autotune_cache.
+    """
+    cache_file = args.conv_autotune_cache
+    autotuner = autotuners.get(cache_file)
+    if autotuner is None:
+        autotuner = ConvAutotuner(
+            cache_file=cache_file,
+            repetitions=args.conv_autotune_repetitions)
+        autotuners[cache_file] = autotuner
+    return autotuner
+
+
+class AutotuneConv2d(Module):
+    """
+    2D convolution that dispatches to the fastest implementation for the
+    size of its input.
+    """
+
+    def __init__(self, in_channels, out_channels, kernel_size, stride=1,
+                 padding=0, bias=True, is_manual=tensor([0]),
+                 args=Arguments(), candidates=None):
+        """
+        :param in_channels: (int) – Number of channels in the input image.
+        :param out_channels: (int) – Number of channels produced by the
+        convolution (equal to the number of filters in the given conv layer).
+        :param kernel_size: (int) - Size of the convolving kernel (the width and
+        height of the filter).
+        :param stride: the stride of the convolution.
+        :param padding: the padding added to the (top and bottom) and to the
+        (left and right) of the input image.
+        :param bias: (bool) - add bias or not.
+        :param is_manual: to check if the backward computation of the fft
+        based convolution was computed manually.
+        :param args: the general arguments for a program.
+        :param candidates: the names of the candidates (keys in CANDIDATES),
+        by default all of them.
+        """
+        super(AutotuneConv2d, self).__init__()
+        self.args = args
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        kernel_height, kernel_width = get_pair(kernel_size)
+        self.kernel_size = (kernel_height, kernel_width)
+        self.stride = get_pair(stride)
+        self.padding = get_pair(padding)
+        self.weight = Parameter(
+            torch.empty(out_channels, in_channels, kernel_height, kernel_width,
+                        dtype=args.dtype))
+        if bias:
+            self.bias = Parameter(torch.empty(out_channels, dtype=args.dtype))
+        else:
+            self.register_parameter('bias', None)
+        self.is_manual = is_manual
+        # The layers are indexed together with the fft based convolutions, e.g.
+        # to find the compress rate in args.layers_compress_rates.
+        self.conv_index = Conv2dfft.conv_index_counter
+        Conv2dfft.conv_index_counter += 1
+        if args.fft_filter_cache:
+            self.filter_cache = FilterSpectrumCache()
+        else:
+            self.filter_cache = None
+        if candidates is None:
+            candidates = list(CANDIDATES.keys())
+        self.candidates = candidates
+        self.autotuner = get_autotuner(args)
+        # The winners for the input sizes seen so far and the args for the fft
+        # based convolutions (not registered as modules or parameters).
+        self.winners = {}
+        self.exec_args = {}
+        self.dct_conv = []
+        self.reset_parameters()
+
+    def reset_parameters(self):
+        init.kaiming_uniform_(self.weight, a=math.sqrt(5))
+        if self.bias is not None:
+            fan_in, _ = init._calculate_fan_in_and_fan_out(self.weight)
+            bound = 1 / math.sqrt(fan_in)
+            init.uniform_(self.bias, -bound, bound)
+
+    def get_exec_args(self, conv_exec_type):
+        args = self.exec_args.get(conv_exec_type)
+        if args is None:
+            args = copy.copy(self.args)
+            args.conv_exec_type = conv_exec_type
+            self.exec_args[conv_exec_type] = args
+        return args
+
+    def get_dct_conv(self):
+        if not self.dct_conv:
+            self.dct_conv.append(ConvDCT(
+                weight_value=self.weight, bias_value=self.bias,
+                stride=self.stride, padding=self.padding, args=self.args))
+        return self.dct_conv[0]
+
+    def get_compress_rate(self):
+        args = self.args
+        if args.layers_compress_rates is not None:
+            return args.layers_compress_rates[self.conv_index]
+        return args.compress_rate
+
+    def is_exact(self):
+        """
+        :return: True if the fft based convolution computes the exact
+        convolution (no compression in the frequency domain).
+        """
+        args = self.args
+        compress_rate = self.get_compress_rate()
+        if compress_rate is not None and compress_rate > 0:
+            return False
+        if args.preserve_energy is not None and args.preserve_energy < 100:
+            return False
+        if self.stride != (1, 1) and args.stride_type is StrideType.SPECTRAL:
+            return False
+        return True
+
+    def get_key(self, input):
+        """
+        :param input: the input to the layer.
+        :return: the key of the shape of the convolution for the cache.
+        """
+        N, C, H, W = input.size()
+        F, _, HH, WW = self.weight.size()
+        mode = "train" if self.training and torch.is_grad_enabled() else "eval"
+        return ",".join(str(x) for x in [
+            N, C, H, W, F, HH, WW, self.stride[0], self.padding[0],
+            self.get_compress_rate(), self.args.preserve_energy,
+            self.args.stride_type.name, input.device.type, input.dtype, mode])
+
+    def get_winner(self, input):
+        key = self.get_key(input)
+        winner = self.winners.get(key)
+        if winner is None:
+            if self.is_exact():
+                reference = STANDARD_CANDIDATE
+            else:
+                conv_exec_type = self.args.conv_exec_type
+                if conv_exec_type in CUDA_EXEC_TYPES and not input.is_cuda:
+                    conv_exec_type = ConvExecType.BATCH
+                reference = get_fft_candidate(conv_exec_type)
+            winner = self.autotuner.pick(
+                key=key, layer=self, input=input, candidates=self.candidates,
+                reference=reference)
+            self.winners[key] = winner
+        return winner
+
+    def forward(self, input):
+        return CANDIDATES[self.get_winner(input)](self, input)
@@ -0,0 +1,85 @@
+import json
+import os
+import tempfile
+import unittest
+import torch
+from cnns.nnlib.pytorch_layers.conv_autotune import AutotuneConv2d
+from cnns.nnlib.pytorch_layers.conv_autotune import ConvAutotuner
+from cnns.nnlib.pytorch_layers.conv_autotune import DCT_CANDIDATE
+from cnns.nnlib.pytorch_layers.conv_autotune import STANDARD_CANDIDATE
+from cnns.nnlib.utils.arguments import Arguments
+
+
+class TestConvAutotune(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.args = Arguments()
+        self.args.conv_autotune_cache = os.path.join(self.folder.name,
+                                                     "autotune.json")
+        self.args.compress_rate = 0
+        self.args.preserve_energy = 100
+        self.candidates = [STANDARD_CANDIDATE, DCT_CANDIDATE]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def get_conv(self):
+        return AutotuneConv2d(in_channels=3, out_channels=4, kernel_size=3,
+                              padding=1, args=self.args,
+                              candidates=self.candidates)
+
+    def test_exact_output(self):
+        conv = self.get_conv()
+        x = torch.randn(2, 3, 8, 8)
+        out = conv(x)
+        expect = torch.nn.functional.conv2d(x, conv.weight, conv.bias,
+                                            padding=1)
+        # The DCT based convolution is not exact, so it cannot win.
+        self.assertEqual([STANDARD_CANDIDATE], list(conv.winners.values()))
+        self.assertTrue(torch.allclose(expect, out))
+        # The benchmark does not accumulate the gradients.
+        self.assertIsNone(conv.weight.grad)
+        out.sum().backward()
+        self.assertIsNotNone(conv.weight.grad)
+
+    def test_cache_file(self):
+        conv = self.get_conv()
+        x = torch.randn(2, 3, 8, 8)
+        conv(x)
+        key = conv.get_key(x)
+        with open(self.args.conv_autotune_cache) as file:
+            self.assertEqual(STANDARD_CANDIDATE, json.load(file)[key])
+
+        # A new autotuner reads the winners from the file.
+        autotuner = ConvAutotuner(cache_file=self.args.conv_autotune_cache)
+        autotuner.time_candidate = None  # the benchmark must not be run
+        winner = autotuner.pick(key=key, layer=conv, input=x,
+                                candidates=self.candidates,
+                                reference=STANDARD_CANDIDATE)
+        self.assertEqual(STANDARD_CANDIDATE, winner)
+
+    def test_concurrent_save(self):
+        # Two workers share the cache file and pick the winners for
+        # different keys, none of the entries is lost.
+        worker1 = ConvAutotuner(cache_file=self.args.conv_autotune_cache)
+        worker2 = ConvAutotuner(cache_file=self.args.conv_autotune_cache)
+        worker1.winners["key1"] = STANDARD_CANDIDATE
+        worker1.save()
+        worker2.winners["key2"] = DCT_CANDIDATE
+        worker2.save()
+        with open(self.args.conv_autotune_cache) as file:
+            self.assertEqual({"key1": STANDARD_CANDIDATE,
+                              "key2": DCT_CANDIDATE}, json.load(file))
+
+    def test_key_per_mode(self):
+        conv = self.get_conv()
+        x = torch.randn(2, 3, 8, 8)
+        conv(x)
+        conv.eval()
+        conv(x)
+        self.assertEqual(2, len(conv.winners))
+
+
+if __name__ == '__main__':
+    unittest.main()
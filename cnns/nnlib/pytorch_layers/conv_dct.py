@@ -3,7 +3,6 @@ import sys
 import math
 import numpy as np
 import torch
-from torch_dct import dct, idct
 import time
 from torch import tensor
 from torch.nn import Module
@@ -31,12 +30,75 @@ from cnns.nnlib.pytorch_layers.pytorch_utils import get_elem_size
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_tensors_elem_size
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_step_estimate
 from cnns.nnlib.pytorch_layers.pytorch_utils import restore_size_2D
+from cnns.nnlib.pytorch_layers.fft_filter_cache import FilterSpectrumCache
 from cnns.nnlib.utils.general_utils import CompressType, next_power2
 from cnns.nnlib.utils.general_utils import ConvExecType
 from cnns.nnlib.utils.general_utils import StrideType
 from cnns.nnlib.utils.arguments import Arguments
 from cnns.nnlib.utils.general_utils import additional_log_file
 
+# The orthonormal DCT-II basis matrices by (size, dtype, device).
+dct_bases = {}
+
+
+def get_dct_basis(size, dtype=torch.float, device=torch.device("cpu")):
+    """
+    :param size: the length of the signal.
+    :param dtype: the type of the basis.
+    :param device: the device of the basis.
+    :return: the orthonormal DCT-II matrix of shape (size, size), the k-th row
+    is the k-th basis vector: dct(x) = x @ basis.t(), idct(X) = X @ basis.
+
+    >>> basis = get_dct_basis(4, dtype=torch.double)
+    >>> torch.allclose(basis @ basis.t(), torch.eye(4, dtype=torch.double))
+    True
+    """
+    key = (size, dtype, device)
+    basis = dct_bases.get(key)
+    if basis is None:
+        n = torch.arange(size, dtype=torch.double)
+        basis = torch.cos(
+            math.pi * n.unsqueeze(1) * (2 * n.unsqueeze(0) + 1) / (2 * size))
+        basis *= math.sqrt(2.0 / size)
+        basis[0] /= math.sqrt(2.0)
+        basis = basis.to(dtype=dtype, device=device)
+        dct_bases[key] = basis
+    return basis
+
+
+def get_dct_scale(size, dtype=torch.double):
+    """
+    :param size: the length of the signal.
+    :param dtype: the type of the scale.
+    :return: the scale of the coefficients of the non-normalized DCT-II
+    (torch_dct.dct with norm=None) with respect to the orthonormal DCT-II.
+
+    >>> get_dct_scale(2)
+    tensor([2.8284, 2.0000], dtype=torch.float64)
+    """
+    scale = torch.full((size,), math.sqrt(2.0 * size), dtype=dtype)
+    scale[0] = 2 * math.sqrt(size)
+    return scale
+
+
+def get_dct_coefficients(size, compress_rate=None):
+    """
+    :param size: the length of the signal.
+    :param compress_rate: the percentage of the discarded (high frequency)
+    coefficients.
+    :return: the number of the preserved coefficients.
+
+    >>> get_dct_coefficients(32, compress_rate=50)
+    16
+    >>> get_dct_coefficients(32, compress_rate=None)
+    32
+    >>> get_dct_coefficients(3, compress_rate=99)
+    1
+    """
+    if not compress_rate:
+        return size
+    return max(1, int(math.ceil(size * (100 - compress_rate) / 100)))
+
 
 class ConvDCT(Module):
     """
@@ -198,6 +260,11 @@ class ConvDCT(Module):
             self.is_debug = args.is_debug
             self.compress_type = args.compress_type
 
+        if args is not None and args.fft_filter_cache:
+            self.filter_cache = FilterSpectrumCache()
+        else:
+            self.filter_cache = None
+
         self.reset_parameters()
 
     def reset_parameters(self):
@@ -234,6 +301,33 @@ class ConvDCT(Module):
                 "We only support a symmetric compression in the frequency domain.")
         return out_H, out_W
 
+    def get_filter_dct(self, filter, W, rows, coefficients):
+        """
+        :param filter: the filter (weights) of shape (F, C, HH, WW).
+        :param W: the width of the input.
+        :param rows: the number of the rows of the filter to transform.
+        :param coefficients: the number of the preserved DCT coefficients.
+        :return: the DCT of the filter padded to the width W of shape (F, C,
+        rows, coefficients) scaled so that the product with the orthonormal
+        DCT of the input and the orthonormal inverse DCT give the same result
+        as the non-normalized DCT (torch_dct.dct) of both.
+        """
+
+        def compute_filter_dct():
+            WW = min(filter.shape[-1], W)
+            basis = get_dct_basis(W, dtype=torch.double, device=filter.device)
+            scale = get_dct_scale(W, dtype=torch.double).to(filter.device)
+            basis = basis[:coefficients, :WW] * scale[:coefficients, None]
+            # The padding of the filter with zeros is skipped.
+            return torch.matmul(filter[:, :, :rows, :WW],
+                                basis.t().to(filter.dtype))
+
+        if self.filter_cache is None:
+            return compute_filter_dct()
+        return self.filter_cache.get(filter=filter,
+                                     key=(W, rows, coefficients),
+                                     compute_spectrum=compute_filter_dct)
+
     def forward(self, input):
         """
         This is the fully manual implementation of the forward and backward
@@ -258,24 +352,26 @@ class ConvDCT(Module):
         # WW - the width of the filter (its length).
         F, C, HH, WW = filter.size()
 
-        pad_filter_H = H - HH
-        pad_filter_W = W - WW
-
-        filter = torch_pad(
-            filter, (0, pad_filter_W, 0, pad_filter_H), 'constant', 0)
-
-        input = dct(input)
-        filter = dct(filter)
-        # permute from N, C, H, W to H, W, N, C
-        input = input.permute(2, 3, 0, 1)
-        # permute from F, C, H, W to H, W, C, F
-        filter = filter.permute(2, 3, 1, 0)
-        result = torch.matmul(input, filter)
-        # permute from H, W, N, F to N, F, H, W
-        result = result.permute(2, 3, 0, 1)
-        result = idct(result)
         out_H, out_W = self.out_HW(H, W, HH, WW)
-        result = result[..., :out_H, :out_W]
+        # The DCT is applied along the width (the last dimension) and the
+        # channels are multiplied point-wise for each (row, coefficient). The
+        # filter padded to the size of the input is zero in the rows from HH,
+        # so only the first rows of the output are non-zero.
+        rows = min(H, HH, out_H)
+        coefficients = get_dct_coefficients(W, self.compress_rate)
+        basis = get_dct_basis(W, dtype=input.dtype, device=input.device)
+        basis = basis[:coefficients]
+
+        # N, C, rows, coefficients
+        input = torch.matmul(input[:, :, :rows], basis.t())
+        # F, C, rows, coefficients
+        filter = self.get_filter_dct(filter=filter, W=W, rows=rows,
+                                     coefficients=coefficients)
+        result = torch.einsum('nchk,fchk->nfhk', input, filter)
+        # The inverse DCT: N, F, rows, out_W
+        result = torch.matmul(result, basis[:, :out_W])
+        if rows < out_H:
+            result = torch_pad(result, (0, 0, 0, out_H - rows), 'constant', 0)
         if self.bias is not None:
             # Add the bias term for each filter (it has to be unsqueezed to
             # the dimension of the out to properly sum up the values).
@@ -0,0 +1,84 @@
+import unittest
+import torch
+from torch.nn.functional import pad
+from torch_dct import dct, idct
+from cnns.nnlib.pytorch_layers.conv_dct import ConvDCT
+from cnns.nnlib.pytorch_layers.conv_dct import get_dct_basis
+from cnns.nnlib.utils.arguments import Arguments
+
+
+def conv_dct_reference(conv, input):
+    """
+    The DCT based convolution with the full padding of the filter and the
+    non-normalized torch_dct transforms.
+    """
+    filter = conv.weight
+    N, C, H, W = input.size()
+    F, C, HH, WW = filter.size()
+    filter = pad(filter, (0, W - WW, 0, H - HH), 'constant', 0)
+    input = dct(input).permute(2, 3, 0, 1)
+    filter = dct(filter).permute(2, 3, 1, 0)
+    result = idct(torch.matmul(input, filter).permute(2, 3, 0, 1))
+    out_H, out_W = conv.out_HW(H, W, HH, WW)
+    result = result[..., :out_H, :out_W]
+    if conv.bias is not None:
+        result = result + conv.bias.unsqueeze(-1).unsqueeze(-1)
+    return result[:, :, ::conv.stride_H, ::conv.stride_W]
+
+
+class TestConvDCT(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+        self.args = Arguments()
+        self.args.compress_rate = 0
+
+    def test_reference(self):
+        for size, kernel_size, padding, stride in [
+            (8, 3, 1, 1), (9, 5, 0, 1), (16, 3, 1, 2)]:
+            conv = ConvDCT(in_channels=3, out_channels=4,
+                           kernel_size=kernel_size, padding=padding,
+                           stride=stride, bias=True, args=self.args)
+            x = torch.randn(2, 3, size, size)
+            expect = conv_dct_reference(conv, x)
+            result = conv(x)
+            self.assertEqual(expect.shape, result.shape)
+            self.assertTrue(torch.allclose(expect, result, atol=1e-4))
+
+    def test_filter_cache(self):
+        conv = ConvDCT(in_channels=3, out_channels=4, kernel_size=3,
+                       padding=1, args=self.args)
+        x = torch.randn(2, 3, 8, 8)
+        with torch.no_grad():
+            conv(x)
+            first = conv(x)
+            self.assertEqual(1, conv.filter_cache.hits)
+            conv.weight.mul_(2)
+            second = conv(x)
+        self.assertEqual(2, conv.filter_cache.misses)
+        self.assertTrue(torch.allclose(2 * first, second, atol=1e-4))
+
+        # The gradients flow through the filter transform in the training.
+        x.requires_grad_(True)
+        conv(x).sum().backward()
+        self.assertIsNotNone(conv.weight.grad)
+        self.assertIsNotNone(x.grad)
+
+    def test_compress_rate(self):
+        conv = ConvDCT(in_channels=3, out_channels=4, kernel_size=3,
+                       padding=1, args=self.args)
+        x = torch.randn(2, 3, 16, 16)
+        expect = conv(x)
+        conv.compress_rate = 50
+        result = conv(x)
+        self.assertEqual(expect.shape, result.shape)
+        # The truncation is the projection of the input on the low
+        # frequencies.
+        basis = get_dct_basis(16)[:8]
+        x_low = torch.matmul(torch.matmul(x, basis.t()), basis)
+        conv.compress_rate = 0
+        self.assertTrue(torch.allclose(conv(x_low), result, atol=1e-4))
+
+
+if __name__ == '__main__':
+    unittest.main()
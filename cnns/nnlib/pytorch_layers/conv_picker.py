@@ -9,6 +9,8 @@ from cnns.nnlib.pytorch_layers.conv1D_fft import Conv1dfftCompressSignalOnly
 from cnns.nnlib.pytorch_layers.conv1D_fft import Conv1dfftSimple
 from cnns.nnlib.pytorch_layers.conv1D_fft import Conv1dfftSimpleForLoop
 from cnns.nnlib.pytorch_layers.conv_dct import ConvDCT
+from cnns.nnlib.pytorch_layers.conv_autotune import AutotuneConv2d
+from cnns.nnlib.pytorch_layers.conv2D_winograd import Conv2dWinograd
 
 CONV_TYPE_ERROR = "Unknown type of convolution."
 
@@ -94,6 +96,22 @@ class Conv(object):
                            padding=self.padding[param_index],
                            bias=self.is_bias,
                            args=self.args)
+        elif self.conv_type is ConvType.AUTOTUNE2D:
+            return AutotuneConv2d(in_channels=in_channels,
+                                  out_channels=self.out_channels[param_index],
+                                  stride=self.strides[param_index],
+                                  kernel_size=self.kernel_sizes[param_index],
+                                  padding=self.padding[param_index],
+                                  bias=self.is_bias,
+                                  args=self.args)
+        elif self.conv_type is ConvType.WINOGRAD2D:
+            return Conv2dWinograd(in_channels=in_channels,
+                                  out_channels=self.out_channels[param_index],
+                                  stride=self.strides[param_index],
+                                  kernel_size=self.kernel_sizes[param_index],
+                                  padding=self.padding[param_index],
+                                  bias=self.is_bias,
+                                  args=self.args)
         elif self.conv_type is ConvType.AUTOGRAD:
             return Conv1dfftAutograd(in_channels=in_channels,
                                      out_channels=self.out_channels[
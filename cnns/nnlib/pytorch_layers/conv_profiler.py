@@ -0,0 +1,173 @@
+"""
+Profiler for the stages of the FFT based convolution (Conv2dfftFunction).
+
+The profiler records for each convolutional layer (by its conv_index) and
+each stage of the computation (pad, rfft, compression, complex multiply,
+irfft, backward): the number of calls, the wall time (the time to launch the
+operations on the host), the cuda time (the wall time until the operations
+finish on the device, measured with torch.cuda.synchronize) and the change of
+the allocated cuda memory.
+
+The profiler is disabled by default, then start() returns None and stop()
+returns immediately, so the cost in the convolution is a single attribute
+check per stage.
+
+Usage:
+
+    conv_profiler.enable(cuda_sync=True)
+    ... train or test the model ...
+    conv_profiler.to_csv("conv_profile.csv")
+"""
+import csv
+import json
+import time
+import torch
+
+STAGE_PAD = "pad"
+STAGE_RFFT = "rfft"
+STAGE_COMPRESSION = "compression"
+STAGE_COMPLEX_MULTIPLY = "complex_multiply"
+STAGE_IRFFT = "irfft"
+STAGE_BACKWARD = "backward"
+# The parts of the backward pass.
+STAGE_BACKWARD_RFFT = "backward_rfft"
+STAGE_BACKWARD_INPUT_MULTIPLY = "backward_input_complex_multiply"
+STAGE_BACKWARD_INPUT_IRFFT = "backward_input_irfft"
+STAGE_BACKWARD_FILTER_MULTIPLY = "backward_filter_complex_multiply"
+STAGE_BACKWARD_FILTER_IRFFT = "backward_filter_irfft"
+
+RECORD_FIELDS = ["conv_index", "stage", "calls", "wall_time", "cuda_time",
+                 "allocated_bytes", "max_allocated_bytes"]
+
+
+class ConvProfiler(object):
+
+    def __init__(self, enabled=False, cuda_sync=True, track_memory=True):
+        """
+        :param enabled: record the stages of the convolutions.
+        :param cuda_sync: synchronize cuda at the beginning and the end of each
+        stage to measure the cuda time (it slows down the execution).
+        :param track_memory: record the change of the allocated cuda memory.
+        """
+        self.enabled = enabled
+        self.cuda_sync = cuda_sync
+        self.track_memory = track_memory
+        # (conv_index, stage) -> [calls, wall_time, cuda_time,
+        # allocated_bytes, max_allocated_bytes]
+        self.records = {}
+
+    def enable(self, cuda_sync=True, track_memory=True):
+        self.enabled = True
+        self.cuda_sync = cuda_sync
+        self.track_memory = track_memory
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        self.records.clear()
+
+    def is_cuda(self):
+        return torch.cuda.is_available() and torch.cuda.is_initialized()
+
+    def start(self):
+        """
+        Start measuring a stage.
+
+        :return: the start stamp for the stop() or None if the profiler is
+        disabled.
+        """
+        if not self.enabled:
+            return None
+        is_cuda = self.is_cuda()
+        if is_cuda and self.cuda_sync:
+            # Do not count the pending operations of the previous stages.
+            torch.cuda.synchronize()
+        memory = 0
+        if is_cuda and self.track_memory:
+            memory = torch.cuda.memory_allocated()
+        return time.perf_counter(), memory
+
+    def stop(self, conv_index, stage, start):
+        """
+        Finish measuring a stage and add it to the records.
+
+        :param conv_index: the index of the convolutional layer.
+        :param stage: the name of the stage, e.g., STAGE_RFFT.
+        :param start: the stamp returned by the start().
+        """
+        if start is None:
+            return
+        start_time, start_memory = start
+        wall_time = time.perf_counter() - start_time
+        cuda_time = wall_time
+        allocated_bytes = 0
+        is_cuda = self.is_cuda()
+        if is_cuda and self.cuda_sync:
+            torch.cuda.synchronize()
+            cuda_time = time.perf_counter() - start_time
+        if is_cuda and self.track_memory:
+            allocated_bytes = torch.cuda.memory_allocated() - start_memory
+        record = self.records.get((conv_index, stage))
+        if record is None:
+            record = [0, 0.0, 0.0, 0, 0]
+            self.records[(conv_index, stage)] = record
+        record[0] += 1
+        record[1] += wall_time
+        record[2] += cuda_time
+        record[3] += allocated_bytes
+        record[4] = max(record[4], allocated_bytes)
+
+    def get_records(self):
+        """
+        :return: the list of records (dicts with the RECORD_FIELDS) sorted by
+        the conv_index.
+        """
+        records = []
+        for (conv_index, stage), values in self.records.items():
+            record = {"conv_index": conv_index, "stage": stage}
+            record.update(zip(RECORD_FIELDS[2:], values))
+            records.append(record)
+        records.sort(key=lambda record: (
+            -1 if record["conv_index"] is None else record["conv_index"]))
+        return records
+
+    def to_json(self, path):
+        with open(path, "w") as file:
+            json.dump(self.get_records(), file, indent=2)
+
+    def to_csv(self, path):
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, fieldnames=RECORD_FIELDS)
+            writer.writeheader()
+            writer.writerows(self.get_records())
+
+    def export(self, path):
+        """
+        Export the records to a json or csv file (based on the extension).
+
+        :param path: the path to the output file.
+        """
+        if path.endswith(".json"):
+            self.to_json(path)
+        elif path.endswith(".csv"):
+            self.to_csv(path)
+        else:
+            raise Exception(f"Unknown format of the profile file: {path}, "
+                            f"use .json or .csv.")
+
+
+# The single profiler shared by all the fft based convolutions.
+conv_profiler = ConvProfiler()
+
+
+def set_conv_profiler(args):
+    """
+    Enable or disable the conv_profiler based on the args.
+
+    :param args: the general arguments for a program.
+    """
+    if args.profile_conv:
+        conv_profiler.enable(cuda_sync=args.profile_conv_cuda_sync)
+    else:
+        conv_profiler.disable()
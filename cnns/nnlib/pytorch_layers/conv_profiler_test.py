@@ -0,0 +1,60 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+from cnns.nnlib.pytorch_layers.conv_profiler import ConvProfiler
+from cnns.nnlib.pytorch_layers.conv_profiler import RECORD_FIELDS
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_PAD
+from cnns.nnlib.pytorch_layers.conv_profiler import STAGE_RFFT
+
+
+class TestConvProfiler(unittest.TestCase):
+
+    def test_disabled(self):
+        profiler = ConvProfiler()
+        start = profiler.start()
+        self.assertIsNone(start)
+        profiler.stop(0, STAGE_PAD, start)
+        self.assertEqual([], profiler.get_records())
+
+    def test_records(self):
+        profiler = ConvProfiler(enabled=True)
+        for conv_index in [1, 0, 1]:
+            start = profiler.start()
+            profiler.stop(conv_index, STAGE_PAD, start)
+        start = profiler.start()
+        profiler.stop(0, STAGE_RFFT, start)
+        records = profiler.get_records()
+        self.assertEqual([(0, STAGE_PAD, 1), (0, STAGE_RFFT, 1),
+                          (1, STAGE_PAD, 2)],
+                         [(record["conv_index"], record["stage"],
+                           record["calls"]) for record in records])
+        for record in records:
+            self.assertGreaterEqual(record["cuda_time"], record["wall_time"])
+        profiler.reset()
+        self.assertEqual([], profiler.get_records())
+
+    def test_export(self):
+        profiler = ConvProfiler(enabled=True)
+        profiler.stop(2, STAGE_PAD, profiler.start())
+        with tempfile.TemporaryDirectory() as folder:
+            json_file = os.path.join(folder, "profile.json")
+            profiler.export(json_file)
+            with open(json_file) as file:
+                records = json.load(file)
+            self.assertEqual(2, records[0]["conv_index"])
+
+            csv_file = os.path.join(folder, "profile.csv")
+            profiler.export(csv_file)
+            with open(csv_file) as file:
+                rows = list(csv.DictReader(file))
+            self.assertEqual(RECORD_FIELDS, list(rows[0].keys()))
+            self.assertEqual(STAGE_PAD, rows[0]["stage"])
+
+            with self.assertRaises(Exception):
+                profiler.export(os.path.join(folder, "profile.txt"))
+
+
+if __name__ == '__main__':
+    unittest.main()
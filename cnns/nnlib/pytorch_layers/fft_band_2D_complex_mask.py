@@ -4,6 +4,7 @@ from cnns.nnlib.utils.general_utils import next_power2
 from torch.nn.functional import pad as torch_pad
 from cnns.nnlib.utils.complex_mask import get_disk_mask
 from cnns.nnlib.utils.complex_mask import get_hyper_mask
+from cnns.nnlib.utils.complex_mask import get_cached_mask
 from cnns.nnlib.utils.shift_DC_component import shift_DC
 
 class FFTBandFunctionComplexMask2D(torch.autograd.Function):
@@ -59,13 +60,12 @@ class FFTBandFunctionComplexMask2D(torch.autograd.Function):
         _, _, H_xfft, W_xfft, _ = xfft.size()
         # assert H_fft == W_xfft, "The input tensor has to be squared."
 
-        mask, _ = get_mask(H=H_xfft, W=W_xfft,
-                           compress_rate=args.compress_fft_layer,
-                           val=val, interpolate=args.interpolate,
-                           onesided=onesided)
-        mask = mask[:, 0:W_xfft, :]
+        mask = get_cached_mask(H=H_xfft, W=W_xfft,
+                               compress_rate=args.compress_fft_layer,
+                               val=val, interpolate=args.interpolate,
+                               onesided=onesided, dtype=xfft.dtype,
+                               device=xfft.device, get_mask=get_mask)
         # print(mask)
-        mask = mask.to(xfft.dtype).to(xfft.device)
         xfft = xfft * mask
 
         if ctx is not None:
@@ -0,0 +1,72 @@
+"""
+Cache of the filter spectrum for the FFT based convolutions (Conv1dfft and
+Conv2dfft).
+
+The filter is padded to the size of the fft, transformed with rfft and
+(optionally) compressed in each forward pass. In the inference mode the
+weights do not change, so we can keep the spectrum of the filter and reuse it
+for all the batches of the same input size.
+"""
+import torch
+
+
+class FilterSpectrumCache(object):
+    """
+    The spectra are keyed by the parameters that determine the size and
+    compression of the spectrum (e.g. the fft size of the input, the
+    compression rate). Each spectrum is stored together with the data pointer
+    and the version of the filter tensor, so any in-place update of the
+    weights (optimizer step, load_state_dict) invalidates the spectrum
+    automatically.
+    """
+
+    def __init__(self, max_size=4):
+        """
+        :param max_size: the max number of spectra (e.g. for different input
+        sizes) to keep for a single layer.
+        """
+        self.max_size = max_size
+        self.spectra = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_filter_stamp(filter):
+        """
+        :param filter: the filter (weights) of the layer.
+        :return: the identity of the current values of the filter.
+        """
+        return (filter.data_ptr(), filter._version, tuple(filter.size()),
+                filter.dtype, filter.device)
+
+    def get(self, filter, key, compute_spectrum):
+        """
+        Get the spectrum of the filter from the cache or compute it.
+
+        :param filter: the filter (weights) of the layer.
+        :param key: the tuple of parameters (besides the filter) that determine
+        the spectrum, e.g. the fft size and the compression.
+        :param compute_spectrum: the function without arguments that computes
+        the spectrum of the filter.
+        :return: the spectrum of the filter.
+        """
+        if filter.requires_grad and torch.is_grad_enabled():
+            # The autograd has to record the operations on the filter.
+            return compute_spectrum()
+        stamp = self.get_filter_stamp(filter)
+        entry = self.spectra.get(key)
+        if entry is not None and entry[0] == stamp:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        spectrum = compute_spectrum()
+        if entry is None and len(self.spectra) >= self.max_size:
+            # Drop the oldest spectrum (dicts keep the insertion order).
+            del self.spectra[next(iter(self.spectra))]
+        self.spectra[key] = (stamp, spectrum)
+        return spectrum
+
+    def clear(self):
+        self.spectra.clear()
+        self.hits = 0
+        self.misses = 0
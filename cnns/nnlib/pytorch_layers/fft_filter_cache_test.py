@@ -0,0 +1,55 @@
+import unittest
+import torch
+from cnns.nnlib.pytorch_layers.fft_filter_cache import FilterSpectrumCache
+
+
+class TestFilterSpectrumCache(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        self.filter = torch.nn.Parameter(torch.randn(4, 3, 3, 3))
+
+    def compute(self):
+        self.calls += 1
+        return self.filter.detach() * 2
+
+    def test_reuse_for_the_same_key(self):
+        cache = FilterSpectrumCache()
+        with torch.no_grad():
+            first = cache.get(self.filter, key=(8, 8),
+                              compute_spectrum=self.compute)
+            second = cache.get(self.filter, key=(8, 8),
+                               compute_spectrum=self.compute)
+            cache.get(self.filter, key=(16, 16), compute_spectrum=self.compute)
+        self.assertIs(first, second)
+        self.assertEqual(2, self.calls)
+        self.assertEqual(1, cache.hits)
+
+    def test_invalidate_after_update(self):
+        cache = FilterSpectrumCache()
+        with torch.no_grad():
+            cache.get(self.filter, key=(8, 8), compute_spectrum=self.compute)
+            self.filter.add_(1.0)
+            spectrum = cache.get(self.filter, key=(8, 8),
+                                 compute_spectrum=self.compute)
+        self.assertEqual(2, self.calls)
+        self.assertTrue(torch.equal(self.filter.detach() * 2, spectrum))
+
+    def test_bypass_for_autograd(self):
+        cache = FilterSpectrumCache()
+        cache.get(self.filter, key=(8, 8), compute_spectrum=self.compute)
+        cache.get(self.filter, key=(8, 8), compute_spectrum=self.compute)
+        self.assertEqual(2, self.calls)
+        self.assertEqual(0, len(cache.spectra))
+
+    def test_max_size(self):
+        cache = FilterSpectrumCache(max_size=2)
+        with torch.no_grad():
+            for size in [4, 8, 16]:
+                cache.get(self.filter, key=(size,),
+                          compute_spectrum=self.compute)
+        self.assertEqual([(8,), (16,)], list(cache.spectra.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+"""
+Overlap-save (tiled) execution of the FFT based convolutions (Conv1dfft and
+Conv2dfft) for large inputs.
+
+The fft based convolution pads the whole input to at least the size of the
+input plus the size of the output (or the filter) and transforms it with a
+single fft. For large inputs (e.g. 224x224 images or long time-series) with
+small filters, the spectra are much larger than needed. In the overlap-save
+mode, the padded input is split into tiles of size tile_size that overlap by
+(kernel_size - 1), each tile yields (tile_size - kernel_size + 1) valid
+outputs and the outputs of the tiles are stitched back together.
+
+All the tiles have the same size (the input is padded at the end), so they
+are stacked in the batch dimension and convolved in a single call: the filter
+is transformed once per forward pass (once per tile size) and the compression
+(compress_rate, preserve_energy) is applied per tile.
+"""
+import math
+import torch.nn.functional as F
+from cnns.nnlib.utils.general_utils import StrideType
+
+
+def get_sizes(value, ndim, name="value"):
+    """
+    :param value: a number or a tuple.
+    :param ndim: the number of the spatial dimensions.
+    :param name: the name of the value.
+    :return: the tuple of size ndim.
+
+    >>> get_sizes(3, ndim=2)
+    (3, 3)
+    >>> get_sizes((1, 2), ndim=2)
+    (1, 2)
+    >>> get_sizes(None, ndim=1)
+    (0,)
+    """
+    if value is None:
+        value = 0
+    if isinstance(value, int):
+        return (value,) * ndim
+    value = tuple(value)
+    if len(value) != ndim:
+        raise ValueError(f"{name} requires a tuple of length {ndim}")
+    return value
+
+
+def get_tiles(size, kernel_size, tile_size):
+    """
+    :param size: the size of the padded input in a dimension.
+    :param kernel_size: the size of the filter in the dimension.
+    :param tile_size: the max size of the input tile.
+    :return: the number of the tiles and the number of the outputs of a tile.
+
+    >>> get_tiles(size=226, kernel_size=3, tile_size=32)
+    (8, 30)
+    >>> get_tiles(size=20, kernel_size=3, tile_size=32)
+    (1, 18)
+    """
+    out_size = size - kernel_size + 1
+    if tile_size < kernel_size:
+        raise Exception(f"The tile size {tile_size} has to be at least the "
+                        f"size of the filter {kernel_size}.")
+    tile_out = min(tile_size - kernel_size + 1, out_size)
+    return math.ceil(out_size / tile_out), tile_out
+
+
+def conv_fft_tiled(conv, input, kernel_size, padding=0, stride=1,
+                   tile_size=32, stride_type=StrideType.STANDARD,
+                   out_size=None):
+    """
+    Compute the convolution of a large input tile by tile (overlap-save).
+
+    :param conv: the function(tiles) that computes the valid convolution (no
+    padding, stride 1) of the tiles of shape (N, C, tile_H, tile_W) (or
+    (N, C, tile_W) for 1D) with the filters of the layer.
+    :param input: the input map of shape (N, C, H, W) or (N, C, W).
+    :param kernel_size: the spatial size of the filter.
+    :param padding: the padding of the input.
+    :param stride: the stride of the convolution.
+    :param tile_size: the max size of the input tile (with the overlap of
+    kernel_size - 1).
+    :param stride_type: only the STANDARD stride can be computed per tile.
+    :param out_size: the spectral pooling is not supported.
+    :return: the result of the convolution.
+    """
+    if out_size is not None:
+        raise Exception("The out_size (spectral pooling) is not supported for "
+                        "the tiled fft based convolution.")
+    ndim = input.dim() - 2
+    kernel_size = get_sizes(kernel_size, ndim, name="kernel_size")
+    padding = get_sizes(padding, ndim, name="padding")
+    stride = get_sizes(stride, ndim, name="stride")
+    if stride_type is not StrideType.STANDARD and max(stride) > 1:
+        raise Exception(f"Unsupported stride type for the tiled fft based "
+                        f"convolution: {stride_type.name}.")
+
+    N, C = input.shape[:2]
+    out_sizes, counts, tile_outs, pads = [], [], [], []
+    for size, kernel, pad in zip(input.shape[2:], kernel_size, padding):
+        count, tile_out = get_tiles(size=size + 2 * pad, kernel_size=kernel,
+                                    tile_size=tile_size)
+        out_sizes.append(size + 2 * pad - kernel + 1)
+        counts.append(count)
+        tile_outs.append(tile_out)
+        # Pad the end, so that all the tiles have the same size.
+        pads.append((pad, count * tile_out + kernel - 1 - size - pad))
+
+    # F.pad starts from the last dimension.
+    input = F.pad(input, [value for pad in reversed(pads) for value in pad])
+    for dim, (kernel, tile_out) in enumerate(zip(kernel_size, tile_outs)):
+        input = input.unfold(2 + dim, tile_out + kernel - 1, tile_out)
+    # (N, C, count_H, count_W, tile_H, tile_W) ->
+    # (N, count_H, count_W, C, tile_H, tile_W)
+    tiles = input.permute(0, *range(2, 2 + ndim), 1,
+                          *range(2 + ndim, 2 + 2 * ndim))
+    tiles = tiles.reshape(-1, C, *tiles.shape[2 + ndim:])
+    out = conv(tiles)
+    del tiles
+
+    # (N, count_H, count_W, F, tile_out_H, tile_out_W) ->
+    # (N, F, count_H, tile_out_H, count_W, tile_out_W)
+    out = out.reshape(N, *counts, out.shape[1], *tile_outs)
+    out = out.permute(0, 1 + ndim, *[index for dim in range(ndim) for index in
+                                     (1 + dim, 2 + ndim + dim)])
+    out = out.reshape(N, out.shape[1], *[count * tile_out for count, tile_out
+                                         in zip(counts, tile_outs)])
+    return out[(Ellipsis,) + tuple(
+        slice(0, size, step) for size, step in zip(out_sizes, stride))]
@@ -0,0 +1,96 @@
+import unittest
+import torch
+import torch.nn.functional as F
+from cnns.nnlib.pytorch_layers.conv1D_fft import Conv1dfft
+from cnns.nnlib.pytorch_layers.conv2D_fft import Conv2dfft
+from cnns.nnlib.pytorch_layers.fft_tiling import conv_fft_tiled
+from cnns.nnlib.utils.arguments import Arguments
+from cnns.nnlib.utils.general_utils import ConvExecType
+from cnns.nnlib.utils.general_utils import StrideType
+
+
+class TestFFTTiling(unittest.TestCase):
+
+    def check_conv(self, input_size, kernel_size, padding, stride, tile_size):
+        """
+        Compare the tiled convolution (with the standard convolution of each
+        tile) with the convolution of the whole input.
+        """
+        ndim = len(input_size)
+        conv = F.conv2d if ndim == 2 else F.conv1d
+        x = torch.randn(2, 3, *input_size, dtype=torch.double,
+                        requires_grad=True)
+        w = torch.randn(4, 3, *kernel_size, dtype=torch.double,
+                        requires_grad=True)
+        expect = conv(x, w, padding=padding, stride=stride)
+        result = conv_fft_tiled(
+            conv=lambda tiles: conv(tiles, w), input=x,
+            kernel_size=kernel_size, padding=padding, stride=stride,
+            tile_size=tile_size)
+        self.assertEqual(expect.shape, result.shape)
+        self.assertTrue(torch.allclose(expect, result))
+        expect_grads = torch.autograd.grad(expect.sum(), [x, w])
+        result_grads = torch.autograd.grad(result.sum(), [x, w])
+        for expect_grad, result_grad in zip(expect_grads, result_grads):
+            self.assertTrue(torch.allclose(expect_grad, result_grad))
+
+    def test_conv2D(self):
+        self.check_conv(input_size=(37, 29), kernel_size=(3, 5), padding=1,
+                        stride=1, tile_size=8)
+        self.check_conv(input_size=(37, 29), kernel_size=(3, 3), padding=2,
+                        stride=2, tile_size=7)
+        # A single tile.
+        self.check_conv(input_size=(5, 5), kernel_size=(3, 3), padding=1,
+                        stride=1, tile_size=64)
+
+    def test_conv1D(self):
+        self.check_conv(input_size=(100,), kernel_size=(5,), padding=2,
+                        stride=1, tile_size=16)
+        self.check_conv(input_size=(100,), kernel_size=(5,), padding=0,
+                        stride=3, tile_size=6)
+
+    def check_layer(self, layer, conv, x, w, b, padding):
+        """
+        Run the fft based layer with args.conv_tile_size set (in the train
+        and eval modes) and compare it with the standard convolution.
+        """
+        expect = conv(x, w, b, padding=padding)
+        for training in [True, False]:
+            layer.train(training)
+            result = layer(x)
+            self.assertEqual(expect.shape, result.shape)
+            self.assertTrue(torch.allclose(expect, result))
+
+    def test_conv2D_layer(self):
+        args = Arguments()
+        args.conv_tile_size = 8
+        x = torch.randn(2, 3, 33, 33, dtype=torch.double)
+        w = torch.randn(4, 3, 3, 3, dtype=torch.double)
+        b = torch.randn(4, dtype=torch.double)
+        layer = Conv2dfft(weight_value=w, bias_value=b, padding=1, args=args,
+                          native_complex=True)
+        self.check_layer(layer=layer, conv=F.conv2d, x=x, w=w, b=b, padding=1)
+
+    def test_conv1D_layer(self):
+        args = Arguments(conv_exec_type=ConvExecType.BATCH)
+        args.conv_tile_size = 16
+        x = torch.randn(2, 3, 100, dtype=torch.double)
+        w = torch.randn(4, 3, 5, dtype=torch.double)
+        b = torch.randn(4, dtype=torch.double)
+        layer = Conv1dfft(filter_value=w, bias_value=b, padding=2, args=args)
+        self.check_layer(layer=layer, conv=F.conv1d, x=x, w=w, b=b, padding=2)
+
+    def test_unsupported(self):
+        x = torch.randn(1, 1, 10, 10)
+        w = torch.randn(1, 1, 3, 3)
+        with self.assertRaises(Exception):
+            conv_fft_tiled(conv=lambda tiles: F.conv2d(tiles, w), input=x,
+                           kernel_size=(3, 3), tile_size=2)
+        with self.assertRaises(Exception):
+            conv_fft_tiled(conv=lambda tiles: F.conv2d(tiles, w), input=x,
+                           kernel_size=(3, 3), stride=2, tile_size=4,
+                           stride_type=StrideType.SPECTRAL)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -848,6 +848,100 @@ def complex_mul8_stride_cuda(x, y, out):
     return complex_mul_strid_cuda(x, y, out)
 
 
+def get_tile_steps(A, B, K, spectrum_size, item_size, memory_budget, scale=3):
+    """
+    Get the sizes of the tiles for the complex multiplication of x (A, K, ...)
+    and y (B, K, ...) summed over the K dimension, such that the intermediate
+    tensors fit in the memory budget.
+
+    The broadcast multiplication of a tile materializes the (a, b, k, ...)
+    complex tensor and complex_mul creates about scale such tensors. We split
+    first the A dimension (each tile of x is multiplied only once), then the
+    B dimension, and finally the summed K dimension (its partial sums are
+    accumulated in the output).
+
+    :param A: the size of the first dimension of x (e.g. N).
+    :param B: the size of the first dimension of y (e.g. F).
+    :param K: the size of the summed dimension (e.g. C).
+    :param spectrum_size: the number of complex coefficients in a single
+    spectrum (e.g. H * (W // 2 + 1)).
+    :param item_size: the size of the real number in bytes.
+    :param memory_budget: the max number of bytes for the intermediate
+    tensors.
+    :param scale: the number of the intermediate tensors of the tile size.
+    :return: the steps (tile sizes) for the A, B and K dimensions.
+
+    >>> get_tile_steps(A=32, B=16, K=8, spectrum_size=10, item_size=4,
+    ... memory_budget=2 ** 30)
+    (32, 16, 8)
+    >>> get_tile_steps(A=32, B=16, K=8, spectrum_size=10, item_size=4,
+    ... memory_budget=16 * 8 * 10 * 2 * 4 * 3 * 5)
+    (5, 16, 8)
+    >>> get_tile_steps(A=32, B=16, K=8, spectrum_size=10, item_size=4,
+    ... memory_budget=4 * 8 * 10 * 2 * 4 * 3)
+    (1, 4, 8)
+    >>> get_tile_steps(A=32, B=16, K=8, spectrum_size=10, item_size=4,
+    ... memory_budget=1)
+    (1, 1, 1)
+    """
+    # The max number of (a, b, k) spectra in a tile.
+    elems = memory_budget // (scale * spectrum_size * 2 * item_size)
+    step_A = min(A, max(1, elems // (B * K)))
+    step_B = B
+    step_K = K
+    if step_A == 1:
+        step_B = min(B, max(1, elems // K))
+        if step_B == 1:
+            step_K = min(K, max(1, elems))
+    return step_A, step_B, step_K
+
+
+def complex_mul_tiled(x, y, memory_budget, out=None):
+    """
+    Compute out[a, b] = sum_k x[a, k] * y[b, k] for complex numbers, tile by
+    tile, so that the intermediate tensors fit in the memory budget.
+
+    :param x: the complex tensor of size (A, K, ..., 2).
+    :param y: the complex tensor of size (B, K, ..., 2).
+    :param memory_budget: the max number of bytes for the intermediate
+    tensors.
+    :param out: the preallocated output of size (A, B, ..., 2).
+    :return: the output of size (A, B, ..., 2).
+
+    >>> x = torch.randn(5, 3, 4, 2, 2)
+    >>> y = torch.randn(6, 3, 4, 2, 2)
+    >>> expect = complex_mul(x.unsqueeze(1), y).sum(dim=2)
+    >>> result = complex_mul_tiled(x, y, memory_budget=1)
+    >>> np.testing.assert_allclose(expect, result, rtol=1e-5, atol=1e-5)
+    >>> result = complex_mul_tiled(x, y, memory_budget=2 ** 30)
+    >>> np.testing.assert_allclose(expect, result, rtol=1e-5, atol=1e-5)
+    """
+    A, K = x.shape[:2]
+    B = y.shape[0]
+    spectrum_size = x[0, 0].numel() // 2
+    step_A, step_B, step_K = get_tile_steps(
+        A=A, B=B, K=K, spectrum_size=spectrum_size,
+        item_size=get_elem_size(x), memory_budget=memory_budget)
+    if out is None:
+        out = torch.zeros((A, B) + x.shape[2:], dtype=x.dtype, device=x.device)
+    elif step_K < K:
+        out.zero_()
+    for start_A in range(0, A, step_A):
+        x_tile = x[start_A:start_A + step_A].unsqueeze(1)
+        for start_B in range(0, B, step_B):
+            y_tile = y[start_B:start_B + step_B]
+            out_tile = out[start_A:start_A + step_A, start_B:start_B + step_B]
+            for start_K in range(0, K, step_K):
+                stop_K = start_K + step_K
+                result = complex_mul(x_tile[:, :, start_K:stop_K],
+                                     y_tile[:, start_K:stop_K]).sum(dim=2)
+                if step_K < K:
+                    out_tile += result
+                else:
+                    out_tile.copy_(result)
+    return out
+
+
 def pytorch_conjugate(x):
     """
     Conjugate all the complex numbers in tensor x (not in place, clone x).
@@ -1337,23 +1431,20 @@ def preserve_energy_index_back(xfft, preserve_energy_rate=None,
     assert len(squared) == input_length
     # Sum of squared values of the signal of length input_length.
     full_energy = torch.sum(squared).item()
-    current_energy = 0.0
     preserved_energy = full_energy * preserve_energy_rate / 100.0
-    index = 0
-    increment = 1
     if is_reversed:
-        index = input_length - 1
-        increment = -1
-    # Accumulate the energy (and increment the index) until the required
-    # preserved energy is reached.
-    while current_energy < preserved_energy and (
-            index < input_length and index >= 0):
-        current_energy += squared[index]
-        index += increment
-    if current_energy < preserved_energy:
+        squared = torch.flip(squared, dims=[0])
+    # Accumulate the energy until the required preserved energy is reached.
+    if squared.sum().item() < preserved_energy:
         raise AssertionError("We have to accumulate at least preserve energy! "
                              "The index is too low.")
-    return input_length - index
+    count = get_retained_count(
+        squared=squared.unsqueeze(0),
+        preserved_energy=torch.tensor([[preserved_energy]])).item()
+    if is_reversed:
+        # The index stops one before the last accumulated coefficient.
+        return count + 1
+    return input_length - count
 
 
 def preserve_energy2D_index_back(xfft, preserve_energy_rate=None):
@@ -2979,7 +3070,7 @@ def correlate_fft_signals2D(xfft, yfft, input_height, input_width,
         raise Exception(f"Unsupported number of dimensions: {xfft.dim()}")
     out = torch.irfft(input=freq_mul, signal_ndim=signal_ndim,
                       signal_sizes=(input_height, input_width), onesided=True)
-    all_tensors_size = get_tensors_elem_size()
+    # all_tensors_size = get_tensors_elem_size()
     # print("all tensor size in corr: ", all_tensors_size / 2 ** 30)
     # print("torch max memory in corr: ", torch.cuda.max_memory_allocated() / 2 ** 30)
     del freq_mul
@@ -3588,6 +3679,165 @@ def retain_big_coef_bulk(xfft, preserve_energy=None, index_back=None):
     return xfft
 
 
+def get_retained_count(squared, preserved_energy, preserved_indexes=None):
+    """
+    Find how many coefficients have to be retained (counting from the
+    beginning of the squared array) to reach the preserved energy. This is the
+    batched version of the while loops used in the retain_*_coef methods: the
+    cumulative energy is computed with cumsum and the stop index is found with
+    searchsorted for all signals at once.
+
+    :param squared: the energies (squared absolute values) of the coefficients
+    in the order in which they are retained, the last dimension is the length
+    of the signal (..., L).
+    :param preserved_energy: the energy to be preserved for each signal (..., 1)
+    :param preserved_indexes: the max number of coefficients to be retained
+    :return: the number of retained coefficients for each signal (..., 1)
+
+    >>> squared = torch.tensor([[5., 3., 1.], [1., 0., 0.]])
+    >>> preserved_energy = torch.tensor([[7.], [0.]])
+    >>> counts = get_retained_count(squared, preserved_energy)
+    >>> np.testing.assert_equal(counts.numpy(), np.array([[2], [0]]))
+
+    >>> counts = get_retained_count(squared, torch.tensor([[9.], [1.]]),
+    ... preserved_indexes=2)
+    >>> np.testing.assert_equal(counts.numpy(), np.array([[2], [1]]))
+    """
+    length = squared.shape[-1]
+    current_energy = torch.cumsum(squared, dim=-1).contiguous()
+    preserved_energy = preserved_energy.to(current_energy.dtype).contiguous()
+    # The number of coefficients for which the cumulative energy is still
+    # below the preserved energy (we keep adding coefficients until the
+    # preserved energy is reached so we retain one more coefficient).
+    counts = torch.searchsorted(current_energy, preserved_energy) + 1
+    counts = torch.clamp(counts, max=length)
+    # Nothing is retained if there is no energy to preserve.
+    counts = torch.where(preserved_energy > 0, counts,
+                         torch.zeros_like(counts))
+    if preserved_indexes is not None:
+        counts = torch.clamp(counts, min=0, max=max(preserved_indexes, 0))
+    return counts
+
+
+def retain_low_coef_vectorized(xfft, preserve_energy=None, index_back=None):
+    """
+    The batched version of retain_low_coef without the Python loops over the
+    data points, channels and coefficients. It gives the same results as the
+    retain_low_coef.
+
+    :param xfft: the input signal (4 dimensions: batch size, channel, signal,
+    complex numbers).
+    :param preserve_energy: the percentage of energy to be preserved
+    :param index_back: the number of zeroed out coefficients (starting from the
+    highest frequency).
+    :return: the zeroed-out high frequency coefficients
+
+    >>> xfft = torch.tensor([[[[0.1, 0.1], [30., 40.], [1.1, 2.1], [0.1, -0.8],
+    ... [0.0, -1.0]]]])
+    >>> result = retain_low_coef_vectorized(xfft, preserve_energy=5)
+    >>> expected = torch.tensor([[[[0.1, 0.1], [30., 40.], [0.0, 0.0],
+    ... [0.0, 0.0], [0.0, 0.0]]]])
+    >>> np.testing.assert_equal(actual=result.numpy(), desired=expected.numpy())
+
+    >>> xfft = torch.tensor([[[[1., 2.], [3., 4.], [0.1, 0.1]]],
+    ... [[[0.0, 0.1], [2.0, -6.0], [0.01, 0.002]]]])
+    >>> result = retain_low_coef_vectorized(xfft, index_back=1)
+    >>> expected = torch.tensor([[[[1., 2.], [3., 4.], [0.0, 0.0]]],
+    ... [[[0.0, 0.1], [2.0, -6.0], [0.0, 0.0]]]])
+    >>> np.testing.assert_equal(actual=result.numpy(), desired=expected.numpy())
+    """
+    INPUT_ERROR = "Specify only one of: compress_rate, preserve_energy"
+    if (index_back is not None and index_back > 0) and (
+            preserve_energy is not None and preserve_energy < 100):
+        raise TypeError(INPUT_ERROR)
+    if xfft is None or len(xfft) == 0:
+        return xfft
+    if (preserve_energy is not None and preserve_energy < 100) or (
+            index_back is not None and index_back > 0):
+        full_energy, squared = get_full_energy_bulk(xfft)
+        length = squared.shape[-1]
+        preserved_indexes = length
+        if index_back is not None:
+            preserved_indexes = length - index_back
+        preserved_energy = full_energy
+        if preserve_energy is not None:
+            preserved_energy = full_energy * preserve_energy / 100
+        counts = get_retained_count(squared=squared,
+                                    preserved_energy=preserved_energy,
+                                    preserved_indexes=preserved_indexes)
+        positions = torch.arange(length, device=xfft.device)
+        mask = (positions < counts).unsqueeze(-1)
+        return torch.where(mask, xfft, torch.zeros_like(xfft))
+    return xfft
+
+
+def retain_big_coef_vectorized(xfft, preserve_energy=None, index_back=None):
+    """
+    The batched version of retain_big_coef_bulk without the Python loops over
+    the data points, channels and coefficients. The coefficients are sorted by
+    their energy, the number of retained coefficients is found from the
+    cumulative energy with searchsorted and the retained coefficients are
+    selected with a scattered mask. It gives the same results as the
+    retain_big_coef_bulk (and retain_big_coef).
+
+    :param xfft: the input signal (4 dimensions: batch size, channel, signal,
+    complex numbers).
+    :param preserve_energy: the percentage of energy to be preserved
+    :param index_back: the number of zeroed out coefficients (starting from the
+    smallest one).
+    :return: the zeroed-out small coefficients
+
+    >>> xfft = torch.tensor([[[[1.1, 2.1], [30., 40.], [0.1, 0.1], [0.1, -0.8],
+    ... [0.0, -1.0]]]])
+    >>> result = retain_big_coef_vectorized(xfft, preserve_energy=5)
+    >>> expected = torch.tensor([[[[0.0, 0.0], [30., 40.], [0.0, 0.0],
+    ... [0.0, 0.0], [0.0, 0.0]]]])
+    >>> np.testing.assert_equal(actual=result.numpy(), desired=expected.numpy())
+
+    >>> xfft = torch.tensor([[[[0.1, 0.1], [30., 40.], [1.1, 2.1], [0.1, -0.8],
+    ... [0.0, -1.0]]]])
+    >>> result = retain_big_coef_vectorized(xfft, index_back=3)
+    >>> expected = torch.tensor([[[[0.0, 0.0], [30., 40.], [1.1, 2.1],
+    ... [0.0, 0.0], [0.0, 0.0]]]])
+    >>> np.testing.assert_equal(actual=result.numpy(), desired=expected.numpy())
+
+    >>> xfft = torch.tensor([[[[1., 2.], [3., 4.], [0.1, 0.1]],
+    ... [[0.0, 0.1], [2.0, -6.0], [0.01, 0.002]]]])
+    >>> result = retain_big_coef_vectorized(xfft, preserve_energy=90)
+    >>> expected = torch.tensor([[[[1., 2.], [3., 4.], [0.0, 0.0]],
+    ... [[0.0, 0.0], [2.0, -6.0], [0.0, 0.0]]]])
+    >>> np.testing.assert_equal(actual=result.numpy(), desired=expected.numpy())
+    """
+    INPUT_ERROR = "Specify only one of: compress_rate, preserve_energy"
+    if (index_back is not None and index_back > 0) and (
+            preserve_energy is not None and preserve_energy < 100):
+        raise TypeError(INPUT_ERROR)
+    if xfft is None or len(xfft) == 0:
+        return xfft
+    if (preserve_energy is not None and preserve_energy < 100) or (
+            index_back is not None and index_back > 0):
+        full_energy, squared = get_full_energy_bulk(xfft)
+        squared, indices = torch.sort(squared, descending=True)
+        length = squared.shape[-1]
+        preserved_indexes = length
+        if index_back is not None:
+            preserved_indexes = length - index_back
+        preserved_energy = full_energy
+        if preserve_energy is not None:
+            preserved_energy = full_energy * preserve_energy / 100
+        counts = get_retained_count(squared=squared,
+                                    preserved_energy=preserved_energy,
+                                    preserved_indexes=preserved_indexes)
+        # Mark the first counts positions in the sorted order and scatter the
+        # marks back to the original positions of the coefficients.
+        positions = torch.arange(length, device=xfft.device)
+        retained = positions < counts
+        mask = torch.zeros_like(retained).scatter_(-1, indices, retained)
+        mask = mask.unsqueeze(-1)
+        return torch.where(mask, xfft, torch.zeros_like(xfft))
+    return xfft
+
+
 def cuda_mem_show(is_debug=True, info="", omit_objs=[]):
     if torch.cuda.is_available() and is_debug is True:
         cuda_mem_empty(is_debug=is_debug)
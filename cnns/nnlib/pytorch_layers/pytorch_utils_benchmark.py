@@ -3,6 +3,10 @@ import unittest
 from cnns.nnlib.pytorch_layers.pytorch_utils import flip
 from cnns.nnlib.pytorch_layers.pytorch_utils import preserve_energy2D
 from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef_bulk
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef_vectorized
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_low_coef
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_low_coef_vectorized
 from cnns.nnlib.pytorch_layers.conv2D_fft import Conv2dfft
 from cnns.nnlib.utils.arguments import Arguments
 from cnns.nnlib.utils.general_utils import StrideType
@@ -296,6 +300,52 @@ class TestPytorchUtils(unittest.TestCase):
         #     actual=out.cpu().numpy(), desired=expect.cpu().numpy(), rtol=1e-4,
         #     err_msg="actual out different from desired expected")
 
+    def test_retain_coef_vectorized_speedup(self):
+        if torch.cuda.is_available():
+            device = torch.device("cuda")
+        else:
+            device = torch.device("cpu")
+        dtype = torch.float
+        I = 2
+        preserve_energy = 90
+        repeat = 3
+        # cases: N, C, L (the length of the spectrum)
+        cases = [(1, 1, 64),
+                 (8, 3, 64),
+                 (32, 3, 129),
+                 (32, 16, 129),
+                 (64, 16, 257),
+                 (128, 32, 257)]
+
+        for case in cases:
+            print("\ncase: ", case)
+            N, C, L = case
+            xfft = torch.randn(N, C, L, I, device=device, dtype=dtype)
+
+            for loop_fn, vectorized_fn in [
+                (retain_big_coef_bulk, retain_big_coef_vectorized),
+                (retain_low_coef, retain_low_coef_vectorized)]:
+                start = time.time()
+                for _ in range(repeat):
+                    expect = loop_fn(xfft, preserve_energy=preserve_energy)
+                loop_time = (time.time() - start) / repeat
+
+                # warm-up
+                vectorized_fn(xfft, preserve_energy=preserve_energy)
+                start = time.time()
+                for _ in range(repeat):
+                    result = vectorized_fn(xfft,
+                                           preserve_energy=preserve_energy)
+                if torch.cuda.is_available():
+                    torch.cuda.synchronize()
+                vectorized_time = (time.time() - start) / repeat
+
+                print(f"{loop_fn.__name__} time: {loop_time}, "
+                      f"{vectorized_fn.__name__} time: {vectorized_time}, "
+                      f"speedup: {loop_time / vectorized_time} X")
+
+                np.testing.assert_equal(actual=result.cpu().numpy(),
+                                        desired=expect.cpu().numpy())
 
 
 if __name__ == '__main__':
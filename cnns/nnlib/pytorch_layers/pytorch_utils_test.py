@@ -3,8 +3,15 @@ import unittest
 from cnns.nnlib.pytorch_layers.pytorch_utils import flip
 from cnns.nnlib.pytorch_layers.pytorch_utils import preserve_energy2D
 from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul
+from cnns.nnlib.pytorch_layers.pytorch_utils import complex_mul_tiled
 from cnns.nnlib.pytorch_layers.pytorch_utils import correlate_dct_1D
 from cnns.nnlib.pytorch_layers.pytorch_utils import get_sorted_spectrum_indices
+from cnns.nnlib.pytorch_layers.pytorch_utils import preserve_energy_index_back
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef_bulk
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_big_coef_vectorized
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_low_coef
+from cnns.nnlib.pytorch_layers.pytorch_utils import retain_low_coef_vectorized
 import numpy as np
 from torch import tensor
 import time
@@ -796,5 +803,77 @@ class TestPytorchUtils(unittest.TestCase):
         assert xfft[min_index // W_xfft, min_index % W_xfft, 1] == 0.7
 
 
+    def test_retain_big_coef_vectorized(self):
+        torch.manual_seed(31)
+        N, C, L, I = 4, 3, 33, 2
+        xfft = torch.randn(N, C, L, I)
+        for preserve_energy in [0, 10, 50, 90, 99, 99.9, 100]:
+            expected = retain_big_coef_bulk(xfft,
+                                            preserve_energy=preserve_energy)
+            result = retain_big_coef_vectorized(
+                xfft, preserve_energy=preserve_energy)
+            np.testing.assert_equal(actual=result.numpy(),
+                                    desired=expected.numpy())
+            expected = retain_big_coef(xfft, preserve_energy=preserve_energy)
+            np.testing.assert_equal(actual=result.numpy(),
+                                    desired=expected.numpy())
+        for index_back in [0, 1, 10, L - 1, L]:
+            expected = retain_big_coef_bulk(xfft, index_back=index_back)
+            result = retain_big_coef_vectorized(xfft, index_back=index_back)
+            np.testing.assert_equal(actual=result.numpy(),
+                                    desired=expected.numpy())
+
+    def test_retain_low_coef_vectorized(self):
+        torch.manual_seed(31)
+        N, C, L, I = 4, 3, 33, 2
+        xfft = torch.randn(N, C, L, I)
+        for preserve_energy in [0, 10, 50, 90, 99, 99.9, 100]:
+            expected = retain_low_coef(xfft, preserve_energy=preserve_energy)
+            result = retain_low_coef_vectorized(
+                xfft, preserve_energy=preserve_energy)
+            np.testing.assert_equal(actual=result.numpy(),
+                                    desired=expected.numpy())
+        for index_back in [0, 1, 10, L - 1, L]:
+            expected = retain_low_coef(xfft, index_back=index_back)
+            result = retain_low_coef_vectorized(xfft, index_back=index_back)
+            np.testing.assert_equal(actual=result.numpy(),
+                                    desired=expected.numpy())
+
+    def test_preserve_energy_index_back(self):
+        torch.manual_seed(31)
+        N, C, L, I = 4, 3, 33, 2
+        xfft = torch.randn(N, C, L, I)
+        squared = (xfft[..., 0] ** 2 + xfft[..., 1] ** 2).sum(dim=0).sum(dim=0)
+        for is_reversed in [False, True]:
+            for preserve_energy in [0.0, 10, 50, 90, 99.9]:
+                preserved = squared.sum().item() * preserve_energy / 100.0
+                # The accumulation loop that was used before.
+                current_energy = 0.0
+                index = L - 1 if is_reversed else 0
+                increment = -1 if is_reversed else 1
+                while current_energy < preserved and 0 <= index < L:
+                    current_energy += squared[index]
+                    index += increment
+                result = preserve_energy_index_back(
+                    xfft, preserve_energy, is_reversed=is_reversed)
+                self.assertEqual(result, L - index)
+
+    def test_complex_mul_tiled(self):
+        N, F, C, H, W = 8, 6, 5, 7, 4
+        xfft = torch.randn(N, C, H, W, 2)
+        yfft = torch.randn(F, C, H, W, 2)
+        expect = complex_mul(xfft.unsqueeze(dim=1), yfft).sum(dim=2)
+        spectrum_bytes = H * W * 2 * 4 * 3
+        # Tiles over: N, N and F, N and F and C.
+        for memory_budget in [spectrum_bytes * F * C * 3,
+                              spectrum_bytes * C * 2,
+                              spectrum_bytes * 2]:
+            out = torch.empty(N, F, H, W, 2)
+            result = complex_mul_tiled(xfft, yfft, memory_budget=memory_budget,
+                                       out=out)
+            self.assertIs(out, result)
+            np.testing.assert_allclose(expect, result, rtol=1e-5, atol=1e-5)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,581 @@
+"""
+Batched driver for the sweeps of main_adversarial: the images are attacked B
+at a time on the device of the PyTorch model, the recovery defenses are
+applied to whole batches and the results are returned per image (with the
+same fields as the result of main_adversarial.run).
+
+The attacks work in the input space of the model with the bounds
+(args.min, args.max) and follow the semantics of the foolbox attacks used by
+main_adversarial.run:
+
+FGSM - the smallest of the linearly spaced epsilons (up to
+args.attack_strength) in the direction of the sign of the gradient that
+changes the label.
+
+ProjectedGradientDescentAttack - the L-infinity PGD with the epsilon 0.3 and
+the step size 0.01 (relative to the bounds) run for int(args.attack_strength)
+iterations that stop at the first success of an image.
+
+RandomStartProjectedGradientDescentAttack - the L-infinity PGD from a random
+start with the foolbox defaults: 40 iterations that stop at the first success
+and the search of the smallest epsilon per image starting from 0.3. For both
+PGD attacks the adversarial closest to the original image (the L2 distance)
+is returned.
+
+CarliniWagnerL2Attack - the L2 attack optimized in the tanh space with the
+binary search over the constant c (starting from args.attack_strength).
+"""
+import math
+import time
+import torch
+import torch.nn.functional as F
+from cnns.nnlib.datasets.transformations.denorm_round_norm import \
+    DenormRoundNorm
+from cnns.nnlib.datasets.transformations.denormalize import Denormalize
+from cnns.nnlib.pytorch_layers.fft_band_2D_complex_mask import \
+    FFTBandFunctionComplexMask2D
+from cnns.nnlib.robustness.channels.channels_definition import \
+    compress_svd_batch
+from cnns.nnlib.robustness.channels.channels_definition import \
+    gauss_noise_torch
+from cnns.nnlib.robustness.channels.channels_definition import \
+    laplace_noise_torch
+from cnns.nnlib.robustness.channels.channels_definition import \
+    subtract_rgb
+from cnns.nnlib.robustness.channels.channels_definition import \
+    uniform_noise_torch
+from cnns.nnlib.utils.complex_mask import get_hyper_mask
+from cnns.nnlib.utils.general_utils import AdversarialType
+from cnns.nnlib.utils.object import Object
+
+
+def is_adversarial(logits, labels, target=None):
+    """
+    :param logits: the output of the model.
+    :param labels: the true labels.
+    :param target: the target classes (None - untargeted).
+    :return: the mask of the adversarial examples.
+    """
+    predictions = logits.argmax(dim=1)
+    if target is not None:
+        return predictions == target
+    return predictions != labels
+
+
+def get_attack_loss(logits, labels, target=None):
+    """
+    :return: the per image loss to be maximized by the attack.
+    """
+    if target is not None:
+        return -F.cross_entropy(logits, target, reduction='none')
+    return F.cross_entropy(logits, labels, reduction='none')
+
+
+def get_loss_gradient(model, images, labels, target=None):
+    images = images.detach().clone().requires_grad_(True)
+    loss = get_attack_loss(model(images), labels, target=target)
+    grad, = torch.autograd.grad(loss.sum(), images)
+    return grad
+
+
+def get_l2(images, other):
+    return (images - other).flatten(start_dim=1).norm(p=2, dim=1)
+
+
+def fgsm_batch(model, images, labels, bounds, max_epsilon=1.0, epsilons=1000,
+               target=None):
+    """
+    The fast gradient sign method with the linear search over the epsilons.
+
+    :param model: the PyTorch model.
+    :param images: the input images of shape (N, C, H, W).
+    :param labels: the true labels.
+    :param bounds: the (min, max) values of the input.
+    :param max_epsilon: the largest epsilon (relative to the bounds).
+    :param epsilons: the number of the epsilons to try.
+    :param target: the target classes (None - untargeted).
+    :return: the adversarial images and the mask of the found adversarials.
+    """
+    min_, max_ = bounds
+    sign = get_loss_gradient(model, images, labels, target=target).sign()
+    adv = images.clone()
+    found = torch.zeros(len(images), dtype=torch.bool, device=images.device)
+    with torch.no_grad():
+        for epsilon in torch.linspace(0, max_epsilon, epsilons + 1)[1:]:
+            active = (~found).nonzero().flatten()
+            if len(active) == 0:
+                break
+            perturbed = images[active] + epsilon.item() * (
+                    max_ - min_) * sign[active]
+            perturbed = perturbed.clamp(min_, max_)
+            success = is_adversarial(
+                model(perturbed), labels[active],
+                target=None if target is None else target[active])
+            adv[active[success]] = perturbed[success]
+            found[active[success]] = True
+    return adv, found
+
+
+def pgd_batch(model, images, labels, bounds, epsilon=0.3, step_size=0.01,
+              iterations=40, random_start=False, binary_search=True,
+              return_early=True, target=None):
+    """
+    The projected gradient descent with the L-infinity constraint (as the
+    foolbox ProjectedGradientDescentAttack, the defaults are the same).
+
+    :param epsilon: the max perturbation (relative to the bounds), the
+    initial epsilon of the search with the binary_search.
+    :param step_size: the step size (relative to the bounds), with the
+    binary_search the ratio step_size / epsilon is kept for each epsilon.
+    :param iterations: the number of the gradient steps.
+    :param random_start: start from a random point in the epsilon ball.
+    :param binary_search: search the smallest epsilon for each image: the
+    epsilon is increased 1.5 times until the attack succeeds and then
+    bisected, for 20 steps each (True) or the given number of steps (False -
+    only the epsilon is tried).
+    :param return_early: stop the steps of an image (for an epsilon) once it
+    is adversarial.
+    :return: the adversarial images (the closest to the original images) and
+    the mask of the found adversarials.
+    """
+    min_, max_ = bounds
+    N = len(images)
+    device = images.device
+    adv = images.clone()
+    found = torch.zeros(N, dtype=torch.bool, device=device)
+    best = torch.full((N,), math.inf, device=device)
+    shape = (-1,) + (1,) * (images.dim() - 1)
+
+    def select(values, indexes):
+        return None if values is None else values[indexes]
+
+    def run_one(indexes, epsilons, step_sizes):
+        # One run of the attack for the images with the indexes, returns the
+        # mask of the successful images.
+        original = images[indexes]
+        eps = (epsilons * (max_ - min_)).view(shape)
+        steps = (step_sizes * (max_ - min_)).view(shape)
+        x = original.clone()
+        if random_start:
+            x = x + (torch.rand_like(x) * 2 - 1) * eps
+            x = x.clamp(min_, max_)
+        success = torch.zeros(len(indexes), dtype=torch.bool, device=device)
+        active = torch.arange(len(indexes), device=device)
+        for _ in range(iterations):
+            if len(active) == 0:
+                break
+            image_indexes = indexes[active]
+            grad = get_loss_gradient(model, x[active], labels[image_indexes],
+                                     target=select(target, image_indexes))
+            with torch.no_grad():
+                x_active = x[active] + steps[active] * grad.sign()
+                x_active = torch.min(
+                    torch.max(x_active, original[active] - eps[active]),
+                    original[active] + eps[active])
+                x_active = x_active.clamp(min_, max_)
+                x[active] = x_active
+                is_adv = is_adversarial(model(x_active),
+                                        labels[image_indexes],
+                                        target=select(target, image_indexes))
+                distance = get_l2(x_active, original[active])
+                better = is_adv & (distance < best[image_indexes])
+                adv[image_indexes[better]] = x_active[better]
+                best[image_indexes[better]] = distance[better]
+                found[image_indexes[is_adv]] = True
+                success[active[is_adv]] = True
+                if return_early:
+                    active = active[~is_adv]
+        return success
+
+    all_indexes = torch.arange(N, device=device)
+    if not binary_search:
+        run_one(all_indexes, torch.full((N,), float(epsilon), device=device),
+                torch.full((N,), float(step_size), device=device))
+        return adv, found
+
+    if isinstance(binary_search, bool):
+        k = 20
+    else:
+        k = int(binary_search)
+    factor = step_size / epsilon
+    # The exponential search for an epsilon that works.
+    epsilons = torch.full((N,), float(epsilon), device=device)
+    good = torch.full((N,), math.inf, device=device)
+    pending = all_indexes
+    for _ in range(k):
+        if len(pending) == 0:
+            break
+        success = run_one(pending, epsilons[pending],
+                          factor * epsilons[pending])
+        good[pending[success]] = epsilons[pending[success]]
+        epsilons[pending[~success]] *= 1.5
+        pending = pending[~success]
+    # The binary search between 0 and the epsilon that works.
+    searched = torch.isfinite(good).nonzero().flatten()
+    bad = torch.zeros(N, device=device)
+    for _ in range(k):
+        if len(searched) == 0:
+            break
+        epsilons = (good[searched] + bad[searched]) / 2
+        success = run_one(searched, epsilons, factor * epsilons)
+        good[searched[success]] = epsilons[success]
+        bad[searched[~success]] = epsilons[~success]
+    return adv, found
+
+
+def cw_batch(model, images, labels, bounds, initial_const=0.01,
+             max_iterations=1000, binary_search_steps=5, confidence=0,
+             learning_rate=5e-3, target=None):
+    """
+    The Carlini & Wagner L2 attack with the per image binary search over the
+    constant c.
+
+    :param initial_const: the initial value of the constant c.
+    :param max_iterations: the number of the optimization steps per constant.
+    :param binary_search_steps: the number of the values of c to try.
+    :param confidence: the required margin of the adversarial class.
+    :param learning_rate: the learning rate of the Adam optimizer.
+    :return: the adversarial images (with the smallest L2 distance) and the
+    mask of the found adversarials.
+    """
+    min_, max_ = bounds
+    N = len(images)
+    device = images.device
+
+    def to_tanh_space(x):
+        x = (x - min_) / (max_ - min_) * 2 - 1
+        return torch.atanh(x.clamp(-1 + 1e-6, 1 - 1e-6))
+
+    def from_tanh_space(w):
+        return (torch.tanh(w) + 1) / 2 * (max_ - min_) + min_
+
+    w_images = to_tanh_space(images)
+    classes = labels if target is None else target
+    const = torch.full((N,), float(initial_const), device=device)
+    lower = torch.zeros(N, device=device)
+    upper = torch.full((N,), math.inf, device=device)
+    adv = images.clone()
+    found = torch.zeros(N, dtype=torch.bool, device=device)
+    best = torch.full((N,), math.inf, device=device)
+
+    for _ in range(binary_search_steps):
+        delta = torch.zeros_like(images, requires_grad=True)
+        optimizer = torch.optim.Adam([delta], lr=learning_rate)
+        success_const = torch.zeros(N, dtype=torch.bool, device=device)
+        for _ in range(max_iterations):
+            x = from_tanh_space(w_images + delta)
+            logits = model(x)
+            one_hot = F.one_hot(classes, num_classes=logits.shape[1]).bool()
+            class_logit = logits[one_hot]
+            other_logit = logits.masked_fill(one_hot, -math.inf).max(
+                dim=1).values
+            if target is None:
+                margin = class_logit - other_logit + confidence
+            else:
+                margin = other_logit - class_logit + confidence
+            distance = ((x - images) ** 2).flatten(start_dim=1).sum(dim=1)
+            loss = distance + const * margin.clamp(min=0)
+            optimizer.zero_grad()
+            loss.sum().backward()
+            optimizer.step()
+            with torch.no_grad():
+                success = is_adversarial(logits, labels, target=target)
+                l2 = distance.sqrt()
+                better = success & (l2 < best)
+                adv[better] = x.detach()[better]
+                best[better] = l2[better]
+                success_const |= success
+        found |= success_const
+        # Decrease c for the images attacked successfully, increase otherwise.
+        upper = torch.where(success_const, torch.min(upper, const), upper)
+        lower = torch.where(success_const, lower, torch.max(lower, const))
+        const = torch.where(torch.isinf(upper), const * 10,
+                            (lower + upper) / 2)
+    return adv, found
+
+
+# The attacks (from main_adversarial.run) supported in the batch mode.
+BATCH_ATTACKS = ("FGSM", "ProjectedGradientDescentAttack",
+                 "RandomStartProjectedGradientDescentAttack",
+                 "CarliniWagnerL2Attack")
+
+
+def get_batch_attack(args):
+    """
+    :param args: the global arguments.
+    :return: the function(model, images, labels, target) that returns the
+    adversarial images and the mask of the found adversarials, or None if no
+    attack is set.
+    """
+    name = args.attack_name
+    bounds = (args.min, args.max)
+    if name is None or name == 'None':
+        return None
+    if name == "FGSM":
+        def attack(model, images, labels, target=None):
+            return fgsm_batch(model, images, labels, bounds=bounds,
+                              max_epsilon=args.attack_strength,
+                              target=target)
+    elif name == "ProjectedGradientDescentAttack":
+        # As in main_adversarial.run: the attack_strength is the number of
+        # the iterations with the fixed epsilon.
+        iterations = int(args.attack_strength)
+        if iterations < 1:
+            raise Exception(
+                f"The attack_strength of {name} is the number of the "
+                f"iterations, got: {args.attack_strength}.")
+
+        def attack(model, images, labels, target=None):
+            return pgd_batch(model, images, labels, bounds=bounds,
+                             iterations=iterations, binary_search=False,
+                             target=target)
+    elif name == "RandomStartProjectedGradientDescentAttack":
+        # As in main_adversarial.run: the foolbox defaults.
+        def attack(model, images, labels, target=None):
+            return pgd_batch(model, images, labels, bounds=bounds,
+                             random_start=True, target=target)
+    elif name == "CarliniWagnerL2Attack":
+        def attack(model, images, labels, target=None):
+            return cw_batch(model, images, labels, bounds=bounds,
+                            initial_const=args.attack_strength,
+                            max_iterations=args.attack_max_iterations,
+                            binary_search_steps=args.binary_search_steps,
+                            confidence=args.attack_confidence,
+                            target=target)
+    else:
+        raise Exception(f"Unsupported attack for the batch mode: {name}, "
+                        f"use one of: {', '.join(BATCH_ATTACKS)}.")
+    return attack
+
+
+def get_batch_recoveries(args, device=torch.device("cpu")):
+    """
+    :param args: the global arguments.
+    :param device: the device of the images.
+    :return: the list of (prefix, function(images)) of the recovery defenses
+    enabled in args (as in main_adversarial.run).
+    """
+    if args.recover_iterations > 0 or args.noise_iterations > 0:
+        raise Exception("The randomized defense with many iterations is not "
+                        "supported in the batch mode.")
+    bounds = (args.min, args.max)
+    if args.values_per_channel > 0:
+        rounder = DenormRoundNorm(
+            mean_array=args.mean_array, std_array=args.std_array,
+            values_per_channel=args.values_per_channel, device=device)
+
+    def fft(images):
+        return FFTBandFunctionComplexMask2D.forward(
+            ctx=None, input=images.clone(), args=args, val=0,
+            get_mask=get_hyper_mask, onesided=True)
+
+    def uniform(images):
+        return images + uniform_noise_torch(
+            images, epsilon=args.noise_epsilon, bounds=bounds)
+
+    def svd(images):
+        return compress_svd_batch(images, compress_rate=args.svd_compress)
+
+    recoveries = []
+    if args.values_per_channel > 0:
+        recoveries.append(("round_", rounder))
+    if args.compress_fft_layer > 0:
+        recoveries.append(("fft_", fft))
+    if args.noise_sigma > 0:
+        recoveries.append(("gauss_", lambda images: images + gauss_noise_torch(
+            epsilon=args.noise_sigma, images=images, bounds=bounds)))
+    if args.noise_epsilon > 0:
+        recoveries.append(("noise_", uniform))
+    if args.laplace_epsilon > 0:
+        recoveries.append((
+            "laplace_", lambda images: images + laplace_noise_torch(
+                epsilon=args.laplace_epsilon, images=images, bounds=bounds)))
+    if args.svd_compress > 0:
+        recoveries.append(("svd_", svd))
+    if args.rgb_value > 0:
+        recoveries.append(("rgb_", lambda images: subtract_rgb(
+            images=images, subtract_value=args.rgb_value)))
+    # The combined defenses are run only for their recover_type.
+    combined = {
+        "roundfft": (args.values_per_channel > 0 and
+                     args.compress_fft_layer > 0,
+                     lambda images: fft(rounder(images))),
+        "fftround": (args.values_per_channel > 0 and
+                     args.compress_fft_layer > 0,
+                     lambda images: rounder(fft(images))),
+        "fftuniform": (args.noise_epsilon > 0 and args.compress_fft_layer > 0,
+                       lambda images: uniform(fft(images))),
+        "roundsvd": (args.values_per_channel > 0 and args.svd_compress > 0,
+                     lambda images: svd(rounder(images))),
+        "rounduniform": (args.values_per_channel > 0 and
+                         args.noise_epsilon > 0,
+                         lambda images: uniform(rounder(images))),
+    }
+    if args.recover_type in combined:
+        is_enabled, recover = combined[args.recover_type]
+        if is_enabled:
+            recoveries.append((args.recover_type + "_", recover))
+    return recoveries
+
+
+# The defenses that main_adversarial.run always reports (their labels are
+# None if they are disabled).
+DEFENSE_PREFIXES = ["round_", "fft_", "gauss_", "noise_", "laplace_", "svd_",
+                    "rgb_"]
+# The combined defenses reported only for their recover_type.
+COMBINED_RECOVER_TYPES = ["roundfft", "fftround", "fftuniform", "roundsvd",
+                          "rounduniform"]
+
+
+class BatchClassifier(object):
+    """
+    Classify the batches of images and measure their distances to the
+    original images (in the [0, 1] range if the images are normalized).
+    """
+
+    def __init__(self, model, args, device=torch.device("cpu")):
+        self.model = model
+        self.args = args
+        if args.normalize_pytorch:
+            self.denormalizer = Denormalize(
+                mean_array=args.mean_array, std_array=args.std_array,
+                device=device)
+        else:
+            self.denormalizer = None
+
+    def __call__(self, images, original_images):
+        """
+        :return: the per image class ids, labels, confidences and the L2, L1
+        and Linf distances to the original images.
+        """
+        with torch.no_grad():
+            probs = F.softmax(self.model(images), dim=1)
+        confidence, class_id = probs.max(dim=1)
+        diff = images - original_images
+        if self.denormalizer is not None:
+            diff = self.denormalizer(images) - self.denormalizer(
+                original_images)
+        diff = diff.flatten(start_dim=1)
+        result = Object()
+        result.class_id = class_id.tolist()
+        result.label = [self.args.from_class_idx_to_label[x] for x in
+                        result.class_id]
+        result.confidence = confidence.tolist()
+        result.L2_distance = diff.norm(p=2, dim=1).tolist()
+        result.L1_distance = diff.norm(p=1, dim=1).tolist()
+        result.Linf_distance = diff.abs().max(dim=1).values.tolist()
+        return result
+
+
+def add_result(results, batch_result, prefix, indexes=None):
+    """
+    Add the per image values of batch_result to the results with the prefix.
+
+    :param results: the list of the per image Objects.
+    :param batch_result: the result of the BatchClassifier.
+    :param prefix: the prefix of the fields, e.g., adv_.
+    :param indexes: the indexes in the results of the images in the batch
+    (None - all the images).
+    """
+    if indexes is None:
+        indexes = range(len(results))
+    for field, values in batch_result.__dict__.items():
+        for index, value in zip(indexes, values):
+            setattr(results[index], prefix + field, value)
+
+
+def run_batch(model, images, true_ids, args, attack=None, recoveries=(),
+              classifier=None):
+    """
+    Attack a batch of images and apply the recovery defenses.
+
+    :param model: the PyTorch model.
+    :param images: the original images of shape (N, C, H, W).
+    :param true_ids: the true class ids.
+    :param args: the global arguments.
+    :param attack: the batched attack (from get_batch_attack).
+    :param recoveries: the recovery defenses (from get_batch_recoveries).
+    :param classifier: the BatchClassifier for the model.
+    :return: the list of the per image results (Object with the labels of the
+    defenses as in the result of main_adversarial.run).
+    """
+    if classifier is None:
+        classifier = BatchClassifier(model=model, args=args,
+                                     device=images.device)
+    N = len(images)
+    results = [Object() for _ in range(N)]
+    for result, true_id in zip(results, true_ids.tolist()):
+        result.true_id = true_id
+        result.true_label = args.from_class_idx_to_label[true_id]
+        result.adv_label = None
+        # The labels of the disabled defenses are None (as in run).
+        for prefix in DEFENSE_PREFIXES:
+            setattr(result, prefix + "label", None)
+        if args.recover_type in COMBINED_RECOVER_TYPES:
+            setattr(result, args.recover_type + "_label", None)
+    original = classifier(images, images)
+    add_result(results, original, prefix="original_")
+
+    # Only the correctly classified images are attacked.
+    inputs = images
+    if attack is not None and args.adv_type == AdversarialType.BEFORE:
+        correct = (torch.tensor(original.class_id, device=images.device) ==
+                   true_ids).nonzero().flatten()
+        if len(correct) > 0:
+            target = None
+            if args.target_class > -1:
+                target = torch.full_like(true_ids[correct], args.target_class)
+            start_adv = time.time()
+            adv, found = attack(model, images[correct], true_ids[correct],
+                                target=target)
+            adv_timing = (time.time() - start_adv) / len(correct)
+            found_indexes = correct[found].tolist()
+            if len(found_indexes) > 0:
+                adv = adv[found]
+                add_result(results, classifier(adv, images[correct[found]]),
+                           prefix="adv_", indexes=found_indexes)
+                if args.result_store:
+                    for index, adv_image in zip(found_indexes, adv):
+                        results[index].adv_image = adv_image.cpu().numpy()
+                inputs = images.clone()
+                inputs[correct[found]] = adv
+            for index in correct.tolist():
+                results[index].adv_timing = adv_timing
+
+    for prefix, recover in recoveries:
+        recovered = recover(inputs)
+        add_result(results, classifier(recovered, images), prefix=prefix)
+    return results
+
+
+def run_batches(model, dataset, index_range, args, batch_size=32,
+                device=torch.device("cpu")):
+    """
+    Run the attack and the recovery defenses for the images of the dataset.
+
+    :param model: the PyTorch model.
+    :param dataset: the dataset with the (image, class id) pairs.
+    :param index_range: the indexes of the images.
+    :param args: the global arguments.
+    :param batch_size: the number of the images attacked at once.
+    :param device: the device of the model.
+    :return: the generator of the per image results (in the order of the
+    index_range).
+    """
+    model.eval()
+    attack = get_batch_attack(args)
+    recoveries = get_batch_recoveries(args, device=device)
+    classifier = BatchClassifier(model=model, args=args, device=device)
+    index_range = list(index_range)
+    for start in range(0, len(index_range), batch_size):
+        indexes = index_range[start:start + batch_size]
+        items = [dataset[index] for index in indexes]
+        images = torch.stack([torch.as_tensor(x) for x, _ in items]).to(
+            device)
+        true_ids = torch.tensor([int(y) for _, y in items], device=device)
+        results = run_batch(model=model, images=images, true_ids=true_ids,
+                            args=args, attack=attack, recoveries=recoveries,
+                            classifier=classifier)
+        for image_index, result in zip(indexes, results):
+            result.image_index = image_index
+            yield result
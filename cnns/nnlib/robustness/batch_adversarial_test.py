@@ -0,0 +1,187 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+import torch
+from torch import nn
+from cnns.nnlib.robustness.batch_adversarial import cw_batch
+from cnns.nnlib.robustness.batch_adversarial import fgsm_batch
+from cnns.nnlib.robustness.batch_adversarial import get_batch_attack
+from cnns.nnlib.robustness.batch_adversarial import pgd_batch
+from cnns.nnlib.robustness.batch_adversarial import run_batches
+from cnns.nnlib.robustness.sweep_results import RECOVER_PREFIXES
+from cnns.nnlib.robustness.sweep_results import aggregate_result
+from cnns.nnlib.robustness.sweep_results import get_sweep_stats
+from cnns.nnlib.robustness.sweep_results import write_result_labels
+from cnns.nnlib.utils.arguments import Arguments
+from cnns.nnlib.utils.general_utils import AdversarialType
+
+
+class LinearNet(nn.Module):
+
+    def __init__(self):
+        super(LinearNet, self).__init__()
+        self.linear = nn.Linear(3 * 4 * 4, 10)
+
+    def forward(self, x):
+        return self.linear(x.flatten(1))
+
+
+class TestBatchAdversarial(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+        self.model = LinearNet()
+        self.images = torch.rand(16, 3, 4, 4)
+        with torch.no_grad():
+            self.labels = self.model(self.images).argmax(dim=1)
+        self.bounds = (0.0, 1.0)
+
+    def get_args(self):
+        args = Arguments()
+        args.min, args.max = self.bounds
+        args.mean_array = np.zeros((3, 1, 1), dtype=np.float32)
+        args.std_array = np.ones((3, 1, 1), dtype=np.float32)
+        args.normalize_pytorch = False
+        args.from_class_idx_to_label = {x: str(x) for x in range(10)}
+        args.adv_type = AdversarialType.BEFORE
+        args.recover_type = "rounding"
+        args.recover_iterations = 0
+        args.noise_iterations = 0
+        args.values_per_channel = 8
+        args.compress_fft_layer = 0
+        args.noise_sigma = 0
+        args.noise_epsilon = 0
+        args.laplace_epsilon = 0
+        args.svd_compress = 50
+        args.rgb_value = 0
+        args.target_class = -1
+        return args
+
+    def check_adversarial(self, adv, found):
+        self.assertTrue(found.any())
+        self.assertGreaterEqual(adv.min().item(), self.bounds[0])
+        self.assertLessEqual(adv.max().item(), self.bounds[1])
+        with torch.no_grad():
+            predictions = self.model(adv).argmax(dim=1)
+        self.assertTrue(torch.equal(predictions[found] != self.labels[found],
+                                    torch.ones_like(self.labels[found],
+                                                    dtype=torch.bool)))
+        # The images without an adversarial are returned unchanged.
+        self.assertTrue(torch.equal(adv[~found], self.images[~found]))
+
+    def test_attacks(self):
+        adv, found = fgsm_batch(self.model, self.images, self.labels,
+                                bounds=self.bounds, max_epsilon=0.5,
+                                epsilons=100)
+        self.check_adversarial(adv, found)
+        adv, found = pgd_batch(self.model, self.images, self.labels,
+                               bounds=self.bounds, iterations=20,
+                               binary_search=False)
+        self.check_adversarial(adv, found)
+        self.assertLessEqual((adv - self.images).abs().max().item(),
+                             0.3 + 1e-6)
+        adv, found = cw_batch(self.model, self.images, self.labels,
+                              bounds=self.bounds, initial_const=1.0,
+                              max_iterations=50, binary_search_steps=3,
+                              learning_rate=0.05)
+        self.check_adversarial(adv, found)
+
+    def test_pgd_epsilon_search(self):
+        # A small epsilon is increased until the attack succeeds and the
+        # found epsilons are smaller than the fixed epsilon 0.3.
+        fixed_adv, fixed_found = pgd_batch(
+            self.model, self.images, self.labels, bounds=self.bounds,
+            binary_search=False)
+        adv, found = pgd_batch(self.model, self.images, self.labels,
+                               bounds=self.bounds, epsilon=0.01)
+        self.check_adversarial(adv, found)
+        self.assertTrue(found.all())
+        linf = (adv - self.images).flatten(1).abs().max(dim=1)[0]
+        fixed_linf = (fixed_adv - self.images).flatten(1).abs().max(dim=1)[0]
+        self.assertTrue((linf[fixed_found] <= fixed_linf[fixed_found] +
+                         1e-6).all())
+        self.assertLess(linf.max().item(), 0.3)
+        # A single image is attacked as in a batch.
+        single_adv, single_found = pgd_batch(
+            self.model, self.images[:1], self.labels[:1], bounds=self.bounds,
+            epsilon=0.01)
+        self.assertTrue(torch.equal(found[:1], single_found))
+        self.assertTrue(torch.allclose(adv[:1], single_adv, atol=1e-6))
+
+    def test_pgd_iterations(self):
+        args = self.get_args()
+        args.attack_name = "ProjectedGradientDescentAttack"
+        args.attack_strength = 0.01
+        with self.assertRaises(Exception):
+            get_batch_attack(args)
+
+    def test_targeted_attack(self):
+        target = torch.full_like(self.labels, 3)
+        adv, found = pgd_batch(self.model, self.images, self.labels,
+                               bounds=self.bounds, iterations=30,
+                               target=target)
+        self.assertTrue(found.any())
+        with torch.no_grad():
+            predictions = self.model(adv[found]).argmax(dim=1)
+        self.assertTrue((predictions == 3).all())
+
+    def test_run_batches(self):
+        # The per image results do not depend on the size of the batch.
+        args = self.get_args()
+        args.attack_name = "ProjectedGradientDescentAttack"
+        args.attack_strength = 10
+        dataset = list(zip(self.images, self.labels.tolist()))
+        index_range = range(0, 16, 2)
+        expect = list(run_batches(self.model, dataset, index_range, args,
+                                  batch_size=1))
+        results = list(run_batches(self.model, dataset, index_range, args,
+                                   batch_size=5))
+        self.assertEqual(len(index_range), len(results))
+        fields = ["image_index", "true_label", "original_label", "adv_label",
+                  "round_label", "svd_label"]
+        for expect_result, result in zip(expect, results):
+            for field in fields:
+                self.assertEqual(expect_result[field], result[field])
+            if result.adv_label is not None:
+                self.assertAlmostEqual(expect_result.adv_L2_distance,
+                                       result.adv_L2_distance, places=4)
+                self.assertNotEqual(result.true_label, result.adv_label)
+        self.assertTrue(any(result.adv_label is not None for result in results))
+
+    def test_aggregate_disabled_defenses(self):
+        # The batch results of the disabled defenses go through the
+        # aggregation of the sweep and the labels file as the results of run.
+        args = self.get_args()
+        args.attack_name = "ProjectedGradientDescentAttack"
+        args.attack_strength = 10
+        args.values_per_channel = 0
+        args.svd_compress = 0
+        dataset = list(zip(self.images, self.labels.tolist()))
+        with tempfile.TemporaryDirectory() as folder:
+            args.file_name_labels = os.path.join(folder, "labels.csv")
+            for recover_type in list(RECOVER_PREFIXES) + ["all", "empty"]:
+                args.recover_type = recover_type
+                stats = get_sweep_stats()
+                args.total_count = 0
+                for result in run_batches(self.model, dataset, range(4),
+                                          args, batch_size=3):
+                    self.assertIsNone(
+                        result[RECOVER_PREFIXES.get(recover_type, "round_") +
+                               "label"])
+                    write_result_labels(args, result)
+                    args.total_count += 1
+                    aggregate_result(args, result, stats)
+                self.assertEqual(4, stats.count_original)
+                self.assertEqual(0, stats.count_recovered)
+            with open(args.file_name_labels) as file:
+                lines = file.read().splitlines()
+        # A header and 4 rows per recover type.
+        self.assertEqual((len(RECOVER_PREFIXES) + 2) * 5, len(lines))
+        header = lines[0].split(";")
+        self.assertIn("round_label", header)
+        self.assertEqual(len(header), len(lines[1].split(";")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -44,6 +44,7 @@ from cnns.nnlib.pytorch_architecture import vgg_fft
 
 from cnns.nnlib.pytorch_architecture import resnet
 from cnns.nnlib.robustness.param_perturbation.utils import perturb_model_params
+from cnns.nnlib.robustness.ensemble_infer import ensemble_infer
 
 
 def linf_for(diff):
@@ -235,17 +236,6 @@ def attack_rand_fgsm(input_v, label_v, net, epsilon):
 
 
 # Ensemble by sum of probability
-def ensemble_infer(input_v, net, n=50, nclass=10):
-    net.eval()
-    batch_size = input_v.size()[0]
-    softmax = nn.Softmax()
-    prob = torch.zeros(batch_size, nclass).cuda()
-    for i in range(n):
-        prob += softmax(net(input_v))
-    pred = torch.argmax(prob, 1)
-    return pred
-
-
 def get_perturbed_net(opt):
     perturbed_net, _ = get_nets(opt)
     perturbed_net = perturb_model_params(
@@ -279,6 +269,10 @@ def apply_channel(adverse_v, opt):
     elif opt.channel == 'svd':
         adverse_v = compress_svd_batch(x=adverse_v,
                                        compress_rate=opt.noise_epsilon)
+    elif opt.channel == 'svd_randomized':
+        adverse_v = compress_svd_batch(x=adverse_v,
+                                       compress_rate=opt.noise_epsilon,
+                                       randomized=True)
     elif opt.channel == 'inv_fft':
         adverse_v = fft_channel(input=adverse_v,
                                 compress_rate=opt.noise_epsilon,
@@ -308,7 +302,9 @@ def apply_attack(attack_f, c, input, output, net, netAttack, opt):
             net_infer = net
         idx = torch.argmax(net_infer(adverse_v), dim=1)
     else:
-        idx = ensemble_infer(adverse_v, net=net, n=opt.ensemble)
+        idx = ensemble_infer(adverse_v, net=net, n=opt.ensemble,
+                             max_batch=opt.ensemble_batch,
+                             alpha=opt.ensemble_alpha)
     correct_idx = label_v.eq(idx)
     correct = torch.sum(correct_idx).item()
     count = output.numel()
@@ -913,6 +909,14 @@ if __name__ == "__main__":
                         default='cifar10')
     parser.add_argument('--mode', type=str, default='test')  # peek or test
     parser.add_argument('--ensemble', type=int, default=1)
+    parser.add_argument('--ensemble_batch', type=int, default=0,
+                        help='The max number of images in a forward pass of '
+                             'the ensemble inference (0 - one copy of the '
+                             'input per pass).')
+    parser.add_argument('--ensemble_alpha', type=float, default=0.0,
+                        help='The significance level of the early stopping '
+                             'of the ensemble inference (0 - no early '
+                             'stopping).')
     parser.add_argument('--batch_size', type=int,
                         default=3584,
                         # default=256,
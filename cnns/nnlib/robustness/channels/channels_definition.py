@@ -2,6 +2,7 @@ import torch
 import numpy as np
 from cnns.nnlib.utils.complex_mask import get_hyper_mask
 from cnns.nnlib.utils.complex_mask import get_inverse_hyper_mask
+from cnns.nnlib.utils.complex_mask import get_cached_mask
 from cnns.nnlib.utils.general_utils import next_power2
 from torch.nn.functional import pad as torch_pad
 from torch.distributions.laplace import Laplace
@@ -80,20 +81,22 @@ def fft_channel(input, compress_rate, val=0, get_mask=get_hyper_mask,
 
     _, _, H_xfft, W_xfft, _ = xfft.size()
 
-    mask, _ = get_mask(H=H_xfft, W=W_xfft,
-                       compress_rate=compress_rate,
-                       val=val, interpolate='const',
-                       onesided=onesided)
+    # The masks are cached on the device of xfft (built only once for the
+    # given size of the input and the compression rate).
+    mask = get_cached_mask(H=H_xfft, W=W_xfft,
+                           compress_rate=compress_rate,
+                           val=val, interpolate='const',
+                           onesided=onesided, dtype=xfft.dtype,
+                           device=xfft.device, get_mask=get_mask)
 
     if inverse_compress_rate > 0 and get_inv_mask is not None:
-        inv_mask, _ = get_inv_mask(H=H_xfft, W=W_xfft,
+        inv_mask = get_cached_mask(H=H_xfft, W=W_xfft,
                                    compress_rate=inverse_compress_rate,
                                    val=val, interpolate='const',
-                                   onesided=onesided)
+                                   onesided=onesided, dtype=xfft.dtype,
+                                   device=xfft.device, get_mask=get_inv_mask)
         mask = mask + inv_mask
 
-    mask = mask[:, 0:W_xfft, :]
-    mask = mask.to(xfft.dtype).to(xfft.device)
     xfft = xfft * mask
 
     out = torch.irfft(input=xfft,
@@ -463,30 +466,121 @@ def subtract_rgb_numpy(images, subtract_value):
     return ext_multiplier * images
 
 
-def compress_svd(torch_img, compress_rate):
-    C, H, W = torch_img.size()
-    D = min(H, W)
-    index = int((1 - compress_rate / 100) * D)
-    torch_compress_img = torch.zeros_like(torch_img)
-    for c in range(C):
-        iters = 10
+def batch_qr(x):
+    """
+    The reduced QR decomposition of a batch of matrices (torch.qr was moved to
+    torch.linalg.qr in the newer versions of PyTorch).
+    """
+    if hasattr(torch, 'linalg') and hasattr(torch.linalg, 'qr'):
+        return torch.linalg.qr(x)
+    return torch.qr(x)
+
+
+def randomized_svd(x, index, oversample=10, power_iters=2):
+    """
+    Randomized truncated SVD (Halko, Martinsson, Tropp) for a batch of
+    matrices. Only the top index singular vectors/values are computed.
+
+    :param x: the batch of matrices (B, H, W)
+    :param index: the number of singular values to retain
+    :param oversample: the number of additional random projections
+    :param power_iters: the number of power iterations (for the spectra that
+    decay slowly)
+    :return: u (B, H, index), s (B, index), v (B, W, index)
+    """
+    B, H, W = x.size()
+    k = min(index + oversample, H, W)
+    omega = torch.randn(B, W, k, dtype=x.dtype, device=x.device)
+    y = torch.matmul(x, omega)
+    for _ in range(power_iters):
+        q, _ = batch_qr(y)
+        y = torch.matmul(x, torch.matmul(x.transpose(-2, -1), q))
+    q, _ = batch_qr(y)
+    # Project x to the range of q: (B, k, W).
+    b = torch.matmul(q.transpose(-2, -1), x)
+    u_b, s, v = torch.svd(b)
+    u = torch.matmul(q, u_b)
+    return u[..., :index], s[..., :index], v[..., :index]
+
+
+def svd_low_rank(x, index, randomized=False, iters=10):
+    """
+    Batched low rank reconstruction of the last 2 dimensions of x.
+
+    :param x: the input tensor (..., H, W), e.g. (N, C, H, W)
+    :param index: the number of singular values to retain
+    :param randomized: use the randomized truncated svd (cheaper if index is
+    much smaller than min(H, W))
+    :param iters: the number of svd retries for the slices that fail to
+    converge (the slice is returned unchanged if all the retries fail)
+    :return: the low rank approximation of x (the same size as x)
+
+    >>> x = torch.tensor([[[1.0, 0.0], [0.0, 2.0]]])
+    >>> svd_low_rank(x, index=1)
+    tensor([[[0., 0.],
+             [0., 2.]]])
+    """
+    size = x.size()
+    H, W = size[-2], size[-1]
+    flat = x.reshape(-1, H, W)
+
+    def reconstruct(u, s, v):
+        return torch.matmul(u * s.unsqueeze(-2), v.transpose(-2, -1))
+
+    def compress(a):
+        if randomized:
+            u, s, v = randomized_svd(a, index=index)
+        else:
+            u, s, v = torch.svd(a)
+            u, s, v = u[..., :index], s[..., :index], v[..., :index]
+        return reconstruct(u, s, v)
+
+    try:
+        result = compress(flat)
+        failed = ~torch.isfinite(result).reshape(result.size(0), -1).all(
+            dim=-1)
+        failed = failed & torch.isfinite(flat).reshape(flat.size(0), -1).all(
+            dim=-1)
+    except RuntimeError as ex:
+        print("SVD compression problem (batch): ", ex)
+        result = torch.empty_like(flat)
+        failed = torch.ones(flat.size(0), dtype=torch.bool, device=x.device)
+
+    # Fall back to the per slice svd only for the slices that failed.
+    for b in torch.nonzero(failed).flatten().tolist():
+        result[b] = flat[b]
         for i in range(iters):
             try:
-                u, s, v = torch.svd(torch_img[c])
-                u_c = u[:, :index]
-                s_c = s[:index]
-                v_c = v[:, :index]
-                torch_compress_img[c] = torch.mm(torch.mm(u_c, torch.diag(s_c)),
-                                                 v_c.t())
-                break
+                slice_result = compress(flat[b:b + 1])[0]
             except RuntimeError as ex:
                 msg = "SVD compression problem: ", ex, " iteration: ", i
                 print(msg)
+                continue
+            if torch.isfinite(slice_result).all():
+                result[b] = slice_result
+                break
+            print("SVD compression problem: non-finite values, iteration: ",
+                  i)
+
+    return result.reshape(size)
 
-                if i == (iters - 1):
-                    torch_compress_img[c] = torch_img[c]
 
-    return torch_compress_img
+def get_svd_compress_index(H, W, compress_rate):
+    """
+    :return: the number of singular values retained for the compress_rate (in
+    percent of the singular values that are removed).
+
+    >>> get_svd_compress_index(H=32, W=32, compress_rate=50)
+    16
+    """
+    D = min(H, W)
+    return int((1 - compress_rate / 100) * D)
+
+
+def compress_svd(torch_img, compress_rate, randomized=False):
+    C, H, W = torch_img.size()
+    index = get_svd_compress_index(H=H, W=W, compress_rate=compress_rate)
+    return svd_low_rank(torch_img, index=index, randomized=randomized)
 
 
 def compress_svd_numpy_through_torch(numpy_array, compress_rate):
@@ -496,12 +590,10 @@ def compress_svd_numpy_through_torch(numpy_array, compress_rate):
     return torch_image.cpu().numpy()
 
 
-def compress_svd_batch(x, compress_rate):
-    result = torch.zeros_like(x)
-    for i, torch_img in enumerate(x):
-        result[i] = compress_svd(torch_img=torch_img,
-                                 compress_rate=compress_rate)
-    return result
+def compress_svd_batch(x, compress_rate, randomized=False):
+    N, C, H, W = x.size()
+    index = get_svd_compress_index(H=H, W=W, compress_rate=compress_rate)
+    return svd_low_rank(x, index=index, randomized=randomized)
 
 
 def distort_svd(torch_img, distort_rate):
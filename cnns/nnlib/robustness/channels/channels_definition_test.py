@@ -1,5 +1,6 @@
 import logging
 import unittest
+from unittest import mock
 import time
 import numpy as np
 import torch
@@ -10,6 +11,10 @@ from cnns.nnlib.utils.arguments import Arguments
 from numpy.testing.utils import assert_allclose
 from cnns.nnlib.robustness.channels.channels_definition import \
     svd_transformation
+from cnns.nnlib.robustness.channels.channels_definition import \
+    compress_svd_batch
+from cnns.nnlib.robustness.channels.channels_definition import \
+    svd_low_rank
 
 
 class TestChannelsDefinition(unittest.TestCase):
@@ -155,3 +160,41 @@ class TestChannelsDefinition(unittest.TestCase):
         print('x: ', x)
         desired = np.sum(a, axis=0, keepdims=True)
         assert_allclose(actual=x, desired=desired, rtol=1e-6, atol=1e-12)
+
+    def testCompressSVDBatchAsPerChannel(self):
+        x = torch.rand(4, 3, 16, 16)
+        compress_rate = 50
+        index = int((1 - compress_rate / 100) * 16)
+        desired = torch.zeros_like(x)
+        for n in range(x.size(0)):
+            for c in range(x.size(1)):
+                u, s, v = torch.svd(x[n, c])
+                desired[n, c] = torch.mm(
+                    torch.mm(u[:, :index], torch.diag(s[:index])),
+                    v[:, :index].t())
+        actual = compress_svd_batch(x=x, compress_rate=compress_rate)
+        assert_allclose(actual=actual.numpy(), desired=desired.numpy(),
+                        rtol=1e-5, atol=1e-5)
+
+    def testCompressSVDBatchRandomized(self):
+        # The randomized svd is exact for the matrices of a low rank.
+        a = torch.rand(2, 3, 16, 2)
+        b = torch.rand(2, 3, 2, 16)
+        x = torch.matmul(a, b)
+        actual = svd_low_rank(x, index=2, randomized=True)
+        assert_allclose(actual=actual.numpy(), desired=x.numpy(),
+                        rtol=1e-4, atol=1e-4)
+
+    def testSVDLowRankNonFinite(self):
+        # The slices with the non-finite svd results (in the batch and in all
+        # the retries) are returned unchanged.
+        x = torch.rand(2, 3, 4, 4)
+        svd = torch.svd
+
+        def nan_svd(a):
+            u, s, v = svd(a)
+            return u, torch.full_like(s, float('nan')), v
+
+        with mock.patch("torch.svd", nan_svd):
+            actual = svd_low_rank(x, index=2, iters=3)
+        assert_allclose(actual=actual.numpy(), desired=x.numpy())
@@ -1,6 +1,7 @@
 import torch
 import numpy as np
 from cnns.nnlib.utils.complex_mask import get_hyper_mask
+from cnns.nnlib.utils.complex_mask import get_cached_mask
 from cnns.nnlib.utils.general_utils import next_power2
 from torch.nn.functional import pad as torch_pad
 from torch.distributions.laplace import Laplace
@@ -60,13 +61,12 @@ def fft_channel(input, compress_rate, val=0, get_mask=get_hyper_mask,
     _, _, H_xfft, W_xfft, _ = xfft.size()
     # assert H_fft == W_xfft, "The input tensor has to be squared."
 
-    mask, _ = get_mask(H=H_xfft, W=W_xfft,
-                       compress_rate=compress_rate,
-                       val=val, interpolate='const',
-                       onesided=onesided)
-    mask = mask[:, 0:W_xfft, :]
+    mask = get_cached_mask(H=H_xfft, W=W_xfft,
+                           compress_rate=compress_rate,
+                           val=val, interpolate='const',
+                           onesided=onesided, dtype=xfft.dtype,
+                           device=xfft.device, get_mask=get_mask)
     # print(mask)
-    mask = mask.to(xfft.dtype).to(xfft.device)
     xfft = xfft * mask
 
     out = torch.irfft(input=xfft,
@@ -0,0 +1,134 @@
+"""
+Ensemble inference (the expectation over the randomness) for the randomized
+defenses, e.g., the noise channels or the RSE nets.
+
+The n stochastic passes of the net can be stacked in the batch dimension:
+each forward pass evaluates several copies of the input images at once (up
+to max_batch images, by default one copy per pass). Optionally, the
+inference for an image is stopped early once its top class is statistically
+decided (a sequential sign test between the votes for the top class and the
+runner-up).
+
+The copies evaluated in one forward pass share the noise that a net samples
+once per call (e.g., the perturbation of the weights), so such nets have to be
+run with the default one copy per pass.
+"""
+import math
+import torch
+import torch.nn.functional as F
+
+
+def get_ensemble_copies(batch_size, n, max_batch=None):
+    """
+    :param batch_size: the number of the input images.
+    :param n: the number of the stochastic passes.
+    :param max_batch: the max number of images in a forward pass (None or 0 -
+    one copy per pass).
+    :return: the number of the copies of the input in a forward pass.
+
+    >>> get_ensemble_copies(batch_size=32, n=50, max_batch=512)
+    16
+    >>> get_ensemble_copies(batch_size=32, n=50)
+    1
+    >>> get_ensemble_copies(batch_size=32, n=50, max_batch=16)
+    1
+    """
+    if not max_batch:
+        return 1
+    return max(1, min(n, max_batch // batch_size))
+
+
+def get_decision_threshold(n, copies, alpha):
+    """
+    :param n: the number of the stochastic passes.
+    :param copies: the number of the copies in a forward pass.
+    :param alpha: the probability of stopping on a wrong top class (the level
+    is split among all the tests - the Bonferroni correction).
+    :return: the z-score that the normalized vote difference has to exceed.
+
+    >>> round(get_decision_threshold(n=50, copies=50, alpha=0.05), 2)
+    1.96
+    """
+    tests = math.ceil(n / copies)
+    normal = torch.distributions.Normal(0.0, 1.0)
+    return normal.icdf(torch.tensor(1.0 - alpha / (2 * tests))).item()
+
+
+def ensemble_predict(input_v, net, n=50, max_batch=None, alpha=None,
+                     min_samples=10):
+    """
+    Predict the classes by the sum of probabilities over n stochastic passes.
+
+    :param input_v: the input images of shape (N, C, H, W).
+    :param net: the randomized net.
+    :param n: the max number of the stochastic passes per image.
+    :param max_batch: the max number of images in a forward pass (None or 0 -
+    one copy of the input per pass).
+    :param alpha: the significance level of the early stopping (None - run
+    all the n passes).
+    :param min_samples: the min number of the passes before the early
+    stopping.
+    :return: the predicted classes, the average probabilities and the number
+    of the passes per image.
+    """
+    net.eval()
+    batch_size = input_v.size()[0]
+    device = input_v.device
+    copies = get_ensemble_copies(batch_size=batch_size, n=n,
+                                 max_batch=max_batch)
+    if alpha:
+        threshold = get_decision_threshold(n=n, copies=copies, alpha=alpha)
+    prob = None
+    votes = None
+    samples = torch.zeros(batch_size, dtype=torch.long, device=device)
+    active = torch.arange(batch_size, device=device)
+    done = 0
+    with torch.no_grad():
+        while done < n:
+            # More copies fit in a pass once some images are decided.
+            b = len(active)
+            k = get_ensemble_copies(batch_size=b, n=n - done,
+                                    max_batch=max_batch)
+            x = input_v[active]
+            logits = net(x.repeat(k, *([1] * (x.dim() - 1))))
+            probs = F.softmax(logits, dim=1).view(k, b, -1)
+            if prob is None:
+                nclass = probs.shape[-1]
+                prob = torch.zeros(batch_size, nclass, device=device)
+                votes = torch.zeros(batch_size, nclass, dtype=torch.long,
+                                    device=device)
+            prob[active] += probs.sum(dim=0)
+            votes[active] += F.one_hot(probs.argmax(dim=2),
+                                       num_classes=nclass).sum(dim=0)
+            samples[active] += k
+            done += k
+            if alpha and done >= min_samples and done < n and nclass > 1:
+                top, top_classes = votes[active].topk(2, dim=1)
+                difference = (top[:, 0] - top[:, 1]).float()
+                decided = difference > threshold * torch.sqrt(
+                    top.sum(dim=1).float())
+                # The prediction is by the probabilities, so they have to
+                # agree with the votes.
+                decided &= prob[active].argmax(dim=1) == top_classes[:, 0]
+                active = active[~decided]
+                if len(active) == 0:
+                    break
+    pred = torch.argmax(prob, 1)
+    return pred, prob / samples.unsqueeze(1).float(), samples
+
+
+def ensemble_infer(input_v, net, n=50, max_batch=None, alpha=None):
+    """
+    Ensemble by sum of probability.
+
+    :param input_v: the input images.
+    :param net: the randomized net.
+    :param n: the max number of the stochastic passes per image.
+    :param max_batch: the max number of images in a forward pass (None or 0 -
+    one copy of the input per pass).
+    :param alpha: the significance level of the early stopping.
+    :return: the predicted classes.
+    """
+    pred, _, _ = ensemble_predict(input_v=input_v, net=net, n=n,
+                                  max_batch=max_batch, alpha=alpha)
+    return pred
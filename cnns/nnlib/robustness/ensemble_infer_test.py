@@ -0,0 +1,84 @@
+import unittest
+import torch
+from torch import nn
+from cnns.nnlib.robustness.ensemble_infer import ensemble_infer
+from cnns.nnlib.robustness.ensemble_infer import ensemble_predict
+
+
+class NoisyNet(nn.Module):
+    """
+    A linear net with the gaussian noise added to its input (as in RSE).
+    """
+
+    def __init__(self, sigma):
+        super(NoisyNet, self).__init__()
+        self.sigma = sigma
+        self.linear = nn.Linear(3 * 4 * 4, 10)
+
+    def forward(self, x):
+        x = x + self.sigma * torch.randn_like(x)
+        return self.linear(x.flatten(1))
+
+
+class TestEnsembleInfer(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+        self.input = torch.rand(8, 3, 4, 4)
+
+    def test_ensemble_infer(self):
+        # Without the noise, the ensemble prediction is the prediction of the
+        # net, for any number of copies in a forward pass.
+        net = NoisyNet(sigma=0.0)
+        expect = net(self.input).argmax(dim=1)
+        for max_batch in [None, 8, 20, 1000]:
+            pred, prob, samples = ensemble_predict(
+                self.input, net=net, n=10, max_batch=max_batch)
+            self.assertTrue(torch.equal(expect, pred))
+            self.assertTrue(torch.equal(torch.full((8,), 10), samples))
+            self.assertTrue(torch.allclose(
+                torch.softmax(net(self.input), dim=1), prob, atol=1e-6))
+
+    def test_ensemble_sequence(self):
+        # The stacked copies are the same stochastic passes as the sequential
+        # calls of the net.
+        net = NoisyNet(sigma=0.5)
+        n = 6
+        torch.manual_seed(1)
+        prob = torch.zeros(8, 10)
+        with torch.no_grad():
+            noise = torch.randn(n, *self.input.shape)
+            for i in range(n):
+                prob += torch.softmax(
+                    net.linear((self.input + 0.5 * noise[i]).flatten(1)), 1)
+        # One copy per pass (the default) or all the copies at once.
+        for max_batch in [None, 8 * n]:
+            torch.manual_seed(1)
+            pred, avg_prob, _ = ensemble_predict(self.input, net=net, n=n,
+                                                 max_batch=max_batch)
+            self.assertTrue(torch.equal(prob.argmax(dim=1), pred))
+            self.assertTrue(torch.allclose(prob / n, avg_prob, atol=1e-6))
+
+    def test_default_one_copy(self):
+        # By default, each forward pass gets only the input images.
+        net = NoisyNet(sigma=0.5)
+        sizes = []
+        net.register_forward_hook(
+            lambda module, input, output: sizes.append(len(input[0])))
+        ensemble_predict(self.input, net=net, n=5)
+        self.assertEqual([8] * 5, sizes)
+
+    def test_early_stopping(self):
+        net = NoisyNet(sigma=0.1)
+        n = 200
+        pred, _, samples = ensemble_predict(self.input, net=net, n=n,
+                                            max_batch=40, alpha=0.01)
+        full_pred = ensemble_infer(self.input, net=net, n=n)
+        self.assertTrue(torch.equal(full_pred, pred))
+        # The decided images are not evaluated any more.
+        self.assertLess(samples.sum().item(), 8 * n)
+        self.assertTrue((samples >= 10).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,10 +18,11 @@ from cnns.nnlib.robustness.fast_attack.channels import laplace_noise_torch
 from cnns.nnlib.robustness.fast_attack.complex_mask import \
     get_inverse_hyper_mask
 from cnns.nnlib.robustness.fast_attack.channels import subtract_rgb
-from cnns.nnlib.robustness.fast_attack.nattack import nattack
+from cnns.nnlib.robustness.fast_attack.nattack import nattack_batch
 from cnns.nnlib.robustness.fast_attack.nattack import \
     iterations as nattack_iterations
 from cnns.nnlib.robustness.fast_attack.nattack import npop as nattack_population
+from cnns.nnlib.robustness.ensemble_infer import ensemble_infer
 from cnns.nnlib.utils.exec_args import get_args
 from cnns.nnlib.datasets.load_data import get_data
 from cnns.nnlib.robustness.foolbox_model import get_fmodel
@@ -38,16 +39,10 @@ def nattack_wrapper(input_v, label_v, net, c=None, opt=None):
         iterations = nattack_iterations
         population = nattack_population
 
-    adv_imgs = torch.zeros_like(input_v)
-    device = input_v.device
-    for i, (input, label) in enumerate(zip(input_v, label_v)):
-        adv_img = nattack(input=input, target=label, model=net,
-                          iterations=iterations, population=population)
-        if adv_img is not None:
-            adv_imgs[i] = adv_img.to(device)
-        else:
-            adv_imgs[i] = input
-    return adv_imgs
+    adv_imgs, _, _ = nattack_batch(inputs=input_v, targets=label_v, model=net,
+                                   iterations=iterations,
+                                   population=population)
+    return adv_imgs.to(input_v.device)
 
 
 def attack_eot_pgd(input_v, label_v, net, epsilon=8.0 / 255.0, opt=None):
@@ -152,18 +147,6 @@ def attack_rand_fgsm(input_v, label_v, net, epsilon):
     return adverse_v
 
 
-# Ensemble by sum of probability
-def ensemble_infer(input_v, net, n=50, nclass=10):
-    net.eval()
-    batch_size = input_v.size()[0]
-    softmax = nn.Softmax()
-    prob = torch.zeros(batch_size, nclass).to(args.device)
-    for i in range(n):
-        prob += softmax(net(input_v))
-    _, pred = torch.max(prob, 1)
-    return pred
-
-
 def to_numpy(tensor):
     return tensor.clone().detach().cpu().numpy()
 
@@ -220,7 +203,11 @@ def acc_under_attack(dataloader, net, c, attack_f, args, netAttack=None):
         net.eval()
         adverse_torch = args.normalizer(adv)
         if args.ensemble > 1:
-            idx = ensemble_infer(adverse_torch, net, n=50)
+            # The number of the passes is kept at 50 as before, the
+            # args.ensemble only switches the ensemble inference on.
+            idx = ensemble_infer(adverse_torch, net, n=50,
+                                 max_batch=args.ensemble_batch,
+                                 alpha=args.ensemble_alpha)
         else:
             logits = net(adverse_torch)
             _, idx = torch.max(logits, dim=1)
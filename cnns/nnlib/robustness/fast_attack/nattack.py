@@ -1,6 +1,6 @@
 import numpy as np
 import torch
-import cv2
+import torch.nn.functional as F
 
 # npop = 300  # population size
 npop = 100  # population size
@@ -75,6 +75,7 @@ def nattack(input, target, model, means=default_mean_array,
 
         num_classes = 10
         if dataset == 'imagenet':
+            import cv2
             num_classes = 1000
             temp = []
             for x in modify_try:
@@ -94,6 +95,7 @@ def nattack(input, target, model, means=default_mean_array,
         inputimg = np.tanh(newimg + modify_try) * boxmul + boxplus
         if runstep % 10 == 0:
             if dataset == 'imagenet':
+                import cv2
                 temp = []
                 for x in modify:
                     temp.append(
@@ -180,3 +182,138 @@ def nattack(input, target, model, means=default_mean_array,
     print('An adversarial example has not been found.')
     return None
 
+
+
+def clipping_batch(realdist, dist_type):
+    """
+    Clip the distortion of each sample separately.
+
+    :param realdist: the distortions of shape (N, C, H, W).
+    :param dist_type: Linf or L2.
+    :return: the clipped distortions.
+    """
+    if dist_type == "Linf":
+        return torch.clamp(realdist, -epsi_inf, epsi_inf)
+    elif dist_type == "L2":
+        l2_realdist = realdist.flatten(1).norm(dim=1).view(-1, 1, 1, 1)
+        return realdist * torch.clamp(epsi_l2 / (l2_realdist + epsilon),
+                                      max=1.0)
+    else:
+        raise Exception(f'Unknown dist_type: {dist_type}')
+
+
+def predict_batch(model, input, max_batch=None):
+    """
+    :param model: the model to query.
+    :param input: the images of shape (N, C, H, W).
+    :param max_batch: the max number of images passed to the model at once
+    (None - all the images at once).
+    :return: the softmax probabilities of shape (N, num_classes).
+    """
+    if max_batch is None or input.shape[0] <= max_batch:
+        logits = model(input)
+    else:
+        logits = torch.cat([model(chunk) for chunk in
+                            torch.split(input, max_batch)])
+    return F.softmax(logits.float(), dim=-1)
+
+
+def nattack_batch(inputs, targets, model, iterations=iterations,
+                  population=npop, dist_type='Linf', latent_size=None,
+                  max_batch=None, is_debug=False):
+    """
+    Batched NAttack: the populations of all the images are sampled and
+    evaluated together as a single (B*population, C, H, W) tensor on the
+    device of the model. An image stops being attacked (and queried) as soon
+    as its adversarial example is found.
+
+    :param inputs: the images of shape (B, C, H, W) with values in [0, 1].
+    :param targets: the correct labels of the images of shape (B,).
+    :param model: the attacked model.
+    :param iterations: the max number of iterations per image.
+    :param population: the population size (the number of queries per
+    iteration).
+    :param dist_type: Linf or L2.
+    :param latent_size: the (height, width) of the seed z, which is upsampled
+    bilinearly to the size of the image, e.g. (32, 32) for ImageNet (None -
+    the size of the image, no upsampling).
+    :param max_batch: the max number of images passed to the model at once.
+    :param is_debug: print the progress.
+    :return: the adversarial examples (the input images for the failed
+    attacks), the success flags and the number of queries per image.
+    """
+    parameter = next(model.parameters(), None)
+    device = parameter.device if parameter is not None else inputs.device
+    inputs = inputs.detach().to(device=device, dtype=torch.float32)
+    targets = targets.to(device).view(-1)
+    B, C, H, W = inputs.shape
+    if latent_size is None:
+        latent_size = (H, W)
+    h, w = latent_size
+
+    def upsample(z):
+        if (h, w) == (H, W):
+            return z
+        # align_corners=False matches cv2.INTER_LINEAR.
+        return F.interpolate(z, size=(H, W), mode='bilinear',
+                             align_corners=False)
+
+    adv = inputs.clone()
+    success = torch.zeros(B, dtype=torch.bool, device=device)
+    queries = torch.zeros(B, dtype=torch.long, device=device)
+    # The images are in [0, 1], so arctanh is applied to [-1, +1] scaled by
+    # (1 - eps).
+    newimg = torch.atanh((inputs - boxplus) / boxmul * (1. - 1e-6))
+    base = torch.tanh(newimg) * boxmul + boxplus
+    modify = torch.randn(B, C, h, w, device=device) * 0.001
+    active = torch.arange(B, device=device)
+
+    with torch.no_grad():
+        for runstep in range(iterations):
+            if runstep % 10 == 0:
+                realinput = torch.tanh(
+                    newimg[active] + upsample(modify[active])) * boxmul + boxplus
+                realclipdist = clipping_batch(
+                    realdist=realinput - base[active], dist_type=dist_type)
+                realclipinput = realclipdist + base[active]
+                outputsreal = predict_batch(model, realclipinput, max_batch)
+                queries[active] += 1
+                found = (outputsreal.argmax(dim=1) != targets[active]) & (
+                        realclipdist.flatten(1).abs().max(dim=1)[0] <= epsi_inf)
+                adv[active[found]] = realclipinput[found]
+                success[active[found]] = True
+                active = active[~found]
+                if is_debug:
+                    print(f'step: {runstep}, found: {success.sum().item()}/{B}')
+                if active.numel() == 0:
+                    break
+
+            b = active.numel()
+            Nsample = torch.randn(b, population, C, h, w, device=device)
+            # Step 1: draws a 'seed' z and then maps it by g_0(z) to the space
+            # of the same dimension as the input x.
+            modify_try = modify[active].unsqueeze(1) + sigma * Nsample
+            modify_try = upsample(modify_try.view(b * population, C, h, w))
+            inputimg = torch.tanh(
+                newimg[active].repeat_interleave(population, dim=0) +
+                modify_try) * boxmul + boxplus
+            active_base = base[active].repeat_interleave(population, dim=0)
+            clipdist = clipping_batch(realdist=inputimg - active_base,
+                                      dist_type=dist_type)
+            outputs = predict_batch(model, clipdist + active_base, max_batch)
+            queries[active] += population
+
+            target_onehot = F.one_hot(
+                targets[active].repeat_interleave(population),
+                num_classes=outputs.shape[1]).float()
+            real = torch.log((target_onehot * outputs).sum(1) + epsilon)
+            other = torch.log(((1. - target_onehot) * outputs -
+                               target_onehot * 10000.).max(1)[0] + epsilon)
+            Reward = -0.5 * torch.clamp(real - other, 0., 1000)
+            Reward = Reward.view(b, population)
+            A = (Reward - Reward.mean(dim=1, keepdim=True)) / (
+                    Reward.std(dim=1, unbiased=False, keepdim=True) + 1e-7)
+            modify[active] += (alpha / (population * sigma)) * torch.einsum(
+                'bn,bnchw->bchw', A, Nsample)
+
+    return adv, success, queries
@@ -0,0 +1,40 @@
+import unittest
+import torch
+from torch import nn
+from cnns.nnlib.robustness.fast_attack.nattack import epsi_inf
+from cnns.nnlib.robustness.fast_attack.nattack import nattack_batch
+
+
+class TestNattackBatch(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+        self.model = nn.Sequential(nn.Flatten(), nn.Linear(3 * 8 * 8, 10))
+
+    def test_nattack_batch(self):
+        inputs = torch.rand(6, 3, 8, 8)
+        with torch.no_grad():
+            labels = self.model(inputs).argmax(dim=1)
+        # The first image is misclassified before the attack.
+        labels[0] = (labels[0] + 1) % 10
+        iterations, population = 30, 20
+        adv, success, queries = nattack_batch(
+            inputs=inputs, targets=labels, model=self.model,
+            iterations=iterations, population=population, latent_size=(4, 4))
+        self.assertEqual(inputs.shape, adv.shape)
+        self.assertTrue(success[0].item())
+        self.assertEqual(1, queries[0].item())
+        max_queries = iterations * population + (iterations + 9) // 10
+        self.assertTrue((queries <= max_queries).all())
+        with torch.no_grad():
+            predictions = self.model(adv).argmax(dim=1)
+        # The successful adversarial examples are misclassified and within the
+        # epsilon ball, the failed ones are the input images.
+        self.assertTrue((predictions[success] != labels[success]).all())
+        self.assertLessEqual((adv - inputs).abs().max().item(), epsi_inf + 1e-5)
+        self.assertTrue(torch.equal(inputs[~success], adv[~success]))
+        self.assertTrue((queries[~success] == max_queries).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
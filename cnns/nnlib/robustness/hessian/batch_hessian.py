@@ -0,0 +1,189 @@
+"""
+Hessian (with respect to the input images) eigenvalues for many images at
+once.
+
+The gradient of the loss with respect to the input is computed (with its
+graph) once per batch of images and the graph is reused by all the
+Hessian-vector products (HVPs). The loss of a batch is the sum of the losses
+of the images, so its Hessian is block diagonal and a single backward pass
+through the graph computes the HVPs of all the images of the batch.
+Everything stays on the device of the model.
+"""
+import torch
+import torch.nn.functional as F
+from cnns.nnlib.robustness.hessian.pytorch_hessian_eigenthings.hessian_eigenthings.block_lanczos import \
+    block_krylov_eigen
+
+
+def get_device(model):
+    """
+    :return: the device of the parameters of the model.
+    """
+    for param in model.parameters():
+        return param.device
+    return torch.device("cpu")
+
+
+class BatchHVPOperatorInputs(object):
+    """
+    The Hessian-vector products of the loss with respect to the inputs for a
+    batch of images, one vector per image.
+    """
+
+    def __init__(self, model, images, labels, criterion=F.cross_entropy):
+        """
+        :param model: the PyTorch model (in the eval mode, so that the images
+        do not interact, e.g., in the batch norm).
+        :param images: the input images of shape (N, C, H, W).
+        :param labels: the labels of the images.
+        :param criterion: the loss function with the reduction argument.
+        """
+        device = get_device(model)
+        self.model = model
+        self.images = images.detach().to(device).requires_grad_(True)
+        self.labels = labels.to(device)
+        self.batch_size = len(images)
+        self.size = self.images[0].numel()
+        self.hvp_count = 0
+        loss = criterion(model(self.images), self.labels, reduction='sum')
+        # The graph of the gradient is kept for all the HVPs.
+        self.grad, = torch.autograd.grad(loss, self.images, create_graph=True)
+
+    def apply(self, vecs):
+        """
+        :param vecs: the vectors of shape (N, size), one vector per image.
+        :return: the Hessian-vector products of shape (N, size).
+        """
+        self.hvp_count += 1
+        hvp, = torch.autograd.grad(
+            self.grad, self.images, grad_outputs=vecs.view_as(self.images),
+            retain_graph=True)
+        return hvp.reshape(self.batch_size, -1)
+
+    def apply_block(self, vecs):
+        """
+        :param vecs: the blocks of vectors of shape (N, b, size), b vectors per
+        image.
+        :return: the Hessian-vector products of shape (N, b, size).
+        """
+        N, b, size = vecs.shape
+        self.hvp_count += b
+        grad_outputs = vecs.transpose(0, 1).reshape(b, *self.images.shape)
+        try:
+            # All the b backward passes through the graph at once (vmap).
+            hvp, = torch.autograd.grad(
+                self.grad, self.images, grad_outputs=grad_outputs,
+                retain_graph=True, is_grads_batched=True)
+        except RuntimeError:
+            # Some operations do not support the batching rules.
+            hvp = torch.stack([torch.autograd.grad(
+                self.grad, self.images, grad_outputs=grad_output,
+                retain_graph=True)[0] for grad_output in grad_outputs])
+        return hvp.reshape(b, N, size).transpose(0, 1)
+
+
+def batch_dot(x, y):
+    return (x * y).sum(dim=-1)
+
+
+def batch_power_iteration(operator, num_eigens=20, steps=20,
+                          error_threshold=1e-4):
+    """
+    Compute the top eigenvalues (by magnitude) of the operators of the images
+    with the deflated power iteration. The found eigenvectors are removed
+    explicitly from the HVPs (no nested deflated operators).
+
+    :param operator: the BatchHVPOperatorInputs.
+    :param num_eigens: the number of the eigenvalues per image.
+    :param steps: the max number of the steps of the power iteration per
+    eigenvalue.
+    :param error_threshold: the relative change of the eigenvalues of all the
+    images to stop the power iteration.
+    :return: the eigenvalues of shape (N, num_eigens) sorted in the descending
+    order and the eigenvectors of shape (N, num_eigens, size).
+    """
+    N, size = operator.batch_size, operator.size
+    device, dtype = operator.images.device, operator.images.dtype
+    eigenvals = torch.zeros(N, num_eigens, device=device, dtype=dtype)
+    eigenvecs = torch.zeros(N, num_eigens, size, device=device, dtype=dtype)
+
+    def deflated_apply(vec, k):
+        hvp = operator.apply(vec)
+        if k > 0:
+            # (N, k) coefficients of the vec in the found eigenvectors.
+            coefficients = torch.bmm(eigenvecs[:, :k],
+                                     vec.unsqueeze(2)).squeeze(2)
+            hvp = hvp - torch.bmm((eigenvals[:, :k] * coefficients).unsqueeze(
+                1), eigenvecs[:, :k]).squeeze(1)
+        return hvp
+
+    for k in range(num_eigens):
+        vec = torch.rand(N, size, device=device, dtype=dtype)
+        vec = vec / vec.norm(dim=1, keepdim=True)
+        prev_lambda = torch.zeros(N, device=device, dtype=dtype)
+        for _ in range(steps):
+            new_vec = deflated_apply(vec, k)
+            lambda_estimate = batch_dot(vec, new_vec)
+            vec = new_vec / new_vec.norm(dim=1, keepdim=True)
+            error = ((lambda_estimate - prev_lambda) / lambda_estimate).abs()
+            prev_lambda = lambda_estimate
+            if (error < error_threshold).all():
+                break
+        eigenvals[:, k] = lambda_estimate
+        eigenvecs[:, k] = vec
+
+    eigenvals, indexes = eigenvals.sort(dim=1, descending=True)
+    eigenvecs = eigenvecs.gather(
+        1, indexes.unsqueeze(2).expand(-1, -1, size))
+    return eigenvals, eigenvecs
+
+
+def batch_block_lanczos(operator, num_eigens=20, init_vecs=None, **kwargs):
+    """
+    Compute the top eigenvalues (by magnitude) of the operators of the images
+    with the restarted block Lanczos method.
+
+    The number of the HVPs per image is close to the one of the (ARPACK)
+    Lanczos method, a bit higher with the larger blocks (see
+    batch_hessian_benchmark). The gain is in the wall time: the HVPs of all
+    the images and of all the vectors of a block are batched.
+
+    :param operator: the BatchHVPOperatorInputs.
+    :param num_eigens: the number of the eigenvalues per image.
+    :param init_vecs: the vectors of shape (N, k, size) to start from, e.g.,
+    the eigenvectors of the previous images (warm start).
+    :param kwargs: the arguments of the block_krylov_eigen.
+    :return: the eigenvalues of shape (N, num_eigens) sorted in the descending
+    order and the eigenvectors of shape (N, num_eigens, size).
+    """
+    eigenvals, eigenvecs, _ = block_krylov_eigen(
+        operator.apply_block, batch_size=operator.batch_size,
+        size=operator.size, num_eigenthings=num_eigens, init_vecs=init_vecs,
+        device=operator.images.device, dtype=operator.images.dtype, **kwargs)
+    return eigenvals, eigenvecs
+
+
+def compute_hessian_eigenvalues(model, images, labels, num_eigens=20,
+                                criterion=F.cross_entropy,
+                                mode='block_lanczos', **kwargs):
+    """
+    :param model: the PyTorch model.
+    :param images: the batch of the input images.
+    :param labels: the labels of the images.
+    :param num_eigens: the number of the top eigenvalues per image.
+    :param criterion: the loss function.
+    :param mode: the eigen-solver: block_lanczos or power_iter.
+    :param kwargs: the arguments of the batch_block_lanczos or the
+    batch_power_iteration.
+    :return: the eigenvalues of shape (N, num_eigens) and the eigenvectors of
+    the Hessians of the loss with respect to the images.
+    """
+    operator = BatchHVPOperatorInputs(model=model, images=images,
+                                      labels=labels, criterion=criterion)
+    if mode == 'block_lanczos':
+        return batch_block_lanczos(operator, num_eigens=num_eigens, **kwargs)
+    elif mode == 'power_iter':
+        return batch_power_iteration(operator, num_eigens=num_eigens,
+                                     **kwargs)
+    else:
+        raise Exception(f"Unknown eigen-solver mode: {mode}")
@@ -0,0 +1,65 @@
+import time
+import unittest
+import torch
+import torch.nn.functional as F
+from torch import nn
+from torch.utils.data import DataLoader
+from cnns.nnlib.robustness.hessian.pytorch_hessian_eigenthings.hessian_eigenthings import \
+    HVPOperatorInputs
+from cnns.nnlib.robustness.hessian.pytorch_hessian_eigenthings.hessian_eigenthings import \
+    compute_hessian_eigenthings
+from cnns.nnlib.robustness.hessian.batch_hessian import \
+    BatchHVPOperatorInputs
+from cnns.nnlib.robustness.hessian.batch_hessian import \
+    batch_block_lanczos
+
+
+class TestBatchHessianBenchmark(unittest.TestCase):
+
+    def test_benchmark_num_eigens_20(self):
+        # The HVP counts and the times for the 20 top eigenvalues of the
+        # Hessians of a few images with the deflated power iteration and the
+        # ARPACK Lanczos (one image at a time, the gradient is recomputed for
+        # each HVP) and with the block Lanczos (all the images at once).
+        num_eigens = 20
+        model = nn.Sequential(
+            nn.Conv2d(3, 8, 3, padding=1), nn.Tanh(), nn.Flatten(),
+            nn.Linear(8 * 8 * 8, 10)).eval()
+        images = torch.rand(8, 3, 8, 8)
+        labels = torch.randint(0, 10, (8,))
+
+        class CountingOperator(HVPOperatorInputs):
+            hvp_count = 0
+
+            def apply(self, vec):
+                CountingOperator.hvp_count += 1
+                return super(CountingOperator, self).apply(vec)
+
+        results = {}
+        for mode in ['power_iter', 'lanczos']:
+            CountingOperator.hvp_count = 0
+            start = time.time()
+            for image, label in zip(images, labels):
+                dataloader = DataLoader([(image, label)], batch_size=1)
+                kwargs = {'max_steps': 1000} if mode == 'lanczos' else {}
+                compute_hessian_eigenthings(
+                    model=model, dataloader=dataloader,
+                    loss=F.cross_entropy, num_eigenthings=num_eigens,
+                    mode=mode, use_gpu=False,
+                    hvp_operator_class=CountingOperator, **kwargs)
+            results[mode] = (CountingOperator.hvp_count / len(images),
+                             time.time() - start)
+
+        start = time.time()
+        operator = BatchHVPOperatorInputs(model, images, labels)
+        eigenvals, _ = batch_block_lanczos(operator, num_eigens=num_eigens)
+        # A batched HVP computes the HVPs of all the images at once.
+        results['block_lanczos'] = (operator.hvp_count, time.time() - start)
+        for mode, (hvp_count, elapsed) in results.items():
+            print(f"{mode}: HVPs per image: {hvp_count}, "
+                  f"time (sec): {elapsed}")
+        self.assertEqual((8, num_eigens), eigenvals.shape)
+
+
+if __name__ == '__main__':
+    unittest.main()
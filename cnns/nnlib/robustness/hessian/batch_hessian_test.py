@@ -0,0 +1,128 @@
+import unittest
+import numpy as np
+import torch
+import torch.nn.functional as F
+from torch import nn
+from cnns.nnlib.robustness.hessian.pytorch_hessian_eigenthings.hessian_eigenthings import \
+    HVPOperatorInputs
+from cnns.nnlib.robustness.hessian.pytorch_hessian_eigenthings.hessian_eigenthings import \
+    HVPOperatorParams
+from cnns.nnlib.robustness.hessian.pytorch_hessian_eigenthings.hessian_eigenthings import \
+    compute_hessian_eigenthings
+from cnns.nnlib.robustness.hessian.batch_hessian import \
+    BatchHVPOperatorInputs
+from cnns.nnlib.robustness.hessian.batch_hessian import \
+    batch_block_lanczos
+from cnns.nnlib.robustness.hessian.batch_hessian import \
+    compute_hessian_eigenvalues
+
+
+class TestBatchHessian(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+        self.model = nn.Sequential(
+            nn.Flatten(), nn.Linear(3 * 4 * 4, 32), nn.Tanh(),
+            nn.Linear(32, 10)).double().eval()
+        self.images = torch.rand(4, 3, 4, 4, dtype=torch.double)
+        self.labels = torch.randint(0, 10, (4,))
+
+    def get_hessian(self, index):
+        def loss(image):
+            return F.cross_entropy(self.model(image.view(1, 3, 4, 4)),
+                                   self.labels[index:index + 1])
+
+        return torch.autograd.functional.hessian(
+            loss, self.images[index].flatten())
+
+    def test_hvp(self):
+        operator = BatchHVPOperatorInputs(self.model, self.images,
+                                          self.labels)
+        vecs = torch.rand(4, 48, dtype=torch.double)
+        # The graph of the gradient is reused by many HVPs.
+        for _ in range(2):
+            hvp = operator.apply(vecs)
+            for index in range(4):
+                expect = self.get_hessian(index).matmul(vecs[index])
+                self.assertTrue(torch.allclose(expect, hvp[index]))
+        self.assertEqual(2, operator.hvp_count)
+
+    def test_hvp_operators_reuse_graph(self):
+        # The gradient graph is computed once for many HVPs (use_gpu only
+        # selects the device of the eigen-solvers, the HVPs are computed on
+        # the device of the model).
+        image_batch = [(self.images[:1], self.labels[:1])]
+        vec = torch.rand(48, dtype=torch.double)
+        operator = HVPOperatorInputs(self.model, image_batch,
+                                     F.cross_entropy, use_gpu=True)
+        for _ in range(2):
+            self.assertTrue(torch.allclose(
+                self.get_hessian(0).matmul(vec), operator.apply(vec)))
+
+        size = sum(p.numel() for p in self.model.parameters())
+        vec = torch.rand(size, dtype=torch.double)
+        expect = HVPOperatorParams(self.model, image_batch, F.cross_entropy,
+                                   reuse_graph=False).apply(vec)
+        operator = HVPOperatorParams(self.model, image_batch,
+                                     F.cross_entropy)
+        prepare_grad = operator.prepare_grad
+        calls = []
+        operator.prepare_grad = lambda: calls.append(1) or prepare_grad()
+        for _ in range(3):
+            self.assertTrue(torch.allclose(expect, operator.apply(vec)))
+        self.assertEqual(1, len(calls))
+
+    def test_block_lanczos_model_device(self):
+        # The vectors are on the device (and of the type) of the model, even
+        # with the default use_gpu.
+        eigenvals, _ = compute_hessian_eigenthings(
+            model=self.model, dataloader=[(self.images, self.labels)],
+            loss=F.cross_entropy, num_eigenthings=4, mode='block_lanczos',
+            hvp_operator_class=HVPOperatorInputs, tol=1e-8)
+        expect = self.get_top_eigenvalues(0, num_eigens=4)
+        self.assertTrue(np.allclose(expect.numpy(), eigenvals))
+
+    def get_top_eigenvalues(self, index, num_eigens):
+        expect = torch.linalg.eigvalsh(self.get_hessian(index))
+        # The top eigenvalues by magnitude in the descending order.
+        expect = expect[expect.abs().argsort(descending=True)[:num_eigens]]
+        return expect.sort(descending=True).values
+
+    def test_eigenvalues(self):
+        eigenvals, eigenvecs = compute_hessian_eigenvalues(
+            self.model, self.images, self.labels, num_eigens=2, steps=500,
+            error_threshold=1e-12, mode='power_iter')
+        self.assertEqual((4, 2, 48), eigenvecs.shape)
+        for index in range(4):
+            expect = self.get_top_eigenvalues(index, num_eigens=2)
+            self.assertTrue(torch.allclose(expect, eigenvals[index],
+                                           rtol=1e-3))
+
+    def test_block_lanczos(self):
+        eigenvals, eigenvecs = compute_hessian_eigenvalues(
+            self.model, self.images, self.labels, num_eigens=5, tol=1e-8)
+        self.assertEqual((4, 5, 48), eigenvecs.shape)
+        for index in range(4):
+            expect = self.get_top_eigenvalues(index, num_eigens=5)
+            self.assertTrue(torch.allclose(expect, eigenvals[index]))
+            hessian = self.get_hessian(index)
+            for value, vec in zip(eigenvals[index], eigenvecs[index]):
+                self.assertTrue(torch.allclose(hessian.matmul(vec),
+                                               value * vec, atol=1e-6))
+
+    def test_block_lanczos_warm_start(self):
+        operator = BatchHVPOperatorInputs(self.model, self.images,
+                                          self.labels)
+        eigenvals, eigenvecs = batch_block_lanczos(
+            operator, num_eigens=3, block_size=5, krylov_steps=3, tol=1e-8)
+        # Start from the eigenvectors: a single restart is enough.
+        operator.hvp_count = 0
+        warm_eigenvals, _ = batch_block_lanczos(
+            operator, num_eigens=3, block_size=5, krylov_steps=3, tol=1e-8,
+            init_vecs=eigenvecs)
+        self.assertEqual(5 * 3, operator.hvp_count)
+        self.assertTrue(torch.allclose(eigenvals, warm_eigenvals))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,7 +16,9 @@ from cnns.nnlib.robustness.foolbox_model import get_fmodel
 from cnns.nnlib.utils.exec_args import get_args
 from cnns.nnlib.datasets.load_data import get_data
 from cnns.nnlib.datasets.pickled import get_pickled_args
-from torch.utils.data import DataLoader
+from cnns.nnlib.robustness.hessian.batch_hessian import \
+    compute_hessian_eigenvalues
+from cnns.nnlib.robustness.hessian.batch_hessian import get_device
 from torch.nn.functional import softmax
 
 
@@ -37,29 +39,87 @@ def compute_hessian(args, num_eigens=20, file_pickle=None,
     num_eigenthings = num_eigens  # compute top 20 eigenvalues/eigenvectors
     model = pytorch_model.eval()
 
+    # The eigen-solvers keep their vectors on the device of the model.
+    use_gpu = get_device(model).type == 'cuda'
+
     eigenset = []
     confidences = []
     for data_batch, target_batch in dataloader:
-        for image, label in zip(data_batch, target_batch):
-            output = pytorch_model(
-                image.unsqueeze(0).to(args.device)).squeeze().detach().cpu()
+        with torch.no_grad():
+            outputs = pytorch_model(data_batch.to(args.device)).detach().cpu()
+        for image, label, output in zip(data_batch, target_batch, outputs):
             predicted = torch.argmax(output)
             if predicted != label:
                 raise Exception('Predicted class is different from the label.')
-            probs = softmax(output)
+            probs = softmax(output, dim=0)
             confidence = probs[label]
             confidences.append(confidence.item())
             print(
                 f'predicted: {predicted}, label: {label}, confidence: {confidence}')
-            dataloader = DataLoader([(image, label)], batch_size=1)
+            # A single batch with the image: the gradient graph of the image
+            # is computed once and reused by all the Hessian-vector products.
+            image_batch = [(image.unsqueeze(0), label.unsqueeze(0))]
             eigenvals, _ = compute_hessian_eigenthings(
-                model=model, dataloader=dataloader, loss=loss,
-                num_eigenthings=num_eigenthings,
+                model=model, dataloader=image_batch, loss=loss,
+                num_eigenthings=num_eigenthings, use_gpu=use_gpu,
                 hvp_operator_class=hvp_operator_class)
             eigenset.append(eigenvals)
     return eigenset
 
 
+def compute_hessian_batch(args, num_eigens=20, file_pickle=None,
+                          mode='block_lanczos', warm_start=True):
+    """
+    Compute the top eigenvalues of the Hessians of the loss with respect to
+    the inputs for the whole batches of the dataloader at once (the gradient
+    graph of a batch is reused by all the Hessian-vector products).
+
+    :param args: the global arguments.
+    :param num_eigens: the number of the top eigenvalues per image.
+    :param file_pickle: the file with the pickled images (None - the test
+    set).
+    :param mode: the eigen-solver: block_lanczos or power_iter.
+    :param warm_start: start the block_lanczos from the eigenvectors of the
+    images of the previous batch.
+    :return: the list of the eigenvalues per image.
+    """
+    fmodel, pytorch_model, from_class_idx_to_label = get_fmodel(args=args)
+    if file_pickle:
+        test_loader, test_dataset = get_pickled_args(file=file_pickle,
+                                                     args=args)
+    else:
+        train_loader, test_loader, train_dataset, test_dataset, limit = get_data(
+            args=args)
+    dataloader = test_loader
+    if args.is_debug:
+        print('dataloader len: ', len(dataloader.dataset))
+    model = pytorch_model.eval()
+
+    eigenset = []
+    confidences = []
+    eigenvecs = None
+    for data_batch, target_batch in dataloader:
+        data_batch = data_batch.to(args.device)
+        target_batch = target_batch.to(args.device)
+        with torch.no_grad():
+            output = model(data_batch)
+        predicted = torch.argmax(output, dim=1)
+        if (predicted != target_batch).any():
+            raise Exception('Predicted class is different from the label.')
+        probs = softmax(output, dim=1)
+        confidence = probs.gather(1, target_batch.unsqueeze(1)).squeeze(1)
+        confidences.extend(confidence.tolist())
+        kwargs = {}
+        if mode == 'block_lanczos' and warm_start and eigenvecs is not None:
+            # The last batch can be smaller.
+            kwargs['init_vecs'] = eigenvecs[:len(data_batch)]
+        eigenvals, eigenvecs = compute_hessian_eigenvalues(
+            model=model, images=data_batch, labels=target_batch,
+            num_eigens=num_eigens, mode=mode, **kwargs)
+        eigenset.extend(eigenvals.detach().cpu().numpy())
+    return eigenset
+
+
 if __name__ == "__main__":
     start_time = time.time()
     np.random.seed(31)
@@ -103,9 +163,13 @@ if __name__ == "__main__":
     for file_pickle in files:
         print('file_pickle: ', file_pickle)
         beg_eigenset = time.time()
-        eigenset = compute_hessian(
-            args=args, file_pickle=file_pickle,
-            hvp_operator_class=hvp_operator_class)
+        if hvp_operator_class is HVPOperatorInputs:
+            eigenset = compute_hessian_batch(args=args,
+                                             file_pickle=file_pickle)
+        else:
+            eigenset = compute_hessian(
+                args=args, file_pickle=file_pickle,
+                hvp_operator_class=hvp_operator_class)
         # eigenset = [[1,2,3,4],[5,6,7,8]]
         print('eigenset len:', len(eigenset))
         print('eigenset: ', eigenset)
@@ -2,6 +2,7 @@
 from hessian_eigenthings.power_iter import power_iteration,\
     deflated_power_iteration
 from hessian_eigenthings.lanczos import lanczos
+from hessian_eigenthings.block_lanczos import block_lanczos
 from hessian_eigenthings.hvp_operator import HVPOperatorParams,\
     compute_hessian_eigenthings
 from hessian_eigenthings.hvp_operator import HVPOperatorInputs
@@ -10,6 +11,7 @@ __all__ = [
     'power_iteration',
     'deflated_power_iteration',
     'lanczos',
+    'block_lanczos',
     'HVPOperatorParams',
     'HVPOperatorInputs',
     'compute_hessian_eigenthings'
@@ -0,0 +1,191 @@
+"""
+This module contains a restarted block Lanczos (block Krylov) solver for the
+top eigenvalues and eigenvectors of a symmetric linear operator.
+
+The operator is applied to a whole block of vectors at once, all the
+eigenpairs are found together by the Rayleigh-Ritz projection onto the Krylov
+subspace (no deflation) and the computation stays in torch on the device of
+the vectors. The solver runs for a batch of independent operators at once
+(e.g. the Hessians of many images) and can be warm started from the
+eigenvectors found for the previous operators.
+"""
+import numpy as np
+import torch
+
+
+def orthonormalize(vecs, basis=None):
+    """
+    Orthonormalize the columns of vecs (and make them orthogonal to the
+    orthonormal columns of the basis).
+
+    vecs: (N, size, b) tensor
+    basis: (N, size, m) tensor or None
+    returns: (N, size, b) tensor with the orthonormal columns
+    """
+    for _ in range(2):
+        if basis is not None:
+            vecs = vecs - torch.bmm(basis, torch.bmm(basis.transpose(1, 2),
+                                                     vecs))
+        vecs, _ = torch.linalg.qr(vecs)
+    return vecs
+
+
+def block_krylov_eigen(apply_block, batch_size, size, num_eigenthings=10,
+                       block_size=None, krylov_steps=None, max_restarts=30,
+                       tol=1e-4, init_vecs=None, device=torch.device("cpu"),
+                       dtype=torch.float32, keep_size=None):
+    """
+    Compute the top eigenvalues (by magnitude) of a batch of operators.
+
+    The restarts are thick: the top keep_size Ritz vectors are kept in the
+    Krylov subspace together with their products (linear combinations of the
+    computed products, so no operator-vector products are spent on them) and
+    the subspace is extended from the next block of the Krylov sequence.
+
+    apply_block: function mapping vecs (N, b, size) -> (L_i vecs_i) (N, b, size)
+    batch_size: the number N of the operators
+    size: the dimension of the operators
+    num_eigenthings: number of eigenvalues to compute per operator
+    block_size: the number of vectors in a block (by default a tenth of
+        num_eigenthings, at least 1), a smaller block needs fewer
+        operator-vector products, a larger one fewer (batched) calls of the
+        operator
+    krylov_steps: the max number of blocks in the Krylov subspace together
+        with the kept Ritz vectors (by default the subspace has about
+        3 * num_eigenthings vectors)
+    max_restarts: the max number of restarts
+    tol: the stopping threshold of the residual norms (relative to the largest
+        eigenvalue of the operator)
+    init_vecs: (N, k, size) vectors to start from, e.g. the eigenvectors of
+        the previous operators (warm start)
+    keep_size: the number of the Ritz vectors kept at a restart (by default
+        num_eigenthings plus a few extra vectors for faster convergence)
+    returns: the eigenvalues (N, num_eigenthings) in descending order, the
+        eigenvectors (N, num_eigenthings, size) and the number of the
+        operator-vector products per operator
+    """
+    N = batch_size
+    num_eigenthings = min(num_eigenthings, size)
+    if block_size is None:
+        block_size = max(1, num_eigenthings // 10)
+    if init_vecs is not None:
+        # Start from all the given vectors.
+        block_size = max(block_size, min(init_vecs.shape[1], num_eigenthings))
+    block_size = max(1, min(block_size, size))
+    if keep_size is None:
+        keep_size = num_eigenthings + max(2, num_eigenthings // 4)
+    keep_size = max(num_eigenthings, min(keep_size, size - block_size))
+    if krylov_steps is None:
+        krylov_steps = -(-3 * num_eigenthings // block_size)
+    # The max dimension of the Krylov subspace.
+    max_dim = min(size, max(keep_size + block_size,
+                            krylov_steps * block_size))
+
+    vecs = torch.rand(N, size, block_size, device=device, dtype=dtype) - 0.5
+    if init_vecs is not None:
+        k = min(init_vecs.shape[1], block_size)
+        vecs[:, :, :k] = init_vecs[:, :k].transpose(1, 2).to(
+            device=device, dtype=dtype)
+    block = orthonormalize(vecs)
+
+    count = 0
+    basis = []
+    products = []
+    for _ in range(max_restarts):
+        step = 0
+        while sum(part.shape[2] for part in basis) + block_size <= max_dim:
+            if step > 0:
+                block = orthonormalize(products[-1], torch.cat(basis, dim=2))
+            basis.append(block)
+            product = apply_block(block.transpose(1, 2))
+            products.append(product.detach().transpose(1, 2))
+            count += block_size
+            step += 1
+        # The next block of the Krylov sequence (for the restart).
+        block = orthonormalize(products[-1], torch.cat(basis, dim=2))
+        basis = torch.cat(basis, dim=2)
+        products = torch.cat(products, dim=2)
+
+        # Rayleigh-Ritz: the eigenpairs of the operator projected onto the
+        # Krylov subspace.
+        projected = torch.bmm(basis.transpose(1, 2), products)
+        projected = (projected + projected.transpose(1, 2)) / 2
+        ritz_vals, ritz_vecs = torch.linalg.eigh(projected)
+        order = ritz_vals.abs().argsort(dim=1, descending=True)
+        ritz_vals = ritz_vals.gather(1, order)
+        ritz_vecs = ritz_vecs.gather(
+            2, order.unsqueeze(1).expand(-1, ritz_vecs.shape[1], -1))
+        vecs = torch.bmm(basis, ritz_vecs[:, :, :keep_size])
+        vec_products = torch.bmm(products, ritz_vecs[:, :, :keep_size])
+
+        # The residuals of the top eigenpairs.
+        top_vals = ritz_vals[:, :num_eigenthings]
+        residuals = vec_products[:, :, :num_eigenthings] - (
+                vecs[:, :, :num_eigenthings] * top_vals.unsqueeze(1))
+        scale = top_vals.abs().max(dim=1, keepdim=True).values
+        if (residuals.norm(dim=1) <= tol * scale).all():
+            break
+        # Thick restart: keep the top Ritz vectors with their products.
+        basis = [vecs]
+        products = [vec_products]
+
+    eigenvals = ritz_vals[:, :num_eigenthings]
+    eigenvecs = vecs[:, :, :num_eigenthings].transpose(1, 2)
+    eigenvals, order = eigenvals.sort(dim=1, descending=True)
+    eigenvecs = eigenvecs.gather(1, order.unsqueeze(2).expand(-1, -1, size))
+    return eigenvals, eigenvecs, count
+
+
+def block_lanczos(operator,
+                  num_eigenthings=10,
+                  block_size=None,
+                  krylov_steps=None,
+                  max_restarts=30,
+                  tol=1e-4,
+                  init_vecs=None,
+                  use_gpu=True,
+                  to_numpy=True):
+    """
+    Compute top k eigenvalues with the restarted block Lanczos method
+    operator: linear operator that gives us access to matrix vector product,
+        the operator.apply_block(vecs) is used if present to apply the
+        operator to the block of vectors (b, size) at once
+    num_eigenthings: number of eigenvalues to compute
+    init_vecs: the vectors (k, size) to start from (e.g. the eigenvectors of
+        the previous image)
+    use_gpu: use cuda tensors if the operator has no model (otherwise the
+        vectors are on the device of the model)
+    returns: np.ndarray of top eigenvalues, np.ndarray of top eigenvectors
+    """
+    size = operator.size
+    if not isinstance(size, int):
+        size = size[0]
+
+    def apply_block(vecs):
+        vecs = vecs[0]
+        if hasattr(operator, 'apply_block'):
+            out = operator.apply_block(vecs)
+        else:
+            out = torch.stack([operator.apply(vec) for vec in vecs])
+        return out.unsqueeze(0)
+
+    device = torch.device("cuda") if use_gpu else torch.device("cpu")
+    dtype = torch.float32
+    model = getattr(operator, 'model', None)
+    if model is not None:
+        # The vectors are on the device (and of the type) of the model.
+        for param in model.parameters():
+            device, dtype = param.device, param.dtype
+            break
+    if init_vecs is not None:
+        init_vecs = torch.as_tensor(init_vecs).unsqueeze(0)
+    eigenvals, eigenvecs, _ = block_krylov_eigen(
+        apply_block, batch_size=1, size=size, num_eigenthings=num_eigenthings,
+        block_size=block_size, krylov_steps=krylov_steps,
+        max_restarts=max_restarts, tol=tol, init_vecs=init_vecs,
+        device=device, dtype=dtype)
+    eigenvals = eigenvals[0].cpu().numpy()
+    eigenvecs = eigenvecs[0].detach().cpu()
+    if to_numpy:
+        eigenvecs = eigenvecs.numpy()
+    return np.array(eigenvals), eigenvecs
@@ -5,6 +5,16 @@ for a given pytorch model using subsampled data.
 import torch
 from hessian_eigenthings.power_iter import Operator, deflated_power_iteration
 from hessian_eigenthings.lanczos import lanczos
+from hessian_eigenthings.block_lanczos import block_lanczos
+
+
+def get_device(model):
+    """
+    Returns the device of the parameters of the model
+    """
+    for param in model.parameters():
+        return param.device
+    return torch.device("cpu")
 
 
 class HVPOperatorParams(Operator):
@@ -15,18 +25,21 @@ class HVPOperatorParams(Operator):
     model:  PyTorch network to compute hessian for
     dataloader: pytorch dataloader that we get examples from to compute grads
     loss:   Loss function to descend (e.g. F.cross_entropy)
-    use_gpu: use cuda or not
+    use_gpu: use cuda tensors in the eigen-solvers (the hvps are computed on
+        the device of the model)
     max_samples: max number of examples per batch using all GPUs.
+    reuse_graph: with the full_dataset, compute the gradient (with its graph)
+        once and reuse it for all the hvps (the graphs of all the batches of
+        the dataloader are kept in memory).
     """
 
     def __init__(self, model, dataloader, criterion, use_gpu=True,
-                 full_dataset=True, max_samples=512):
+                 full_dataset=True, max_samples=512, reuse_graph=True):
         size = int(sum(p.numel() for p in model.parameters()))
         super(HVPOperatorParams, self).__init__(size)
         self.grad_vec = torch.zeros(size)
         self.model = model
-        if use_gpu:
-            self.model = self.model.cuda()
+        self.device = get_device(model)
         self.dataloader = dataloader
         # Make a copy since we will go over it a bunch
         self.dataloader_iter = iter(dataloader)
@@ -34,12 +47,16 @@ class HVPOperatorParams(Operator):
         self.use_gpu = use_gpu
         self.full_dataset = full_dataset
         self.max_samples = max_samples
+        # The subsampled gradient changes with every hvp.
+        self.reuse_graph = reuse_graph and full_dataset
+        self.grad_graph = None
 
-    def apply(self, vec):
+    def get_grad(self):
         """
-        Returns H*vec where H is the hessian of the loss w.r.t.
-        the vectorized model parameters
+        Returns the gradient with its graph for the second gradient
         """
+        if self.grad_graph is not None:
+            return self.grad_graph
         # compute original gradient, tracking computation graph
         self.zero_grad()
         if self.full_dataset:
@@ -47,14 +64,42 @@ class HVPOperatorParams(Operator):
         else:
             grad_vec = self.prepare_grad()
         self.zero_grad()
+        if self.reuse_graph:
+            self.grad_graph = grad_vec
+        return grad_vec
+
+    def apply(self, vec):
+        """
+        Returns H*vec where H is the hessian of the loss w.r.t.
+        the vectorized model parameters
+        """
+        grad_vec = self.get_grad()
         # take the second gradient
         grad_grad = torch.autograd.grad(grad_vec, self.model.parameters(),
-                                        grad_outputs=vec,
-                                        only_inputs=True)
+                                        grad_outputs=vec.to(self.device),
+                                        only_inputs=True,
+                                        retain_graph=self.reuse_graph)
         # concatenate the results over the different components of the network
         hessian_vec_prod = torch.cat([g.contiguous().view(-1)
                                       for g in grad_grad])
-        return hessian_vec_prod
+        return hessian_vec_prod.to(vec.device)
+
+    def apply_block(self, vecs):
+        """
+        Returns H*vec for each vec in the block vecs (b x size), the gradient
+        (with its graph) is computed only once for the whole block
+        """
+        grad_vec = self.get_grad()
+        params = list(self.model.parameters())
+        hessian_vec_prods = []
+        for vec in vecs:
+            grad_grad = torch.autograd.grad(grad_vec, params,
+                                            grad_outputs=vec.to(self.device),
+                                            only_inputs=True,
+                                            retain_graph=True)
+            hessian_vec_prods.append(torch.cat([g.contiguous().view(-1)
+                                                for g in grad_grad]))
+        return torch.stack(hessian_vec_prods).to(vecs.device)
 
     def zero_grad(self):
         """
@@ -97,9 +142,8 @@ class HVPOperatorParams(Operator):
         input_chunks = all_inputs.chunk(num_chunks)
         target_chunks = all_targets.chunk(num_chunks)
         for input, target in zip(input_chunks, target_chunks):
-            if self.use_gpu:
-                input = input.cuda()
-                target = target.cuda()
+            input = input.to(self.device)
+            target = target.to(self.device)
 
             output = self.model(input)
             loss = self.criterion(output, target)
@@ -124,46 +168,79 @@ class HVPOperatorInputs(Operator):
     model:  PyTorch network to compute hessian for
     dataloader: pytorch dataloader that we get examples from to compute grads
     loss:   Loss function to descend (e.g. F.cross_entropy)
-    use_gpu: use cuda or not
+    use_gpu: use cuda tensors in the eigen-solvers (the hvps are computed on
+        the device of the model)
     max_samples: max number of examples per batch using all GPUs.
+    reuse_graph: compute the gradient (with its graph) once and reuse it for
+        all the hvps.
     """
 
     def __init__(self, model, dataloader, criterion, use_gpu=True,
-                 full_dataset=True, max_samples=512):
+                 full_dataset=True, max_samples=512, reuse_graph=True):
         self.dataloader = dataloader
         self.dataloader_iter = iter(dataloader)
         images, labels = next(iter(dataloader))
-        self.image = images[0].unsqueeze(0).requires_grad_(requires_grad=True)
-        self.label = labels[0].unsqueeze(0)
+        self.model = model
+        self.device = get_device(model)
+        self.image = images[0].unsqueeze(0).to(self.device).requires_grad_(
+            requires_grad=True)
+        self.label = labels[0].unsqueeze(0).to(self.device)
         size = self.image.numel()
         super(HVPOperatorInputs, self).__init__(size)
         self.grad_vec = torch.zeros(size)
-        self.model = model
-        if use_gpu:
-            self.model = self.model.cuda()
-            self.image = self.image.cuda()
-            self.label = self.label.cuda()
         self.criterion = criterion
         self.use_gpu = use_gpu
         self.full_dataset = full_dataset
         self.max_samples = max_samples
+        self.reuse_graph = reuse_graph
+        self.grad_graph = None
 
-    def apply(self, vec):
+    def get_grad(self):
         """
-        Returns H*vec where H is the hessian of the loss w.r.t.
-        the vectorized input
+        Returns the gradient with its graph for the second gradient
         """
+        if self.grad_graph is not None:
+            return self.grad_graph
         # compute original gradient, tracking computation graph
         self.zero_grad()
         grad_vec = self.prepare_grad()
         self.zero_grad()
+        if self.reuse_graph:
+            self.grad_graph = grad_vec
+        return grad_vec
+
+    def apply(self, vec):
+        """
+        Returns H*vec where H is the hessian of the loss w.r.t.
+        the vectorized input
+        """
+        grad_vec = self.get_grad()
         # take the second gradient
         grad_grad = torch.autograd.grad(outputs=grad_vec, inputs=self.image,
-                                        grad_outputs=vec, only_inputs=True)
+                                        grad_outputs=vec.to(self.device),
+                                        only_inputs=True,
+                                        retain_graph=self.reuse_graph)
         # concatenate the results over the different components
         hessian_vec_prod = torch.cat([g.contiguous().view(-1)
                                       for g in grad_grad])
-        return hessian_vec_prod
+        return hessian_vec_prod.to(vec.device)
+
+    def apply_block(self, vecs):
+        """
+        Returns H*vec for each vec in the block vecs (b x size), the gradient
+        (with its graph) is computed only once for the whole block
+        """
+        grad_vec = self.get_grad()
+        hessian_vec_prods = []
+        for vec in vecs:
+            grad_grad = torch.autograd.grad(outputs=grad_vec,
+                                            inputs=self.image,
+                                            grad_outputs=vec.to(self.device),
+                                            only_inputs=True,
+                                            retain_graph=True)
+            hessian_vec_prods.append(torch.cat([g.contiguous().view(-1)
+                                                for g in grad_grad]))
+        return torch.stack(hessian_vec_prods).to(vecs.device)
 
     def zero_grad(self):
         """
@@ -193,6 +270,7 @@ def compute_hessian_eigenthings(model, dataloader, loss,
                                 use_gpu=True,
                                 max_samples=512,
                                 hvp_operator_class=HVPOperatorParams,
+                                reuse_graph=True,
                                 **kwargs):
     """
     Computes the top `num_eigenthings` eigenvalues and eigenvecs
@@ -214,20 +292,24 @@ def compute_hessian_eigenthings(model, dataloader, loss,
     full_dataset : boolean
         if true, each power iteration call evaluates the gradient over the
         whole dataset.
-    mode : str ['power_iter', 'lanczos']
+    mode : str ['power_iter', 'lanczos', 'block_lanczos']
         which backend to use to compute the top eigenvalues.
     use_gpu:
         if true, attempt to use cuda for all lin alg computatoins
     max_samples:
         the maximum number of samples that can fit on-memory. used
         to accumulate gradients for large batches.
+    reuse_graph:
+        if true, the gradient graph is computed once and reused by all the
+        hessian-vector products.
     **kwargs:
         contains additional parameters passed onto lanczos or power_iter.
     """
     hvp_operator = hvp_operator_class(model, dataloader, loss,
                                       use_gpu=use_gpu,
                                       full_dataset=full_dataset,
-                                      max_samples=max_samples)
+                                      max_samples=max_samples,
+                                      reuse_graph=reuse_graph)
     if mode == 'power_iter':
         eigenvals, eigenvecs = deflated_power_iteration(hvp_operator,
                                                         num_eigenthings,
@@ -238,7 +320,12 @@ def compute_hessian_eigenthings(model, dataloader, loss,
                                        num_eigenthings,
                                        use_gpu=use_gpu,
                                        **kwargs)
+    elif mode == 'block_lanczos':
+        eigenvals, eigenvecs = block_lanczos(hvp_operator,
+                                             num_eigenthings,
+                                             use_gpu=use_gpu,
+                                             **kwargs)
     else:
-        raise ValueError("Unsupported mode %s (must be power_iter or lanczos)"
-                         % mode)
+        raise ValueError("Unsupported mode %s (must be power_iter, lanczos "
+                         "or block_lanczos)" % mode)
     return eigenvals, eigenvecs
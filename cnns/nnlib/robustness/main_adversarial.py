@@ -70,6 +70,13 @@ from cnns.nnlib.attacks.simple_blackbox_attack import SimbaSingle
 from cnns.nnlib.robustness.gradients.compute import compute_gradients
 from cnns.nnlib.robustness.foolbox_model import get_fmodel
 from cnns.nnlib.datasets.load_data import get_data
+from cnns.nnlib.robustness.batch_adversarial import run_batches
+from cnns.nnlib.robustness.result_store import get_config_key
+from cnns.nnlib.robustness.result_store import get_result_store
+from cnns.nnlib.robustness.sweep_results import aggregate_result
+from cnns.nnlib.robustness.sweep_results import get_sweep_stats
+from cnns.nnlib.robustness.sweep_results import write_result_labels
+from itertools import islice
 
 results_folder = "results/"
 delimiter = ";"
@@ -1270,6 +1277,9 @@ def run(args):
                 save_adv_image = False
                 if save_adv_image is True:
                     np.save(file=full_name + ".npy", arr=adv_image)
+                if args.result_store:
+                    # Appended to the images file of the result store.
+                    result.adv_image = adv_image
                 if args.save_out and result.original_class_id == args.True_class_id and args.noise_sigma > 0:
                     adv_images.append(adv_image)
                     adv_labels.append(result.adv_class_id)
@@ -1296,12 +1306,7 @@ def run(args):
 
         result.image_index = args.image_index
         # write labels to the log file.
-        with open(args.file_name_labels, "a") as f:
-            if args.total_count == 0:
-                header = result.get_attrs_sorted(delimiter=delimiter)
-                f.write(header + "\n")
-            values = result.get_vals_sorted(delimiter=delimiter)
-            f.write(values + "\n")
+        write_result_labels(args=args, result=result, delimiter=delimiter)
 
         for fft_type in fft_types:
             args.fft_type = fft_type
@@ -1486,6 +1491,95 @@ def randomized_defense(image, fmodel, original_image=None, defense_name=""):
     return Object()
 
 
+def get_batch_results(args, index_range):
+    """
+    Attack the images and apply the recovery defenses in batches of
+    args.adversarial_batch_size images.
+
+    :param args: the global arguments.
+    :param index_range: the indexes of the images in the test dataset.
+    :return: the generator of the per image results (as returned by run).
+    """
+    if args.use_foolbox_data:
+        raise Exception("The batch mode supports only the test_set data.")
+    if args.fmodel is None:
+        fmodel, pytorch_model, from_class_idx_to_label = get_fmodel(args=args)
+        args.pytorch_model = pytorch_model
+        args.fmodel = fmodel
+        args.from_class_idx_to_label = from_class_idx_to_label
+    return run_batches(model=args.pytorch_model, dataset=test_dataset,
+                       index_range=index_range, args=args,
+                       batch_size=args.adversarial_batch_size,
+                       device=args.device)
+
+
+def get_run_results(args, index_range):
+    """
+    Run the images of the index_range one by one (or in batches if
+    args.adversarial_batch_size > 0). With the args.result_store, only the
+    images from the shards claimed by this worker are returned and the images
+    done before are not run again. The claims are refreshed after each image
+    (or batch) and a shard taken over by another worker is not processed
+    further.
+
+    :param args: the global arguments.
+    :param index_range: the indexes of the images.
+    :return: the generator of (image_index, result).
+    """
+    store = get_result_store(args)
+    if store is not None:
+        config = get_config_key(args)
+        items = store.claim_indexes(config=config, index_range=index_range,
+                                    shard_size=args.result_store_shard_size)
+    else:
+        items = ((None, image_index, None) for image_index in index_range)
+
+    def is_claimed(shard):
+        # Refresh the claim of the shard after the work, the results of a
+        # shard taken over by another worker are dropped.
+        return store is None or store.claim(config, shard)
+
+    def store_result(image_index, result):
+        if store is not None:
+            store.put(config=config, image_index=image_index, result=result)
+            # Do not keep the images in memory.
+            if hasattr(result, "adv_image"):
+                del result.adv_image
+
+    if args.adversarial_batch_size > 0:
+        while True:
+            chunk = list(islice(items, args.adversarial_batch_size))
+            if len(chunk) == 0:
+                break
+            todo = [image_index for _, image_index, result in chunk if
+                    result is None]
+            batch_results = iter(
+                list(get_batch_results(args=args, index_range=todo)))
+            claimed = {shard: is_claimed(shard) for shard in
+                       set(shard for shard, _, _ in chunk)}
+            for shard, image_index, result in chunk:
+                if result is None:
+                    result = next(batch_results)
+                    if not claimed[shard]:
+                        continue
+                    # The same row of the labels file as in run.
+                    write_result_labels(args=args, result=result,
+                                        delimiter=delimiter)
+                    store_result(image_index, result)
+                elif not claimed[shard]:
+                    continue
+                yield image_index, result
+    else:
+        for shard, image_index, result in items:
+            if result is None:
+                args.image_index = image_index
+                result = run(args)
+                if not is_claimed(shard):
+                    continue
+                store_result(image_index, result)
+            yield image_index, result
+
+
 def index_ranges(
         input_ranges=[(20, 58), (2500, 2516), (5000, 5050), (9967, 10000)]):
     """
@@ -1737,26 +1831,7 @@ if __name__ == "__main__":
                     for attack_strength in args.attack_strengths:
                         args.attack_strength = attack_strength
 
-                        count_original = 0  # how many examples correctly classified by the base model
-                        count_recovered = 0
-                        count_many_recovered = 0
-                        count_adv = 0  # count the number of adversarial examples that have label different than the ground truth
-                        count_incorrect = 0
-                        total_adv = 0  # adversarial might return the correct label as the transformation can cause mis-prediction
-                        sum_L1_distance_defense = 0
-                        sum_L2_distance_defense = 0
-                        sum_Linf_distance_defense = 0
-                        sum_confidence_defense = 0
-                        sum_L1_distance_defense_many = 0
-                        sum_L2_distance_defense_many = 0
-                        sum_Linf_distance_defense_many = 0
-                        sum_confidence_defense_many = 0
-                        sum_L2_distance_adv = 0
-                        sum_L1_distance_adv = 0
-                        sum_Linf_distance_adv = 0
-                        sum_confidence_adv = 0
-                        sum_adv_timing = 0
-                        sum_defend_timing = 0
+                        stats = get_sweep_stats()
                         args.total_count = 0
 
                         # for index in range(4950, -1, -50):
@@ -1765,204 +1840,50 @@ if __name__ == "__main__":
 
                         run_time = 0
 
-                        for image_index in index_range:
+                        start = time.time()
+                        for image_index, result_run in get_run_results(
+                                args=args, index_range=index_range):
                             # for index in range(args.start_epoch, limit, step):
                             # for index in range(args.start_epoch, 5000, 50):
                             # for index in range(limit - step, args.start_epoch - 1, -step):
-                            args.image_index = image_index
                             print("image index: ", image_index)
 
-                            start = time.time()
-
-                            result_run = run(args)
-
+                            # A batch is run for its first image and the
+                            # stored results are not run at all.
                             single_run_time = time.time() - start
 
                             args.total_count += 1
                             print("single run elapsed time: ", single_run_time)
                             run_time += single_run_time
 
-                            if result_run.original_label is not None and (
-                                    result_run.true_label == result_run.original_label):
-                                count_original += 1
-
-                            if args.recover_type == "rounding":
-                                if result_run.round_label is not None:
-                                    if result_run.true_label == result_run.round_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.round_L2_distance
-                                    sum_L1_distance_defense += result_run.round_L1_distance
-                                    sum_Linf_distance_defense += result_run.round_Linf_distance
-                                    sum_confidence_defense += result_run.round_confidence
-
-                            elif args.recover_type == "fft":
-                                if result_run.fft_label is not None:
-                                    if result_run.true_label == result_run.fft_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.fft_L2_distance
-                                    sum_L1_distance_defense += result_run.fft_L1_distance
-                                    sum_Linf_distance_defense += result_run.fft_Linf_distance
-                                    sum_confidence_defense += result_run.fft_confidence
-
-                            elif args.recover_type == "roundfft":
-                                if result_run.roundfft_label is not None:
-                                    if result_run.true_label == result_run.roundfft_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.roundfft_L2_distance
-                                    sum_L1_distance_defense += result_run.roundfft_L1_distance
-                                    sum_Linf_distance_defense += result_run.roundfft_Linf_distance
-                                    sum_confidence_defense += result_run.roundfft_confidence
-
-                            elif args.recover_type == "roundsvd":
-                                if result_run.roundsvd_label is not None:
-                                    if result_run.true_label == result_run.roundsvd_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.roundsvd_L2_distance
-                                    sum_L1_distance_defense += result_run.roundsvd_L1_distance
-                                    sum_Linf_distance_defense += result_run.roundsvd_Linf_distance
-                                    sum_confidence_defense += result_run.roundsvd_confidence
-
-                            elif args.recover_type == "rounduniform":
-                                if result_run.rounduniform_label is not None:
-                                    if result_run.true_label == result_run.rounduniform_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.rounduniform_L2_distance
-                                    sum_L1_distance_defense += result_run.rounduniform_L1_distance
-                                    sum_Linf_distance_defense += result_run.rounduniform_Linf_distance
-                                    sum_confidence_defense += result_run.rounduniform_confidence
-
-                            elif args.recover_type == "fftround":
-                                if result_run.fftround_label is not None:
-                                    if result_run.true_label == result_run.fftround_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.fftround_L2_distance
-                                    sum_L1_distance_defense += result_run.fftround_L1_distance
-                                    sum_Linf_distance_defense += result_run.fftround_Linf_distance
-                                    sum_confidence_defense += result_run.fftround_confidence
-
-                            elif args.recover_type == "fftuniform":
-                                if result_run.fftuniform_label is not None:
-                                    if result_run.true_label == result_run.fftuniform_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.fftuniform_L2_distance
-                                    sum_L1_distance_defense += result_run.fftuniform_L1_distance
-                                    sum_Linf_distance_defense += result_run.fftuniform_Linf_distance
-                                    sum_confidence_defense += result_run.fftuniform_confidence
-
-                            elif args.recover_type == "gauss":
-                                if result_run.gauss_label is not None:
-                                    if result_run.true_label == result_run.gauss_label:
-                                        count_recovered += 1
-                                if args.noise_sigma > 0:
-                                    sum_L2_distance_defense += result_run.gauss_L2_distance
-                                    sum_L1_distance_defense += result_run.gauss_L1_distance
-                                    sum_Linf_distance_defense += result_run.gauss_Linf_distance
-                                    sum_confidence_defense += result_run.gauss_confidence
-                                if args.noise_iterations > 0 or args.recover_iterations > 0:
-                                    if result_run.true_label == result_run.gauss_many_label:
-                                        count_many_recovered += 1
-                                    sum_L2_distance_defense_many += result_run.gauss_many_L2_distance
-                                    sum_L1_distance_defense_many += result_run.gauss_many_L1_distance
-                                    sum_Linf_distance_defense_many += result_run.gauss_many_Linf_distance
-                                    sum_confidence_defense_many += result_run.gauss_many_confidence
-                                    sum_defend_timing += result_run.time_gauss_defend
-
-                            elif args.recover_type == "noise":
-                                if result_run.noise_label is not None:
-                                    if result_run.true_label == result_run.noise_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.noise_L2_distance
-                                    sum_L1_distance_defense += result_run.noise_L1_distance
-                                    sum_Linf_distance_defense += result_run.noise_Linf_distance
-                                    sum_confidence_defense += result_run.noise_confidence
-                                if args.noise_iterations > 0 or args.recover_iterations > 0:
-                                    if result_run.true_label == result_run.noise_many_label:
-                                        count_many_recovered += 1
-                                    sum_L2_distance_defense_many += result_run.noise_many_L2_distance
-                                    sum_L1_distance_defense_many += result_run.noise_many_L1_distance
-                                    sum_Linf_distance_defense_many += result_run.noise_many_Linf_distance
-                                    sum_confidence_defense_many += result_run.noise_many_confidence
-                                    sum_defend_timing += result_run.time_noise_defend
-
-                            elif args.recover_type == "laplace":
-                                if result_run.laplace_label is not None:
-                                    if result_run.true_label == result_run.laplace_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.laplace_L2_distance
-                                    sum_L1_distance_defense += result_run.laplace_L1_distance
-                                    sum_Linf_distance_defense += result_run.laplace_Linf_distance
-                                    sum_confidence_defense += result_run.laplace_confidence
-                                if args.noise_iterations > 0 or args.recover_iterations > 0:
-                                    if result_run.true_label == result_run.laplace_many_label:
-                                        count_many_recovered += 1
-                                    sum_L2_distance_defense_many += result_run.laplace_many_L2_distance
-                                    sum_L1_distance_defense_many += result_run.laplace_many_L1_distance
-                                    sum_Linf_distance_defense_many += result_run.laplace_many_Linf_distance
-                                    sum_confidence_defense_many += result_run.laplace_many_confidence
-                                    sum_defend_timing += result_run.time_laplace_defend
-
-                            elif args.recover_type == "svd":
-                                if result_run.svd_label is not None:
-                                    if result_run.true_label == result_run.svd_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.svd_L2_distance
-                                    sum_L1_distance_defense += result_run.svd_L1_distance
-                                    sum_Linf_distance_defense += result_run.svd_Linf_distance
-                                    sum_confidence_defense += result_run.svd_confidence
-                                if args.noise_iterations > 0 or args.recover_iterations > 0:
-                                    if result_run.true_label == result_run.svd_many_label:
-                                        count_many_recovered += 1
-                                    sum_L2_distance_defense_many += result_run.svd_many_L2_distance
-                                    sum_L1_distance_defense_many += result_run.svd_many_L1_distance
-                                    sum_Linf_distance_defense_many += result_run.svd_many_Linf_distance
-                                    sum_confidence_defense_many += result_run.svd_many_confidence
-                                    sum_defend_timing += result_run.time_svd_defend
-                            elif args.recover_type == "rgb":
-                                if result_run.rgb_label is not None:
-                                    if result_run.true_label == result_run.rgb_label:
-                                        count_recovered += 1
-                                    sum_L2_distance_defense += result_run.rgb_L2_distance
-                                    sum_L1_distance_defense += result_run.rgb_L1_distance
-                                    sum_Linf_distance_defense += result_run.rgb_Linf_distance
-                                    sum_confidence_defense += result_run.rgb_confidence
-                                if args.noise_iterations > 0 or args.recover_iterations > 0:
-                                    if result_run.true_label == result_run.rgb_many_label:
-                                        count_many_recovered += 1
-                                    sum_L2_distance_defense_many += result_run.rgb_many_L2_distance
-                                    sum_L1_distance_defense_many += result_run.rgb_many_L1_distance
-                                    sum_Linf_distance_defense_many += result_run.rgb_many_Linf_distance
-                                    sum_confidence_defense_many += result_run.rgb_many_confidence
-                                    sum_defend_timing += result_run.time_rgb_defend
-                            elif args.recover_type == "debug":
-                                exit(0)
-                            elif args.recover_type == "all" or args.recover_type == "empty":
-                                pass
-                            else:
-                                raise Exception(
-                                    f"Unknown recover type: {args.recover_type}")
-
-                            if result_run.original_label is not None and (
-                                    result_run.true_label == result_run.original_label):
-                                # The classifier was correct.
-                                if result_run.adv_label is not None:
-                                    if result_run.original_label != result_run.adv_label:
-                                        # The classifier was fooled.
-                                        count_adv += 1
-                                        # Aggregate the statistics about the attack.
-                                        sum_L2_distance_adv += result_run.adv_L2_distance
-                                        sum_L1_distance_adv += result_run.adv_L1_distance
-                                        sum_Linf_distance_adv += result_run.adv_Linf_distance
-                                        sum_confidence_adv += result_run.adv_confidence
-                                        sum_adv_timing += result_run.adv_timing
-
-                            if result_run.true_label != result_run.original_label or (
-                                    result_run.adv_label is not None and result_run.original_label != result_run.adv_label):
-                                count_incorrect += 1
+                            aggregate_result(args=args, result=result_run,
+                                             stats=stats)
 
                             if image_index % 128 == 0:
                                 save_adv_org()
 
+                            start = time.time()
+
                         total_count = args.total_count
+                        count_original = stats.count_original
+                        count_recovered = stats.count_recovered
+                        count_many_recovered = stats.count_many_recovered
+                        count_adv = stats.count_adv
+                        count_incorrect = stats.count_incorrect
+                        sum_L1_distance_defense = stats.sum_L1_distance_defense
+                        sum_L2_distance_defense = stats.sum_L2_distance_defense
+                        sum_Linf_distance_defense = stats.sum_Linf_distance_defense
+                        sum_confidence_defense = stats.sum_confidence_defense
+                        sum_L1_distance_defense_many = stats.sum_L1_distance_defense_many
+                        sum_L2_distance_defense_many = stats.sum_L2_distance_defense_many
+                        sum_Linf_distance_defense_many = stats.sum_Linf_distance_defense_many
+                        sum_confidence_defense_many = stats.sum_confidence_defense_many
+                        sum_L2_distance_adv = stats.sum_L2_distance_adv
+                        sum_L1_distance_adv = stats.sum_L1_distance_adv
+                        sum_Linf_distance_adv = stats.sum_Linf_distance_adv
+                        sum_confidence_adv = stats.sum_confidence_adv
+                        sum_adv_timing = stats.sum_adv_timing
+                        sum_defend_timing = stats.sum_defend_timing
 
                         print("total_count: ", total_count)
                         print("classified correctly (base model): ",
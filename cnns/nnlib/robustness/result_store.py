@@ -0,0 +1,311 @@
+"""
+Resumable store of the per image results of the adversarial sweeps.
+
+The results are kept in a SQLite database keyed by the configuration of the
+run (the attack, its strength, the defense and its parameters, see
+CONFIG_FIELDS) and the index of the image, so a restarted sweep skips the
+images that are already done. The images (e.g. the adversarial examples) are
+appended to a single binary file next to the database (path + ".images")
+and only their offsets, types and shapes are kept in the database.
+
+Many workers can share a store: the index range is split into shards of
+shard_size images and a worker processes only the shards it claimed. A claim
+expires if it is not refreshed for timeout seconds (e.g. the worker was
+killed), so the shard can be taken over by another worker. The claims are
+refreshed after each image or batch, so a batch has to finish within the
+timeout.
+"""
+import json
+import os
+import socket
+import sqlite3
+import time
+import numpy as np
+from cnns.nnlib.utils.object import Object
+
+# The fields of the arguments that define the configuration of a run.
+CONFIG_FIELDS = [
+    "dataset", "model_path", "use_set", "adv_type", "attack_name",
+    "attack_strength", "attack_max_iterations", "attack_confidence",
+    "binary_search_steps", "target_class", "recover_type",
+    "values_per_channel", "compress_fft_layer", "noise_sigma",
+    "noise_epsilon", "laplace_epsilon", "svd_compress", "rgb_value",
+    "recover_iterations", "noise_iterations", "interpolate",
+    "adversarial_batch_size"]
+
+
+def get_config_key(args, fields=CONFIG_FIELDS):
+    """
+    :param args: the global arguments.
+    :param fields: the fields of the arguments that define the configuration.
+    :return: the configuration as a json string with the sorted keys.
+
+    >>> args = Object(attack_name="FGSM", attack_strength=0.1)
+    >>> get_config_key(args, fields=["attack_strength", "attack_name"])
+    '{"attack_name": "FGSM", "attack_strength": 0.1}'
+    """
+    config = {}
+    for field in fields:
+        value = getattr(args, field, None)
+        if value is not None and not isinstance(value, (int, float, str)):
+            # E.g. the AdversarialType.
+            value = str(value)
+        config[field] = value
+    return json.dumps(config, sort_keys=True)
+
+
+def to_json(value):
+    """
+    Convert the numpy values of the results for json.
+
+    >>> to_json(np.float32(0.5))
+    0.5
+    """
+    if isinstance(value, np.generic):
+        return value.item()
+    if hasattr(value, "tolist"):
+        # E.g. the small numpy arrays or the torch tensors.
+        return value.tolist()
+    raise TypeError(f"Cannot store the value of type: {type(value)}")
+
+
+def get_shards(index_range, shard_size):
+    """
+    :param index_range: the indexes of the images.
+    :param shard_size: the number of the images in a shard.
+    :return: the list of the shards (the lists of the indexes).
+
+    >>> get_shards(range(0, 10, 2), shard_size=2)
+    [[0, 2], [4, 6], [8]]
+    """
+    index_range = list(index_range)
+    return [index_range[start:start + shard_size] for start in
+            range(0, len(index_range), shard_size)]
+
+
+def get_worker():
+    return socket.gethostname() + "-" + str(os.getpid())
+
+
+class ResultStore(object):
+
+    def __init__(self, path, timeout=600, worker=None):
+        """
+        :param path: the path to the database file.
+        :param timeout: the number of seconds after which a claim of a shard
+        that has not been refreshed expires.
+        :param worker: the name of the worker (by default the host and the
+        process id).
+        """
+        self.path = path
+        self.images_path = path + ".images"
+        self.timeout = timeout
+        self.worker = worker if worker is not None else get_worker()
+        # Wait for the locks held by the other workers.
+        self.connection = sqlite3.connect(path, timeout=60,
+                                          isolation_level=None)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS results (
+                config TEXT, image_index INTEGER, result TEXT,
+                PRIMARY KEY (config, image_index));
+            CREATE TABLE IF NOT EXISTS images (
+                config TEXT, image_index INTEGER, name TEXT, offset INTEGER,
+                dtype TEXT, shape TEXT,
+                PRIMARY KEY (config, image_index, name));
+            CREATE TABLE IF NOT EXISTS claims (
+                config TEXT, shard INTEGER, worker TEXT, time REAL,
+                PRIMARY KEY (config, shard));
+            """)
+
+    def close(self):
+        self.connection.close()
+
+    def transaction(self):
+        """
+        :return: the context manager of a transaction that holds the write
+        lock of the database from its start.
+        """
+        store = self
+
+        class Transaction(object):
+            def __enter__(self):
+                store.connection.execute("BEGIN IMMEDIATE")
+                return store.connection
+
+            def __exit__(self, exc_type, exc_value, traceback):
+                if exc_type is None:
+                    store.connection.execute("COMMIT")
+                else:
+                    store.connection.execute("ROLLBACK")
+
+        return Transaction()
+
+    def put(self, config, image_index, result):
+        """
+        Store the result of an image, the numpy arrays in the result (e.g. the
+        adv_image) are appended to the images file.
+
+        :param config: the key of the configuration (from get_config_key).
+        :param image_index: the index of the image.
+        :param result: the Object with the result of the run.
+        """
+        values = {}
+        images = {}
+        for name, value in result.__dict__.items():
+            if isinstance(value, np.ndarray):
+                images[name] = value
+            else:
+                values[name] = value
+        with self.transaction() as connection:
+            for name, image in images.items():
+                self.write_image(connection, config, image_index, name, image)
+            connection.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (config, int(image_index), json.dumps(values, default=to_json)))
+
+    def write_image(self, connection, config, image_index, name, image):
+        # The write lock of the database serializes the appends of the
+        # workers, so the offset is the current size of the file.
+        image = np.ascontiguousarray(image)
+        with open(self.images_path, "ab") as file:
+            offset = file.seek(0, os.SEEK_END)
+            file.write(image.tobytes())
+        connection.execute(
+            "INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?)",
+            (config, int(image_index), name, offset, image.dtype.str,
+             json.dumps(image.shape)))
+
+    def put_image(self, config, image_index, name, image):
+        """
+        Append the image to the images file.
+
+        :param name: the name of the image, e.g. adv_image.
+        :param image: the numpy array.
+        """
+        with self.transaction() as connection:
+            self.write_image(connection, config, image_index, name, image)
+
+    def get(self, config, image_index):
+        """
+        :return: the stored result (an Object without the images) or None.
+        """
+        row = self.connection.execute(
+            "SELECT result FROM results WHERE config = ? AND image_index = ?",
+            (config, int(image_index))).fetchone()
+        if row is None:
+            return None
+        return Object(**json.loads(row[0]))
+
+    def get_image(self, config, image_index, name):
+        """
+        :return: the stored image (a numpy array) or None.
+        """
+        row = self.connection.execute(
+            "SELECT offset, dtype, shape FROM images WHERE config = ? AND "
+            "image_index = ? AND name = ?",
+            (config, int(image_index), name)).fetchone()
+        if row is None:
+            return None
+        offset, dtype, shape = row
+        shape = json.loads(shape)
+        return np.fromfile(self.images_path, dtype=np.dtype(dtype),
+                           count=int(np.prod(shape)), offset=offset).reshape(
+            shape)
+
+    def get_images(self, config, name):
+        """
+        :return: the indexes of the images and the stacked images with the
+        name (e.g. all the adversarial examples of a configuration).
+        """
+        indexes = [row[0] for row in self.connection.execute(
+            "SELECT image_index FROM images WHERE config = ? AND name = ? "
+            "ORDER BY image_index", (config, name))]
+        images = [self.get_image(config, index, name) for index in indexes]
+        if len(images) == 0:
+            return indexes, None
+        return indexes, np.stack(images)
+
+    def get_done(self, config, indexes=None):
+        """
+        :param config: the key of the configuration.
+        :param indexes: the indexes of the images to check (None - all).
+        :return: the set of the indexes of the images done for the config.
+        """
+        query = "SELECT image_index FROM results WHERE config = ?"
+        params = [config]
+        if indexes is not None:
+            indexes = [int(index) for index in indexes]
+            query += " AND image_index IN (" + ", ".join(
+                "?" * len(indexes)) + ")"
+            params += indexes
+        return set(row[0] for row in self.connection.execute(query, params))
+
+    def claim(self, config, shard):
+        """
+        Claim the shard if it is free, its claim expired or it is already
+        claimed by this worker. A claimed shard is refreshed.
+
+        :return: True if the shard is claimed by this worker.
+        """
+        now = time.time()
+        with self.transaction() as connection:
+            row = connection.execute(
+                "SELECT worker, time FROM claims WHERE config = ? AND "
+                "shard = ?", (config, shard)).fetchone()
+            if row is not None and row[0] != self.worker and (
+                    now - row[1] < self.timeout):
+                return False
+            connection.execute(
+                "INSERT OR REPLACE INTO claims VALUES (?, ?, ?, ?)",
+                (config, shard, self.worker, now))
+        return True
+
+    def claim_indexes(self, config, index_range, shard_size=100):
+        """
+        Iterate over the images of the shards claimed by this worker.
+
+        :param config: the key of the configuration.
+        :param index_range: the indexes of the images of the whole sweep.
+        :param shard_size: the number of the images in a shard.
+        :return: the generator of (shard, image_index, the stored result or
+        None if the image has to be run). The stored results of the finished
+        shards are returned as well, so that a rerun after all the workers are
+        done aggregates the whole sweep. The caller keeps the claim alive with
+        claim(config, shard) while it runs the images (see get_run_results).
+        """
+        for shard, indexes in enumerate(get_shards(index_range, shard_size)):
+            done = self.get_done(config, indexes)
+            if all(index in done for index in indexes):
+                for index in indexes:
+                    yield shard, index, self.get(config, index)
+                continue
+            if not self.claim(config, shard):
+                continue
+            for position, index in enumerate(indexes):
+                # Refresh the claim and stop if the shard was taken over by
+                # another worker.
+                if position > 0 and not self.claim(config, shard):
+                    break
+                result = None
+                if index in done:
+                    result = self.get(config, index)
+                yield shard, index, result
+
+
+# The open stores by the path.
+stores = {}
+
+
+def get_result_store(args):
+    """
+    :param args: the global arguments.
+    :return: the store for the args.result_store path or None.
+    """
+    path = args.result_store
+    if not path:
+        return None
+    store = stores.get(path)
+    if store is None:
+        store = ResultStore(path)
+        stores[path] = store
+    return store
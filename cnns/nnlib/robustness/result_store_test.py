@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from cnns.nnlib.robustness.result_store import ResultStore
+from cnns.nnlib.robustness.result_store import get_config_key
+from cnns.nnlib.utils.object import Object
+
+
+class TestResultStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.path = os.path.join(self.folder, "results.db")
+        self.config = get_config_key(
+            Object(attack_name="FGSM", attack_strength=0.1),
+            fields=["attack_name", "attack_strength"])
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_put_get(self):
+        store = ResultStore(self.path)
+        adv_images = np.random.rand(3, 3, 4, 4).astype(np.float32)
+        for index in range(3):
+            result = Object(true_label="cat", adv_L2_distance=np.float32(0.5),
+                            adv_image=adv_images[index])
+            store.put(self.config, index, result)
+        store.close()
+
+        # Reopen the store (e.g. after a restart).
+        store = ResultStore(self.path)
+        self.assertEqual({0, 1, 2}, store.get_done(self.config))
+        result = store.get(self.config, 1)
+        self.assertEqual("cat", result.true_label)
+        self.assertEqual(0.5, result.adv_L2_distance)
+        self.assertFalse(hasattr(result, "adv_image"))
+        self.assertTrue(np.array_equal(
+            adv_images[2], store.get_image(self.config, 2, "adv_image")))
+        indexes, images = store.get_images(self.config, "adv_image")
+        self.assertEqual([0, 1, 2], indexes)
+        self.assertTrue(np.array_equal(adv_images, images))
+        self.assertIsNone(store.get("other config", 1))
+        store.close()
+
+    def test_config_batch_size(self):
+        # The batch and per image results are kept apart.
+        per_image = get_config_key(
+            Object(attack_name="FGSM", adversarial_batch_size=0))
+        batch = get_config_key(
+            Object(attack_name="FGSM", adversarial_batch_size=32))
+        self.assertNotEqual(per_image, batch)
+
+    def test_claim_indexes(self):
+        worker1 = ResultStore(self.path, worker="worker1")
+        worker2 = ResultStore(self.path, worker="worker2")
+        index_range = range(10)
+        # The first worker claims the first shard and is stopped.
+        items1 = worker1.claim_indexes(self.config, index_range,
+                                       shard_size=4)
+        for _ in range(2):
+            shard, index, result = next(items1)
+            self.assertEqual(0, shard)
+            self.assertIsNone(result)
+            worker1.put(self.config, index, Object(label=index))
+        # The second worker skips the shard claimed by the first worker.
+        items2 = list(worker2.claim_indexes(self.config, index_range,
+                                            shard_size=4))
+        self.assertEqual([4, 5, 6, 7, 8, 9],
+                         [index for _, index, _ in items2])
+        self.assertEqual([1, 1, 1, 1, 2, 2], [shard for shard, _, _ in items2])
+        for _, index, _ in items2:
+            worker2.put(self.config, index, Object(label=index))
+
+        # The claim of the first worker expires, the second worker finishes
+        # its shard and skips the images that are done.
+        worker2.timeout = 0
+        items2 = list(worker2.claim_indexes(self.config, index_range,
+                                            shard_size=4))
+        self.assertEqual(list(index_range),
+                         [index for _, index, _ in items2])
+        self.assertEqual([0, 1], [result.label for _, _, result in items2[:2]])
+        self.assertEqual([None, None],
+                         [result for _, _, result in items2[2:4]])
+        self.assertTrue(all(result.label == index for _, index, result in
+                            items2[4:]))
+
+    def test_claim_lost(self):
+        worker1 = ResultStore(self.path, worker="worker1")
+        worker2 = ResultStore(self.path, worker="worker2", timeout=0)
+        index_range = range(8)
+        items1 = worker1.claim_indexes(self.config, index_range,
+                                       shard_size=4)
+        shard, index, _ = next(items1)
+        self.assertEqual((0, 0), (shard, index))
+        # A long batch: the claim is refreshed after the work.
+        self.assertTrue(worker1.claim(self.config, shard))
+        # The second worker takes the shard over (e.g. the claim expired).
+        self.assertTrue(worker2.claim(self.config, 0))
+        self.assertFalse(worker1.claim(self.config, 0))
+        # The first worker stops processing the lost shard.
+        self.assertEqual([(1, 4), (1, 5), (1, 6), (1, 7)],
+                         [(shard, index) for shard, index, _ in items1])
+
+
+if __name__ == '__main__':
+    unittest.main()
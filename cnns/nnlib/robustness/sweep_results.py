@@ -0,0 +1,139 @@
+"""
+The per image results of the adversarial sweeps of main_adversarial: the
+rows of the labels file and the aggregated statistics of a sweep.
+"""
+from cnns.nnlib.utils.object import Object
+
+# The prefixes of the results of the recover types.
+RECOVER_PREFIXES = {
+    "rounding": "round_",
+    "fft": "fft_",
+    "roundfft": "roundfft_",
+    "roundsvd": "roundsvd_",
+    "rounduniform": "rounduniform_",
+    "fftround": "fftround_",
+    "fftuniform": "fftuniform_",
+    "gauss": "gauss_",
+    "noise": "noise_",
+    "laplace": "laplace_",
+    "svd": "svd_",
+    "rgb": "rgb_",
+}
+
+# The recover types that are also run many times (with the noise or the
+# recover iterations).
+MANY_RECOVER_TYPES = ["gauss", "noise", "laplace", "svd", "rgb"]
+
+
+def write_result_labels(args, result, delimiter=";"):
+    """
+    Append the row of the result to the labels file (args.file_name_labels),
+    with the header before the first result of a sweep (args.total_count is
+    0).
+
+    :param args: the global arguments.
+    :param result: the per image result.
+    :param delimiter: the delimiter of the values.
+    """
+    with open(args.file_name_labels, "a") as f:
+        if args.total_count == 0:
+            header = result.get_attrs_sorted(delimiter=delimiter)
+            f.write(header + "\n")
+        values = result.get_vals_sorted(delimiter=delimiter)
+        f.write(values + "\n")
+
+
+def get_sweep_stats():
+    """
+    :return: the statistics of a sweep before any result is added.
+    """
+    stats = Object()
+    # how many examples correctly classified by the base model
+    stats.count_original = 0
+    stats.count_recovered = 0
+    stats.count_many_recovered = 0
+    # count the number of adversarial examples that have label different
+    # than the ground truth
+    stats.count_adv = 0
+    stats.count_incorrect = 0
+    stats.sum_L1_distance_defense = 0
+    stats.sum_L2_distance_defense = 0
+    stats.sum_Linf_distance_defense = 0
+    stats.sum_confidence_defense = 0
+    stats.sum_L1_distance_defense_many = 0
+    stats.sum_L2_distance_defense_many = 0
+    stats.sum_Linf_distance_defense_many = 0
+    stats.sum_confidence_defense_many = 0
+    stats.sum_L2_distance_adv = 0
+    stats.sum_L1_distance_adv = 0
+    stats.sum_Linf_distance_adv = 0
+    stats.sum_confidence_adv = 0
+    stats.sum_adv_timing = 0
+    stats.sum_defend_timing = 0
+    return stats
+
+
+def aggregate_result(args, result, stats):
+    """
+    Add the result of an image to the statistics of the sweep.
+
+    :param args: the global arguments (with the recover_type).
+    :param result: the per image result (from run or run_batches).
+    :param stats: the statistics from get_sweep_stats.
+    """
+    if result.original_label is not None and (
+            result.true_label == result.original_label):
+        stats.count_original += 1
+
+    recover_type = args.recover_type
+    if recover_type in RECOVER_PREFIXES:
+        prefix = RECOVER_PREFIXES[recover_type]
+        label = result[prefix + "label"]
+        if label is not None and result.true_label == label:
+            stats.count_recovered += 1
+        # The distances of the gauss defense are aggregated if it is
+        # enabled.
+        if (label is not None and recover_type != "gauss") or (
+                recover_type == "gauss" and args.noise_sigma > 0):
+            stats.sum_L2_distance_defense += result[prefix + "L2_distance"]
+            stats.sum_L1_distance_defense += result[prefix + "L1_distance"]
+            stats.sum_Linf_distance_defense += result[
+                prefix + "Linf_distance"]
+            stats.sum_confidence_defense += result[prefix + "confidence"]
+        if recover_type in MANY_RECOVER_TYPES and (
+                args.noise_iterations > 0 or args.recover_iterations > 0):
+            many = prefix + "many_"
+            if result.true_label == result[many + "label"]:
+                stats.count_many_recovered += 1
+            stats.sum_L2_distance_defense_many += result[many + "L2_distance"]
+            stats.sum_L1_distance_defense_many += result[many + "L1_distance"]
+            stats.sum_Linf_distance_defense_many += result[
+                many + "Linf_distance"]
+            stats.sum_confidence_defense_many += result[many + "confidence"]
+            stats.sum_defend_timing += result[
+                "time_" + recover_type + "_defend"]
+    elif recover_type == "debug":
+        exit(0)
+    elif recover_type == "all" or recover_type == "empty":
+        pass
+    else:
+        raise Exception(f"Unknown recover type: {recover_type}")
+
+    if result.original_label is not None and (
+            result.true_label == result.original_label):
+        # The classifier was correct.
+        if result.adv_label is not None:
+            if result.original_label != result.adv_label:
+                # The classifier was fooled.
+                stats.count_adv += 1
+                # Aggregate the statistics about the attack.
+                stats.sum_L2_distance_adv += result.adv_L2_distance
+                stats.sum_L1_distance_adv += result.adv_L1_distance
+                stats.sum_Linf_distance_adv += result.adv_Linf_distance
+                stats.sum_confidence_adv += result.adv_confidence
+                stats.sum_adv_timing += result.adv_timing
+
+    if result.true_label != result.original_label or (
+            result.adv_label is not None and
+            result.original_label != result.adv_label):
+        stats.count_incorrect += 1
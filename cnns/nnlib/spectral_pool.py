@@ -1,113 +1,215 @@
+"""
+Spectral pooling: the input is transformed with the (one-sided) fft, only the
+lowest frequencies that fit in the output size are retained and the result is
+transformed back with the inverse fft of the output size.
+
+The retained rows (the low positive and negative frequencies of the height
+dimension) are selected with a single gather and the retained columns of the
+one-sided spectrum with a slice, so the pooling is a few tensor operations
+with the gradients computed by autograd.
+"""
+import math
 import torch
 from torch import nn
 
-from nnlib.layers import get_out_pool_shape
-
-
-def _common_spectral_pool(images, filter_size):
-    print("images size: ", images.size())
-    assert len(images.size()) == 5
-    assert filter_size >= 3
-    if filter_size % 2 == 1:
-        n = int((filter_size - 1) / 2)
-        top_left = images[:, :, :n + 1, :n + 1, :]
-        print("top left: ", top_left)
-        top_right = images[:, :, :n + 1, -n:, :]
-        bottom_left = images[:, :, -n:, :n + 1, :]
-        bottom_right = images[:, :, -n:, -n:, :]
-        top_combined = torch.cat([top_left, top_right], dim=3)
-        print("top combined size: ", top_combined.size())
-        bottom_combined = torch.cat([bottom_left, bottom_right], dim=3)
-        print("bottom combined size: ", bottom_combined.size())
-        all_together = torch.cat([top_combined, bottom_combined], dim=2)
-    else:
-        all_together = images
-    #     n = filter_size // 2
-    #     top_left = images[:, :, :n, :n]
-    #     top_middle = tf.expand_dims(
-    #         tf.cast(0.5 ** 0.5, tf.complex64) *
-    #         (images[:, :, :n, n] + images[:, :, :n, -n]),
-    #         -1
-    #     )
-    #     top_right = images[:, :, :n, -(n-1):]
-    #     middle_left = tf.expand_dims(
-    #         tf.cast(0.5 ** 0.5, tf.complex64) *
-    #         (images[:, :, n, :n] + images[:, :, -n, :n]),
-    #         -2
-    #     )
-    #     middle_middle = tf.expand_dims(
-    #         tf.expand_dims(
-    #             tf.cast(0.5, tf.complex64) *
-    #             (images[:, :, n, n] + images[:, :, n, -n] +
-    #              images[:, :, -n, n] + images[:, :, -n, -n]),
-    #             -1
-    #         ),
-    #         -1
-    #     )
-    #     middle_right = tf.expand_dims(
-    #         tf.cast(0.5 ** 0.5, tf.complex64) *
-    #         (images[:, :, n, -(n-1):] + images[:, :, -n, -(n-1):]),
-    #         -2
-    #     )
-    #     bottom_left = images[:, :, -(n-1):, :n]
-    #     bottom_middle = tf.expand_dims(
-    #         tf.cast(0.5 ** 0.5, tf.complex64) *
-    #         (images[:, :, -(n-1):, n] + images[:, :, -(n-1):, -n]),
-    #         -1
-    #     )
-    #     bottom_right = images[:, :, -(n-1):, -(n-1):]
-    #     top_combined = tf.concat(
-    #         [top_left, top_middle, top_right],
-    #         axis=-1
-    #     )
-    #     middle_combined = tf.concat(
-    #         [middle_left, middle_middle, middle_right],
-    #         axis=-1
-    #     )
-    #     bottom_combined = tf.concat(
-    #         [bottom_left, bottom_middle, bottom_right],
-    #         axis=-1
-    #     )
-    #     all_together = tf.concat(
-    #         [top_combined, middle_combined, bottom_combined],
-    #         axis=-2
-    #     )
-    return all_together
+# The indexes of the retained rows by (size, out_size, device).
+pool_indexes = {}
+# The matrices of spectral_pool_crop by the sizes, device and dtype.
+crop_pool_matrices = {}
+
+
+def get_pool_out_size(size, filter_size, stride):
+    """
+    :param size: the size of the input.
+    :param filter_size: the size of the pooling window.
+    :param stride: the stride of the pooling.
+    :return: the size of the output (as for the max pooling).
+
+    >>> get_pool_out_size(32, filter_size=2, stride=2)
+    16
+    >>> get_pool_out_size(7, filter_size=3, stride=3)
+    2
+    """
+    return (size - filter_size) // stride + 1
+
+
+def get_spectral_pool_index(size, out_size, device=torch.device("cpu")):
+    """
+    :param size: the size of the (two-sided) spectrum.
+    :param out_size: the size of the pooled spectrum.
+    :param device: the device of the index.
+    :return: the indexes of the low frequencies: 0, 1, ... and -1, -2, ...
+
+    >>> get_spectral_pool_index(8, 5)
+    tensor([0, 1, 2, 6, 7])
+    >>> get_spectral_pool_index(8, 4)
+    tensor([0, 1, 6, 7])
+    """
+    key = (size, out_size, device)
+    index = pool_indexes.get(key)
+    if index is None:
+        if out_size > size:
+            raise Exception(f"The output size {out_size} of the spectral "
+                            f"pooling cannot exceed the input size {size}.")
+        positive = (out_size + 1) // 2
+        index = torch.cat((torch.arange(positive),
+                           torch.arange(size - (out_size - positive), size)))
+        index = index.to(device)
+        pool_indexes[key] = index
+    return index
+
+
+def spectral_pool_fft(xfft, out_H, out_W):
+    """
+    Crop the one-sided spectrum to the lowest frequencies.
+
+    :param xfft: the complex one-sided spectrum of shape (..., H, W // 2 + 1).
+    :param out_H: the height of the output.
+    :param out_W: the width of the output.
+    :return: the complex one-sided spectrum of shape (..., out_H,
+    out_W // 2 + 1).
+    """
+    index = get_spectral_pool_index(xfft.shape[-2], out_H, xfft.device)
+    return torch.index_select(xfft, dim=-2, index=index)[..., :out_W // 2 + 1]
+
+
+def spectral_pool(input, out_size):
+    """
+    :param input: the input maps of shape (N, C, H, W).
+    :param out_size: the (height, width) of the output.
+    :return: the pooled maps of shape (N, C, out_H, out_W). The forward
+    normalization of the transforms preserves the mean of the maps.
+
+    >>> x = torch.ones(1, 1, 8, 8)
+    >>> torch.allclose(spectral_pool(x, (4, 4)), torch.ones(1, 1, 4, 4))
+    True
+    """
+    # Import it only here, since in PyTorch 1.7 the torch.fft module shadows
+    # the torch.fft function used by the complex_fft type.
+    import torch.fft
+
+    out_H, out_W = out_size
+    xfft = torch.fft.rfftn(input, dim=(-2, -1), norm="forward")
+    xfft = spectral_pool_fft(xfft, out_H=out_H, out_W=out_W)
+    return torch.fft.irfftn(xfft, s=(out_H, out_W), dim=(-2, -1),
+                            norm="forward")
+
+
+def get_crop_pool_matrices(grid_size, crop_size, out_size, device,
+                           dtype=torch.complex64):
+    """
+    The matrices of the linear map from the one-sided spectrum of the maps on
+    the fft grid to the pooled one-sided spectrum of their top-left crop, see
+    spectral_pool_crop.
+
+    :return: the matrices for the height (applied to the spectrum and its
+    conjugate) of shape (out_H, grid_H) and for the width of shape
+    (out_W // 2 + 1, grid_W // 2 + 1).
+    """
+    key = (grid_size, crop_size, out_size, device, dtype)
+    matrices = crop_pool_matrices.get(key)
+    if matrices is None:
+        grid_H, grid_W = grid_size
+        crop_H, crop_W = crop_size
+        out_H, out_W = out_size
+        if crop_H > grid_H or crop_W > grid_W:
+            raise Exception(f"The crop {crop_size} cannot exceed the fft "
+                            f"grid {grid_size}.")
+
+        def dft(freqs, positions, size, sign):
+            return torch.exp(sign * 2j * math.pi * torch.outer(
+                freqs.to(torch.float64), positions.to(torch.float64)) / size)
+
+        # Height: the inverse fft to the rows of the crop and the fft (with
+        # the forward normalization) to the retained rows.
+        rows = torch.arange(crop_H)
+        inverse_H = dft(rows, torch.arange(grid_H), grid_H, 1) / grid_H
+        forward_H = dft(get_spectral_pool_index(crop_H, out_H), rows, crop_H,
+                        -1) / crop_H
+        # Width: the inverse of the one-sided spectrum (the irfft, where the
+        # frequencies except 0 and the Nyquist one stand for the pairs of the
+        # conjugate frequencies) and the fft to the retained columns.
+        half_W = grid_W // 2 + 1
+        scale = torch.full((half_W,), 2.0, dtype=torch.float64)
+        scale[0] = 1
+        if grid_W % 2 == 0:
+            scale[-1] = 1
+        cols = torch.arange(crop_W)
+        inverse_W = dft(cols, torch.arange(half_W), grid_W, 1) * scale / (
+                2 * grid_W)
+        forward_W = dft(torch.arange(out_W // 2 + 1), cols, crop_W,
+                        -1) / crop_W
+        matrices = [forward_H @ inverse_H, forward_H @ inverse_H.conj(),
+                    forward_W @ inverse_W, forward_W @ inverse_W.conj()]
+        matrices = [matrix.to(device=device, dtype=dtype) for matrix in
+                    matrices]
+        crop_pool_matrices[key] = matrices
+    return matrices
+
+
+def spectral_pool_crop(xfft, grid_size, crop_size, out_size):
+    """
+    The spectral pooling of the top-left crop of the maps given by their
+    spectrum on a larger fft grid (e.g. the output of the fft based
+    convolution), without the inverse fft of the whole grid and the fft of the
+    crop.
+
+    The crop of the maps is real, so the width is inverted as in the irfft:
+    the value of the map is the real part, which is a linear function of the
+    spectrum and its conjugate. Both the inverse and the forward transforms
+    are separable, so the pooled spectrum is:
+    P_H xfft Q_W^T + P_H' conj(xfft) Q_W'^T
+    with the small matrices from get_crop_pool_matrices.
+
+    :param xfft: the complex one-sided spectrum of shape (..., grid_H,
+    grid_W // 2 + 1).
+    :param grid_size: the (height, width) of the fft grid.
+    :param crop_size: the (height, width) of the top-left crop of the maps.
+    :param out_size: the (height, width) of the output.
+    :return: the same as spectral_pool(irfftn(xfft)[..., :crop_H, :crop_W],
+    out_size).
+    """
+    # Import it only here, since in PyTorch 1.7 the torch.fft module shadows
+    # the torch.fft function used by the complex_fft type.
+    import torch.fft
+
+    out_H, out_W = out_size
+    height, height_conj, width, width_conj = get_crop_pool_matrices(
+        grid_size=tuple(grid_size), crop_size=tuple(crop_size),
+        out_size=(out_H, out_W), device=xfft.device, dtype=xfft.dtype)
+    outfft = torch.einsum("kh,...hw,lw->...kl", height, xfft, width)
+    outfft = outfft + torch.einsum("kh,...hw,lw->...kl", height_conj,
+                                   xfft.conj(), width_conj)
+    return torch.fft.irfftn(outfft, s=(out_H, out_W), dim=(-2, -1),
+                            norm="forward")
 
 
 class SpectralPool(nn.Module):
-    def __init__(self, filter_size=3, stride=3):
+
+    def __init__(self, filter_size=3, stride=3, out_size=None):
         """
 
         :param filter_size: the size of the filter
         :param stride: the size of the stride
+        :param out_size: the (height, width) of the output, None - the output
+        size of the max pooling with the filter_size and stride.
         """
+        super(SpectralPool, self).__init__()
         self.filter_size = filter_size
         self.stride = stride
+        self.out_size = out_size
+
+    def get_out_size(self, H, W):
+        if self.out_size is not None:
+            return self.out_size
+        return (get_pool_out_size(H, self.filter_size, self.stride),
+                get_pool_out_size(W, self.filter_size, self.stride))
 
     def forward(self, image):
         """
 
-        :param image: numpy array representing the image
-        :param filter_size: the size of the filter (one of HH, WW - there have to be the same)
-        :param stride: stride for the pooling operation
+        :param image: the input maps of shape (N, C, H, W)
         :return: image after the spectral pooling
         """
-        N, C, H, W = image.size()
-        out_size = get_out_pool_shape((H, W), {"pool_height": self.filter_size, "pool_width": self.filter_size,
-                                               "stride": self.stride})
-        onesided = False
-        im_fft = torch.rfft(image, 2, onesided=onesided)
-        im_transformed = _common_spectral_pool(im_fft, out_size[0])
-        im_ifft = torch.irfft(im_transformed, 2, onesided=onesided)
-        print("im_ifft size: ", im_ifft.size())
-        # normalize image
-        im_out = im_ifft
-        # im_ch_last = im_ifft.permute(0, 2, 3, 1)
-        # channel_max = torch.max(im_ch_last, -1)[0]
-        # channel_min = torch.min(im_ch_last, -1)[0]
-        # numerator = im_ch_last - channel_min
-        # denominator = channel_max - channel_min
-        # im_out = numerator / denominator
-
-        return im_out
+        H, W = image.shape[-2:]
+        return spectral_pool(image, self.get_out_size(H, W))
@@ -0,0 +1,88 @@
+import unittest
+import torch
+import torch.nn.functional as F
+from cnns.nnlib.pytorch_layers.conv2D_fft import Conv2dfft
+from cnns.nnlib.spectral_pool import SpectralPool
+from cnns.nnlib.spectral_pool import spectral_pool
+from cnns.nnlib.spectral_pool import spectral_pool_crop
+from cnns.nnlib.utils.arguments import Arguments
+
+
+def spectral_pool_full(input, out_size):
+    """
+    The spectral pooling with the two-sided fft and the centered spectrum.
+    """
+    out_H, out_W = out_size
+    H, W = input.shape[-2:]
+    xfft = torch.fft.fftshift(torch.fft.fftn(input, dim=(-2, -1)),
+                              dim=(-2, -1))
+    top, left = H // 2 - out_H // 2, W // 2 - out_W // 2
+    xfft = xfft[..., top:top + out_H, left:left + out_W]
+    xfft = torch.fft.ifftshift(xfft, dim=(-2, -1))
+    out = torch.fft.ifftn(xfft, dim=(-2, -1)).real
+    return out * out_H * out_W / (H * W)
+
+
+class TestSpectralPool(unittest.TestCase):
+
+    def setUp(self):
+        torch.manual_seed(31)
+
+    def test_spectral_pool(self):
+        x = torch.randn(2, 3, 16, 15, dtype=torch.double, requires_grad=True)
+        pool = SpectralPool(filter_size=3, stride=2)
+        out = pool(x)
+        self.assertEqual((2, 3, 7, 7), tuple(out.shape))
+        # For the odd output sizes there are no Nyquist frequencies to split.
+        self.assertTrue(torch.allclose(spectral_pool_full(x, (7, 7)), out))
+        self.assertTrue(torch.allclose(x.mean(dim=(-2, -1)),
+                                       out.mean(dim=(-2, -1))))
+        self.assertTrue(torch.autograd.gradcheck(
+            lambda x: spectral_pool(x, (4, 6)), (x[:1, :1, :8, :9],)))
+
+    def test_spectral_pool_crop(self):
+        for grid_size, crop_size, out_size in [
+                ((18, 18), (16, 16), (8, 8)), ((17, 20), (15, 17), (7, 9)),
+                ((8, 8), (8, 8), (4, 4))]:
+            x = torch.randn(2, 3, *grid_size, dtype=torch.double)
+            xfft = torch.fft.rfftn(x, dim=(-2, -1))
+            crop_H, crop_W = crop_size
+            expect = spectral_pool(x[..., :crop_H, :crop_W], out_size)
+            out = spectral_pool_crop(xfft, grid_size=grid_size,
+                                     crop_size=crop_size, out_size=out_size)
+            self.assertTrue(torch.allclose(expect, out))
+
+    def test_fused_conv(self):
+        args = Arguments()
+        args.compress_rate = 0
+        args.preserve_energy = 100
+        for size, padding, pool_size in [(16, 1, 8), (28, 1, 7), (32, 1, 15),
+                                         (16, 0, 8), (15, 2, (6, 9))]:
+            conv = Conv2dfft(in_channels=3, out_channels=4, kernel_size=3,
+                             padding=padding, bias=True, args=args,
+                             native_complex=True,
+                             pool_size=pool_size).double()
+            x = torch.randn(2, 3, size, size, dtype=torch.double,
+                            requires_grad=True)
+            out = conv(x)
+            pool_H, pool_W = (pool_size, pool_size) if isinstance(
+                pool_size, int) else pool_size
+            self.assertEqual((2, 4, pool_H, pool_W), tuple(out.shape))
+
+            # The same as the convolution followed by the spectral pooling.
+            pool = SpectralPool(out_size=(pool_H, pool_W))
+            expect = pool(F.conv2d(x, conv.weight, conv.bias,
+                                   padding=padding))
+            self.assertTrue(torch.allclose(expect, out))
+
+        out.sum().backward()
+        self.assertIsNotNone(conv.weight.grad)
+        self.assertIsNotNone(x.grad)
+
+        with self.assertRaises(Exception):
+            Conv2dfft(in_channels=3, out_channels=4, kernel_size=3, args=args,
+                      native_complex=False, pool_size=pool_size)
+
+
+if __name__ == '__main__':
+    unittest.main()
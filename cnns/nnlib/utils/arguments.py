@@ -475,6 +475,20 @@ class Arguments(object):
                  attack_strengths=[0.01],
                  gradient_iters=1,
                  ensemble=1,
+                 # The max number of images in a forward pass of the ensemble
+                 # inference (0 - one copy of the input per pass).
+                 ensemble_batch=0,
+                 # The significance level of the early stopping of the
+                 # ensemble inference (0 - no early stopping).
+                 ensemble_alpha=0.0,
+                 # The number of images attacked at once in the sweeps of
+                 # main_adversarial (0 - one image at a time with foolbox).
+                 adversarial_batch_size=0,
+                 # The path to the database of the per image results of the
+                 # adversarial sweeps (None - do not store the results).
+                 result_store=None,
+                 # The number of images in a shard claimed by a worker.
+                 result_store_shard_size=100,
                  attack_confidence=0,
                  target_class=-1,
                  rgb_value=0,
@@ -495,6 +509,49 @@ class Arguments(object):
                  binary_search_steps=5,
                  use_set='test_set',
                  normalize_pytorch=False,
+                 # Apply the svd/fft input compression once per collated
+                 # batch on args.device instead of per image in the workers.
+                 batch_transform=False,
+                 # The number of processes for the sweep over the grid of
+                 # hyper-parameters in main.py: 0 - serially, -1 - all cores
+                 # (or cuda devices times sweep_device_slots).
+                 sweep_workers=0,
+                 sweep_device_slots=1,
+                 # Resume the sweep from this global log file.
+                 sweep_log_file="",
+                 # Yield the batches of the UCR datasets by slicing the
+                 # resident tensor (on args.device) instead of a DataLoader.
+                 in_memory_loader=False,
+                 # Reuse the spectrum of the filters in the fft based
+                 # convolutions in the eval mode.
+                 fft_filter_cache=True,
+                 # Record the time and memory of the stages of the fft based
+                 # convolutions and export them to this .json or .csv file.
+                 profile_conv=False,
+                 profile_conv_cuda_sync=True,
+                 profile_conv_file="conv_profile.csv",
+                 # The json file with the fastest implementations of the
+                 # convolutions (for ConvType.AUTOTUNE2D) and the number of
+                 # runs of each implementation in the benchmark.
+                 conv_autotune_cache="conv_autotune.json",
+                 conv_autotune_repetitions=3,
+                 # The max number of bytes for the intermediate tensors of the
+                 # complex multiplication in the BATCH exec type of the fft
+                 # based convolutions (0 - no tiling).
+                 conv_memory_budget=0,
+                 # Compute the fft based convolution with the native complex
+                 # tensors instead of the last dimension of size 2.
+                 native_complex=False,
+                 # The size of the input tiles for the overlap-save fft based
+                 # convolutions (0 - transform the whole input at once).
+                 conv_tile_size=0,
+                 # The size of the output tile of the Winograd convolution:
+                 # 2 for F(2x2, 3x3) or 4 for F(4x4, 3x3).
+                 winograd_m=2,
+                 # Save only the input and filter of the fft based
+                 # convolutions for the backward pass and recompute their
+                 # spectra there (less memory, more computation).
+                 conv_recompute_backward=False,
                  ):
         """
         The default parameters for the execution of the program.
@@ -636,6 +693,11 @@ class Arguments(object):
         self.target_class = target_class
         self.gradient_iters = gradient_iters
         self.ensemble = ensemble
+        self.ensemble_batch = ensemble_batch
+        self.ensemble_alpha = ensemble_alpha
+        self.adversarial_batch_size = adversarial_batch_size
+        self.result_store = result_store
+        self.result_store_shard_size = result_store_shard_size
         self.attack_confidence = attack_confidence
         self.rgb_value = rgb_value
         self.rgb_values = rgb_values
@@ -647,6 +709,22 @@ class Arguments(object):
         self.binary_search_steps = binary_search_steps
         self.use_set = use_set
         self.normalize_pytorch = normalize_pytorch
+        self.batch_transform = batch_transform
+        self.sweep_workers = sweep_workers
+        self.sweep_device_slots = sweep_device_slots
+        self.sweep_log_file = sweep_log_file
+        self.in_memory_loader = in_memory_loader
+        self.fft_filter_cache = fft_filter_cache
+        self.profile_conv = profile_conv
+        self.profile_conv_cuda_sync = profile_conv_cuda_sync
+        self.profile_conv_file = profile_conv_file
+        self.conv_autotune_cache = conv_autotune_cache
+        self.conv_autotune_repetitions = conv_autotune_repetitions
+        self.conv_memory_budget = conv_memory_budget
+        self.native_complex = native_complex
+        self.conv_tile_size = conv_tile_size
+        self.winograd_m = winograd_m
+        self.conv_recompute_backward = conv_recompute_backward
 
         # deeprl
         # self.env_name = "Reacher-v2"
@@ -704,6 +782,12 @@ class Arguments(object):
         # self.rollout_file = 'dagger_data/' + self.env_name + '-600.pkl'
         self.dagger_iterations = 100
         self.behave_iterations = 100
+        # The number of the copies of the environment stepped in lock-step to
+        # collect the rollouts, the learner and the expert are queried once
+        # per batch of the observations of the copies.
+        self.rollout_envs = 1
+        # Step each copy of the environment in its own worker process.
+        self.rollout_subprocess = False
 
         self.log_file = 'logs/' + get_log_time() + '-log' + '.txt'
         self.delimiter = ";"
@@ -793,6 +877,16 @@ class Arguments(object):
         self.is_DC_shift = self.get_bool(parsed_args.is_DC_shift)
         self.use_foolbox_data = self.get_bool(parsed_args.use_foolbox_data)
         self.normalize_pytorch = self.get_bool(parsed_args.normalize_pytorch)
+        self.batch_transform = self.get_bool(parsed_args.batch_transform)
+        self.in_memory_loader = self.get_bool(parsed_args.in_memory_loader)
+        self.rollout_subprocess = self.get_bool(parsed_args.rollout_subprocess)
+        self.fft_filter_cache = self.get_bool(parsed_args.fft_filter_cache)
+        self.profile_conv = self.get_bool(parsed_args.profile_conv)
+        self.profile_conv_cuda_sync = self.get_bool(
+            parsed_args.profile_conv_cuda_sync)
+        self.native_complex = self.get_bool(parsed_args.native_complex)
+        self.conv_recompute_backward = self.get_bool(
+            parsed_args.conv_recompute_backward)
 
         if hasattr(parsed_args, "preserve_energy"):
             self.preserve_energy = parsed_args.preserve_energy
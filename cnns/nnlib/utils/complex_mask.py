@@ -1,3 +1,4 @@
+import collections
 import numpy as np
 import torch
 
@@ -251,6 +252,89 @@ def get_array_mask(mask, n=7, val=0, back=1, dtype=np.float32,
     return array
 
 
+class SpectralMaskCache(object):
+    """
+    LRU cache for the masks in the frequency domain. The masks depend only on
+    the size of the fft-ed input and the compression parameters, so we build
+    each of them once (with NumPy) and keep it resident on the target device.
+    """
+
+    def __init__(self, max_size=64):
+        """
+        :param max_size: the max number of masks kept in the cache.
+        """
+        super(SpectralMaskCache, self).__init__()
+        self.max_size = max_size
+        self.masks = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, H, W, compress_rate, val=0, interpolate=None, onesided=True,
+            dtype=torch.float32, device=torch.device("cpu"),
+            get_mask=get_hyper_mask):
+        """
+        Get the mask of size (H, W, 2) from the cache or build it.
+
+        :param H: the height of the fft-ed input
+        :param W: the width of the fft-ed input
+        :param compress_rate: percentage of coefficients that should be removed
+        :param val: the value (to change coefficients to) for the mask
+        :param interpolate: the interpolation within mask: const, linear, exp,
+        log, etc.
+        :param onesided: is the mask for the onesided FFT
+        :param dtype: the type of the mask
+        :param device: the device where the mask is kept
+        :param get_mask: the function that builds the mask, e.g. get_hyper_mask
+        :return: the mask (do not change it in place, it is shared)
+        """
+        key = (get_mask, H, W, compress_rate, val, interpolate, onesided,
+               dtype, device)
+        mask = self.masks.get(key)
+        if mask is not None:
+            self.hits += 1
+            self.masks.move_to_end(key)
+            return mask
+        self.misses += 1
+        mask, _ = get_mask(H=H, W=W, compress_rate=compress_rate, val=val,
+                           interpolate=interpolate, onesided=onesided)
+        mask = mask[:, 0:W, :]
+        mask = mask.to(dtype).to(device)
+        self.masks[key] = mask
+        if len(self.masks) > self.max_size:
+            self.masks.popitem(last=False)
+        return mask
+
+    def clear(self):
+        """
+        Remove all the masks and reset the counters.
+        """
+        self.masks.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """
+        :return: the statistics of the cache.
+        """
+        return {"hits": self.hits, "misses": self.misses,
+                "size": len(self.masks), "max_size": self.max_size}
+
+
+# The cache shared by the fft channels and layers.
+mask_cache = SpectralMaskCache()
+
+
+def get_cached_mask(H, W, compress_rate, val=0, interpolate=None,
+                    onesided=True, dtype=torch.float32,
+                    device=torch.device("cpu"), get_mask=get_hyper_mask):
+    """
+    Get the mask from the shared cache, see SpectralMaskCache.get.
+    """
+    return mask_cache.get(H=H, W=W, compress_rate=compress_rate, val=val,
+                          interpolate=interpolate, onesided=onesided,
+                          dtype=dtype, device=device, get_mask=get_mask)
+
+
 if __name__ == "__main__":
     a, b = 1, 1
     n = 7
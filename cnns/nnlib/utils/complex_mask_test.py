@@ -1,6 +1,7 @@
 from cnns.nnlib.utils.complex_mask import get_disk_mask
 from cnns.nnlib.utils.complex_mask import get_hyper_mask
 from cnns.nnlib.utils.complex_mask import get_inverse_hyper_mask
+from cnns.nnlib.utils.complex_mask import SpectralMaskCache
 
 import torch
 import unittest
@@ -311,6 +312,44 @@ class TestGetComplexMask(unittest.TestCase):
                                 rtol=1e-3)
 
 
+    def test_spectral_mask_cache(self):
+        cache = SpectralMaskCache(max_size=2)
+        H, W = 8, 5
+        mask = cache.get(H=H, W=W, compress_rate=50, val=0,
+                         interpolate="const", onesided=True)
+        expected, _ = get_hyper_mask(H=H, W=W, compress_rate=50, val=0,
+                                     interpolate="const", onesided=True)
+        expected = expected[:, 0:W, :].to(torch.float32)
+        np.testing.assert_equal(actual=mask.numpy(), desired=expected.numpy())
+        self.assertEqual(cache.info()["misses"], 1)
+        self.assertEqual(cache.info()["hits"], 0)
+
+        # The same parameters: the mask is taken from the cache.
+        mask2 = cache.get(H=H, W=W, compress_rate=50, val=0,
+                          interpolate="const", onesided=True)
+        self.assertIs(mask, mask2)
+        self.assertEqual(cache.info()["hits"], 1)
+
+        # A different type gives a different mask.
+        mask3 = cache.get(H=H, W=W, compress_rate=50, val=0,
+                          interpolate="const", onesided=True,
+                          dtype=torch.float64)
+        self.assertEqual(mask3.dtype, torch.float64)
+        self.assertEqual(cache.info()["misses"], 2)
+
+        # The least recently used mask is evicted.
+        cache.get(H=H, W=W, compress_rate=50, val=0, interpolate="const",
+                  onesided=True, get_mask=get_inverse_hyper_mask)
+        self.assertEqual(cache.info()["size"], 2)
+        cache.get(H=H, W=W, compress_rate=50, val=0, interpolate="const",
+                  onesided=True)
+        self.assertEqual(cache.info()["misses"], 4)
+
+        cache.clear()
+        self.assertEqual(cache.info()["size"], 0)
+        self.assertEqual(cache.info()["hits"], 0)
+
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -456,6 +456,17 @@ def get_args():
                         default=args.behave_iterations,
                         help='Number of iterations for the behaviorac clonning algorithm.'
                         )
+    parser.add_argument('--rollout_envs',
+                        type=int,
+                        default=args.rollout_envs,
+                        help='Number of the copies of the environment stepped '
+                             'in lock-step to collect the rollouts.'
+                        )
+    parser.add_argument("--rollout_subprocess",
+                        default="TRUE" if args.rollout_subprocess else "FALSE",
+                        help="step each copy of the environment in its own "
+                             "worker process; options: " + ",".join(
+                            Bool.get_names()))
     parser.add_argument('--pickle_protocol',
                         type=int,
                         default=args.pickle_protocol,
@@ -477,6 +488,35 @@ def get_args():
                         default=args.ensemble,
                         help='For the RSE defense, how many models in the '
                              'ensemble.')
+    parser.add_argument("--ensemble_batch",
+                        type=int,
+                        default=args.ensemble_batch,
+                        help='The max number of images in a forward pass of '
+                             'the ensemble inference (0 - one copy of the '
+                             'input per pass).')
+    parser.add_argument("--ensemble_alpha",
+                        type=float,
+                        default=args.ensemble_alpha,
+                        help='The significance level of the early stopping '
+                             'of the ensemble inference (0 - no early '
+                             'stopping).')
+    parser.add_argument("--adversarial_batch_size",
+                        type=int,
+                        default=args.adversarial_batch_size,
+                        help='The number of images attacked at once (with '
+                             'the batched attacks and recovery defenses) in '
+                             'main_adversarial (0 - one image at a time).')
+    parser.add_argument("--result_store",
+                        type=str,
+                        default=args.result_store,
+                        help='The path to the SQLite database of the per '
+                             'image results of the adversarial sweeps, the '
+                             'images done before are skipped on restart.')
+    parser.add_argument("--result_store_shard_size",
+                        type=int,
+                        default=args.result_store_shard_size,
+                        help='The number of images in a shard of the index '
+                             'range claimed by a worker of the sweep.')
     parser.add_argument("--attack_confidence",
                         type=float,
                         default=args.attack_confidence,
@@ -536,6 +576,99 @@ def get_args():
                         # "TRUE", "FALSE"
                         help="should we normalize the data pytorch way? " + ",".join(
                             Bool.get_names()))
+    parser.add_argument("--batch_transform",
+                        default="TRUE" if args.batch_transform else "FALSE",
+                        help="apply the svd/fft input compression once per "
+                             "collated batch on the training device instead "
+                             "of per image in the data loader workers; "
+                             "options: " + ",".join(Bool.get_names()))
+    parser.add_argument('--sweep_workers', type=int,
+                        default=args.sweep_workers,
+                        help=f"number of processes for the sweep over the "
+                             f"grid of hyper-parameters: 0 - serially, -1 - "
+                             f"all cores or cuda devices times "
+                             f"sweep_device_slots"
+                             f" (default: {args.sweep_workers})")
+    parser.add_argument('--sweep_device_slots', type=int,
+                        default=args.sweep_device_slots,
+                        help=f"number of concurrent jobs per cuda device"
+                             f" (default: {args.sweep_device_slots})")
+    parser.add_argument('--sweep_log_file', type=str,
+                        default=args.sweep_log_file,
+                        help="the global log file of an interrupted sweep; "
+                             "the jobs already in the log are skipped")
+    parser.add_argument("--in_memory_loader",
+                        default="TRUE" if args.in_memory_loader else "FALSE",
+                        help="yield the batches of the UCR datasets by "
+                             "slicing the resident tensor on the training "
+                             "device instead of using the DataLoader; "
+                             "options: " + ",".join(Bool.get_names()))
+    parser.add_argument("--fft_filter_cache",
+                        default="TRUE" if args.fft_filter_cache else "FALSE",
+                        help="reuse the padded and fft-ed filters of the fft "
+                             "based convolutions in the eval mode; "
+                             "options: " + ",".join(Bool.get_names()))
+    parser.add_argument("--profile_conv",
+                        default="TRUE" if args.profile_conv else "FALSE",
+                        help="record the time and memory of the stages (pad, "
+                             "rfft, compression, complex multiply, irfft, "
+                             "backward) of the fft based convolutions; "
+                             "options: " + ",".join(Bool.get_names()))
+    parser.add_argument("--profile_conv_cuda_sync",
+                        default="TRUE" if args.profile_conv_cuda_sync else "FALSE",
+                        help="synchronize cuda in each profiled stage to "
+                             "measure the cuda time; "
+                             "options: " + ",".join(Bool.get_names()))
+    parser.add_argument('--profile_conv_file', type=str,
+                        default=args.profile_conv_file,
+                        help="the .json or .csv file for the profile of the "
+                             "convolutions (default: "
+                             f"{args.profile_conv_file})")
+    parser.add_argument('--conv_autotune_cache', type=str,
+                        default=args.conv_autotune_cache,
+                        help="the json file with the fastest implementation "
+                             "of the convolution for each layer and input "
+                             "size (for the conv_type AUTOTUNE2D) (default: "
+                             f"{args.conv_autotune_cache})")
+    parser.add_argument('--conv_autotune_repetitions', type=int,
+                        default=args.conv_autotune_repetitions,
+                        help="how many times to run each implementation of "
+                             "the convolution in the autotuning (default: "
+                             f"{args.conv_autotune_repetitions})")
+    parser.add_argument('--conv_memory_budget', type=int,
+                        default=args.conv_memory_budget,
+                        help="the max number of bytes for the intermediate "
+                             "tensors of the complex multiplication in the "
+                             "BATCH exec type of the fft convolutions; the "
+                             "batch, filters and channels are split into "
+                             "tiles that fit in the budget (0 - no tiling) "
+                             f"(default: {args.conv_memory_budget})")
+    parser.add_argument("--native_complex",
+                        default="TRUE" if args.native_complex else "FALSE",
+                        help="compute the fft based convolutions with the "
+                             "native complex tensors (the backward pass via "
+                             "autograd); "
+                             "options: " + ",".join(Bool.get_names()))
+    parser.add_argument('--conv_tile_size', type=int,
+                        default=args.conv_tile_size,
+                        help="split the large inputs of the fft based "
+                             "convolutions into tiles of this size "
+                             "(overlap-save), the filter is transformed once "
+                             "per tile size (0 - no tiling) "
+                             f"(default: {args.conv_tile_size})")
+    parser.add_argument('--winograd_m', type=int, default=args.winograd_m,
+                        help="the size of the output tile of the Winograd "
+                             "convolution (for the conv_type WINOGRAD2D): 2 "
+                             "for F(2x2, 3x3) or 4 for F(4x4, 3x3) (default: "
+                             f"{args.winograd_m})")
+    parser.add_argument("--conv_recompute_backward",
+                        default="TRUE" if args.conv_recompute_backward
+                        else "FALSE",
+                        help="save only the input and filter of the fft based "
+                             "convolutions for the backward pass and "
+                             "recompute their spectra there (less memory for "
+                             "the activations, more computation); "
+                             "options: " + ",".join(Bool.get_names()))
     parser.add_argument('--noiseInit', type=float, default=0.0)
     parser.add_argument('--noiseInner', type=float, default=0.0)
     parser.add_argument('--param_noise', type=float, default=0.0)
@@ -155,6 +155,8 @@ class ConvType(EnumWithNames):
     DCT = 13
     PYTORCH = 14
     FFT = 15
+    AUTOTUNE2D = 16
+    WINOGRAD2D = 17
 
 
 class AttackType(EnumWithNames):
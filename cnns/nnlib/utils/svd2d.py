@@ -1,5 +1,7 @@
 import torch
 import numpy as np
+from cnns.nnlib.robustness.channels.channels_definition import \
+    svd_low_rank
 
 from cnns import matplotlib_backend
 
@@ -34,25 +36,11 @@ linestyles = [":", "-", "--", ":", "-", "--", "-", "--", ':', ':', "-", "-",
               "-"]
 
 
-def compress_svd(torch_img, compress_rate):
+def compress_svd(torch_img, compress_rate, randomized=False):
     C, H, W = torch_img.size()
     assert H == W
     index = int((1 - compress_rate / 100) * H)
-    torch_compress_img = torch.zeros_like(torch_img)
-    for c in range(C):
-        try:
-            u, s, v = torch.svd(torch_img[c])
-        except RuntimeError as ex:
-            print("SVD problem: ", ex)
-            return None
-
-        u_c = u[:, :index]
-        s_c = s[:index]
-        v_c = v[:, :index]
-
-        torch_compress_img[c] = torch.mm(torch.mm(u_c, torch.diag(s_c)),
-                                         v_c.t())
-    return torch_compress_img
+    return svd_low_rank(torch_img, index=index, randomized=randomized)
 
 
 def compress_svd_numpy(numpy_array, compress_rate):
@@ -62,12 +50,11 @@ def compress_svd_numpy(numpy_array, compress_rate):
     return torch_image.cpu().numpy()
 
 
-def compress_svd_batch(x, compress_rate):
-    result = torch.zeros_like(x)
-    for i, torch_img in enumerate(x):
-        result[i] = compress_svd(torch_img=torch_img,
-                                 compress_rate=compress_rate)
-    return result
+def compress_svd_batch(x, compress_rate, randomized=False):
+    N, C, H, W = x.size()
+    assert H == W
+    index = int((1 - compress_rate / 100) * H)
+    return svd_low_rank(x, index=index, randomized=randomized)
 
 
 iters_per_epoch = 947